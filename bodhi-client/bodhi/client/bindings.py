@@ -766,8 +766,15 @@ class BodhiClient:
         if 'error_message' in compose and compose['error_message']:
             compose_lines.append(line_formatter.format('Error', compose['error_message']))
 
-        compose_lines += ['\nUpdates:\n\n']
         line_formatter = f'\t{line_formatter}'
+        if compose.get('phases'):
+            compose_lines += ['\nPhases:\n\n']
+            for phase in compose['phases']:
+                duration = 'current' if phase['duration'] is None else f"{phase['duration']:.0f}s"
+                compose_lines.append(line_formatter.format(
+                    phase['state'], f"{phase['started']} ({duration})"))
+
+        compose_lines += ['\nUpdates:\n\n']
         for s in compose['update_summary']:
             compose_lines.append(line_formatter.format(s['alias'], s['title']))
 
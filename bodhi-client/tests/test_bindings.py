@@ -239,6 +239,17 @@ class TestComposeStr(BodhiClientTestCase):
         assert 'FEDORA-EPEL-2018-328e2b8c27: qtpass-1.2.1-3.el7' in s
         assert 'Error' not in s
 
+    def test_phases(self, mocker):
+        """Assert that the phases get rendered in the long form."""
+        mocker.patch.dict(client_test_data.EXAMPLE_COMPOSES_MUNCH['composes'][0], {'phases': [
+            {'state': 'requested', 'started': '2018-03-15 17:25:22', 'duration': 12.3},
+            {'state': 'punging', 'started': '2018-03-15 17:25:34', 'duration': None}]})
+        s = bindings.BodhiClient.compose_str(
+            client_test_data.EXAMPLE_COMPOSES_MUNCH['composes'][0], minimal=False)
+
+        assert '\nPhases:\n\n\t   requested: 2018-03-15 17:25:22 (12s)\n' \
+            '\t     punging: 2018-03-15 17:25:34 (current)\n\nUpdates:' in s
+
     def test_minimal_true(self):
         """Test with minimal True."""
         s = bindings.BodhiClient.compose_str(
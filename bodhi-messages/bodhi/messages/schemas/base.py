@@ -20,7 +20,7 @@ Each message is defined as a Python class. For details, see `fedora-messaging
 <https://fedora-messaging.readthedocs.io/en/stable/>`_ documentation on
 messages.
 """
-
+from datetime import date, datetime
 import json
 import re
 import typing
@@ -33,6 +33,8 @@ from bodhi.messages.utils import MENTION_RE
 
 
 SCHEMA_URL = 'https://bodhi.fedoraproject.org/message-schemas'
+# The value of the attributes an object doesn't have, in build_payload().
+_MISSING = object()
 
 
 class BodhiMessage(message.Message):
@@ -101,18 +103,15 @@ class BodhiMessage(message.Message):
         """
         Generate a message based on the given message dictionary.
 
+        The objects of the dictionary are reduced to the properties the body schema of the message
+        declares for them, see :func:`build_payload`.
+
         Args:
             message: A dictionary representation of the message you wish to instantiate.
         Returns:
             A Message.
         """
-        # Dirty, nasty hack that I feel shame for: use the fedmsg encoder that modifies
-        # messages quietly if they have objects with __json__ methods on them.
-        # For now, copy that behavior. In the future, callers should pass
-        # fedora_messaging.api.Message sub-classes or this whole API should go away.
-        body = json.loads(json.dumps(message, cls=FedMsgEncoder))
-
-        return cls(body=body)
+        return cls(body=build_payload(message, cls.body_schema))
 
     @property
     def usernames(self) -> typing.List[str]:
@@ -305,6 +304,58 @@ class UserV1(typing.NamedTuple):
         }
 
 
+def build_payload(value: typing.Any, schema: typing.Optional[dict],
+                  definitions: typing.Optional[dict] = None) -> typing.Any:
+    """
+    Return a JSON-serializable representation of the value, as described by its schema.
+
+    The objects with a ``__json__`` method, such as Bodhi's database models, are reduced to the
+    properties their schema declares, which are read from their attributes. This avoids serializing
+    them entirely, with all their relationships, only to drop most of it. The objects without
+    declared properties are serialized with :class:`FedMsgEncoder`, and the dictionaries keep all
+    their keys.
+
+    Args:
+        value: The value to represent.
+        schema: The JSON schema of the value, or None if it is unknown.
+        definitions: The definitions the references of the schema point to. Defaults to the
+            definitions of the schema.
+    Returns:
+        The representation of the value.
+    """
+    if definitions is None:
+        definitions = (schema or {}).get('definitions', {})
+    if schema is not None and '$ref' in schema:
+        schema = definitions.get(schema['$ref'].rsplit('/', 1)[-1])
+    properties = (schema or {}).get('properties')
+
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {
+            # Convert the keys as json.dumps() does.
+            key if isinstance(key, str) else json.dumps(key):
+            build_payload(item, properties.get(key) if properties else None, definitions)
+            for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = (schema or {}).get('items')
+        return [build_payload(item, items if isinstance(items, dict) else None, definitions)
+                for item in value]
+    if properties and hasattr(value, '__json__'):
+        payload = {}
+        for name, property_schema in properties.items():
+            attribute = getattr(value, name, _MISSING)
+            if attribute is not _MISSING:
+                payload[name] = build_payload(attribute, property_schema, definitions)
+        return payload
+    # Serialize the dates the same way as Bodhi's models.
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return json.loads(json.dumps(value, cls=FedMsgEncoder))
+
+
 class FedMsgEncoder(json.encoder.JSONEncoder):
     """Encoder with convenience support.
 
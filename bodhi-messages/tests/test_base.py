@@ -17,6 +17,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """This test module contains tests for bodhi.messages.schemas.base."""
 
+from datetime import date, datetime, timezone
 import json
 
 import pytest
@@ -49,6 +50,67 @@ class TestFedMsgEncoder:
             base.FedMsgEncoder().default(object())
 
 
+class _Model:
+    """A stand-in for the database models, which can be serialized entirely with __json__."""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __json__(self):
+        return {'serialized': 'entirely'}
+
+
+class TestBuildPayload:
+    """Tests for :func:`build_payload`."""
+
+    def test_declared_properties(self):
+        """Assert the objects are reduced to the properties declared by the schema."""
+        update = _Model(
+            alias='FEDORA-2019-d64d0caab3', title='golang-github-SAP-go-hdb-0.14.1-1.fc29',
+            builds=[_Model(nvr='golang-github-SAP-go-hdb-0.14.1-1.fc29', signed=True)],
+            release=_Model(name='F29', long_name='Fedora 29'), request=None, status='stable',
+            user=_Model(name='eclipseo', email='eclipseo@example.com'))
+
+        msg = UpdateCompleteStableV1.from_dict({'update': update, 'agent': 'bodhi'})
+
+        assert msg.body == {
+            'update': {
+                'alias': 'FEDORA-2019-d64d0caab3',
+                'builds': [{'nvr': 'golang-github-SAP-go-hdb-0.14.1-1.fc29'}],
+                'release': {'name': 'F29'},
+                'request': None,
+                'status': 'stable',
+                'user': {'name': 'eclipseo'}},
+            'agent': 'bodhi'}
+        msg.validate()
+
+    def test_missing_attribute(self):
+        """Assert the declared properties an object doesn't have are left out."""
+        schema = {'type': 'object', 'properties': {'name': {}, 'email': {}}}
+
+        assert base.build_payload(_Model(name='eclipseo'), schema) == {'name': 'eclipseo'}
+
+    def test_undeclared(self):
+        """Assert the objects without declared properties are serialized entirely."""
+        assert base.build_payload(
+            {'a': _Model(), 'b': [_Model()]}, {'type': 'object', 'properties': {'a': {}}}
+        ) == {'a': {'serialized': 'entirely'}, 'b': [{'serialized': 'entirely'}]}
+
+    def test_dict_keys(self):
+        """Assert the keys of the dictionaries are converted like json.dumps() does."""
+        value = {'a': 1, 2: 'b', None: (True, 1.5)}
+
+        assert base.build_payload(value, None) == json.loads(json.dumps(value))
+
+    def test_dates(self):
+        """Assert the dates are serialized like Bodhi's models do."""
+        value = {'datetime': datetime(2019, 4, 1, 12, 3, 4, tzinfo=timezone.utc),
+                 'date': date(2019, 4, 1)}
+
+        assert base.build_payload(value, None) == {'datetime': '2019-04-01 12:03:04',
+                                                   'date': '2019-04-01'}
+
+
 class TestAgentDeprecationWarning:
     """ Test the agent deprecation warning """
     expected = {
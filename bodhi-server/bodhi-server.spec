@@ -21,6 +21,7 @@ BuildRequires:  pyproject-rpm-macros
 BuildRequires:  systemd-rpm-macros
 BuildRequires:  python3-devel
 BuildRequires:  python3-pytest
+BuildRequires:  python3-pytest-benchmark
 BuildRequires:  python3-pytest-cov
 BuildRequires:  python3-pytest-mock
 BuildRequires:  python3-sphinx
@@ -131,6 +132,8 @@ install -p -D -m 0644 %{name}.sysusers %{buildroot}%{_sysusersdir}/%{name}.sysus
 %{_bindir}/bodhi-check-policies
 %{_bindir}/bodhi-clean-old-composes
 %{_bindir}/bodhi-expire-overrides
+%{_bindir}/bodhi-populate-db
+%{_bindir}/bodhi-profiles
 %{_bindir}/bodhi-push
 %{_bindir}/bodhi-sar
 %{_bindir}/bodhi-shell
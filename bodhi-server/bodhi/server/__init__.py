@@ -187,7 +187,7 @@ def initialize_db(config):
     return engine
 
 
-def main(global_config, testing=None, session=None, **settings):
+def main(global_config, testing=None, session=None, testing_groups=None, **settings):
     """
     Return a WSGI application.
 
@@ -198,6 +198,8 @@ def main(global_config, testing=None, session=None, **settings):
             a username.
         session (sqlalchemy.orm.session.Session or None): If given, the session will be used instead
             of building a new one.
+        testing_groups (list or None): The names of the groups of the testing user, if it is not a
+            member of the default packager groups.
         settings (dictionary): Unused.
     Returns:
         pyramid.router.Router: A WSGI app.
@@ -260,14 +262,13 @@ def main(global_config, testing=None, session=None, **settings):
     # Authentication & Authorization
     if testing:
         # use a permissive security policy while running unit tests
+        if testing_groups is None:
+            testing_groups = ['packager', 'ipausers', 'fedora-contributor', 'signed_fpca',
+                              'fedorabugs']
         fake_identity = munchify(
             {'name': testing,
              'email': f'{testing}@bodhi-dev.example.com',
-             'groups': [{'name': 'packager'},
-                        {'name': 'ipausers'},
-                        {'name': 'fedora-contributor'},
-                        {'name': 'signed_fpca'},
-                        {'name': 'fedorabugs'},],
+             'groups': [{'name': group} for group in testing_groups],
              'openid': bodhi_config['openid_template'].format(username=testing)}
         )
         config.testing_securitypolicy(userid=testing, identity=fake_identity, permissive=True)
@@ -282,6 +283,11 @@ def main(global_config, testing=None, session=None, **settings):
     config.add_tween(
         'bodhi.server.services.metrics_tween.histo_tween_factory', over=EXCVIEW
     )
+    # Profile the sampled requests
+    config.add_tween(
+        'bodhi.server.profiling.profiling_tween_factory', over=EXCVIEW,
+        under='bodhi.server.services.metrics_tween.histo_tween_factory',
+    )
 
     # Metrics Route
     config.add_route('prometheus_metric', '/metrics')
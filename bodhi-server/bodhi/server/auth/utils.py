@@ -8,6 +8,7 @@ from pyramid.security import remember
 
 from bodhi.server import log
 from bodhi.server.models import Group, User
+from bodhi.server.security import identities
 
 
 if typing.TYPE_CHECKING:  # pragma: no cover
@@ -144,6 +145,9 @@ def create_or_update_user(db, username, email, groups):
             log.info('Removing %s from %s group', user.name, group.name)
             user.groups.remove(group)
 
+    # The cached identity may have another e-mail address or other groups. Only this process
+    # forgets it, the others will once it expires after identity_cache.ttl seconds.
+    identities.invalidate(user.name)
     return user
 
 
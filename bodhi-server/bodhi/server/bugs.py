@@ -24,6 +24,7 @@ import typing
 
 import bugzilla
 
+from bodhi.server import spans
 from bodhi.server.config import config
 
 if typing.TYPE_CHECKING:  # pragma: no cover
@@ -102,6 +103,7 @@ class Bugzilla(object):
             self._connect()
         return self._bz
 
+    @spans.timed('bugzilla')
     def getbug(self, bug_id: int) -> 'bugzilla.bug.Bug':
         """
         Retrieve a bug from Bugzilla.
@@ -113,6 +115,7 @@ class Bugzilla(object):
         """
         return self.bz.getbug(bug_id)
 
+    @spans.timed('bugzilla')
     def comment(self, bug_id: int, comment: str) -> None:
         """
         Add a comment to the given bug.
@@ -149,6 +152,7 @@ class Bugzilla(object):
         except Exception:
             log.exception("Unable to add comment to bug #%d" % bug_id)
 
+    @spans.timed('bugzilla')
     def on_qa(self, bug_id: int, comment: str) -> None:
         """
         Change the status of this bug to ON_QA if it is not already ON_QA, VERIFIED, or CLOSED.
@@ -183,6 +187,7 @@ class Bugzilla(object):
         except Exception:
             log.exception("Unable to alter bug #%d" % bug_id)
 
+    @spans.timed('bugzilla')
     def close(self, bug_id: int, versions: typing.Mapping[str, str], comment: str) -> None:
         """
         Close the bug given by bug_id, mark it as fixed in the given versions, and add a comment.
@@ -230,6 +235,7 @@ class Bugzilla(object):
                     "Got fault from Bugzilla on #%d: fault code: %d, fault string: %s",
                     bug_id, err.faultCode, err.faultString)
 
+    @spans.timed('bugzilla')
     def update_details(self, bug: typing.Union['bugzilla.bug.Bug', None],
                        bug_entity: 'models.Bug') -> None:
         """
@@ -266,6 +272,7 @@ class Bugzilla(object):
         if 'security' in [keyword.lower() for keyword in keywords]:
             bug_entity.security = True
 
+    @spans.timed('bugzilla')
     def modified(self, bug_id: typing.Union[int, str], comment: str) -> None:
         """
         Change the status of this bug to MODIFIED if not already MODIFIED, VERIFIED, or CLOSED.
@@ -17,17 +17,22 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """Define tools for interacting with the build system and a fake build system for development."""
 
+from datetime import datetime, timezone
 from functools import wraps
+import collections
 import hashlib
 from threading import Lock
 import logging
 import os
+import random
 import time
 import typing
 
 import backoff
 import koji
 
+from bodhi.server import spans
+
 
 if typing.TYPE_CHECKING:  # pragma: no cover
     from bodhi.server.config import BodhiConfig  # noqa: 401
@@ -358,6 +363,7 @@ class DevBuildsys:
         rpms += DevBuildsys.__rpms__
         return rpms
 
+    @multicall_enabled
     def listTags(self, build: str, *args, **kw) -> typing.List[typing.Dict[str, object]]:
         """Emulate Koji's listTags."""
         if 'el5' in build or 'el6' in build:
@@ -459,6 +465,7 @@ class DevBuildsys:
                     builds.append(self.getBuild(build))
         return builds
 
+    @multicall_enabled
     def getLatestBuilds(self, *args, **kw) -> typing.List[typing.Any]:
         """
         Return a list of the output from self.getBuild().
@@ -641,8 +648,384 @@ class DevBuildsys:
             return headers
 
 
+def dataset_call(func: typing.Callable[..., typing.Any]) -> typing.Callable[..., typing.Any]:
+    """
+    Decorate the given DatasetBuildsys method to count its calls and emulate Koji's latency.
+
+    Like multicall_enabled(), the results are stored on self when multicall is enabled. The
+    koji.GenericError exceptions are stored as faults, like Koji does.
+
+    Args:
+        func: The method to wrap.
+    Returns:
+        A wrapped version of func.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs) -> typing.Any:
+        """Count the call, then run func or store its result if multicall is enabled."""
+        self.dataset.calls[func.__name__] += 1
+        if not self.multicall:
+            self._round_trip()
+            return func(self, *args, **kwargs)
+
+        try:
+            self.multicall_result.append([func(self, *args, **kwargs)])
+        except koji.GenericError as e:
+            self.multicall_result.append({'faultCode': e.faultCode, 'faultString': str(e)})
+    return wrapper
+
+
+class KojiDataset:
+    """
+    A generated set of Koji packages, builds, RPMs, tags and side tags.
+
+    Each package has ``builds_per_tag`` builds in each of the tags, the builds in the later tags
+    having the higher versions, as if they were moving from the last tag to the first one. Each
+    side tag has a newer build of one of the packages. The RPMs of the builds are generated when
+    they are listed.
+    """
+
+    def __init__(self, packages: int = 1000, builds_per_tag: int = 2, rpms_per_build: int = 4,
+                 side_tags: int = 10, release: str = 'f17', dist: str = 'fc17',
+                 tags: typing.Optional[typing.Sequence[str]] = None, seed: int = 0):
+        """
+        Generate the dataset.
+
+        Args:
+            packages: How many packages there are.
+            builds_per_tag: How many builds of each package are in each tag.
+            rpms_per_build: How many RPMs each build has, besides its source RPM.
+            side_tags: How many side tags there are.
+            release: The name of the release, used to name the tags.
+            dist: The dist tag of the builds.
+            tags: The names of the tags, from the stable tag to the candidate tag. Defaults to the
+                stable, testing and candidate tags of the release.
+            seed: The seed of the generated sizes and times of the builds and of their RPMs.
+        """
+        self.rpms_per_build = rpms_per_build
+        self.seed = seed
+        #: How many times each method was called, by all the clients of this dataset.
+        self.calls = collections.Counter()  # type: typing.Counter[str]
+        self.packages = [f'package{i}' for i in range(packages)]
+        self._package_ids = {package: i + 1 for i, package in enumerate(self.packages)}
+        self.tags = {}  # type: typing.Dict[str, typing.Dict[str, typing.Any]]
+        self.builds = {}  # type: typing.Dict[str, typing.Dict[str, typing.Any]]
+        self.builds_by_id = {}  # type: typing.Dict[int, typing.Dict[str, typing.Any]]
+        # Map the tags to the NVRs of their builds, and the builds to their tags, in tagging order.
+        self.tagged = {}  # type: typing.Dict[str, typing.Dict[str, None]]
+        self.build_tags = collections.defaultdict(dict)  # type: typing.Dict[str, typing.Dict]
+        self._last_task_id = 0
+
+        if tags is None:
+            tags = [f'{release}-updates', f'{release}-updates-testing',
+                    f'{release}-updates-candidate']
+        for tag in tags:
+            self.add_tag(tag)
+        for package in self.packages:
+            for t, tag in reversed(list(enumerate(tags))):
+                for b in range(builds_per_tag):
+                    self.tag(tag, self.add_build(package, f'{t + 1}.{b}', f'1.{dist}')['nvr'])
+        for i in range(side_tags):
+            tag = self.add_tag(f'{release}-build-side-{i + 1}',
+                               extra={'sidetag': True, 'sidetag_user': f'packager{i}'})
+            package = self.packages[i % len(self.packages)]
+            self.tag(tag['name'],
+                     self.add_build(package, f'{len(tags) + 1}.{i}', f'1.{dist}')['nvr'])
+
+    def add_tag(self, name: str, extra: typing.Optional[typing.Dict[str, typing.Any]] = None) \
+            -> typing.Dict[str, typing.Any]:
+        """
+        Add a tag.
+
+        Args:
+            name: The name of the tag.
+            extra: The extra information of the tag.
+        Returns:
+            The tag information, as returned by Koji's getTag.
+        """
+        tag = {'id': len(self.tags) + 1, 'name': name, 'arches': None, 'extra': extra or {},
+               'locked': False, 'maven_include_all': False, 'maven_support': False, 'perm': None,
+               'perm_id': None}
+        self.tags[name] = tag
+        self.tagged[name] = {}
+        return tag
+
+    def add_build(self, package: str, version: str, release: str) -> typing.Dict[str, typing.Any]:
+        """
+        Add a build.
+
+        Args:
+            package: The name of the package.
+            version: The version of the build.
+            release: The release of the build.
+        Returns:
+            The build information, as returned by Koji's getBuild.
+        """
+        build_id = len(self.builds) + 1
+        completion_ts = 1187997970 + build_id * 60
+        build = {'build_id': build_id, 'id': build_id, 'name': package, 'package_name': package,
+                 'package_id': self._package_ids.get(package, 0),
+                 'version': version, 'release': release, 'epoch': None,
+                 'nvr': f'{package}-{version}-{release}', 'owner_id': 388,
+                 'owner_name': 'lmacken', 'state': koji.BUILD_STATES['COMPLETE'],
+                 'source': f'git+https://src.fedoraproject.org/rpms/{package}.git#abc',
+                 'task_id': 100000 + build_id, 'creation_event_id': build_id,
+                 'completion_ts': completion_ts,
+                 'completion_time': datetime.fromtimestamp(
+                     completion_ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f'),
+                 'extra': None}
+        self.builds[build['nvr']] = build
+        self.builds_by_id[build_id] = build
+        return build
+
+    def tag(self, tag: str, nvr: str):
+        """
+        Tag a build.
+
+        Args:
+            tag: The name of the tag.
+            nvr: The NVR of the build.
+        """
+        self.tagged[tag][nvr] = None
+        self.build_tags[nvr][tag] = None
+
+    def untag(self, tag: str, nvr: str):
+        """
+        Untag a build.
+
+        Args:
+            tag: The name of the tag.
+            nvr: The NVR of the build.
+        """
+        self.tagged[tag].pop(nvr, None)
+        self.build_tags[nvr].pop(tag, None)
+
+    def rpms(self, build: typing.Dict[str, typing.Any]) -> typing.List[typing.Dict[str, object]]:
+        """
+        Return the RPMs of a build.
+
+        Args:
+            build: The build information.
+        Returns:
+            The RPMs of the build, as returned by Koji's listBuildRPMs.
+        """
+        rand = random.Random(f'{self.seed}:{build["id"]}')
+        names = [build['name']] + [f'{build["name"]}-sub{i}' for i in range(self.rpms_per_build)]
+        rpms = []
+        for i, name in enumerate(names):
+            rpms.append({
+                'arch': 'src' if i == 0 else 'x86_64', 'build_id': build['id'],
+                'buildroot_id': build['id'], 'buildtime': build['completion_ts'], 'epoch': None,
+                'id': build['id'] * (self.rpms_per_build + 1) + i, 'name': name,
+                'nvr': f'{name}-{build["version"]}-{build["release"]}',
+                'payloadhash': hashlib.sha256(f'{name}{build["id"]}'.encode()).hexdigest()[:32],
+                'release': build['release'], 'size': rand.randint(10000, 10000000),
+                'version': build['version']})
+        return rpms
+
+    def next_task_id(self) -> int:
+        """
+        Return the id of a new Koji task.
+
+        Returns:
+            The id of the task.
+        """
+        self._last_task_id += 1
+        return self._last_task_id
+
+
+class DatasetBuildsys(DevBuildsys):
+    """
+    A fake build system that answers from a KojiDataset, to benchmark Bodhi at production scale.
+
+    Each call waits for ``latency`` seconds, except the calls made in a multicall which wait for
+    a single round trip when multiCall() is called. The methods that are not backed by the dataset
+    behave like the DevBuildsys ones.
+    """
+
+    def __init__(self, dataset: KojiDataset, latency: float = 0):
+        """
+        Initialize the DatasetBuildsys.
+
+        Args:
+            dataset: The Koji data to answer from.
+            latency: How many seconds Koji takes to answer each call.
+        """
+        super().__init__()
+        self.dataset = dataset
+        self.latency = latency
+
+    def _round_trip(self):
+        """Wait for Koji to answer a call."""
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _build(self, build: typing.Union[str, int, typing.Mapping[str, typing.Any]],
+               strict: bool = True) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        Return the information of the given build.
+
+        Args:
+            build: The NVR, the id or the information of the build.
+            strict: If True, raise an exception if the build doesn't exist.
+        Returns:
+            The build information, or None if the build doesn't exist and strict is False.
+        Raises:
+            koji.GenericError: If the build doesn't exist and strict is True.
+        """
+        if isinstance(build, typing.Mapping):
+            build = build.get('id') or build.get('nvr')
+        info = (self.dataset.builds_by_id if isinstance(build, int)
+                else self.dataset.builds).get(build)
+        if info is None and strict:
+            raise koji.GenericError(f'No such build: {build}')
+        return info
+
+    def _tag(self, tag: typing.Union[str, int], strict: bool = True) \
+            -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        Return the information of the given tag.
+
+        Args:
+            tag: The name or the id of the tag.
+            strict: If True, raise an exception if the tag doesn't exist.
+        Returns:
+            The tag information, or None if the tag doesn't exist and strict is False.
+        Raises:
+            koji.GenericError: If the tag doesn't exist and strict is True.
+        """
+        for info in self.dataset.tags.values() if isinstance(tag, int) else ():
+            if info['id'] == tag:
+                return info
+        info = self.dataset.tags.get(tag)
+        if info is None and strict:
+            raise koji.GenericError(f"Invalid tagInfo: '{tag}'")
+        return info
+
+    def multiCall(self, strict: bool = False, batch: typing.Optional[int] = None):
+        """Emulate Koji's multiCall, waiting for a round trip per batch of calls."""
+        self.dataset.calls['multiCall'] += 1
+        result = self.multicall_result
+        self.multicall = False
+        for i in range(0, len(result), batch or len(result) or 1):
+            self._round_trip()
+        if strict:
+            for entry in result:
+                if isinstance(entry, dict):
+                    raise koji.GenericError(entry['faultString'])
+        return result
+
+    @dataset_call
+    def getBuild(self, buildInfo: typing.Union[str, int], strict: bool = False):
+        """Emulate Koji's getBuild."""
+        return self._build(buildInfo, strict=strict)
+
+    @dataset_call
+    def listTags(self, build: typing.Union[str, int], *args, **kw) \
+            -> typing.List[typing.Dict[str, object]]:
+        """Emulate Koji's listTags."""
+        return [self.dataset.tags[tag]
+                for tag in self.dataset.build_tags.get(self._build(build)['nvr'], {})]
+
+    def _list_tagged(self, tag: typing.Union[str, int], latest: bool,
+                     package: typing.Optional[str]) -> typing.List[typing.Dict[str, object]]:
+        """
+        Return the builds tagged with the given tag.
+
+        Args:
+            tag: The name or the id of the tag.
+            latest: If True, only return the latest build of each package.
+            package: If given, only return the builds of this package.
+        Returns:
+            The builds, the most recently tagged first.
+        """
+        taginfo = self._tag(tag)
+        builds = []
+        packages = set()
+        # Koji lists the most recently tagged builds first.
+        for nvr in reversed(self.dataset.tagged[taginfo['name']]):
+            build = self.dataset.builds[nvr]
+            if package and build['package_name'] != package:
+                continue
+            if latest:
+                if build['package_name'] in packages:
+                    continue
+                packages.add(build['package_name'])
+            builds.append(dict(build, tag_id=taginfo['id'], tag_name=taginfo['name']))
+        return builds
+
+    @dataset_call
+    def listTagged(self, tag: typing.Union[str, int], event: typing.Optional[int] = None,
+                   inherit: bool = False, prefix: typing.Optional[str] = None,
+                   latest: bool = False, package: typing.Optional[str] = None, **kw) \
+            -> typing.List[typing.Dict[str, object]]:
+        """Emulate Koji's listTagged, ignoring the inheritance of the tags."""
+        return self._list_tagged(tag, latest, package)
+
+    @dataset_call
+    def getLatestBuilds(self, tag: typing.Union[str, int], event: typing.Optional[int] = None,
+                        package: typing.Optional[str] = None, **kw) \
+            -> typing.List[typing.Dict[str, object]]:
+        """Emulate Koji's getLatestBuilds."""
+        return self._list_tagged(tag, True, package)
+
+    @dataset_call
+    def getTag(self, taginfo: typing.Union[str, int], strict: bool = False, **kw):
+        """Emulate Koji's getTag."""
+        return self._tag(taginfo, strict=strict)
+
+    @dataset_call
+    def listBuildRPMs(self, id: int, *args, **kw) -> typing.List[typing.Dict[str, object]]:
+        """Emulate Koji's listBuildRPMs."""
+        return self.dataset.rpms(self._build(id))
+
+    @dataset_call
+    def listPackages(self, *args, **kw) -> typing.List[typing.Dict[str, object]]:
+        """Emulate Koji's listPackages."""
+        return [{'package_id': i + 1, 'package_name': package}
+                for i, package in enumerate(self.dataset.packages)]
+
+    @dataset_call
+    def listSideTags(self, basetag: typing.Optional[str] = None,
+                     user: typing.Optional[str] = None, **kw) \
+            -> typing.List[typing.Dict[str, object]]:
+        """Emulate Koji's listSideTags."""
+        return [{'id': tag['id'], 'name': tag['name'], 'user_name': tag['extra']['sidetag_user']}
+                for tag in self.dataset.tags.values()
+                if tag['extra'].get('sidetag')
+                and user in (None, tag['extra']['sidetag_user'])]
+
+    @dataset_call
+    def tagBuild(self, tag: str, build: str, *args, **kw) -> int:
+        """Emulate Koji's tagBuild."""
+        self.dataset.tag(self._tag(tag)['name'], self._build(build)['nvr'])
+        return self.dataset.next_task_id()
+
+    @dataset_call
+    def untagBuild(self, tag: str, build: str, *args, **kw):
+        """Emulate Koji's untagBuild."""
+        self.dataset.untag(self._tag(tag)['name'], self._build(build)['nvr'])
+
+    @dataset_call
+    def moveBuild(self, from_tag: str, to_tag: str, build: str, *args, **kw) -> int:
+        """Emulate Koji's moveBuild."""
+        nvr = self._build(build)['nvr']
+        self.dataset.untag(self._tag(from_tag)['name'], nvr)
+        self.dataset.tag(self._tag(to_tag)['name'], nvr)
+        return self.dataset.next_task_id()
+
+
+class ClientSession(koji.ClientSession):
+    """A Koji client session that records its calls to the hub as spans."""
+
+    @spans.timed('koji')
+    def _sendCall(self, handler, headers, request):
+        """Send a call to the hub."""
+        return super()._sendCall(handler, headers, request)
+
+
 @backoff.on_exception(backoff.expo, koji.AuthError, max_time=600)
-def koji_login(config: 'BodhiConfig', authenticate: bool) -> koji.ClientSession:
+def koji_login(config: 'BodhiConfig', authenticate: bool) -> ClientSession:
     """
     Login to Koji and return the session.
 
@@ -661,7 +1044,7 @@ def koji_login(config: 'BodhiConfig', authenticate: bool) -> koji.ClientSession:
         'anon_retry': True,
     }
 
-    koji_client = koji.ClientSession(_koji_hub, koji_options)
+    koji_client = ClientSession(_koji_hub, koji_options)
     if authenticate and not koji_client.gssapi_login(**get_krb_conf(config)):
         log.error('Koji gssapi_login failed')
     return koji_client
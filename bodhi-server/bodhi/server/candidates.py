@@ -0,0 +1,269 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+An index of the candidate builds that can be submitted as updates.
+
+The new update form queries the ``latest_candidates`` view on every keystroke. Rather than asking
+Koji about every keystroke, the latest builds of each release tag are stored in the cache region
+for ``latest_candidates.cache_expiration`` seconds and filtered locally. The builds of a tag are
+split by the first letter of their package name, so that a keystroke only loads the builds of the
+packages that can match it, and a small entry lists the letters of the tag. That entry is dropped as
+soon as the consumer sees a build being tagged into or untagged from the tag.
+
+The NVRs of the builds that are already part of a pending update are cached in the same region,
+and are dropped whenever a committed transaction changed the status or the builds of an update.
+
+The index lives in the cache region shared by the rest of Bodhi, so the entries are only dropped
+for the processes that use the same cache backend. With the default ``dogpile.cache.dbm`` backend,
+that is the processes of the host that dropped them: the web servers of other hosts keep serving
+their entries until they expire. Deployments with several hosts should configure a cache backend
+they all share, such as memcached or redis, or keep ``latest_candidates.cache_expiration`` short.
+"""
+import typing
+
+from dogpile.cache.api import NO_VALUE
+from sqlalchemy import event
+
+from bodhi.server import get_cacheregion, log, Session
+from bodhi.server.config import config
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from dogpile.cache.region import CacheRegion  # noqa: 401
+
+
+#: The key of the cached set of NVRs of builds associated with pending updates.
+ASSOCIATED_NVRS_KEY = 'latest_candidates:associated_nvrs'
+#: The key ``session.info`` uses to remember that the associated NVRs must be invalidated.
+_SESSION_FLAG = 'candidates_changed'
+
+_region = None  # type: typing.Optional[CacheRegion]
+
+# The build fields that are exposed by the latest_candidates view.
+_BUILD_FIELDS = ('nvr', 'id', 'package_name', 'owner_name', 'tag_name')
+
+
+def _get_region() -> 'CacheRegion':
+    """
+    Return the cache region used to store the index, configuring it on first use.
+
+    Returns:
+        The configured cache region.
+    """
+    global _region
+    if _region is None:
+        _region = get_cacheregion(None)
+    return _region
+
+
+def _tag_key(tag: str) -> str:
+    """
+    Return the cache key of the given Koji tag.
+
+    Args:
+        tag: The name of the tag.
+    Returns:
+        The cache key for the letters the package names of that tag start with.
+    """
+    return f'latest_candidates:tag:{tag}'
+
+
+def _shard_key(tag: str, letter: str) -> str:
+    """
+    Return the cache key of the builds of a Koji tag whose package name starts with a letter.
+
+    Args:
+        tag: The name of the tag.
+        letter: The lower case first letter of the package names.
+    Returns:
+        The cache key for these builds.
+    """
+    return f'latest_candidates:tag:{tag}:{letter}'
+
+
+def _index_builds(builds: typing.Iterable[dict]) \
+        -> typing.Dict[str, typing.Dict[str, typing.List[dict]]]:
+    """
+    Group the given Koji builds by package name, keeping only the fields the view uses.
+
+    Args:
+        builds: Builds as returned by Koji's listTagged.
+    Returns:
+        A dictionary mapping the lower case first letters of the package names to dictionaries
+        mapping these package names to the list of their builds.
+    """
+    shards = {}  # type: typing.Dict[str, typing.Dict[str, typing.List[dict]]]
+    for build in builds:
+        slim = {field: build[field] for field in _BUILD_FIELDS if field in build}
+        name = build['package_name']
+        shards.setdefault(name[:1].lower(), {}).setdefault(name, []).append(slim)
+    return shards
+
+
+def get_tagged_builds(koji, tags: typing.Iterable[str], name: str = None) \
+        -> typing.List[typing.Dict[str, typing.List[dict]]]:
+    """
+    Return an index of the latest builds tagged into each of the given tags.
+
+    Tags that are not in the cache are queried from Koji with a single multicall. Errors returned
+    by Koji are logged and not cached, the tag is then treated as empty.
+
+    Args:
+        koji (koji.ClientSession or DevBuildsys): The Koji client to use for cache misses.
+        tags: The names of the tags to list.
+        name: If given, the index may only hold the packages starting with the same letter as this
+            package name or prefix, which are the only ones loaded from the cache.
+    Returns:
+        A list with an item for each given tag, in the same order. Each item is a dictionary
+        mapping package names to the list of their latest builds in that tag.
+    """
+    tags = list(tags)
+    if not tags:
+        return []
+
+    region = _get_region()
+    expiration = config.get('latest_candidates.cache_expiration')
+    letters = region.get_multi([_tag_key(tag) for tag in tags], expiration_time=expiration)
+
+    # Load the builds of the letters wanted from each cached tag.
+    keys = []
+    for tag, tag_letters in zip(tags, letters):
+        if tag_letters is not NO_VALUE:
+            wanted = tag_letters if name is None else set(tag_letters) & {name[:1].lower()}
+            keys.extend((tag, _shard_key(tag, letter)) for letter in sorted(wanted))
+    results = [NO_VALUE if tag_letters is NO_VALUE else {} for tag_letters in letters]
+    positions = {tag: i for i, tag in enumerate(tags)}
+    for (tag, key), shard in zip(keys, region.get_multi([key for tag, key in keys],
+                                                        expiration_time=expiration)):
+        i = positions[tag]
+        if shard is NO_VALUE:
+            # The builds of that letter expired before the letters of the tag.
+            results[i] = NO_VALUE
+        elif results[i] is not NO_VALUE:
+            results[i].update(shard)
+
+    missing = [i for i, result in enumerate(results) if result is NO_VALUE]
+    if missing:
+        log.debug(f'Listing the latest builds of {len(missing)} tags in Koji')
+        koji.multicall = True
+        for i in missing:
+            koji.listTagged(tags[i], latest=True)
+        response = koji.multiCall() or []  # Protect against None
+
+        fresh = {}
+        for i in missing:
+            results[i] = {}
+        for i, taglist in zip(missing, response):
+            # if the call to koji results in errors, it returns them
+            # in the reponse as dicts. Here we detect these, and log
+            # the errors
+            if isinstance(taglist, dict):
+                log.error('latest_candidates endpoint asked Koji about a non-existent tag:')
+                log.error(taglist)
+                continue
+            shards = _index_builds(taglist[0])
+            for letter, shard in shards.items():
+                fresh[_shard_key(tags[i], letter)] = shard
+                if name is None or letter == name[:1].lower():
+                    results[i].update(shard)
+            fresh[_tag_key(tags[i])] = tuple(shards)
+        if fresh:
+            region.set_multi(fresh)
+
+    return results
+
+
+def filter_builds(index: typing.Dict[str, typing.List[dict]], package: str = None,
+                  prefix: str = None) -> typing.List[dict]:
+    """
+    Return the builds of an index returned by get_tagged_builds() matching a package or a prefix.
+
+    This mirrors the filtering done by Koji's listTagged: ``package`` is an exact package name,
+    ``prefix`` is a case-insensitive prefix of the package name.
+
+    Args:
+        index: A dictionary mapping package names to lists of builds.
+        package: If given, only return the builds of this package.
+        prefix: If given (and package is not), only return the builds of packages starting with
+            this prefix.
+    Returns:
+        The matching builds.
+    """
+    if package:
+        return list(index.get(package, []))
+    if prefix:
+        prefix = prefix.lower()
+        return [build for name, builds in index.items() if name.lower().startswith(prefix)
+                for build in builds]
+    return [build for builds in index.values() for build in builds]
+
+
+def get_associated_build_nvrs(creator: typing.Callable[[], typing.Iterable[str]]) \
+        -> typing.FrozenSet[str]:
+    """
+    Return the cached set of NVRs of builds associated with pending updates.
+
+    Args:
+        creator: A callable returning the NVRs from the database, used on cache misses.
+    Returns:
+        The NVRs of builds associated with pending updates.
+    """
+    expiration = config.get('latest_candidates.cache_expiration')
+    return _get_region().get_or_create(
+        ASSOCIATED_NVRS_KEY, lambda: frozenset(creator()), expiration_time=expiration)
+
+
+def invalidate_tag(tag: str):
+    """
+    Drop the cached builds of the given tag.
+
+    Args:
+        tag: The name of the tag whose content changed.
+    """
+    _get_region().delete(_tag_key(tag))
+
+
+def invalidate_associated_build_nvrs():
+    """Drop the cached NVRs of builds associated with pending updates."""
+    _get_region().delete(ASSOCIATED_NVRS_KEY)
+
+
+def associated_builds_changed():
+    """
+    Flag the current database session as having changed the builds of pending updates.
+
+    The cached NVRs are dropped once the session commits, so that concurrent requests can't put
+    the old data back into the cache before the change is visible to them.
+    """
+    Session().info[_SESSION_FLAG] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_after_commit(session):
+    """
+    Drop the cached NVRs of builds associated with pending updates if the session changed them.
+
+    Args:
+        session (sqlalchemy.orm.session.Session): The session that was committed.
+    """
+    if session.info.pop(_SESSION_FLAG, False):
+        invalidate_associated_build_nvrs()
+
+
+def invalidate():
+    """Drop all the entries of the index from this process."""
+    _get_region().invalidate()
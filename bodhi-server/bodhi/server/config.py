@@ -127,6 +127,23 @@ def _generate_list_validator(
     return _validate_list
 
 
+def _generate_choice_validator(choices: typing.Sequence[str]) -> typing.Callable[[str], str]:
+    """Return a function that ensures a value is one of the given choices.
+
+    Args:
+        choices: The allowed values.
+    Returns:
+        A validator function that accepts an argument to be validated.
+    """
+    def _validate_choice(value: str) -> str:
+        value = str(value).strip()
+        if value not in choices:
+            raise ValueError(f'"{value}" is not one of {", ".join(choices)}.')
+        return value
+
+    return _validate_choice
+
+
 def _validate_bool(value: typing.Union[str, bool]) -> bool:
     """Return a bool version of value.
 
@@ -271,6 +288,9 @@ class BodhiConfig(dict):
             # Defined in and tied to the Fedora Account System (limited to 16 characters)
             'value': ['provenpackager', 'releng', 'security_respons'],
             'validator': _generate_list_validator()},
+        'approve_testing_batch_size': {
+            'value': 100,
+            'validator': int},
         'authtkt.secret': {
             'value': 'CHANGEME',
             'validator': _validate_secret},
@@ -330,12 +350,39 @@ class BodhiConfig(dict):
         'celery_config': {
             'value': '/etc/bodhi/celeryconfig.py',
             'validator': str},
+        'check_signed_builds_batch_size': {
+            'value': 500,
+            'validator': int},
         'check_signed_builds_delay': {
             'value': 2,
             'validator': int},
         'clean_old_composes': {
             'value': True,
             'validator': _validate_bool},
+        'clean_old_composes.max_files_per_second': {
+            'value': 0,
+            'validator': int},
+        'clean_old_composes.workers': {
+            'value': 4,
+            'validator': int},
+        'compose_scheduler.default_duration': {
+            'value': 3600,
+            'validator': int},
+        'compose_scheduler.io_bound': {
+            'value': True,
+            'validator': _validate_bool},
+        'consumer.dedupe.max_size': {
+            'value': 100000,
+            'validator': int},
+        'consumer.dedupe.persist': {
+            'value': False,
+            'validator': _validate_bool},
+        'consumer.dedupe.ttl': {
+            'value': 0,
+            'validator': int},
+        'consumer.dispatch_exchange': {
+            'value': '',
+            'validator': str},
         'container.destination_registry': {
             'value': 'registry.fedoraproject.org',
             'validator': str},
@@ -386,12 +433,21 @@ class BodhiConfig(dict):
         'exclude_mail': {
             'value': [],
             'validator': _generate_list_validator()},
+        'expire_overrides_batch_size': {
+            'value': 500,
+            'validator': int},
         'file_url': {
             'value': 'https://download.fedoraproject.org/pub/fedora/linux/updates',
             'validator': str},
         'fmn_url': {
             'value': 'https://apps.fedoraproject.org/notifications/',
             'validator': str},
+        'identity_cache.max_size': {
+            'value': 10000,
+            'validator': int},
+        'identity_cache.ttl': {
+            'value': 30,
+            'validator': int},
         'important_groups': {
             # Defined in and tied to the Fedora Account System (limited to 16 characters)
             'value': ['proventesters', 'provenpackager', 'releng', 'security_respons', 'packager',
@@ -419,6 +475,9 @@ class BodhiConfig(dict):
         'koji_hub': {
             'value': 'https://koji.stg.fedoraproject.org/kojihub',
             'validator': str},
+        'koji_prefetch_batch_size': {
+            'value': 100,
+            'validator': int},
         'krb_ccache': {
             'value': None,
             'validator': _validate_none_or(str)},
@@ -428,6 +487,9 @@ class BodhiConfig(dict):
         'krb_principal': {
             'value': None,
             'validator': _validate_none_or(str)},
+        'latest_candidates.cache_expiration': {
+            'value': 60,
+            'validator': int},
         'legal_link': {
             'value': '',
             'validator': str},
@@ -440,6 +502,12 @@ class BodhiConfig(dict):
         'libravatar_prefer_tls': {
             'value': True,
             'validator': bool},
+        'mail.batch_size': {
+            'value': 100,
+            'validator': int},
+        'mail.queue': {
+            'value': False,
+            'validator': _validate_bool},
         'mail.templates_basepath': {
             'value': 'bodhi.server:email/templates/',
             'validator': str},
@@ -518,6 +586,27 @@ class BodhiConfig(dict):
         'privacy_link': {
             'value': '',
             'validator': str},
+        'profiling.composes': {
+            'value': False,
+            'validator': _validate_bool},
+        'profiling.directory': {
+            'value': '',
+            'validator': str},
+        'profiling.format': {
+            'value': 'pstats',
+            'validator': _generate_choice_validator(('pstats', 'collapsed'))},
+        'profiling.sample_rate': {
+            'value': 0.0,
+            'validator': float},
+        'publisher.batch_size': {
+            'value': 100,
+            'validator': int},
+        'publisher.outbox': {
+            'value': False,
+            'validator': _validate_bool},
+        'publisher.queue_size': {
+            'value': 0,
+            'validator': int},
         'pungi.basepath': {
             'value': '/etc/bodhi',
             'validator': str},
@@ -536,15 +625,30 @@ class BodhiConfig(dict):
         'pungi.labeltype': {
             'value': 'Update',
             'validator': str},
+        'querystats.repeat_threshold': {
+            'value': 50,
+            'validator': int},
+        'querystats.slow_threshold': {
+            'value': 1.0,
+            'validator': float},
         'query_wiki_test_cases': {
             'value': False,
             'validator': _validate_bool},
         'release_team_address': {
             'value': 'bodhiadmin-members@fedoraproject.org',
             'validator': str},
+        'server_timing': {
+            'value': False,
+            'validator': _validate_bool},
         'session.secret': {
             'value': 'CHANGEME',
             'validator': _validate_secret},
+        'signed_handler.batch_size': {
+            'value': 500,
+            'validator': int},
+        'signed_handler.batch_window': {
+            'value': 0.0,
+            'validator': float},
         'skopeo.cmd': {
             'value': '/usr/bin/skopeo',
             'validator': str,
@@ -616,6 +720,24 @@ class BodhiConfig(dict):
         'wait_for_repo_sig': {
             'value': False,
             'validator': _validate_bool},
+        'wait_for_repo_sig.poll_interval': {
+            'value': 30,
+            'validator': int},
+        'wait_for_repo_sig.timeout': {
+            'value': 0,
+            'validator': int},
+        'wait_for_sync.expected_duration': {
+            'value': 600,
+            'validator': int},
+        'wait_for_sync.max_interval': {
+            'value': 200,
+            'validator': int},
+        'wait_for_sync.min_interval': {
+            'value': 15,
+            'validator': int},
+        'wait_for_sync.quorum': {
+            'value': 0,
+            'validator': int},
         'warm_cache_on_start': {
             'value': True,
             'validator': _validate_bool},
@@ -20,19 +20,32 @@ fedora-messaging consumer.
 
 This module is responsible for consuming the messaging from the fedora-messaging bus.
 It has the role to inspect the topics of the message and call the correct handler.
+
+When ``consumer.dispatch_exchange`` is set, the messages are spread over several consumers by
+:mod:`bodhi.server.consumers.dispatch`, each of them only acknowledging a message once it was
+handled. When ``consumer.dedupe.ttl`` is set, the
+messages that were already handled are skipped by a
+:class:`~bodhi.server.consumers.dedupe.DedupeStore`. When ``signed_handler.batch_window`` is set,
+the buildsys.tag messages are handled in batches, pulled from the queue by a
+:class:`~bodhi.server.consumers.util.QueuePrefetcher` and only acknowledged once they were handled.
 """
 from collections import namedtuple
 import logging
+import typing
 
 import fedora_messaging
 
 from bodhi.server import bugs, buildsys, initialize_db
 from bodhi.server.config import config
 from bodhi.server.consumers.automatic_updates import AutomaticUpdateHandler
+from bodhi.server.consumers.candidates import CandidatesHandler
+from bodhi.server.consumers.dedupe import DedupeStore
 from bodhi.server.consumers.signed import SignedHandler
 from bodhi.server.consumers.ci import CIHandler
 from bodhi.server.consumers.resultsdb import ResultsdbHandler
+from bodhi.server.consumers.util import QueuePrefetcher
 from bodhi.server.consumers.waiverdb import WaiverdbHandler
+from bodhi.server.consumers import dispatch
 
 
 log = logging.getLogger('bodhi')
@@ -51,30 +64,144 @@ class Consumer:
         buildsys.setup_buildsystem(config)
         bugs.set_bugtracker()
 
+        self.signed_handler = SignedHandler()
         self.handler_infos = [
-            HandlerInfo('.buildsys.tag', "Signed", SignedHandler()),
+            HandlerInfo('.buildsys.tag', "Signed", self.signed_handler),
             HandlerInfo('.buildsys.tag', 'Automatic Update', AutomaticUpdateHandler()),
+            HandlerInfo('.buildsys.tag', 'Candidates', CandidatesHandler()),
+            HandlerInfo('.buildsys.untag', 'Candidates', CandidatesHandler()),
             HandlerInfo('.ci.koji-build.test.running', 'CI', CIHandler()),
             HandlerInfo('.waiverdb.waiver.new', 'WaiverDB', WaiverdbHandler()),
             HandlerInfo('.resultsdb.result.new', 'ResultsDB', ResultsdbHandler()),
         ]
 
+        self.dedupe = None
+        if config['consumer.dedupe.ttl']:
+            self.dedupe = DedupeStore(
+                ttl=config['consumer.dedupe.ttl'], max_size=config['consumer.dedupe.max_size'],
+                persist=config['consumer.dedupe.persist'])
+
+        self.prefetcher = None
+        if config['signed_handler.batch_window']:
+            self.prefetcher = QueuePrefetcher()
+
     def __call__(self, msg: fedora_messaging.api.Message):  # noqa: D401
         """
         Callback method called by fedora-messaging consume.
 
-        Redirect messages to the correct handler using the
-        message topic.
+        Handle the message, or dispatch it to the consumers of ``consumer.dispatch_exchange`` if
+        it is set and the message was not dispatched already.
 
         Args:
             msg: The message received from the broker.
+        Raises:
+            fedora_messaging.exceptions.Nack: If the message could not be handled or dispatched.
         """
         log.info(f'Received message from fedora-messaging with topic: {msg.topic}')
+        if config['consumer.dispatch_exchange'] and not dispatch.is_dispatched(msg):
+            dispatch.dispatch(msg, config['consumer.dispatch_exchange'])
+            return
+        dispatch.observe_lag(msg)
+        try:
+            if self.prefetcher is not None and msg.queue and msg.topic.endswith('.buildsys.tag'):
+                self.handle_batch(msg)
+            else:
+                self.handle(msg)
+        except fedora_messaging.exceptions.Nack:
+            dispatch.MESSAGES.labels(result='failed').inc()
+            raise
+        dispatch.MESSAGES.labels(result='processed').inc()
+
+    def handle(self, msg: fedora_messaging.api.Message):
+        """
+        Redirect messages to the correct handler using the message topic.
+
+        Args:
+            msg: The message received from the broker.
+        Raises:
+            fedora_messaging.exceptions.Nack: If any of the handlers failed.
+        """
+        if self._is_duplicate(msg):
+            return
+        self._done(msg, self._run_handlers(msg))
+
+    def handle_batch(self, msg: fedora_messaging.api.Message):
+        """
+        Handle a buildsys.tag message together with the tag messages following it in its queue.
+
+        Up to ``signed_handler.batch_size`` messages received within ``signed_handler.batch_window``
+        seconds are pulled from the queue without being acknowledged. The signed handler handles
+        all of them in a single transaction, and then the other handlers handle each of them. The
+        pulled messages are acknowledged once they were handled, and the failed ones are returned
+        to the queue.
+
+        Args:
+            msg: The message received from the broker.
+        Raises:
+            fedora_messaging.exceptions.Nack: If any of the handlers failed on that message.
+        """
+        pulled = self.prefetcher.pull(
+            msg.queue, '.buildsys.tag', config['signed_handler.batch_size'] - 1,
+            config['signed_handler.batch_window'])
+        messages = [msg] + [message for delivery_tag, message in pulled]
+        todo = [index for index, message in enumerate(messages) if not self._is_duplicate(message)]
+        errors = {index: [] for index in todo}
+
+        try:
+            failed = self.signed_handler.handle_messages([messages[index] for index in todo])
+        except Exception as e:
+            log.exception(f'Unable to handle a batch of {len(todo)} messages in Signed handler')
+            failed = {index: e for index in range(len(todo))}
+        for index, e in failed.items():
+            errors[todo[index]].append(('Signed', str(e)))
+        for index in todo:
+            errors[index].extend(self._run_handlers(messages[index], skip=self.signed_handler))
+
+        done = []
+        returned = []
+        for index, (delivery_tag, message) in enumerate(pulled, 1):
+            try:
+                self._done(message, errors.get(index, []))
+            except fedora_messaging.exceptions.Nack as e:
+                log.error(str(e))
+                dispatch.MESSAGES.labels(result='failed').inc()
+                returned.append(delivery_tag)
+            else:
+                dispatch.MESSAGES.labels(result='processed').inc()
+                done.append(delivery_tag)
+        self.prefetcher.settle(done, returned)
+        self._done(msg, errors.get(0, []))
+
+    def _is_duplicate(self, msg: fedora_messaging.api.Message) -> bool:
+        """
+        Return whether the given message was already handled.
+
+        Args:
+            msg: The message received from the broker.
+        Returns:
+            True if the message must be skipped, False otherwise.
+        """
+        if self.dedupe is not None and self.dedupe.is_duplicate(msg):
+            log.info(f'Skipping message {msg.id}, it was already handled')
+            return True
+        return False
+
+    def _run_handlers(
+            self, msg: fedora_messaging.api.Message,
+            skip: typing.Optional[object] = None) -> typing.List[typing.Tuple[str, str]]:
+        """
+        Pass a message to the handlers of its topic.
 
+        Args:
+            msg: The message received from the broker.
+            skip: A handler not to pass the message to, as it already handled it.
+        Returns:
+            The name of each handler that failed, and its error.
+        """
         error_handlers_msgs = []
 
         for handler_info in self.handler_infos:
-            if not msg.topic.endswith(handler_info.topic_suffix):
+            if not msg.topic.endswith(handler_info.topic_suffix) or handler_info.handler is skip:
                 continue
             log.debug(f'Passing message to the {handler_info.name} handler')
             try:
@@ -83,10 +210,30 @@ class Consumer:
                 log.exception(f'{str(e)}: Unable to handle message in {handler_info.name} handler: '
                               f'{msg}')
                 error_handlers_msgs.append((handler_info.name, str(e)))
+        return error_handlers_msgs
+
+    def _done(self, msg: fedora_messaging.api.Message,
+              error_handlers_msgs: typing.List[typing.Tuple[str, str]]):
+        """
+        Remember that a message was handled, unless any of its handlers failed.
 
+        Args:
+            msg: The message received from the broker.
+            error_handlers_msgs: The name of each handler that failed, and its error.
+        Raises:
+            fedora_messaging.exceptions.Nack: If any of the handlers failed.
+        """
         if error_handlers_msgs:
             error_msg = "Unable to (fully) handle message.\nAffected handlers:\n"
             for handler, exc in error_handlers_msgs:
                 error_msg += f"\t{handler}: {exc}\n"
             error_msg += "Message:\n{msg}"
             raise fedora_messaging.exceptions.Nack(error_msg)
+
+        if self.dedupe is not None:
+            try:
+                self.dedupe.remember(msg)
+            except Exception:
+                # The message was handled, failing to remember it only means it is handled again
+                # if it is delivered again.
+                log.exception(f'Unable to remember that message {msg.id} was handled')
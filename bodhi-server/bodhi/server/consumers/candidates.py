@@ -0,0 +1,58 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+The "candidates handler".
+
+This module is responsible for dropping the cached latest builds of a Koji tag
+when a build is tagged into it or untagged from it, so that the new update form
+suggests up-to-date candidate builds.
+"""
+
+import logging
+
+import fedora_messaging
+
+from bodhi.server import candidates
+
+log = logging.getLogger(__name__)
+
+
+class CandidatesHandler:
+    """
+    The Bodhi Candidates Handler.
+
+    A fedora-messaging listener waiting for messages from koji about builds being
+    tagged or untagged.
+    """
+
+    def __call__(self, message: fedora_messaging.api.Message):
+        """
+        Handle messages arriving with the configured topic.
+
+        Duplicate messages: this method is idempotent.
+
+        Args:
+            message: The incoming message.
+        """
+        tag = message.body.get('tag')
+        if not tag:
+            log.debug("Ignoring message without tag.")
+            return
+
+        log.debug(f"Dropping the cached candidate builds of {tag}")
+        candidates.invalidate_tag(tag)
@@ -0,0 +1,165 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Skip the messages the consumer already handled.
+
+A message is a duplicate if a message with the same id, or about the same event, was handled in
+the last ``consumer.dedupe.ttl`` seconds. The event of a message is the build and the tag of the
+``buildsys`` messages, and the id of the result or of the waiver of the ResultsDB and WaiverDB
+messages. Only the messages that were fully handled are remembered, so the messages that failed
+are handled again when they are delivered again.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import logging
+import threading
+import time
+import typing
+
+from prometheus_client import Counter
+import fedora_messaging
+
+from bodhi.server.models import ProcessedMessage
+from bodhi.server.util import transactional_session_maker
+
+
+log = logging.getLogger('bodhi')
+
+DUPLICATES = Counter(
+    'bodhi_consumer_duplicate_messages',
+    'Messages skipped by the consumer because they were already handled',
+    labelnames=['key'],
+)
+
+# How often the expired messages are deleted from the database, in seconds.
+_PURGE_INTERVAL = 60
+
+
+def message_keys(message: fedora_messaging.api.Message) \
+        -> typing.List[typing.Tuple[str, str, str]]:
+    """
+    Return the keys identifying the given message.
+
+    Args:
+        message: The message to identify.
+    Returns:
+        A list of tuples with the kind of key, the key, and the value that must be remembered for
+        the key to be considered a duplicate.
+    """
+    keys = [('message_id', f'id:{message.id}', '')]
+    body = message.body if isinstance(message.body, dict) else {}
+    topic = message.topic or ''
+    if '.buildsys.' in topic and all(f in body for f in ('name', 'version', 'release', 'tag')):
+        # Tagging a build again after it was untagged is not a duplicate, so the action is the
+        # value of the key.
+        keys.append(('semantic', 'buildsys:{name}-{version}-{release}:{tag}'.format(**body),
+                     topic.rsplit('.', 1)[-1]))
+    elif topic.endswith(('.resultsdb.result.new', '.waiverdb.waiver.new')) and body.get('id'):
+        keys.append(('semantic', f"{topic.rsplit('.', 3)[-3]}:{body['id']}", ''))
+    return keys
+
+
+class DedupeStore:
+    """Remember the keys of the handled messages for some time, in memory and in the database."""
+
+    def __init__(self, ttl: int, max_size: int, persist: bool = False):
+        """
+        Initialize the store.
+
+        Args:
+            ttl: How many seconds the messages are remembered.
+            max_size: How many keys are remembered in memory, the oldest ones are forgotten first.
+            persist: Whether to also remember the keys in the database, so they are shared by the
+                consumer processes and survive restarts.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.persist = persist
+        self.db_factory = transactional_session_maker()
+        self._lock = threading.Lock()
+        # Map the keys to their value and the monotonic time they expire at, oldest first.
+        self._keys = OrderedDict()  # type: OrderedDict[str, typing.Tuple[str, float]]
+        self._last_purge = None  # type: typing.Optional[float]
+
+    def is_duplicate(self, message: fedora_messaging.api.Message) -> bool:
+        """
+        Return whether the given message, or another one about the same event, was handled.
+
+        Args:
+            message: The message to check.
+        Returns:
+            True if the message is a duplicate.
+        """
+        keys = message_keys(message)
+        now = time.monotonic()
+        with self._lock:
+            for kind, key, value in keys:
+                remembered = self._keys.get(key)
+                if remembered and remembered[0] == value and remembered[1] > now:
+                    DUPLICATES.labels(key=kind).inc()
+                    return True
+        if not self.persist:
+            return False
+
+        with self.db_factory() as db:
+            expired = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            values = dict(db.query(ProcessedMessage.key, ProcessedMessage.value).filter(
+                ProcessedMessage.key.in_([key for kind, key, value in keys]),
+                ProcessedMessage.date_created > expired))
+        for kind, key, value in keys:
+            if values.get(key) == value:
+                DUPLICATES.labels(key=kind).inc()
+                return True
+        return False
+
+    def remember(self, message: fedora_messaging.api.Message):
+        """
+        Remember that the given message was handled.
+
+        Args:
+            message: The message that was handled.
+        """
+        keys = message_keys(message)
+        now = time.monotonic()
+        with self._lock:
+            for kind, key, value in keys:
+                self._keys.pop(key, None)
+                self._keys[key] = (value, now + self.ttl)
+            while len(self._keys) > self.max_size \
+                    or (self._keys and next(iter(self._keys.values()))[1] <= now):
+                self._keys.popitem(last=False)
+            purge = self._last_purge is None or now - self._last_purge >= _PURGE_INTERVAL
+            if purge:
+                self._last_purge = now
+        if not self.persist:
+            return
+
+        with self.db_factory() as db:
+            date = datetime.now(timezone.utc)
+            if purge:
+                db.query(ProcessedMessage).filter(
+                    ProcessedMessage.date_created <= date - timedelta(seconds=self.ttl)
+                ).delete(synchronize_session=False)
+            remembered = {pm.key: pm for pm in db.query(ProcessedMessage).filter(
+                ProcessedMessage.key.in_([key for kind, key, value in keys]))}
+            for kind, key, value in keys:
+                if key in remembered:
+                    remembered[key].value = value
+                    remembered[key].date_created = date
+                else:
+                    db.add(ProcessedMessage(key=key, value=value, date_created=date))
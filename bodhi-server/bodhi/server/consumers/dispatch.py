@@ -0,0 +1,150 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Spread the messages over several consumers, keeping the messages about the same build in order.
+
+fedora-messaging calls the consumer with one message at a time, and acknowledges it once the
+consumer returned. To handle the messages in parallel without acknowledging them before they are
+handled, the consumer subscribed to the Bodhi topics can dispatch them instead: it republishes each
+message to ``consumer.dispatch_exchange`` with an ordering key header, and only returns once the
+broker confirmed it. That exchange is a consistent-hash exchange routing on this header, so the
+messages about the same build or update always reach the same queue. Each of its queues is consumed
+by a single consumer process, which handles the messages one at a time and acknowledges them once
+they were handled and committed.
+"""
+from datetime import datetime, timezone
+import logging
+import typing
+
+from prometheus_client import Counter, Histogram
+import fedora_messaging
+
+
+log = logging.getLogger('bodhi')
+
+MESSAGES = Counter(
+    'bodhi_consumer_messages',
+    'Messages handled or dispatched by the consumer',
+    labelnames=['result'],
+)
+LAG = Histogram(
+    'bodhi_consumer_lag_seconds',
+    'Time between a message being sent and the consumer starting to handle it',
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200, 14400, float('inf')),
+)
+
+#: The header holding the ordering key of the dispatched messages, which the dispatch exchange
+#: hashes to route them.
+ORDERING_HEADER = 'bodhi_ordering_key'
+
+
+def ordering_key(message: fedora_messaging.api.Message) -> str:
+    """
+    Return the key of the messages that must be handled in order with the given one.
+
+    This is the NVR of the build or the alias of the update the message is about, or the message
+    id if it is about neither.
+
+    Args:
+        message: The message to find the key of.
+    Returns:
+        The ordering key of the message.
+    """
+    body = message.body if isinstance(message.body, dict) else {}
+    if all(field in body for field in ('name', 'version', 'release')):
+        # buildsys.tag and buildsys.untag
+        return '{name}-{version}-{release}'.format(**body)
+    if isinstance(body.get('artifact'), dict) and body['artifact'].get('nvr'):
+        # ci.koji-build
+        return body['artifact']['nvr']
+    # waiverdb.waiver.new and resultsdb.result.new
+    item = body.get('subject') or (body.get('data') if isinstance(body.get('data'), dict) else None)
+    if isinstance(item, dict):
+        item = item.get('nvr') or item.get('item')
+        if isinstance(item, list):
+            item = item[0] if item else None
+        if isinstance(item, str) and item:
+            return item
+    return message.id
+
+
+def _lag(message: fedora_messaging.api.Message) -> typing.Optional[float]:
+    """
+    Return how many seconds ago the given message was sent.
+
+    Args:
+        message: The message.
+    Returns:
+        The age of the message, or None if it has no valid sent-at header.
+    """
+    try:
+        sent_at = datetime.fromisoformat(message._headers['sent-at'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+    if sent_at.tzinfo is None:
+        sent_at = sent_at.replace(tzinfo=timezone.utc)
+    return max((datetime.now(timezone.utc) - sent_at).total_seconds(), 0)
+
+
+def is_dispatched(message: fedora_messaging.api.Message) -> bool:
+    """
+    Return whether the given message was dispatched by another consumer.
+
+    Args:
+        message: The message.
+    Returns:
+        True if the message holds an ordering key header, False otherwise.
+    """
+    return ORDERING_HEADER in message._headers
+
+
+def dispatch(message: fedora_messaging.api.Message, exchange: str):
+    """
+    Republish a message to the dispatch exchange, with its ordering key as a header.
+
+    This only returns once the broker confirmed the message, so that the received message can be
+    acknowledged.
+
+    Args:
+        message: The message to dispatch.
+        exchange: The name of the consistent-hash exchange routing the messages to the consumers.
+    Raises:
+        fedora_messaging.exceptions.Nack: If the message could not be published, so that it is
+            returned to the broker and delivered again.
+    """
+    message._headers[ORDERING_HEADER] = ordering_key(message)
+    try:
+        fedora_messaging.api.publish(message, exchange=exchange)
+    except (fedora_messaging.exceptions.PublishException,
+            fedora_messaging.exceptions.ConnectionException) as e:
+        del message._headers[ORDERING_HEADER]
+        log.warning(f'Unable to dispatch message {message.id}: {e}')
+        raise fedora_messaging.exceptions.Nack(f'Unable to dispatch message {message.id}') from e
+    MESSAGES.labels(result='dispatched').inc()
+
+
+def observe_lag(message: fedora_messaging.api.Message):
+    """
+    Record how long ago the given message was sent, if it tells.
+
+    Args:
+        message: The message about to be handled.
+    """
+    lag = _lag(message)
+    if lag is not None:
+        LAG.observe(lag)
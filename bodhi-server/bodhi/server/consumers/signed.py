@@ -23,12 +23,13 @@ from the pending-signing to pending-updates-testing tag by RoboSignatory.
 """
 
 import logging
+import typing
 
 import fedora_messaging
 from sqlalchemy import func
 
 from bodhi.server.config import config
-from bodhi.server.models import Build, UpdateRequest, UpdateStatus, TestGatingStatus
+from bodhi.server.models import Build, Update, UpdateRequest, UpdateStatus, TestGatingStatus
 from bodhi.server.util import transactional_session_maker
 
 log = logging.getLogger('bodhi')
@@ -39,6 +40,10 @@ class SignedHandler(object):
     The Bodhi Signed Handler.
 
     A fedora-messaging listener waiting for messages from koji about builds being tagged.
+
+    When ``signed_handler.batch_window`` is set, the consumer pulls the tag messages following the
+    one it received, and passes them all to :meth:`handle_messages`: their builds are fetched with a
+    single query, and each affected update is evaluated once per batch rather than once per build.
     """
 
     def __init__(self):
@@ -73,9 +78,7 @@ class SignedHandler(object):
         Args:
             message: The incoming message in the format described above.
         """
-        message = message.body
-        build_nvr = '%(name)s-%(version)s-%(release)s' % message
-        tag = message['tag']
+        build_nvr, tag = self.build_of(message)
 
         log.info("%s tagged into %s" % (build_nvr, tag))
 
@@ -85,59 +88,193 @@ class SignedHandler(object):
                 log.info("Build was not submitted, skipping")
                 return
 
-            if not build.release:
-                log.info('Build is not assigned to release, skipping')
+            if not self._mark_signed(build, tag):
                 return
+            dbsession.flush()
+            log.info("Build %s has been marked as signed" % build_nvr)
 
-            if build.update \
-                    and build.update.from_tag \
-                    and not build.update.release.composed_by_bodhi:
-                koji_testing_tag = build.release.get_pending_testing_side_tag(build.update.from_tag)
-                if tag != koji_testing_tag:
-                    log.info("Tag is not testing side tag, skipping")
-                    return
-            elif build.release.pending_testing_tag != tag:
-                log.info("Tag is not pending_testing tag, skipping")
-                return
+            if build.update:
+                self._update_signed(dbsession, build.update)
 
-            if build.signed:
-                log.info("Build was already marked as signed (maybe a duplicate message)")
-                return
+    @staticmethod
+    def build_of(message: fedora_messaging.api.Message) -> typing.Tuple[str, str]:
+        """
+        Return the build a message is about, and the tag it was tagged into.
 
-            # This build was moved into the pending_testing tag for the applicable release, which
-            # is done by RoboSignatory to indicate that the build has been correctly signed and
-            # written out. Mark it as such.
-            log.info("Build has been signed, marking")
-            build.signed = True
-            dbsession.flush()
-            log.info("Build %s has been marked as signed" % build_nvr)
+        Args:
+            message: A buildsys.tag message.
+        Returns:
+            The NVR of the build, and the tag.
+        Raises:
+            KeyError: If the message is missing a field.
+        """
+        return '%(name)s-%(version)s-%(release)s' % message.body, message.body['tag']
 
-            # Finally, set request to testing for non-rawhide side-tag updates
-            if build.update \
-                    and build.update.release.composed_by_bodhi \
-                    and build.update.from_tag \
-                    and build.update.signed:
-                log.info(f"Setting request for new side-tag update {build.update.alias}.")
-                req = UpdateRequest.testing
-                build.update.set_request(dbsession, req, 'bodhi')
-                return
+    def handle_messages(
+            self, messages: typing.List[fedora_messaging.api.Message]
+    ) -> typing.Dict[int, Exception]:
+        """
+        Handle the given messages as one batch, in a single transaction.
+
+        Args:
+            messages: The buildsys.tag messages.
+        Returns:
+            The exception raised when handling each message that failed, by its index in messages.
+        Raises:
+            Exception: If the batch could not be committed, in which case all the messages failed.
+        """
+        errors = {}
+        builds = []
+        indexes = []
+        for index, message in enumerate(messages):
+            try:
+                builds.append(self.build_of(message))
+            except (KeyError, TypeError) as e:
+                log.error(f'Unable to find the build of message {message.id}: {e!r}')
+                errors[index] = e
+                continue
+            indexes.append(index)
+        if builds:
+            errors.update(
+                (indexes[index], e) for index, e in self.handle_batch(builds).items())
+        return errors
+
+    def handle_batch(
+            self, builds: typing.List[typing.Tuple[str, str]]) -> typing.Dict[int, Exception]:
+        """
+        Mark the given builds as signed, and evaluate each of their updates once.
+
+        The builds of each update are handled in a savepoint, so that a failure only fails the
+        builds of that update.
+
+        Args:
+            builds: The NVR of each build, and the tag it was tagged into.
+        Returns:
+            The exception raised when handling each build that failed, by its index in builds.
+        """
+        log.info(f'Handling a batch of {len(builds)} tagged builds')
+        errors = {}
+        with self.db_factory() as dbsession:
+            known = {build.nvr: build for build in
+                     Build.query.filter(Build.nvr.in_({nvr for nvr, tag in builds}))}
+            # The builds of each update, or each build that is not part of an update.
+            groups = {}
+            for index, (nvr, tag) in enumerate(builds):
+                build = known.get(nvr)
+                if not build:
+                    log.info(f"Build {nvr} was not submitted, skipping")
+                    continue
+                groups.setdefault(build.update or build, []).append((index, build, tag))
+
+            for group in groups.values():
+                try:
+                    self._handle_group(dbsession, group)
+                except Exception as e:
+                    log.exception(f"Unable to handle the builds "
+                                  f"{', '.join(build.nvr for index, build, tag in group)}")
+                    errors.update((index, e) for index, build, tag in group)
+        return errors
+
+    def _handle_group(self, dbsession, group: typing.List[typing.Tuple[int, Build, str]]):
+        """
+        Mark the given builds of the same update as signed, and evaluate the update, in a savepoint.
+
+        Args:
+            dbsession (sqlalchemy.orm.session.Session): The database session.
+            group: The index in the batch of each build, the build, and the tag it was tagged into.
+        """
+        # Releasing the savepoint emits after_commit, which would publish the queued messages before
+        # the batch is committed. Keep them aside, and drop the ones of the group if it fails.
+        queued = dbsession.info.get('messages', [])
+        dbsession.info['messages'] = []
+        savepoint = dbsession.begin_nested()
+        try:
+            marked = []
+            for index, build, tag in group:
+                if self._mark_signed(build, tag):
+                    marked.append(build)
+            if marked:
+                dbsession.flush()
+                log.info(f"Builds {', '.join(b.nvr for b in marked)} have been marked as signed")
+                if marked[0].update:
+                    self._update_signed(dbsession, marked[0].update)
+        except Exception:
+            savepoint.rollback()
+            dbsession.info['messages'] = queued
+            raise
+        messages = dbsession.info['messages']
+        dbsession.info['messages'] = []
+        savepoint.commit()
+        dbsession.info['messages'] = queued + messages
+
+    def _mark_signed(self, build: Build, tag: str) -> bool:
+        """
+        Mark the given build as signed, if the tag it was tagged into means it was signed.
+
+        Args:
+            build: The build that was tagged.
+            tag: The tag the build was tagged into.
+        Returns:
+            Whether the build was marked as signed.
+        """
+        if not build.release:
+            log.info('Build is not assigned to release, skipping')
+            return False
+
+        if build.update \
+                and build.update.from_tag \
+                and not build.update.release.composed_by_bodhi:
+            koji_testing_tag = build.release.get_pending_testing_side_tag(build.update.from_tag)
+            if tag != koji_testing_tag:
+                log.info("Tag is not testing side tag, skipping")
+                return False
+        elif build.release.pending_testing_tag != tag:
+            log.info("Tag is not pending_testing tag, skipping")
+            return False
+
+        if build.signed:
+            log.info("Build was already marked as signed (maybe a duplicate message)")
+            return False
+
+        # This build was moved into the pending_testing tag for the applicable release, which
+        # is done by RoboSignatory to indicate that the build has been correctly signed and
+        # written out. Mark it as such.
+        log.info("Build has been signed, marking")
+        build.signed = True
+        return True
+
+    def _update_signed(self, dbsession, update: Update):
+        """
+        Move the given update forward if all its builds are now signed.
+
+        Args:
+            dbsession (sqlalchemy.orm.session.Session): The database session.
+            update: The update of a build that was just marked as signed.
+        """
+        # Finally, set request to testing for non-rawhide side-tag updates
+        if update.release.composed_by_bodhi \
+                and update.from_tag \
+                and update.signed:
+            log.info(f"Setting request for new side-tag update {update.alias}.")
+            req = UpdateRequest.testing
+            update.set_request(dbsession, req, 'bodhi')
+            return
+
+        # For rawhide updates, if every build in update is signed change status to testing
+        if update.status != UpdateStatus.obsolete \
+                and not update.release.composed_by_bodhi \
+                and update.signed:
+            log.info("Every build in update is signed, set status to testing")
+
+            update.status = UpdateStatus.testing
+            update.date_testing = func.current_timestamp()
+            update.request = None
+            update.pushed = True
+
+            if config.get("test_gating.required"):
+                log.debug('Test gating is required, marking the update as waiting on test '
+                          'gating and updating it from Greenwave to get the real status.')
+                update.test_gating_status = TestGatingStatus.waiting
+                update.update_test_gating_status()
 
-            # For rawhide updates, if every build in update is signed change status to testing
-            if build.update \
-                    and build.update.status != UpdateStatus.obsolete \
-                    and not build.update.release.composed_by_bodhi \
-                    and build.update.signed:
-                log.info("Every build in update is signed, set status to testing")
-
-                build.update.status = UpdateStatus.testing
-                build.update.date_testing = func.current_timestamp()
-                build.update.request = None
-                build.update.pushed = True
-
-                if config.get("test_gating.required"):
-                    log.debug('Test gating is required, marking the update as waiting on test '
-                              'gating and updating it from Greenwave to get the real status.')
-                    build.update.test_gating_status = TestGatingStatus.waiting
-                    build.update.update_test_gating_status()
-
-                log.info(f"Update {build.update.alias} status has been set to testing")
+            log.info(f"Update {update.alias} status has been set to testing")
@@ -18,6 +18,14 @@
 """Utility functions for message consumers."""
 
 import logging
+import ssl
+import time
+import typing
+
+from fedora_messaging import config as messaging_config
+from fedora_messaging.exceptions import ValidationError
+from fedora_messaging.message import Message, get_message
+import pika
 
 from bodhi.server.models import Build, Update
 
@@ -76,3 +84,124 @@ def update_from_db_message(msgid: str, itemdict: dict):
         update = build.update
 
     return update
+
+
+class QueuePrefetcher:
+    """
+    Pull the messages following the one being handled from its queue, deferring their ack.
+
+    fedora-messaging hands the consumer one message at a time and acknowledges it once the consumer
+    returns. This reads the next messages of the same queue on a connection of its own, so that
+    they can be handled together with it and only acknowledged once they were handled. They are
+    returned to the queue if the connection closes before they were settled, for instance if the
+    consumer stops unexpectedly.
+    """
+
+    def __init__(self):
+        """Initialize the QueuePrefetcher, it connects to the broker on first use."""
+        self._connection = None
+        self._channel = None
+
+    def pull(self, queue: str, topic_suffix: str, max_count: int,
+             window: float) -> typing.List[typing.Tuple[int, Message]]:
+        """
+        Pull the next messages of a queue, as long as they have the given topic suffix.
+
+        This stops at the first message with another topic, which is returned to the queue, so
+        that the messages are still handled in order.
+
+        Args:
+            queue: The name of the queue.
+            topic_suffix: The suffix of the topic of the messages to pull.
+            max_count: How many messages to pull at most.
+            window: How many seconds to wait for more messages at most.
+        Returns:
+            The delivery tag of each pulled message, and the message. The caller must settle them.
+        """
+        messages = []
+        deadline = time.monotonic() + window
+        try:
+            channel = self._get_channel()
+            while len(messages) < max_count and time.monotonic() < deadline:
+                method, properties, body = channel.basic_get(queue)
+                if method is None:
+                    time.sleep(min(0.1, max(deadline - time.monotonic(), 0)))
+                    continue
+                try:
+                    message = get_message(method.routing_key, properties, body)
+                except ValidationError:
+                    log.warning(f'Dropping invalid message {properties.message_id}')
+                    channel.basic_nack(method.delivery_tag, requeue=False)
+                    continue
+                if not message.topic.endswith(topic_suffix):
+                    channel.basic_nack(method.delivery_tag, requeue=True)
+                    break
+                message.queue = queue
+                messages.append((method.delivery_tag, message))
+        except pika.exceptions.AMQPError as e:
+            # The messages pulled so far are returned to the queue with the connection.
+            log.warning(f'Unable to pull messages from {queue}: {e}')
+            self._reset()
+            return []
+        return messages
+
+    def settle(self, done: typing.Iterable[int], failed: typing.Iterable[int]):
+        """
+        Acknowledge the messages that were handled, and return the others to their queue.
+
+        Args:
+            done: The delivery tags of the messages that were handled.
+            failed: The delivery tags of the messages that failed.
+        """
+        try:
+            for delivery_tag in done:
+                self._channel.basic_ack(delivery_tag)
+            for delivery_tag in failed:
+                self._channel.basic_nack(delivery_tag, requeue=True)
+        except pika.exceptions.AMQPError as e:
+            # The unsettled messages are delivered again, and handled again as they are idempotent.
+            log.warning(f'Unable to settle the pulled messages: {e}')
+            self._reset()
+
+    def _get_channel(self) -> pika.adapters.blocking_connection.BlockingChannel:
+        """
+        Return the channel to pull the messages on, connecting to the broker if needed.
+
+        Returns:
+            The channel.
+        """
+        if self._channel is None or not self._channel.is_open:
+            self._reset()
+            parameters = pika.URLParameters(messaging_config.conf['amqp_url'])
+            if messaging_config.conf['amqp_url'].startswith('amqps'):
+                _configure_tls(parameters)
+            self._connection = pika.BlockingConnection(parameters)
+            self._channel = self._connection.channel()
+        return self._channel
+
+    def _reset(self):
+        """Close the connection to the broker, returning the unsettled messages to the queue."""
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except pika.exceptions.AMQPError:
+                pass
+
+
+def _configure_tls(parameters: pika.connection.Parameters):
+    """
+    Configure TLS on the given connection parameters, like fedora-messaging does.
+
+    Args:
+        parameters: The connection parameters to modify.
+    """
+    tls = messaging_config.conf['tls']
+    context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
+    if tls['ca_cert']:
+        context.load_verify_locations(cafile=tls['ca_cert'])
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    if tls['certfile'] and tls['keyfile']:
+        parameters.credentials = pika.credentials.ExternalCredentials()
+        context.load_cert_chain(tls['certfile'], tls['keyfile'])
+    parameters.ssl_options = pika.SSLOptions(context, server_hostname=parameters.host)
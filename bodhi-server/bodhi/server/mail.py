@@ -16,19 +16,54 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
-"""A collection of utilities for sending e-mail to Bodhi users."""
+"""
+A collection of utilities for sending e-mail to Bodhi users.
+
+The e-mails are delivered over one SMTP connection for up to ``mail.batch_size`` e-mails. When
+``mail.queue`` is True, they are delivered by a Celery task instead of the web request or the task
+that sent them.
+"""
+from contextlib import contextmanager
 import os
 import smtplib
+import threading
+import time
 import typing
 
+from prometheus_client import Counter, Histogram
+
 from bodhi.server import log
 from bodhi.server.config import config
+from bodhi.server.tasks import send_mail_task
 from bodhi.server.util import get_rpm_header, get_absolute_path, markdown_to_text, wrap_text
 
 if typing.TYPE_CHECKING:  # pragma: no cover
     from bodhi.server.models import Update  # noqa: 401
 
 
+#: The sender, the recipient and the content of an e-mail.
+Envelope = typing.Tuple[str, str, str]
+
+MAILS = Counter(
+    'bodhi_mail_messages',
+    'E-mails handed to the SMTP server',
+    labelnames=['result'],
+)
+DELIVERY_DURATION = Histogram(
+    'bodhi_mail_delivery_duration_seconds',
+    'Time to deliver a run of e-mails',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf')),
+)
+DELIVERY_SIZE = Histogram(
+    'bodhi_mail_delivery_size',
+    'E-mails per delivery run',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, float('inf')),
+)
+
+# The e-mails gathered by batched() in the current thread.
+_batch = threading.local()
+
+
 #
 # All of the email messages that bodhi is going to be sending around.
 #
@@ -343,6 +378,114 @@ def get_template(update: 'Update', use_template: str = 'fedora_errata_template')
     return templates
 
 
+def _quit(smtp: smtplib.SMTP) -> None:
+    """
+    Close an SMTP connection, which may already be broken.
+
+    Args:
+        smtp: The connection to close.
+    """
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError) as e:
+        log.debug('Unable to close the SMTP connection: %s', e)
+        smtp.close()
+
+
+def _deliver_batch(smtp_server: str, batch: typing.Sequence[Envelope]) -> int:
+    """
+    Deliver e-mails over a single connection, reconnecting after an error.
+
+    An e-mail that fails is retried once over a new connection, and the following e-mails are sent
+    over that connection. The remaining e-mails fail if the server can't be connected to.
+
+    Args:
+        smtp_server: The SMTP server to connect to.
+        batch: The e-mails to deliver.
+    Returns:
+        How many e-mails were sent.
+    """
+    sent = 0
+    smtp = None
+    retried = False
+    index = 0
+    try:
+        while index < len(batch):
+            from_addr, to_addr, body = batch[index]
+            if smtp is None:
+                try:
+                    log.debug('Connecting to %s', smtp_server)
+                    smtp = smtplib.SMTP(smtp_server)
+                except Exception:
+                    log.exception('Unable to send mail')
+                    MAILS.labels(result='failed').inc(len(batch) - index)
+                    break
+            try:
+                smtp.sendmail(from_addr, [to_addr], body.encode('utf-8'))
+            except smtplib.SMTPRecipientsRefused as e:
+                log.warning('"recipient refused" for %r, %r' % (to_addr, e))
+                MAILS.labels(result='refused').inc()
+            except Exception:
+                # The connection may be broken, or left in an unknown state.
+                _quit(smtp)
+                smtp = None
+                if not retried:
+                    log.warning('Unable to send mail to %r, retrying over a new connection',
+                                to_addr, exc_info=True)
+                    retried = True
+                    continue
+                log.exception('Unable to send mail')
+                MAILS.labels(result='failed').inc()
+            else:
+                MAILS.labels(result='sent').inc()
+                sent += 1
+            retried = False
+            index += 1
+    finally:
+        if smtp is not None:
+            _quit(smtp)
+    return sent
+
+
+def deliver(envelopes: typing.Sequence[Envelope]) -> None:
+    """
+    Deliver e-mails with smtplib, reusing the connections for up to ``mail.batch_size`` e-mails.
+
+    Args:
+        envelopes: The e-mails to deliver.
+    """
+    smtp_server = config.get('smtp_server')
+    if not smtp_server:
+        log.info('Not sending email: No smtp_server defined')
+        return
+    start = time.monotonic()
+    batch_size = config['mail.batch_size']
+    sent = 0
+    for i in range(0, len(envelopes), batch_size):
+        sent += _deliver_batch(smtp_server, envelopes[i:i + batch_size])
+    duration = time.monotonic() - start
+    DELIVERY_DURATION.observe(duration)
+    DELIVERY_SIZE.observe(len(envelopes))
+    log.debug('Delivered %d of %d e-mails in %.2fs', sent, len(envelopes), duration)
+
+
+def _send_mails(envelopes: typing.Sequence[Envelope]) -> None:
+    """
+    Deliver e-mails, or queue them for delivery.
+
+    Args:
+        envelopes: The e-mails to deliver.
+    """
+    if not envelopes:
+        return
+    if getattr(_batch, 'envelopes', None) is not None:
+        _batch.envelopes.extend(envelopes)
+    elif config['mail.queue']:
+        send_mail_task.delay(envelopes=[list(e) for e in envelopes])
+    else:
+        deliver(envelopes)
+
+
 def _send_mail(from_addr: str, to_addr: str, body: str) -> None:
     """
     Send emails with smtplib. This is a lower level function than send_e-mail().
@@ -352,28 +495,33 @@ def _send_mail(from_addr: str, to_addr: str, body: str) -> None:
         to_addr: The e-mail address to use in the envelope to field.
         body: The body of the e-mail.
     """
-    smtp_server = config.get('smtp_server')
-    if not smtp_server:
-        log.info('Not sending email: No smtp_server defined')
+    _send_mails([(from_addr, to_addr, body)])
+
+
+@contextmanager
+def batched() -> typing.Iterator[None]:
+    """
+    Gather the e-mails sent in the context, and deliver them together when it exits.
+
+    Yields:
+        Nothing.
+    """
+    if getattr(_batch, 'envelopes', None) is not None:
+        # Nested in another batch, which delivers the e-mails.
+        yield
         return
-    smtp = None
+    _batch.envelopes = []
     try:
-        log.debug('Connecting to %s', smtp_server)
-        smtp = smtplib.SMTP(smtp_server)
-        smtp.sendmail(from_addr, [to_addr], body.encode('utf-8'))
-    except smtplib.SMTPRecipientsRefused as e:
-        log.warning('"recipient refused" for %r, %r' % (to_addr, e))
-    except Exception:
-        log.exception('Unable to send mail')
+        yield
     finally:
-        if smtp:
-            smtp.quit()
+        envelopes, _batch.envelopes = _batch.envelopes, None
+        _send_mails(envelopes)
 
 
-def send_mail(from_addr: str, to_addr: str, subject: str, body_text: str,
-              headers: typing.Optional[dict] = None) -> None:
+def _envelope(from_addr: typing.Optional[str], to_addr: str, subject: str, body_text: str,
+              headers: typing.Optional[dict] = None) -> typing.Optional[Envelope]:
     """
-    Send an e-mail.
+    Compose an e-mail.
 
     Args:
         from_addr: The address to use in the From: header.
@@ -382,14 +530,16 @@ def send_mail(from_addr: str, to_addr: str, subject: str, body_text: str,
         body_text: The body of the e-mail to be sent.
         headers: A mapping of header fields to values to be included in the e-mail,
             if not None.
+    Returns:
+        The e-mail, or None if it must not be sent.
     """
     if not from_addr:
         from_addr = config.get('bodhi_email')
     if not from_addr:
         log.warning('Unable to send mail: bodhi_email not defined in the config')
-        return
+        return None
     if to_addr in config.get('exclude_mail'):
-        return
+        return None
 
     msg = [f'From: {from_addr}', f'To: {to_addr}']
     if headers:
@@ -400,7 +550,25 @@ def send_mail(from_addr: str, to_addr: str, subject: str, body_text: str,
     body = '\r\n'.join(msg)
 
     log.info('Sending mail to %s: %s', to_addr, subject)
-    _send_mail(from_addr, to_addr, body)
+    return from_addr, to_addr, body
+
+
+def send_mail(from_addr: str, to_addr: str, subject: str, body_text: str,
+              headers: typing.Optional[dict] = None) -> None:
+    """
+    Send an e-mail.
+
+    Args:
+        from_addr: The address to use in the From: header.
+        to_addr: The address to send the e-mail to.
+        subject: The subject of the e-mail.
+        body_text: The body of the e-mail to be sent.
+        headers: A mapping of header fields to values to be included in the e-mail,
+            if not None.
+    """
+    envelope = _envelope(from_addr, to_addr, subject, body_text, headers)
+    if envelope is not None:
+        _send_mail(*envelope)
 
 
 def send(to: typing.Iterable[str], msg_type: str, update: 'Update',
@@ -443,11 +611,11 @@ def send(to: typing.Iterable[str], msg_type: str, update: 'Update',
             headers["In-Reply-To"] = initial_message_id
 
     subject_template = '[Fedora Update] %s[%s] %s'
-    for person in to:
-        subject = subject_template % (critpath, msg_type, update.get_title(nvr=True, beautify=True))
-        fields = MESSAGES[msg_type]['fields'](agent, update)
-        body = MESSAGES[msg_type]['body'] % fields
-        send_mail(sender, person, subject, body, headers=headers)
+    subject = subject_template % (critpath, msg_type, update.get_title(nvr=True, beautify=True))
+    fields = MESSAGES[msg_type]['fields'](agent, update)
+    body = MESSAGES[msg_type]['body'] % fields
+    envelopes = [_envelope(sender, person, subject, body, headers=headers) for person in to]
+    _send_mails([e for e in envelopes if e is not None])
 
 
 def send_releng(subject: str, body: str) -> None:
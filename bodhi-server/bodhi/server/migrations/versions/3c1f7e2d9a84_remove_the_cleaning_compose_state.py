@@ -0,0 +1,53 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Remove the cleaning compose state.
+
+The old composes are cleaned by a task of their own after the compose succeeded.
+
+Revision ID: 3c1f7e2d9a84
+Revises: 5e2a8f0c7b13
+Create Date: 2026-10-19 16:21:07.318552
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f7e2d9a84'
+down_revision = '5e2a8f0c7b13'
+
+
+def upgrade():
+    """Remove cleaning from the compose_state enum."""
+    # A compose interrupted while cleaning can be resumed from the failed state.
+    op.execute("UPDATE composes SET state = 'failed' WHERE state = 'cleaning'")
+    op.execute("ALTER TYPE ck_compose_state RENAME TO ck_compose_state_old")
+    op.execute(
+        "CREATE TYPE ck_compose_state AS ENUM('requested', 'pending', 'initializing', "
+        "'updateinfo', 'punging', 'syncing_repo', 'notifying', 'success', 'failed', "
+        "'signing_repo')")
+    op.execute(
+        "ALTER TABLE composes ALTER COLUMN state TYPE ck_compose_state "
+        "USING state::text::ck_compose_state")
+    op.execute("DROP TYPE ck_compose_state_old")
+
+
+def downgrade():
+    """Add cleaning to the compose_state enum."""
+    op.execute('COMMIT')  # ALTER TYPE ... ADD VALUE cannot run inside a transaction block
+    op.execute("ALTER TYPE ck_compose_state ADD VALUE 'cleaning' AFTER 'signing_repo'")
@@ -0,0 +1,42 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Record the timeline of the compose states.
+
+Revision ID: 3c9f6a8e21d4
+Revises: fb8bbd75005b
+Create Date: 2026-10-19 11:02:47.180236
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9f6a8e21d4'
+down_revision = 'fb8bbd75005b'
+
+
+def upgrade():
+    """Add the phases column to composes."""
+    op.add_column('composes', sa.Column('phases', sa.UnicodeText(), nullable=False,
+                                        server_default='[]'))
+
+
+def downgrade():
+    """Drop the phases column from composes."""
+    op.drop_column('composes', 'phases')
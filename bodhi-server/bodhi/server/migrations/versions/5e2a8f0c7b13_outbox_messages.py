@@ -0,0 +1,51 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Add the outbox of the messages to publish.
+
+Revision ID: 5e2a8f0c7b13
+Revises: 9d4b7c1e5a60
+Create Date: 2026-10-19 14:02:41.190273
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2a8f0c7b13'
+down_revision = '9d4b7c1e5a60'
+
+
+def upgrade():
+    """Add the outbox_messages table."""
+    op.create_table(
+        'outbox_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.UnicodeText(), nullable=False),
+        sa.Column('body', sa.UnicodeText(), nullable=False),
+        sa.Column('date_created', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('message_id', name='outbox_messages_message_id_key'))
+    op.create_index(op.f('ix_outbox_messages_date_created'), 'outbox_messages',
+                    ['date_created'], unique=False)
+
+
+def downgrade():
+    """Drop the outbox_messages table."""
+    op.drop_index(op.f('ix_outbox_messages_date_created'), table_name='outbox_messages')
+    op.drop_table('outbox_messages')
@@ -0,0 +1,46 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Record which publisher claimed the messages of the outbox.
+
+Revision ID: b7d41e9c2f06
+Revises: 3c1f7e2d9a84
+Create Date: 2026-10-19 18:12:35.604518
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41e9c2f06'
+down_revision = '3c1f7e2d9a84'
+
+
+def upgrade():
+    """Add the claimed_by and claimed_at columns to the outbox_messages table."""
+    op.add_column('outbox_messages', sa.Column('claimed_by', sa.UnicodeText(), nullable=True))
+    op.add_column('outbox_messages', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_outbox_messages_claimed_at'), 'outbox_messages', ['claimed_at'],
+                    unique=False)
+
+
+def downgrade():
+    """Drop the claimed_by and claimed_at columns from the outbox_messages table."""
+    op.drop_index(op.f('ix_outbox_messages_claimed_at'), table_name='outbox_messages')
+    op.drop_column('outbox_messages', 'claimed_at')
+    op.drop_column('outbox_messages', 'claimed_by')
@@ -0,0 +1,65 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Record the durations of the composes to schedule them.
+
+Revision ID: fb8bbd75005b
+Revises: 22cd873f4a1f
+Create Date: 2026-10-19 10:12:31.503718
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'fb8bbd75005b'
+down_revision = '22cd873f4a1f'
+
+
+def upgrade():
+    """Add the compose_durations table, and the scheduling columns of composes."""
+    op.create_table(
+        'compose_durations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('release_id', sa.Integer(), nullable=False),
+        sa.Column('request',
+                  postgresql.ENUM(name='ck_update_request', create_type=False),
+                  nullable=False),
+        sa.Column('content_type',
+                  postgresql.ENUM(name='ck_content_type', create_type=False),
+                  nullable=False),
+        sa.Column('security', sa.Boolean(), nullable=False),
+        sa.Column('updates', sa.Integer(), nullable=False),
+        sa.Column('duration', sa.Integer(), nullable=False),
+        sa.Column('date_created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['release_id'], ['releases.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index(op.f('ix_compose_durations_release_id'), 'compose_durations',
+                    ['release_id'], unique=False)
+    op.add_column('composes', sa.Column('date_started', sa.DateTime(),
+                                        nullable=True))
+    op.add_column('composes', sa.Column('estimated_duration', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    """Drop the compose_durations table, and the scheduling columns of composes."""
+    op.drop_column('composes', 'estimated_duration')
+    op.drop_column('composes', 'date_started')
+    op.drop_index(op.f('ix_compose_durations_release_id'), table_name='compose_durations')
+    op.drop_table('compose_durations')
@@ -18,7 +18,7 @@
 
 from collections import defaultdict
 from datetime import date, datetime, timedelta, timezone
-from functools import lru_cache, partial
+from functools import cmp_to_key, lru_cache, partial
 from textwrap import wrap
 from urllib.parse import urljoin
 import hashlib
@@ -49,7 +49,14 @@ from sqlalchemy import (
     UniqueConstraint,
 )
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import class_mapper, declarative_base, relationship, synonym, validates
+from sqlalchemy.orm import (
+    class_mapper,
+    contains_eager,
+    declarative_base,
+    relationship,
+    synonym,
+    validates,
+)
 from sqlalchemy.orm.base import NEVER_SET
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.properties import RelationshipProperty
@@ -60,7 +67,7 @@ import rpm
 from bodhi.messages.schemas import buildroot_override as override_schemas
 from bodhi.messages.schemas import errata as errata_schemas
 from bodhi.messages.schemas import update as update_schemas
-from bodhi.server import bugs, buildsys, log, mail, notifications, Session, util
+from bodhi.server import bugs, buildsys, candidates, log, mail, notifications, Session, util
 from bodhi.server.config import config
 from bodhi.server.exceptions import (
     BodhiException,
@@ -787,7 +794,6 @@ class ComposeState(DeclEnum):
         success (EnumSymbol): The Compose has completed successfully.
         failed (EnumSymbol): The compose has failed, abandon hope.
         signing_repo (EnumSymbol): Waiting for the repo to be signed.
-        cleaning (EnumSymbol): Cleaning old Composes after successful completion.
     """
 
     requested = 'requested', 'Requested'
@@ -800,7 +806,6 @@ class ComposeState(DeclEnum):
     success = 'success', 'Success'
     failed = 'failed', 'Failed'
     signing_repo = 'signing_repo', 'Signing repo'
-    cleaning = 'cleaning', 'Cleaning old composes'
 
 
 class PackageManager(DeclEnum):
@@ -1619,18 +1624,61 @@ class Build(Base):
 
     def is_latest(self) -> bool:
         """Check if this is the latest build available in the stable tag."""
-        koji_session = buildsys.get_session()
-        # Get the latest builds in koji in a tag for a package
-        koji_builds = koji_session.getLatestBuilds(
-            self.update.release.stable_tag,
-            package=self.package.name
-        )
+        return not Build.find_not_latest([self])
 
-        for koji_build in koji_builds:
-            build_creation_time = datetime.fromisoformat(koji_build['creation_time'])
-            if self.get_creation_time() < build_creation_time:
-                return False
-        return True
+    @staticmethod
+    def find_not_latest(builds: typing.Iterable['Build']) -> typing.Set[str]:
+        """
+        Find the builds that are older than a build of the same package in their stable tag.
+
+        All the builds are resolved with a single Koji multicall, which lists the latest builds of
+        each package in the stable tags and gets the Koji info of the given builds that are not
+        cached yet. The creation times are then compared locally.
+
+        Args:
+            builds: The builds to check. They must be associated with an update.
+        Returns:
+            The NVRs of the given builds that are not the latest in their stable tag.
+        Raises:
+            BodhiException: If Koji returned an error for any of the calls.
+        """
+        builds = list(builds)
+        latest_keys = sorted({(b.update.release.stable_tag, b.package.name) for b in builds})
+        if not latest_keys:
+            return set()
+        uncached = [b for b in builds if not hasattr(b, '_kojiinfo')]
+
+        koji = buildsys.get_session()
+        koji.multicall = True
+        # Get the latest builds in koji in a tag for a package
+        for tag, package in latest_keys:
+            koji.getLatestBuilds(tag, package=package)
+        for build in uncached:
+            koji.getBuild(build.nvr)
+        results = koji.multiCall() or []
+
+        calls = [f'getLatestBuilds({tag!r}, package={package!r})' for tag, package in latest_keys]
+        calls.extend(f'getBuild({build.nvr!r})' for build in uncached)
+        if len(results) != len(calls):
+            raise BodhiException(
+                f'Koji returned {len(results)} results for {len(calls)} calls.')
+        for call, result in zip(calls, results):
+            if not isinstance(result, list) or not result or result[0] is None:
+                raise BodhiException(f'Unexpected data returned by Koji for {call}: {result!r}')
+
+        latest_creation_times = {
+            key: [datetime.fromisoformat(kb['creation_time']) for kb in result[0]]
+            for key, result in zip(latest_keys, results)}
+        for build, result in zip(uncached, results[len(latest_keys):]):
+            build._kojiinfo = result[0]
+
+        not_latest = set()
+        for build in builds:
+            creation_time = build.get_creation_time()
+            key = (build.update.release.stable_tag, build.package.name)
+            if any(creation_time < latest for latest in latest_creation_times[key]):
+                not_latest.add(build.nvr)
+        return not_latest
 
     def update_test_cases(self, db):
         """
@@ -2860,59 +2908,84 @@ class Update(Base):
         If a build is associated with multiple updates, make sure that
         all updates are safe to obsolete, or else just skip it.
 
+        The older builds of all the packages of this update are fetched with a single query, and
+        the bugs of all the obsoleted updates are inherited at once. The EVR of each build is parsed
+        once into a sort key, rather than once for every pair of builds that are compared.
+
         Args:
             db (sqlalchemy.orm.session.Session): A database session.
         Returns:
             list: A list of dictionaries that describe caveats.
         """
         caveats = []
+        package_ids = {build.package.id for build in self.builds}
+        if not package_ids:
+            return caveats
+
+        evr_key = cmp_to_key(rpm.labelCompare)
+        candidate_builds = defaultdict(list)
+        query = db.query(Build).join(Update).options(contains_eager(Build.update)).filter(
+            and_(Build.package_id.in_(package_ids),
+                 Update.locked.is_(False),
+                 Update.release == self.release,
+                 or_(and_(or_(Update.status == UpdateStatus.testing,
+                              Update.status == UpdateStatus.pending),
+                          or_(Update.request != UpdateRequest.stable,
+                              Update.request.is_(None))),
+                     and_(or_(Update.status == UpdateStatus.testing,
+                              Update.status == UpdateStatus.pending),
+                          Update.request == UpdateRequest.stable,
+                          self.request == UpdateRequest.stable)))
+        ).order_by(Build.id)
+        for oldBuild in query:
+            candidate_builds[oldBuild.package_id].append((oldBuild, evr_key(oldBuild.get_n_v_r())))
+
+        pkgs = {b.package.name for b in self.builds}
+        # Whether all of the packages of an older update are present in this one, by update id
+        complete = {}
+        re_changelog = re.compile(r"(?s)\n##### \*\*Changelog\*\*\n\n```\n.*\n```")
+        template = 'This update has obsoleted %s, and has inherited its bugs and notes.'
+        obsoleted = []
+        obsoleted_ids = set()
+        inherited_bugs = []
         for build in self.builds:
-            for oldBuild in db.query(Build).join(Update).filter(
-                and_(Build.nvr != build.nvr,
-                     Build.package == build.package,
-                     Update.locked.is_(False),
-                     Update.release == self.release,
-                     or_(and_(or_(Update.status == UpdateStatus.testing,
-                                  Update.status == UpdateStatus.pending),
-                              or_(Update.request != UpdateRequest.stable,
-                                  Update.request.is_(None))),
-                         and_(or_(Update.status == UpdateStatus.testing,
-                                  Update.status == UpdateStatus.pending),
-                              Update.request == UpdateRequest.stable,
-                              self.request == UpdateRequest.stable)))
-            ).all():
+            build_key = evr_key(build.get_n_v_r())
+            for oldBuild, old_key in candidate_builds[build.package.id]:
+                oldUpdate = oldBuild.update
+                # Updates obsoleted by an earlier build are no longer pending or testing
+                if oldBuild.nvr == build.nvr or oldUpdate.id in obsoleted_ids:
+                    continue
+
                 obsoletable = False
-                nvr = build.get_n_v_r()
-                if rpm.labelCompare(oldBuild.get_n_v_r(), nvr) < 0:
-                    log.debug("%s is newer than %s" % (nvr, oldBuild.nvr))
+                if old_key < build_key:
+                    log.debug("%s is newer than %s" % (build.nvr, oldBuild.nvr))
                     obsoletable = True
 
                 # Ensure that all of the packages in the old update are
                 # present in the new one.
-                pkgs = [b.package.name for b in self.builds]
-                for _build in oldBuild.update.builds:
-                    if _build.package.name not in pkgs:
-                        obsoletable = False
-                        break
+                if oldUpdate.id not in complete:
+                    complete[oldUpdate.id] = all(
+                        _build.package.name in pkgs for _build in oldUpdate.builds)
+                obsoletable = obsoletable and complete[oldUpdate.id]
 
                 # Warn if you're stomping on another user but don't necessarily
                 # obsolete them
-                if len(oldBuild.update.builds) != len(self.builds):
-                    if oldBuild.update.user.name != self.user.name:
+                if len(oldUpdate.builds) != len(self.builds):
+                    if oldUpdate.user.name != self.user.name:
                         caveats.append({
                             'name': 'update',
                             'description': 'Please be aware that there '
                             'is another update in flight owned by %s, '
                             'containing %s. Are you coordinating with '
                             'them?' % (
-                                oldBuild.update.user.name,
+                                oldUpdate.user.name,
                                 oldBuild.nvr,
                             )
                         })
 
                 # Warn about attempt to obsolete security update by update with
                 # other type and set type of new update to security.
-                if oldBuild.update.type == UpdateType.security and \
+                if oldUpdate.type == UpdateType.security and \
                         self.type is not UpdateType.security:
                     caveats.append({
                         'name': 'update',
@@ -2920,35 +2993,42 @@ class Update(Base):
                         'since it obsoletes another security update'
                     })
                     self.type = UpdateType.security
-                    self.severity = oldBuild.update.severity
+                    self.severity = oldUpdate.severity
 
                 if obsoletable:
                     log.info('%s is obsoletable' % oldBuild.nvr)
+                    obsoleted.append((oldBuild, build))
+                    obsoleted_ids.add(oldUpdate.id)
 
-                    # Have the newer update inherit the older updates bugs
-                    oldbugs = [bug.bug_id for bug in oldBuild.update.bugs]
-                    bugs = [bug.bug_id for bug in self.bugs]
-                    self.update_bugs(bugs + oldbugs, db)
+                    # Have the newer update inherit the older updates bugs. They are all
+                    # associated at once below, but inheriting a security bug turns this
+                    # update into a security one straight away, as update_bugs() would.
+                    inherited_bugs.extend(oldUpdate.bugs)
+                    if self.type is not UpdateType.security and any(
+                            bug.security for bug in self.bugs + inherited_bugs):
+                        self.type = UpdateType.security
 
                     # Also inherit the older updates notes as well and
                     # add a markdown separator between the new and old ones.
                     # If it's an automatic update, do not copy the changelog again.
-                    re_changelog = re.compile(r"(?s)\n##### \*\*Changelog\*\*\n\n```\n.*\n```")
-                    old_notes = re.sub(re_changelog, '', oldBuild.update.notes)
+                    old_notes = re.sub(re_changelog, '', oldUpdate.notes)
                     new_notes = self.notes + '\n\n----\n\n' + old_notes
                     if len(new_notes) <= config.get('update_notes_maxlength'):
                         self.notes = new_notes
-                    oldBuild.update.obsolete(db, newer=build)
-                    template = ('This update has obsoleted %s, and has '
-                                'inherited its bugs and notes.')
-                    link = "[%s](%s)" % (oldBuild.nvr,
-                                         oldBuild.update.abs_url())
-                    self.comment(db, template % link, author='bodhi')
                     caveats.append({
                         'name': 'update',
                         'description': template % oldBuild.nvr,
                     })
 
+        if obsoleted:
+            bug_ids = [bug.bug_id for bug in self.bugs + inherited_bugs]
+            self.update_bugs(bug_ids, db)
+
+        for oldBuild, build in obsoleted:
+            oldBuild.update.obsolete(db, newer=build)
+            link = "[%s](%s)" % (oldBuild.nvr, oldBuild.update.abs_url())
+            self.comment(db, template % link, author='bodhi')
+
         return caveats
 
     def get_tags(self):
@@ -3360,18 +3440,20 @@ class Update(Base):
         if return_multicall:
             return koji.multiCall()
 
-    def find_conflicting_builds(self) -> list:
+    def find_conflicting_builds(self, not_latest: typing.Optional[typing.Set[str]] = None) -> list:
         """
         Find if there are any builds conflicting with the stable tag in the update.
 
         Returns a list of conflicting builds, empty is none found.
-        """
-        conflicting_builds = []
-        for build in self.builds:
-            if not build.is_latest():
-                conflicting_builds.append(build.nvr)
 
-        return conflicting_builds
+        Args:
+            not_latest: The NVRs of builds known not to be the latest in their stable tag, as
+                returned by Build.find_not_latest() for a batch of updates including this one. If
+                not given, the builds of this update are checked against Koji.
+        """
+        if not_latest is None:
+            not_latest = Build.find_not_latest(self.builds)
+        return [build.nvr for build in self.builds if build.nvr in not_latest]
 
     def modify_bugs(self):
         """
@@ -3649,7 +3731,7 @@ class Update(Base):
         # Publish to Fedora Messaging
         if author not in config.get('system_users'):
             notifications.publish(update_schemas.UpdateCommentV1.from_dict(
-                {'comment': comment.__json__(), 'agent': author}))
+                {'comment': comment, 'agent': author}))
 
         # Send a notification to everyone that has commented on this update
         people = set()
@@ -4196,6 +4278,20 @@ class Update(Base):
             're-trigger': retrigger,
         }
 
+    @staticmethod
+    def invalidate_candidate_builds(target, *args):
+        """
+        Flag the cached NVRs of builds associated with pending updates as stale.
+
+        This is called whenever the status or the builds of an update change, so the
+        ``latest_candidates`` view stops offering builds that have been submitted in an update.
+
+        Args:
+            target (Update): The update whose status or builds changed.
+            args (tuple): The remaining arguments of the event, which are not used.
+        """
+        candidates.associated_builds_changed()
+
     @staticmethod
     def _ready_for_testing(target, old):
         """
@@ -4230,6 +4326,9 @@ event.listen(
     active_history=True,
     raw=True,
 )
+event.listen(Update.status, 'set', Update.invalidate_candidate_builds)
+event.listen(Update.builds, 'append', Update.invalidate_candidate_builds)
+event.listen(Update.builds, 'remove', Update.invalidate_candidate_builds)
 
 
 class Compose(Base):
@@ -4250,7 +4349,15 @@ class Compose(Base):
         checkpoints (str): A JSON serialized object describing the checkpoints the composer has
             reached.
         date_created (datetime.datetime): The time this Compose was created.
-        error_message (str): An error message indicating what happened if the Compose failed.
+        date_started (datetime.datetime): The time the composer started running this Compose, or
+            None if it is still queued.
+        error_message (str): An error message indicating what happened if the Compose failed, or
+            which arches are still waiting for their repo signatures.
+        estimated_duration (int): How many seconds the composer expects this Compose to take, based
+            on the previous :class:`ComposeDurations <ComposeDuration>`.
+        phases (list): The timeline of the states of this Compose, as dictionaries with the
+            ``state``, the time it ``started`` and its ``duration`` in seconds, which is None for
+            the current state.
         release_id (int): The primary key of the :class:`Release` that is being composed. Forms half
             of the primary key, with the other half being the ``request``.
         request (UpdateRequest): The request of the release that is being composed. Forms half of
@@ -4265,7 +4372,7 @@ class Compose(Base):
     __exclude_columns__ = ('updates')
     # We need to include content_type and security so the composer can collate the Composes and so
     # it can pick the right composer class to use.
-    __include_extras__ = ('content_type', 'security', 'update_summary')
+    __include_extras__ = ('content_type', 'phases', 'security', 'update_summary')
     __tablename__ = 'composes'
 
     # These together form the primary key.
@@ -4281,6 +4388,10 @@ class Compose(Base):
     error_message = Column(UnicodeText)
     date_created = Column(TZDateTime, nullable=False,
                           default=partial(datetime.now, tz=timezone.utc))
+    date_started = Column(TZDateTime)
+    estimated_duration = Column(Integer)
+    # Exposed as the phases property, so it is serialized as a list rather than as a string.
+    _phases = Column('phases', UnicodeText, nullable=False, default='[]')
     state_date = Column(TZDateTime, nullable=False, default=partial(datetime.now, tz=timezone.utc))
 
     release = relationship('Release', back_populates='composes')
@@ -4370,6 +4481,27 @@ class Compose(Base):
         # Python 3 and the docblock states that a list is returned.
         return list(work.values())
 
+    @property
+    def phases(self):
+        """
+        Return the timeline of the states of this compose.
+
+        Returns:
+            list: A dictionary for each state the compose went through, with the ``state``, the
+                time it ``started`` and its ``duration`` in seconds, or None for the current state.
+        """
+        return json.loads(self._phases or '[]')
+
+    @phases.setter
+    def phases(self, phases):
+        """
+        Store the timeline of the states of this compose.
+
+        Args:
+            phases (list): The new timeline.
+        """
+        self._phases = json.dumps(phases)
+
     @property
     def security(self):
         """
@@ -4387,7 +4519,7 @@ class Compose(Base):
     @staticmethod
     def update_state_date(target, value, old, initiator):
         """
-        Update the ``state_date`` when the state changes.
+        Update the ``state_date`` and the ``phases`` when the state changes.
 
         Args:
             target (Compose): The compose that has had a change to its state attribute.
@@ -4397,7 +4529,19 @@ class Compose(Base):
                 transition.
         """
         if value != old:
-            target.state_date = datetime.now(timezone.utc)
+            now = datetime.now(timezone.utc)
+            phases = target.phases
+            if target.state_date is not None and isinstance(old, EnumSymbol):
+                if not phases:
+                    # The first state is set by the column default, which is not an event.
+                    phases.append({
+                        'state': old.value,
+                        'started': target.state_date.strftime('%Y-%m-%d %H:%M:%S')})
+                phases[-1]['duration'] = round((now - target.state_date).total_seconds(), 3)
+            phases.append({'state': value.value, 'started': now.strftime('%Y-%m-%d %H:%M:%S'),
+                           'duration': None})
+            target.phases = phases
+            target.state_date = now
 
     @property
     def update_summary(self):
@@ -4426,8 +4570,8 @@ class Compose(Base):
             str: A JSON representation of the Compose.
         """
         if composer:
-            exclude = ('checkpoints', 'error_message', 'date_created', 'state_date', 'release',
-                       'state', 'updates')
+            exclude = ('checkpoints', 'error_message', 'date_created', 'date_started',
+                       'state_date', 'release', 'state', 'updates')
             # We need to include content_type and security so the composer can collate the Composes
             # and so it can pick the right composer class to use.
             include = ('content_type', 'security')
@@ -4463,6 +4607,62 @@ class Compose(Base):
 event.listen(Compose.state, 'set', Compose.update_state_date, active_history=True)
 
 
+class ComposeDuration(Base):
+    """
+    Record how long a successful compose took, to estimate the duration of the next ones.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        release_id (int): The primary key of the :class:`Release` that was composed.
+        request (UpdateRequest): The request of the release that was composed.
+        content_type (ContentType): The content type of the compose.
+        security (bool): Whether the compose contained security updates.
+        updates (int): The number of updates in the compose.
+        duration (int): How many seconds the compose took.
+        date_created (datetime.datetime): The time the compose finished.
+    """
+
+    __tablename__ = 'compose_durations'
+
+    release_id = Column(Integer, ForeignKey('releases.id', ondelete='CASCADE'), nullable=False,
+                        index=True)
+    request = Column(UpdateRequest.db_type(), nullable=False)
+    content_type = Column(ContentType.db_type(), nullable=False)
+    security = Column(Boolean, nullable=False, default=False)
+    updates = Column(Integer, nullable=False)
+    duration = Column(Integer, nullable=False)
+    date_created = Column(TZDateTime, nullable=False,
+                          default=partial(datetime.now, tz=timezone.utc))
+
+    @classmethod
+    def estimate(cls, db, compose: Compose, history: int = 5) -> int:
+        """
+        Return how many seconds the given compose is expected to take.
+
+        This is the average duration of the last composes of the same release and request, or of
+        the same content type and request if this release was never composed. The
+        ``compose_scheduler.default_duration`` setting is used if there are none either.
+
+        Args:
+            db (sqlalchemy.orm.session.Session): A database session.
+            compose: The compose to estimate.
+            history: How many of the last composes to consider.
+        Returns:
+            The estimated duration of the compose, in seconds.
+        """
+        filters = [and_(cls.release_id == compose.release_id, cls.request == compose.request)]
+        if compose.content_type is not None:
+            filters.append(and_(cls.content_type == compose.content_type,
+                                cls.request == compose.request))
+        for criteria in filters:
+            durations = [
+                d for d, in db.query(cls.duration).filter(criteria).order_by(
+                    cls.date_created.desc(), cls.id.desc()).limit(history)]
+            if durations:
+                return round(sum(durations) / len(durations))
+        return config['compose_scheduler.default_duration']
+
+
 def BugKarma(*args, **kwargs):
     """Redirect to BugKarma class."""
     warnings.warn("Class BugKarma is deprecated, use BugFeedback; date=2024-06-12",
@@ -5060,3 +5260,102 @@ class BuildrootOverride(Base):
 
         notifications.publish(override_schemas.BuildrootOverrideUntagV1.from_dict(
             {'override': self}))
+
+    @classmethod
+    def expire_all(cls, db, overrides: typing.Iterable['BuildrootOverride']) \
+            -> typing.Dict[str, typing.List[str]]:
+        """
+        Mark the given BuildrootOverrides as expired, in bulk.
+
+        The builds are untagged with Koji multicalls of expire_overrides_batch_size calls, the
+        overrides are marked as expired with a single UPDATE, and a message is published for each
+        of them once the transaction is committed. As with expire(), the overrides are marked as
+        expired even if some of their builds could not be untagged.
+
+        Args:
+            db (sqlalchemy.orm.session.Session): A database session.
+            overrides: The overrides to expire. Those that already expired are ignored.
+        Returns:
+            A dictionary mapping the NVRs of the overrides that could not be untagged from some of
+            their tags to the error messages.
+        """
+        overrides = [o for o in overrides if o.expired_date is None]
+        if not overrides:
+            return {}
+
+        untags = [(override, tag) for override in overrides
+                  for tag in (override.build.release.inherited_override_tags
+                              + [override.build.release.override_tag])]
+        batch_size = config.get('expire_overrides_batch_size')
+        koji_session = buildsys.get_session()
+        failures = defaultdict(list)
+        for i in range(0, len(untags), batch_size):
+            chunk = untags[i:i + batch_size]
+            try:
+                koji_session.multicall = True
+                for override, tag in chunk:
+                    koji_session.untagBuild(tag, override.build.nvr, strict=True)
+                results = koji_session.multiCall()
+            except Exception as e:
+                results = [{'faultString': str(e)}] * len(chunk)
+            for (override, tag), result in zip(chunk, results):
+                # Errors are returned as dicts, successful calls as lists holding the result
+                if isinstance(result, dict):
+                    error = f"Unable to untag override {override.build.nvr} from {tag}: " \
+                            f"'{result.get('faultString', result)}'"
+                    log.error(error)
+                    failures[override.build.nvr].append(error)
+
+        db.query(cls).filter(cls.id.in_([o.id for o in overrides])).update(
+            {cls.expired_date: datetime.now(timezone.utc)}, synchronize_session='evaluate')
+
+        for override in overrides:
+            notifications.publish(override_schemas.BuildrootOverrideUntagV1.from_dict(
+                {'override': override}))
+
+        return dict(failures)
+
+
+class ProcessedMessage(Base):
+    """
+    Remember that the consumer handled a message, to skip it if it is delivered again.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        key (str): The id of the message, or a key identifying the event it is about.
+        value (str): Distinguishes the events with the same key, such as a build being tagged or
+            untagged.
+        date_created (datetime.datetime): The time the message was handled.
+    """
+
+    __tablename__ = 'processed_messages'
+
+    key = Column(UnicodeText, nullable=False, unique=True)
+    value = Column(UnicodeText, nullable=False, default='')
+    date_created = Column(TZDateTime, nullable=False, index=True,
+                          default=partial(datetime.now, tz=timezone.utc))
+
+
+class OutboxMessage(Base):
+    """
+    A message written in the same transaction as the changes it announces, until it is published.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        message_id (str): The id of the message.
+        body (str): The message, serialized by :func:`fedora_messaging.message.dumps`.
+        date_created (datetime.datetime): The time the message was queued.
+        claimed_by (str): The publisher that is going to publish the message, or None if the
+            message is left for any publisher to publish.
+        claimed_at (datetime.datetime): The last time the publisher claimed the message. Other
+            publishers may claim it once the claim is older than a grace period.
+    """
+
+    __tablename__ = 'outbox_messages'
+
+    message_id = Column(UnicodeText, nullable=False, unique=True)
+    body = Column(UnicodeText, nullable=False)
+    date_created = Column(TZDateTime, nullable=False, index=True,
+                          default=partial(datetime.now, tz=timezone.utc))
+    claimed_by = Column(UnicodeText)
+    claimed_at = Column(TZDateTime, index=True)
@@ -15,15 +15,39 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
-"""A collection of message publishing utilities."""
+"""
+A collection of message publishing utilities.
+
+By default, the messages are published synchronously after the database commit. When
+``publisher.queue_size`` is set, they are handed to an :class:`AsyncPublisher` instead, which
+publishes them from a background thread so that the web requests and the composer never wait for
+the broker. With ``publisher.outbox``, the messages are also written in the ``outbox_messages``
+table in the same transaction as the changes they announce, and are only deleted once they were
+published: the messages that could not be published, or that were still queued when the process
+died, are published later by any of the publishers. Each message of the outbox is claimed by the
+publisher that is going to publish it, so that two publishers never publish the same message.
+"""
+from datetime import datetime, timedelta, timezone
+import atexit
 import logging
+import os
+import queue
+import socket
+import threading
+import time
 import typing
+import uuid
 
-from sqlalchemy import event
-from fedora_messaging import api, exceptions as fml_exceptions
+from sqlalchemy import event, or_
+from fedora_messaging import api, exceptions as fml_exceptions, message as fml_message
+from prometheus_client import Counter, Gauge, Histogram
+from twisted.internet import defer
 import backoff
+import crochet
 
 from bodhi.server import Session
+from bodhi.server.config import config
+from bodhi.server.util import transactional_session_maker
 
 if typing.TYPE_CHECKING:  # pragma: no cover
     from bodhi.messages.schemas import base  # noqa: 401
@@ -31,6 +55,34 @@ if typing.TYPE_CHECKING:  # pragma: no cover
 
 _log = logging.getLogger(__name__)
 
+QUEUE_DEPTH = Gauge(
+    'bodhi_publisher_queue_depth',
+    'Messages waiting to be published by the background publisher',
+)
+PUBLISH_DURATION = Histogram(
+    'bodhi_publisher_publish_duration_seconds',
+    'Time to publish a batch of messages to the broker',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf')),
+)
+PUBLISHED = Counter(
+    'bodhi_publisher_messages',
+    'Messages handled by the background publisher',
+    labelnames=['result'],
+)
+
+# How often the publisher looks for messages left in the outbox, in seconds.
+_RECOVER_INTERVAL = 60
+# How old the claim of a message of the outbox must be for another publisher to claim it, in
+# seconds. Younger messages may still be waiting in the queue of the publisher that claimed them.
+_OUTBOX_GRACE = 300
+# How long the broker may take to confirm the messages of a batch, in seconds.
+_PUBLISH_TIMEOUT = 30
+# Put in the queue to stop the publisher thread.
+_STOP = object()
+
+_publisher = None  # type: typing.Optional[AsyncPublisher]
+_publisher_lock = threading.Lock()
+
 
 @event.listens_for(Session, 'after_commit')
 def send_messages_after_commit(session):
@@ -41,7 +93,11 @@ def send_messages_after_commit(session):
         session (sqlalchemy.orm.session.Session): The session that was committed.
     """
     if 'messages' in session.info:
+        publisher = get_publisher()
         for m in session.info['messages']:
+            if publisher is not None:
+                publisher.submit(m, spooled=publisher.outbox)
+                continue
             try:
                 _publish_with_retry(m)
             except fml_exceptions.BaseException:
@@ -62,17 +118,340 @@ def publish(message: 'base.BodhiMessage', force: bool = False):
             currently active database transaction successfully commits. If true,
             the messages is sent immediately.
     """
+    publisher = get_publisher()
     if force:
-        _publish_with_retry(message)
+        if publisher is None:
+            _publish_with_retry(message)
+        else:
+            publisher.submit(message)
         return
 
     session = Session()
     if 'messages' not in session.info:
         session.info['messages'] = []
     session.info['messages'].append(message)
+    if publisher is not None and publisher.outbox:
+        # Imported here because the models publish messages through this module.
+        from bodhi.server.models import OutboxMessage
+        session.add(OutboxMessage(
+            message_id=message.id, body=fml_message.dumps(message), claimed_by=publisher.name,
+            claimed_at=datetime.now(timezone.utc)))
     _log.debug('Queuing message %r for delivery on session commit', message.id)
 
 
+def get_publisher() -> typing.Optional['AsyncPublisher']:
+    """
+    Return the background publisher of this process, starting it on first use.
+
+    Returns:
+        The publisher, or None if ``publisher.queue_size`` is 0 and the messages are published
+        synchronously.
+    """
+    global _publisher
+    if not config['publisher.queue_size']:
+        return None
+    with _publisher_lock:
+        # The thread of the publisher doesn't survive a fork, so the child processes of the web
+        # server and of Celery start their own.
+        if _publisher is None or _publisher.pid != os.getpid():
+            _publisher = AsyncPublisher(
+                queue_size=config['publisher.queue_size'],
+                batch_size=config['publisher.batch_size'], outbox=config['publisher.outbox'])
+            _publisher.start()
+            atexit.register(_publisher.close)
+    return _publisher
+
+
+class AsyncPublisher:
+    """Publish the messages from a background thread, in the order they were submitted."""
+
+    def __init__(self, queue_size: int, batch_size: int, outbox: bool = False):
+        """
+        Initialize the publisher.
+
+        Args:
+            queue_size: How many messages can wait to be published. Further messages are dropped,
+                or left in the outbox, until the queue has room again.
+            batch_size: How many messages are published before the outbox rows are deleted, and
+                how many rows are published at once from the outbox.
+            outbox: Whether the messages are also stored in the outbox table until published.
+        """
+        self.batch_size = batch_size
+        self.outbox = outbox
+        self.pid = os.getpid()
+        # The name the publisher claims the messages of the outbox with.
+        self.name = f'{socket.gethostname()}:{self.pid}:{uuid.uuid4().hex[:8]}'
+        self.db_factory = transactional_session_maker()
+        self._queue = queue.Queue(queue_size)
+        # The ids of the messages of the outbox that are in the queue.
+        self._queued = set()  # type: typing.Set[str]
+        self._closed = False
+        self._last_recovery = None  # type: typing.Optional[float]
+        self._thread = threading.Thread(target=self._run, name='bodhi-publisher', daemon=True)
+
+    def start(self):
+        """Start the publisher thread."""
+        self._thread.start()
+
+    def submit(self, message: 'base.BodhiMessage', spooled: bool = False):
+        """
+        Queue a message to be published, without ever blocking.
+
+        Args:
+            message: The message to publish.
+            spooled: Whether the message was stored in the outbox, and must be deleted from it once
+                published.
+        """
+        if self._closed:
+            # The process is exiting, there is nobody left to wait for.
+            try:
+                _publish_with_retry(message)
+            except fml_exceptions.BaseException:
+                _log.exception("An error occurred publishing %r", message)
+            return
+        if spooled:
+            self._queued.add(message.id)
+        try:
+            self._queue.put_nowait((message, spooled))
+        except queue.Full:
+            self._queued.discard(message.id)
+            if spooled:
+                _log.warning('The publisher queue is full, %r will be published from the outbox',
+                             message.id)
+                PUBLISHED.labels(result='deferred').inc()
+            else:
+                _log.error('The publisher queue is full, dropping %r', message)
+                PUBLISHED.labels(result='dropped').inc()
+            return
+        QUEUE_DEPTH.inc()
+
+    def close(self, timeout: float = 30):
+        """
+        Publish the queued messages and stop the publisher thread.
+
+        Args:
+            timeout: How many seconds to wait for the queued messages to be published.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                _log.error('Unable to publish the %d queued messages before exiting',
+                           self._queue.qsize())
+                return
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Publish the queued messages in batches until the publisher is closed."""
+        while True:
+            if self.outbox and (self._last_recovery is None
+                                or time.monotonic() - self._last_recovery >= _RECOVER_INTERVAL):
+                self._last_recovery = time.monotonic()
+                try:
+                    self._recover()
+                except Exception:
+                    _log.exception('Unable to publish the messages left in the outbox')
+            try:
+                item = self._queue.get(timeout=_RECOVER_INTERVAL if self.outbox else None)
+            except queue.Empty:
+                continue
+            batch = []
+            while item is not _STOP:
+                QUEUE_DEPTH.dec()
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._publish_batch(batch)
+            except Exception:
+                _log.exception('Unable to publish a batch of %d messages', len(batch))
+            if item is _STOP:
+                return
+
+    def _publish_batch(self, batch: typing.List[typing.Tuple['base.BodhiMessage', bool]],
+                       result: str = 'published'):
+        """
+        Publish a batch of messages, and delete the published ones from the outbox.
+
+        The messages of the outbox are claimed again first, and skipped if another publisher
+        claimed them meanwhile. The messages that fail to be published are logged, and their claim
+        is released so that the next recovery publishes them.
+
+        Args:
+            batch: The messages, and whether they are in the outbox.
+            result: How the published messages are counted.
+        """
+        try:
+            spooled = [message.id for message, in_outbox in batch if in_outbox]
+            claimed = self._claim(spooled) if spooled else set()
+            publishing = [(message, in_outbox) for message, in_outbox in batch
+                          if not in_outbox or message.id in claimed]
+            if not publishing:
+                return
+
+            start = time.monotonic()
+            errors = _publish_all([message for message, in_outbox in publishing])
+            PUBLISH_DURATION.observe(time.monotonic() - start)
+
+            published, failed = [], []
+            for (message, in_outbox), error in zip(publishing, errors):
+                if error is None:
+                    PUBLISHED.labels(result=result).inc()
+                else:
+                    _log.error("An error occurred publishing %r", message, exc_info=error)
+                    PUBLISHED.labels(result='failed').inc()
+                if in_outbox:
+                    (published if error is None else failed).append(message.id)
+            if published or failed:
+                self._settle(published, failed)
+        finally:
+            self._queued.difference_update(message.id for message, in_outbox in batch)
+
+    def _claim(self, message_ids: typing.List[str]) -> typing.Set[str]:
+        """
+        Renew the claim of this publisher on messages of the outbox.
+
+        Args:
+            message_ids: The ids of the messages.
+        Returns:
+            The ids of the messages that are still claimed by this publisher.
+        """
+        from bodhi.server.models import OutboxMessage
+        with self.db_factory() as db:
+            mine = db.query(OutboxMessage).filter(OutboxMessage.message_id.in_(message_ids),
+                                                  OutboxMessage.claimed_by == self.name)
+            mine.update({'claimed_at': datetime.now(timezone.utc)}, synchronize_session=False)
+            return {message_id for message_id, in mine.with_entities(OutboxMessage.message_id)}
+
+    def _settle(self, published: typing.List[str], failed: typing.List[str]):
+        """
+        Delete the published messages from the outbox, and release the claim on the failed ones.
+
+        Args:
+            published: The ids of the published messages.
+            failed: The ids of the messages that could not be published.
+        """
+        from bodhi.server.models import OutboxMessage
+        with self.db_factory() as db:
+            mine = db.query(OutboxMessage).filter(OutboxMessage.claimed_by == self.name)
+            if published:
+                mine.filter(OutboxMessage.message_id.in_(published)).delete(
+                    synchronize_session=False)
+            if failed:
+                mine.filter(OutboxMessage.message_id.in_(failed)).update(
+                    {'claimed_by': None, 'claimed_at': None}, synchronize_session=False)
+
+    def _recover(self):
+        """
+        Publish the messages left in the outbox by a publisher that failed or died.
+
+        The messages that no publisher claimed, or whose claim is older than the grace period, are
+        claimed atomically before being published, so that the other publishers skip them.
+        """
+        from bodhi.server.models import OutboxMessage
+        now = datetime.now(timezone.utc)
+        unclaimed = or_(OutboxMessage.claimed_at.is_(None),
+                        OutboxMessage.claimed_at < now - timedelta(seconds=_OUTBOX_GRACE))
+        with self.db_factory() as db:
+            query = db.query(OutboxMessage.id).filter(unclaimed)
+            queued = list(self._queued)
+            if queued:
+                # The messages still in the queue of this publisher are published from it.
+                query = query.filter(or_(OutboxMessage.claimed_by.is_(None),
+                                         OutboxMessage.claimed_by != self.name,
+                                         OutboxMessage.message_id.notin_(queued)))
+            left = query.order_by(OutboxMessage.id).limit(self.batch_size).all()
+            if not left:
+                return
+            # The claim only succeeds if nobody claimed the messages since they were listed.
+            db.query(OutboxMessage).filter(
+                OutboxMessage.id.in_([row.id for row in left]), unclaimed
+            ).update({'claimed_by': self.name, 'claimed_at': now}, synchronize_session=False)
+        with self.db_factory() as db:
+            rows = db.query(OutboxMessage).filter(
+                OutboxMessage.id.in_([row.id for row in left]),
+                OutboxMessage.claimed_by == self.name, OutboxMessage.claimed_at == now
+            ).order_by(OutboxMessage.id).all()
+            batch = []
+            for row in rows:
+                try:
+                    batch.append((fml_message.loads(row.body)[0], True))
+                except Exception:
+                    _log.exception('Dropping the invalid message %s from the outbox',
+                                   row.message_id)
+                    db.delete(row)
+        if batch:
+            self._publish_batch(batch, result='recovered')
+
+
+@crochet.run_in_reactor
+@defer.inlineCallbacks
+def _twisted_publish_all(messages: typing.List['base.BodhiMessage'],
+                         errors: typing.List[typing.Optional[Exception]]):
+    """
+    Publish messages in order from the Twisted reactor of fedora-messaging.
+
+    Args:
+        messages: The messages to publish.
+        errors: The list to append None to for each published message, or the exception it failed
+            with.
+    """
+    for message in messages:
+        try:
+            yield api.twisted_publish(message)
+        except defer.CancelledError:
+            raise
+        except Exception as e:
+            errors.append(e)
+        else:
+            errors.append(None)
+
+
+def _publish_all(messages: typing.List['base.BodhiMessage']) \
+        -> typing.List[typing.Optional[Exception]]:
+    """
+    Publish messages in order, over the connection of fedora-messaging to the broker.
+
+    The first message is published with api.publish(), which connects to the broker on first use.
+    If it times out, the broker is unreachable and the other messages are not tried: they fail at
+    once rather than waiting for the broker in turn. Otherwise, the other messages are handed to
+    the Twisted reactor of fedora-messaging all at once, which publishes them over the same
+    connection, and are waited for together.
+
+    Args:
+        messages: The messages to publish.
+    Returns:
+        For each message, None if it was published, or the exception it failed with.
+    """
+    try:
+        api.publish(messages[0], timeout=_PUBLISH_TIMEOUT)
+    except fml_exceptions.PublishTimeout as e:
+        return [e] * len(messages)
+    except fml_exceptions.BaseException as e:
+        errors = [e]  # type: typing.List[typing.Optional[Exception]]
+    else:
+        errors = [None]
+    if len(messages) > 1:
+        result = _twisted_publish_all(messages[1:], errors)
+        try:
+            result.wait(timeout=_PUBLISH_TIMEOUT)
+        except crochet.TimeoutError:
+            result.cancel()
+            # The messages the broker confirms from now on are published again later.
+            errors = list(errors)
+            timeout = fml_exceptions.PublishTimeout(
+                f'Publishing timed out after waiting {_PUBLISH_TIMEOUT} seconds.')
+            errors.extend([timeout] * (len(messages) - len(errors)))
+    return errors
+
+
 @backoff.on_exception(
     backoff.expo,
     (fml_exceptions.ConnectionException, fml_exceptions.PublishException), max_time=120)
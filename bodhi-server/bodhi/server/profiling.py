@@ -0,0 +1,222 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Profile the web requests and the composes on demand.
+
+Nothing is profiled unless ``profiling.directory`` is set. A ``profiling.sample_rate`` fraction of
+the web requests is then profiled, as well as the requests of the admins that have the
+``X-Bodhi-Profile`` header. With ``profiling.composes``, each phase of the composes is profiled.
+
+The profiles are written in a subdirectory of ``profiling.directory`` for each route or compose,
+in the ``profiling.format`` format: ``pstats`` files written by cProfile, or ``collapsed`` stacks
+sampled every few milliseconds, which the flame graph tools read. They are summarized with
+``bodhi-profiles``.
+
+Only one cProfile profile can be active at a time in a process, so the requests and phases that
+start while another one is profiled are not profiled. Since Python 3.12, cProfile also records the
+other threads of the process, so a ``pstats`` profile may include the work of concurrent requests.
+The ``collapsed`` profiles only sample their own thread, and can be taken concurrently.
+"""
+from collections import Counter
+from datetime import datetime, timezone
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import typing
+
+from bodhi.server.config import config
+from bodhi.server.services.metrics_tween import get_pattern
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import pyramid.request  # noqa: 401
+
+
+log = logging.getLogger(__name__)
+
+#: The header the admins set to have their request profiled.
+HEADER = 'X-Bodhi-Profile'
+# How many seconds there are between two samples of the collapsed profiles.
+_SAMPLE_INTERVAL = 0.005
+# Held while a cProfile profile is active.
+_cprofile_lock = threading.Lock()
+
+
+class Sampler:
+    """Sample the stack of a thread from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = _SAMPLE_INTERVAL):
+        """
+        Initialize the sampler.
+
+        Args:
+            thread_id: The identifier of the thread to sample.
+            interval: How many seconds to wait between two samples.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()  # type: typing.Counter[str]
+        self._stop = threading.Event()
+        self._thread = None  # type: typing.Optional[threading.Thread]
+
+    def enable(self):
+        """Start sampling the thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='bodhi-profiler', daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        """Stop sampling the thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        """Record the current stack of the thread."""
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path: str):
+        """
+        Write the sampled stacks in the collapsed format, with their number of samples.
+
+        Args:
+            path: The path of the file to write.
+        """
+        with open(path, 'w') as profile:
+            for stack, count in self.stacks.most_common():
+                profile.write(f'{stack} {count}\n')
+
+    def _run(self):
+        """Sample the thread until the sampler is disabled."""
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def start() -> typing.Optional[typing.Union[cProfile.Profile, Sampler]]:
+    """
+    Start profiling the current thread, in the configured format.
+
+    Returns:
+        The enabled profiler, to pass to stop(), or None if another cProfile profile is active.
+    """
+    if config['profiling.format'] == 'collapsed':
+        profile = Sampler(threading.get_ident())
+        profile.enable()
+        return profile
+    if not _cprofile_lock.acquire(blocking=False):
+        log.info('Not profiling, another profile is active')
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        # Another profiling tool is active, since Python 3.12
+        _cprofile_lock.release()
+        log.info('Not profiling: %s', e)
+        return None
+    return profile
+
+
+def stop(profile: typing.Union[cProfile.Profile, Sampler]):
+    """
+    Stop a profiler returned by start().
+
+    Args:
+        profile: The enabled profiler.
+    """
+    profile.disable()
+    if isinstance(profile, cProfile.Profile):
+        _cprofile_lock.release()
+
+
+def save(profile: typing.Union[cProfile.Profile, Sampler], category: str,
+         name: typing.Optional[str] = None) -> str:
+    """
+    Write a profile in the subdirectory of its category.
+
+    Args:
+        profile: The disabled profiler.
+        category: What was profiled, such as the route of a request.
+        name: What to prefix the file name with.
+    Returns:
+        The path of the written profile.
+    """
+    directory = os.path.join(config['profiling.directory'],
+                             re.sub(r'[^\w.-]+', '_', category).strip('_'))
+    os.makedirs(directory, exist_ok=True)
+    file_name = f'{datetime.now(timezone.utc):%Y%m%dT%H%M%S.%f}-{os.getpid()}'
+    if name:
+        file_name = f'{name}-{file_name}'
+    extension = 'collapsed' if isinstance(profile, Sampler) else 'pstats'
+    path = os.path.join(directory, f'{file_name}.{extension}')
+    profile.dump_stats(path)
+    return path
+
+
+def _should_profile(request: 'pyramid.request.Request') -> bool:
+    """
+    Return whether the given request should be profiled.
+
+    Args:
+        request: The request.
+    Returns:
+        True if the request is part of the sample, or if an admin asked for it to be profiled.
+    """
+    if random.random() < config['profiling.sample_rate']:
+        return True
+    if HEADER not in request.headers or request.identity is None:
+        return False
+    return bool({group.name for group in request.identity.groups} & set(config['admin_groups']))
+
+
+def profiling_tween_factory(handler, registry):
+    """
+    Create a tween that profiles the sampled requests.
+
+    The handler is returned as is when ``profiling.directory`` is not set, so that profiling costs
+    nothing when disabled.
+    """
+    if not config['profiling.directory']:
+        return handler
+
+    def tween(request):
+        if not _should_profile(request):
+            return handler(request)
+        profile = start()
+        if profile is None:
+            return handler(request)
+        try:
+            return handler(request)
+        finally:
+            stop(profile)
+            try:
+                path = save(profile, f'{request.method} {get_pattern(request)}')
+                log.info('Profiled %s %s in %s', request.method, request.path, path)
+            except OSError:
+                log.exception('Unable to save the profile of %s %s', request.method,
+                              request.path)
+    return tween
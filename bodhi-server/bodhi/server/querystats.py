@@ -0,0 +1,167 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Count the SQL statements issued by the web requests and the tasks.
+
+The statements executed while :func:`track` is active are counted and timed. The web requests are
+tracked by the metrics tween and the tasks by a Celery signal, which export the counts as
+prometheus histograms. Once a tracked request or task is done, a warning is logged for each
+statement it executed ``querystats.repeat_threshold`` times or more, as this is usually a
+relationship that is lazy loaded in a loop. The statements taking more than
+``querystats.slow_threshold`` seconds are logged with the Bodhi code that executed them, whether
+they are tracked or not.
+"""
+from collections import Counter
+import contextlib
+import contextvars
+import logging
+import os
+import time
+import traceback
+import typing
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from bodhi.server.config import config
+
+
+log = logging.getLogger(__name__)
+
+# The statistics that are currently being collected by this thread, innermost last.
+_active = contextvars.ContextVar('querystats', default=())
+# The directory of the bodhi package, and the one the paths of the call sites are relative to.
+_PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ROOT = os.path.dirname(_PACKAGE)
+
+
+class QueryStats:
+    """
+    The SQL statements executed while tracking.
+
+    Attributes:
+        name: What is being tracked, used in the logs.
+        count: How many statements were executed.
+        duration: How many seconds the statements took, in total.
+        statements: How many times each statement was executed. The statements are compared
+            without their parameters.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize the statistics.
+
+        Args:
+            name: What is being tracked.
+        """
+        self.name = name
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()  # type: typing.Counter[str]
+
+    def record(self, statement: str, duration: float):
+        """
+        Record an executed statement.
+
+        Args:
+            statement: The SQL statement.
+            duration: How many seconds the statement took.
+        """
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> typing.List[typing.Tuple[str, int]]:
+        """
+        Return the statements executed at least as many times as the threshold.
+
+        Args:
+            threshold: How many times a statement must have been executed.
+        Returns:
+            The statements and how many times they were executed, the most executed first.
+        """
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+@contextlib.contextmanager
+def track(name: str) -> typing.Iterator[QueryStats]:
+    """
+    Collect the statistics of the SQL statements executed by this thread in the block.
+
+    The blocks can be nested, the statements are then recorded by all of them. A warning is logged
+    for the statements repeated ``querystats.repeat_threshold`` times or more in the block.
+
+    Args:
+        name: What is being tracked, used in the logs.
+    Yields:
+        The statistics, which are updated until the block exits.
+    """
+    stats = QueryStats(name)
+    _active.set(_active.get() + (stats, ))
+    try:
+        yield stats
+    finally:
+        # The stats are removed rather than the previous value restored, as the Celery signals
+        # don't guarantee that the tracking blocks exit in order.
+        _active.set(tuple(s for s in _active.get() if s is not stats))
+        threshold = config['querystats.repeat_threshold']
+        if threshold:
+            for statement, count in stats.repeated(threshold):
+                log.warning('%s executed the same SQL statement %d times, it may be lazy loading '
+                            'a relationship in a loop: %s', name, count, statement)
+
+
+def _call_site() -> str:
+    """
+    Return the innermost Bodhi code of the current stack.
+
+    Returns:
+        The path, line and function of the code, or "unknown" if there is no Bodhi code in the
+        stack.
+    """
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(_PACKAGE + os.sep) and frame.filename != __file__:
+            return (f'{os.path.relpath(frame.filename, _ROOT)}:{frame.lineno} '
+                    f'in {frame.name}')
+    return 'unknown'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Remember when the statement started executing."""
+    conn.info.setdefault('querystats_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Record the statement in the active statistics, and log it if it was slow."""
+    duration = time.perf_counter() - conn.info['querystats_start'].pop()
+    for stats in _active.get():
+        stats.record(statement, duration)
+    threshold = config['querystats.slow_threshold']
+    if threshold and duration >= threshold:
+        log.warning('Slow SQL statement (%.3fs) executed from %s: %s', duration, _call_site(),
+                    statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    """Forget when the failed statement started executing."""
+    if context.connection is not None and context.connection.info.get('querystats_start'):
+        context.connection.info['querystats_start'].pop()
@@ -0,0 +1,223 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Decide in which order the composer runs the queued composes.
+
+The composes with security updates go first, then the stable composes, and then the shortest
+ones according to their estimated duration. Composes are mostly bound by the disk IO, so the two
+longest ones are not run at the same time when ``compose_scheduler.io_bound`` is set, as long as
+there are more composes than can run at once. Once they all fit, holding one of them back would only
+make the push longer.
+
+The same rules are used by the composer to start the composes, and by the ``/composes/`` service
+to estimate when each of them will be done.
+"""
+from datetime import datetime, timedelta
+import threading
+import typing
+
+from bodhi.server.config import config
+
+
+class Job(object):
+    """A compose, as seen by the scheduler."""
+
+    def __init__(self, key: typing.Hashable, security: bool, stable: bool,
+                 estimated_duration: float):
+        """
+        Initialize the Job.
+
+        Args:
+            key: Identifies the compose.
+            security: Whether the compose contains security updates.
+            stable: Whether this is a compose of stable updates.
+            estimated_duration: How many seconds the compose is expected to take.
+        """
+        self.key = key
+        self.security = security
+        self.stable = stable
+        self.estimated_duration = estimated_duration
+
+    @classmethod
+    def from_dict(cls, compose: dict) -> 'Job':
+        """
+        Return the Job of a compose in the format returned by :meth:`Compose.__json__`.
+
+        Args:
+            compose: The serialized compose.
+        Returns:
+            The Job of that compose.
+        """
+        return cls(
+            key=job_key(compose), security=compose.get('security', False),
+            stable=compose['request'] == 'stable',
+            estimated_duration=(compose.get('estimated_duration')
+                                or config['compose_scheduler.default_duration']))
+
+    def __repr__(self) -> str:
+        """Return a representation of the Job for debugging."""
+        return f'<Job {self.key} ({self.estimated_duration}s)>'
+
+
+def job_key(compose: dict) -> typing.Tuple[int, str]:
+    """
+    Return the key identifying a compose in the format returned by :meth:`Compose.__json__`.
+
+    Args:
+        compose: The serialized compose.
+    Returns:
+        The release id and request of the compose.
+    """
+    return compose['release_id'], compose['request']
+
+
+def priority(job: Job) -> tuple:
+    """
+    Return the sort key of a job, the lowest runs first.
+
+    Args:
+        job: The job to sort.
+    Returns:
+        A key to sort the jobs by priority.
+    """
+    return not job.security, not job.stable, job.estimated_duration
+
+
+def next_job(queued: typing.Iterable[Job], running: typing.Iterable[Job],
+             max_concurrent: int) -> typing.Optional[Job]:
+    """
+    Return the queued job to start now, if any.
+
+    Args:
+        queued: The jobs waiting to run.
+        running: The jobs being run.
+        max_concurrent: How many jobs can run at the same time.
+    Returns:
+        The job to start, or None if no job can start until a running one is done.
+    """
+    queued = list(queued)
+    running = list(running)
+    if not queued or len(running) >= max_concurrent:
+        return None
+
+    largest = set()
+    if config['compose_scheduler.io_bound'] and len(queued) + len(running) > max_concurrent:
+        largest = {job.key for job in sorted(
+            queued + running, key=lambda j: j.estimated_duration, reverse=True)[:2]}
+    running_largest = any(job.key in largest for job in running)
+    for job in sorted(queued, key=priority):
+        if running_largest and job.key in largest:
+            continue
+        return job
+    return None
+
+
+def simulate(queued: typing.Iterable[Job], running: typing.Dict[Job, datetime],
+             max_concurrent: int, now: datetime) \
+        -> typing.List[typing.Tuple[Job, typing.Optional[datetime], typing.Optional[datetime]]]:
+    """
+    Estimate when the given jobs will start and end.
+
+    Args:
+        queued: The jobs waiting to run.
+        running: Map the running jobs to the time they are expected to end.
+        max_concurrent: How many jobs can run at the same time.
+        now: The time to start the simulation at.
+    Returns:
+        The queued jobs, with the time they should start and end, in the order they should start.
+        The jobs that can never start, such as when ``max_concurrent`` is 0, come last with no
+        start nor end.
+    """
+    queued = list(queued)
+    # The running jobs that should already be done are about to be.
+    running = {job: max(end, now) for job, end in running.items()}
+    schedule = []
+    while queued:
+        job = next_job(queued, running, max_concurrent)
+        if job is None:
+            if not running:
+                schedule.extend((job, None, None) for job in queued)
+                break
+            # Wait for the next running job to be done.
+            now = running.pop(min(running, key=running.get))
+            continue
+        end = now + timedelta(seconds=job.estimated_duration)
+        queued.remove(job)
+        running[job] = end
+        schedule.append((job, now, end))
+    return schedule
+
+
+class ComposeScheduler(object):
+    """
+    Make the composer threads wait until the scheduler lets them run.
+
+    The composes are added to the scheduler before their threads are started, so that the threads
+    start in the right order regardless of which one asks first.
+    """
+
+    def __init__(self, max_concurrent: int):
+        """
+        Initialize the ComposeScheduler.
+
+        Args:
+            max_concurrent: How many composes can run at the same time.
+        """
+        self.max_concurrent = max_concurrent
+        self._condition = threading.Condition()
+        self._queued = {}  # type: typing.Dict[typing.Hashable, Job]
+        self._running = {}  # type: typing.Dict[typing.Hashable, Job]
+
+    def add(self, compose: dict):
+        """
+        Queue the given compose.
+
+        Args:
+            compose: The compose, in the format returned by :meth:`Compose.__json__`.
+        """
+        job = Job.from_dict(compose)
+        with self._condition:
+            self._queued[job.key] = job
+            self._condition.notify_all()
+
+    def acquire(self, compose: dict):
+        """
+        Block until the given compose can run.
+
+        Args:
+            compose: The compose, in the format returned by :meth:`Compose.__json__`.
+        """
+        key = job_key(compose)
+        with self._condition:
+            if key not in self._queued:
+                self._queued[key] = Job.from_dict(compose)
+            self._condition.wait_for(
+                lambda: next_job(self._queued.values(), self._running.values(),
+                                 self.max_concurrent) is self._queued[key])
+            self._running[key] = self._queued.pop(key)
+
+    def release(self, compose: dict):
+        """
+        Let the other composes run once the given one is done.
+
+        Args:
+            compose: The compose, in the format returned by :meth:`Compose.__json__`.
+        """
+        with self._condition:
+            self._running.pop(job_key(compose), None)
+            self._condition.notify_all()
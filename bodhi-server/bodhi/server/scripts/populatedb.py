@@ -0,0 +1,467 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Populate a Bodhi database with a generated dataset, to load and performance test Bodhi.
+
+The dataset is made of releases, users, packages and their builds, updates with their comments,
+bugs and test case feedback, buildroot overrides and composes. The rows are inserted in bulk, and
+a seed always generates the same dataset, with dates relative to the day it is generated on.
+
+The packages are named like the ones of bodhi.server.buildsys.KojiDataset, so both can be used
+together. The dataset is meant to be generated in a database created by initialize_bodhi_db.
+"""
+from datetime import datetime, time, timedelta, timezone
+import random
+import sys
+import typing
+
+import click
+from pyramid.paster import get_appsettings
+from sqlalchemy import func, insert, select, text
+
+from bodhi.server import Session, initialize_db
+from bodhi.server.logging import setup as setup_logging
+from ..models import (
+    Bug,
+    BugFeedback,
+    Build,
+    BuildrootOverride,
+    Comment,
+    Compose,
+    ComposeState,
+    ContentType,
+    Group,
+    Package,
+    PackageManager,
+    Release,
+    ReleaseState,
+    TestCase,
+    TestCaseFeedback,
+    TestGatingStatus,
+    Update,
+    UpdateRequest,
+    UpdateSeverity,
+    UpdateStatus,
+    UpdateType,
+    User,
+    build_testcase_table,
+    update_bug_table,
+    user_group_table,
+)
+
+
+#: How often the updates are in each status.
+STATUSES = {UpdateStatus.stable: 70, UpdateStatus.obsolete: 10, UpdateStatus.unpushed: 5,
+            UpdateStatus.testing: 12, UpdateStatus.pending: 3}
+#: How often the updates are of each type.
+TYPES = {UpdateType.bugfix: 60, UpdateType.enhancement: 20, UpdateType.security: 15,
+         UpdateType.newpackage: 5}
+#: How often the comments give each karma.
+KARMA = {0: 80, 1: 16, -1: 4}
+#: The groups of the users, and the share of the users in each of them.
+GROUPS = {'packager': 1, 'provenpackager': 0.1, 'qa': 0.05}
+
+
+class DatasetGenerator:
+    """Generate a dataset and insert it in the database."""
+
+    def __init__(self, db, seed: int = 0, batch_size: int = 10000):
+        """
+        Initialize the generator.
+
+        Args:
+            db (sqlalchemy.orm.session.Session): The database session to insert the dataset with.
+            seed: The seed of the dataset.
+            batch_size: How many rows are inserted with each statement.
+        """
+        self.db = db
+        self.rand = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = datetime.combine(datetime.now(timezone.utc).date(), time(), timezone.utc)
+        #: How many rows were inserted in each table.
+        self.counts = {}  # type: typing.Dict[str, int]
+
+    def _ids(self, model, count: int) -> range:
+        """
+        Return the ids of the given number of new rows of a model.
+
+        Args:
+            model (bodhi.server.models.Base): The model of the rows.
+            count: How many rows will be inserted.
+        Returns:
+            The ids of the new rows.
+        """
+        start = (self.db.execute(select(func.max(model.id))).scalar() or 0) + 1
+        return range(start, start + count)
+
+    def _insert(self, table, rows: typing.List[typing.Dict[str, typing.Any]]):
+        """
+        Insert the given rows in batches.
+
+        Args:
+            table (sqlalchemy.Table): The table to insert the rows in.
+            rows: The rows to insert.
+        """
+        for i in range(0, len(rows), self.batch_size):
+            self.db.execute(insert(table), rows[i:i + self.batch_size])
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+
+    def _date(self, days: float) -> datetime:
+        """
+        Return a random date in the given number of past days.
+
+        Args:
+            days: How many days ago the oldest date is.
+        Returns:
+            The date.
+        """
+        return self.now - timedelta(seconds=self.rand.uniform(0, days * 86400))
+
+    def _count(self, mean: float) -> int:
+        """
+        Return a random number of items, that is small most of the time.
+
+        Args:
+            mean: The mean number of items.
+        Returns:
+            The number of items.
+        """
+        return round(self.rand.expovariate(1 / mean)) if mean > 0 else 0
+
+    def generate(self, releases: int = 4, first_release: int = 36, users: int = 2000,
+                 packages: int = 20000, builds: int = 300000, updates: int = 150000,
+                 comments: float = 4, bugs: float = 1, overrides: int = 5000) \
+            -> typing.Dict[str, int]:
+        """
+        Generate the dataset.
+
+        Args:
+            releases: How many releases there are.
+            first_release: The version of the oldest release.
+            users: How many users there are.
+            packages: How many packages there are.
+            builds: How many builds there are, most of them are in updates.
+            updates: How many updates there are, at most one per build.
+            comments: The mean number of comments on an update.
+            bugs: The mean number of bugs of an update.
+            overrides: How many buildroot overrides there are.
+        Returns:
+            How many rows were inserted in each table.
+        """
+        user_ids = self._users(users)
+        release_ids = self._releases(releases, first_release)
+        package_ids = self._packages(packages)
+        testcases = self._testcases(package_ids)
+        build_rows = self._builds(builds, release_ids, package_ids)
+        update_rows = self._updates(updates, release_ids, user_ids, build_rows)
+        self._composes(update_rows)
+        self._insert(Update.__table__, update_rows)
+        self._insert(Build.__table__, build_rows)
+        self._insert(build_testcase_table, [
+            {'build_id': build['id'], 'testcase_id': testcase}
+            for build in build_rows if build['update_id']
+            for testcase in testcases.get(build['package_id'], [])])
+        self._comments(comments, bugs, update_rows, build_rows, user_ids, testcases)
+        self._overrides(overrides, build_rows, user_ids)
+        self._reset_sequences()
+        return self.counts
+
+    def _users(self, count: int) -> typing.List[int]:
+        """Insert the users and their groups, and return their ids."""
+        ids = self._ids(User, count)
+        self._insert(User.__table__, [
+            {'id': i, 'name': f'user{i}', 'email': f'user{i}@example.com'} for i in ids])
+        memberships = []
+        for name, share in GROUPS.items():
+            group = self.db.query(Group).filter_by(name=name).first()
+            if group is None:
+                group = Group(name=name)
+                self.db.add(group)
+                self.db.flush()
+            memberships.extend({'user_id': i, 'group_id': group.id}
+                               for i in ids if self.rand.random() < share)
+        self._insert(user_group_table, memberships)
+        return list(ids)
+
+    def _releases(self, count: int, first: int) -> typing.List[int]:
+        """Insert the releases, from the archived oldest one to the pending newest one."""
+        ids = self._ids(Release, count)
+        rows = []
+        for i, (release_id, version) in enumerate(zip(ids, range(first, first + count))):
+            state = ReleaseState.current
+            if i == count - 1:
+                state = ReleaseState.pending
+            elif i == 0 and count > 2:
+                state = ReleaseState.archived
+            rows.append({
+                'id': release_id, 'name': f'F{version}', 'long_name': f'Fedora {version}',
+                'version': str(version), 'id_prefix': 'FEDORA', 'branch': f'f{version}',
+                'dist_tag': f'f{version}', 'stable_tag': f'f{version}-updates',
+                'testing_tag': f'f{version}-updates-testing',
+                'candidate_tag': f'f{version}-updates-candidate',
+                'pending_signing_tag': f'f{version}-signing-pending',
+                'pending_testing_tag': f'f{version}-updates-testing-pending',
+                'pending_stable_tag': f'f{version}-updates-pending',
+                'override_tag': f'f{version}-override', 'state': state,
+                'package_manager': PackageManager.dnf,
+                'testing_repository': 'updates-testing'})
+        self._insert(Release.__table__, rows)
+        return list(ids)
+
+    def _packages(self, count: int) -> typing.List[int]:
+        """Insert the packages, and return their ids."""
+        ids = self._ids(Package, count)
+        self._insert(Package.__table__, [
+            {'id': package_id, 'name': f'package{i}', 'type': ContentType.rpm}
+            for i, package_id in enumerate(ids)])
+        return list(ids)
+
+    def _testcases(self, package_ids: typing.List[int]) -> typing.Dict[int, typing.List[int]]:
+        """Insert the test cases of a fifth of the packages, and return them by package."""
+        tested = [p for p in package_ids if self.rand.random() < 0.2]
+        ids = iter(self._ids(TestCase, len(tested) * 3))
+        testcases = {p: [next(ids) for i in range(self.rand.randint(1, 3))] for p in tested}
+        self._insert(TestCase.__table__, [
+            {'id': testcase, 'name': f'QA:Testcase {package} {i}'}
+            for package, package_testcases in testcases.items()
+            for i, testcase in enumerate(package_testcases)])
+        return testcases
+
+    def _builds(self, count: int, release_ids: typing.List[int],
+                package_ids: typing.List[int]) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        Return the rows of the builds.
+
+        A few packages have many builds, like in Fedora, and the newer releases have more builds.
+        """
+        package_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(package_ids))]
+        release_weights = [i + 1 for i in range(len(release_ids))]
+        versions = self.db.query(Release.id, Release.version).filter(
+            Release.id.in_(release_ids)).all()
+        dists = {release_id: f'fc{version}' for release_id, version in versions}
+        packages = self.rand.choices(range(len(package_ids)), package_weights, k=count)
+        releases = self.rand.choices(release_ids, release_weights, k=count)
+        builds_of = {}  # type: typing.Dict[typing.Tuple[int, int], int]
+        rows = []
+        for build_id, package, release_id in zip(self._ids(Build, count), packages, releases):
+            number = builds_of[package, release_id] = builds_of.get((package, release_id), 0) + 1
+            rows.append({
+                'id': build_id, 'nvr': f'package{package}-{number}.0-1.{dists[release_id]}',
+                'package_id': package_ids[package], 'release_id': release_id, 'update_id': None,
+                'signed': self.rand.random() < 0.99, 'type': ContentType.rpm, 'epoch': 0})
+        return rows
+
+    def _updates(self, count: int, release_ids: typing.List[int], user_ids: typing.List[int],
+                 build_rows: typing.List[typing.Dict[str, typing.Any]]) \
+            -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        Return the rows of the updates, and put the builds in them.
+
+        Most updates have a single build, a tenth of them have up to five. The updates that are
+        still in progress were submitted in the last month.
+        """
+        available = {release_id: [] for release_id in release_ids}
+        for build in build_rows:
+            available[build['release_id']].append(build)
+        for builds in available.values():
+            self.rand.shuffle(builds)
+        rows = []
+        for update_id in self._ids(Update, count):
+            release_id = self.rand.choice([r for r in release_ids if available[r]] or [None])
+            if release_id is None:
+                break
+            size = 1 if self.rand.random() < 0.9 else self.rand.randint(2, 5)
+            builds = [available[release_id].pop() for i in range(size) if available[release_id]]
+            for build in builds:
+                build['update_id'] = update_id
+            status = self.rand.choices(list(STATUSES), list(STATUSES.values()))[0]
+            update_type = self.rand.choices(list(TYPES), list(TYPES.values()))[0]
+            request = None
+            if status is UpdateStatus.pending:
+                request = UpdateRequest.testing
+            elif status is UpdateStatus.testing and self.rand.random() < 0.2:
+                request = UpdateRequest.stable
+            submitted = self._date(30 if status in (UpdateStatus.pending, UpdateStatus.testing)
+                                   else 730)
+            date_testing = date_stable = None
+            if status is not UpdateStatus.pending:
+                date_testing = submitted + timedelta(hours=self.rand.uniform(1, 24))
+            if status is UpdateStatus.stable:
+                date_stable = date_testing + timedelta(days=self.rand.uniform(0, 14))
+            rows.append({
+                'id': update_id, 'alias': f'FEDORA-{submitted.year}-{update_id:010x}',
+                'release_id': release_id, 'user_id': self.rand.choice(user_ids),
+                'display_name': '', 'notes': f'Update of {", ".join(b["nvr"] for b in builds)}.',
+                'type': update_type, 'status': status, 'request': request,
+                'severity': (self.rand.choice([UpdateSeverity.low, UpdateSeverity.medium,
+                                               UpdateSeverity.high, UpdateSeverity.urgent])
+                             if update_type is UpdateType.security
+                             else UpdateSeverity.unspecified),
+                'stable_karma': 3, 'unstable_karma': -3, 'stable_days': 7, 'autokarma': True,
+                'autotime': True, 'critpath': self.rand.random() < 0.1, 'locked': False,
+                'pushed': status not in (UpdateStatus.pending, UpdateStatus.unpushed),
+                'date_submitted': submitted, 'date_modified': None, 'date_testing': date_testing,
+                'date_stable': date_stable,
+                'test_gating_status': self.rand.choices(
+                    [TestGatingStatus.passed, TestGatingStatus.ignored,
+                     TestGatingStatus.failed], [80, 15, 5])[0]})
+        return rows
+
+    def _comments(self, comments: float, bugs: float,
+                  update_rows: typing.List[typing.Dict[str, typing.Any]],
+                  build_rows: typing.List[typing.Dict[str, typing.Any]],
+                  user_ids: typing.List[int], testcases: typing.Dict[int, typing.List[int]]):
+        """Insert the bugs of the updates, and the comments with their karma and feedback."""
+        packages_of = {}  # type: typing.Dict[int, typing.List[int]]
+        for build in build_rows:
+            if build['update_id']:
+                packages_of.setdefault(build['update_id'], []).append(build['package_id'])
+        bug_ids = self._ids(Bug, 0).start
+        next_bug = (self.db.execute(select(func.max(Bug.bug_id))).scalar() or 1000000) + 1
+        bug_rows, links, comment_rows, bug_feedback, testcase_feedback = [], [], [], [], []
+        comment_ids = iter(range(self._ids(Comment, 0).start, sys.maxsize))
+        for update in update_rows:
+            update_bugs = []
+            for i in range(self._count(bugs)):
+                if bug_rows and self.rand.random() < 0.1:
+                    # The same bug is often fixed by the updates of several releases.
+                    bug = self.rand.choice(bug_rows)
+                else:
+                    bug = {'id': bug_ids + len(bug_rows), 'bug_id': next_bug + len(bug_rows),
+                           'title': f'Bug {next_bug + len(bug_rows)}', 'parent': False,
+                           'security': update['type'] is UpdateType.security}
+                    bug_rows.append(bug)
+                if bug['bug_id'] not in update_bugs:
+                    update_bugs.append(bug['bug_id'])
+                    links.append({'update_id': update['id'], 'bug_id': bug['id']})
+            update_testcases = [t for p in packages_of.get(update['id'], [])
+                                for t in testcases.get(p, [])]
+            timestamp = update['date_submitted']
+            for i in range(self._count(comments)):
+                comment_id = next(comment_ids)
+                karma = self.rand.choices(list(KARMA), list(KARMA.values()))[0]
+                timestamp = min(timestamp + timedelta(hours=self.rand.uniform(0, 48)), self.now)
+                comment_rows.append({
+                    'id': comment_id, 'update_id': update['id'],
+                    'user_id': self.rand.choice(user_ids), 'karma': karma, 'karma_critpath': 0,
+                    'text': 'Works for me.' if karma > 0 else 'Broken.' if karma else 'Thanks!',
+                    'timestamp': timestamp})
+                if karma and update_bugs and self.rand.random() < 0.3:
+                    bug_feedback.append({'comment_id': comment_id, 'feedback': karma,
+                                         'bug_id': self.rand.choice(update_bugs)})
+                if karma and update_testcases and self.rand.random() < 0.5:
+                    testcase_feedback.append({'comment_id': comment_id, 'feedback': karma,
+                                              'testcase_id': self.rand.choice(update_testcases)})
+        self._insert(Bug.__table__, bug_rows)
+        self._insert(update_bug_table, links)
+        self._insert(Comment.__table__, comment_rows)
+        self._insert(BugFeedback.__table__, bug_feedback)
+        self._insert(TestCaseFeedback.__table__, testcase_feedback)
+
+    def _overrides(self, count: int, build_rows: typing.List[typing.Dict[str, typing.Any]],
+                   user_ids: typing.List[int]):
+        """Insert the buildroot overrides, most of which expired."""
+        rows = []
+        builds = self.rand.sample(build_rows, min(count, len(build_rows)))
+        for override_id, build in zip(self._ids(BuildrootOverride, len(builds)), builds):
+            submitted = self._date(365)
+            expiration = submitted + timedelta(days=self.rand.randint(1, 31))
+            rows.append({
+                'id': override_id, 'build_id': build['id'],
+                'submitter_id': self.rand.choice(user_ids),
+                'notes': f'Override of {build["nvr"]}.', 'submission_date': submitted,
+                'expiration_date': expiration,
+                'expired_date': expiration if expiration < self.now else None})
+        self._insert(BuildrootOverride.__table__, rows)
+
+    def _composes(self, update_rows: typing.List[typing.Dict[str, typing.Any]]):
+        """Insert a compose for the requests of each release, and lock their updates."""
+        existing = set(self.db.query(Compose.release_id, Compose.request))
+        composes = {}
+        for update in update_rows:
+            key = (update['release_id'], update['request'])
+            if update['request'] is None or key in existing:
+                continue
+            if key not in composes:
+                composes[key] = {
+                    'release_id': key[0], 'request': key[1],
+                    'state': self.rand.choice([ComposeState.requested, ComposeState.punging,
+                                               ComposeState.failed]),
+                    'date_created': self._date(1), 'checkpoints': '{}', 'phases': '[]'}
+            # The composes were requested before the last updates were, so they don't have them.
+            update['locked'] = update['date_submitted'] < composes[key]['date_created']
+        self._insert(Compose.__table__, list(composes.values()))
+
+    def _reset_sequences(self):
+        """Make PostgreSQL generate ids that come after the inserted ones."""
+        if self.db.get_bind().dialect.name != 'postgresql':
+            return
+        for table in (User, Release, Package, TestCase, Build, Update, Bug, Comment,
+                      BuildrootOverride):  # pragma: no cover
+            name = table.__tablename__
+            self.db.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                f"(SELECT max(id) FROM {name}))"))
+
+
+@click.command()
+@click.argument('config_uri')
+@click.option('--seed', default=0, show_default=True, help='The seed of the dataset.')
+@click.option('--releases', default=4, show_default=True, help='How many releases to create.')
+@click.option('--first-release', default=36, show_default=True,
+              help='The version of the oldest release.')
+@click.option('--users', default=2000, show_default=True, help='How many users to create.')
+@click.option('--packages', default=20000, show_default=True,
+              help='How many packages to create.')
+@click.option('--builds', default=300000, show_default=True, help='How many builds to create.')
+@click.option('--updates', default=150000, show_default=True,
+              help='How many updates to create.')
+@click.option('--comments', default=4.0, show_default=True,
+              help='The mean number of comments on an update.')
+@click.option('--bugs', default=1.0, show_default=True,
+              help='The mean number of bugs of an update.')
+@click.option('--overrides', default=5000, show_default=True,
+              help='How many buildroot overrides to create.')
+@click.option('--batch-size', default=10000, show_default=True,
+              help='How many rows to insert with each statement.')
+@click.version_option(message='%(version)s')
+def main(config_uri, seed, batch_size, **sizes):
+    """
+    Populate the database with a generated dataset, for load and performance testing.
+
+    This function is the entry point used by the bodhi-populate-db console script.
+
+    Args:
+        config_uri (str): The path to the configuration file (example: development.ini).
+        seed (int): The seed of the dataset.
+        batch_size (int): How many rows to insert with each statement.
+        sizes (dict): The sizes of the dataset, see DatasetGenerator.generate().
+    """
+    setup_logging()
+    initialize_db(get_appsettings(config_uri))
+    db = Session()
+    try:
+        counts = DatasetGenerator(db, seed=seed, batch_size=batch_size).generate(**sizes)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise click.ClickException(str(e))
+    finally:
+        Session.remove()
+    for table, count in counts.items():
+        click.echo(f'{table}: {count}')
@@ -0,0 +1,116 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This script summarizes the profiles of the web requests and the composes."""
+
+from collections import Counter
+import glob
+import io
+import os
+import pstats
+import sys
+import typing
+
+import click
+
+from bodhi.server.config import config
+
+
+def summarize_pstats(paths: typing.List[str], sort: str, limit: int) -> str:
+    """
+    Return the statistics of the functions in the given cProfile profiles, added up.
+
+    Args:
+        paths: The paths of the pstats files.
+        sort: ``cumulative`` to sort the functions by the time spent in them and in the functions
+            they called, ``tottime`` by the time spent in them only.
+        limit: How many functions to show.
+    Returns:
+        The statistics of the slowest functions, as printed by pstats.
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(*paths, stream=output)
+    # pstats starts with the list of the profiles, which the summary already counts.
+    stats.files = []
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def summarize_collapsed(paths: typing.List[str], sort: str, limit: int) -> str:
+    """
+    Return the share of the samples of the functions in the given collapsed profiles.
+
+    Args:
+        paths: The paths of the collapsed stack files.
+        sort: ``cumulative`` to sort the functions by the samples they are in, ``tottime`` by the
+            samples they are at the top of.
+        limit: How many functions to show.
+    Returns:
+        A table of the functions most often in the sampled stacks.
+    """
+    samples = 0
+    own = Counter()  # type: typing.Counter[str]
+    total = Counter()  # type: typing.Counter[str]
+    for path in paths:
+        with open(path) as profile:
+            for line in profile:
+                stack, count = line.rsplit(' ', 1)
+                frames = stack.split(';')
+                samples += int(count)
+                own[frames[-1]] += int(count)
+                for frame in set(frames):
+                    total[frame] += int(count)
+
+    lines = [f'{samples} samples', f'{"own":>7} {"total":>7}  function']
+    for function, _ in (total if sort == 'cumulative' else own).most_common(limit):
+        lines.append(f'{own[function] / samples:7.1%} {total[function] / samples:7.1%}  '
+                     f'{function}')
+    return '\n'.join(lines) + '\n'
+
+
+@click.command()
+@click.argument('directory', required=False, type=click.Path(exists=True, file_okay=False))
+@click.option('--sort', type=click.Choice(['cumulative', 'tottime']), default='cumulative',
+              show_default=True,
+              help='Sort the functions by the time spent in them and in the functions they called '
+                   '(cumulative), or in them only (tottime).')
+@click.option('--limit', default=20, show_default=True,
+              help='How many functions to show for each route or compose.')
+@click.option('--match', help='Only summarize the routes and composes whose name contains this.')
+@click.version_option(message='%(version)s')
+def summarize(directory, sort, limit, match):
+    """Summarize the profiles in DIRECTORY, by default the profiling.directory setting."""
+    directory = directory or config['profiling.directory']
+    if not directory:
+        click.echo('profiling.directory is not set.', err=True)
+        sys.exit(1)
+
+    for category in sorted(os.listdir(directory)):
+        if match and match not in category:
+            continue
+        if not os.path.isdir(os.path.join(directory, category)):
+            continue
+        for extension, summarize_profiles in (('pstats', summarize_pstats),
+                                              ('collapsed', summarize_collapsed)):
+            paths = sorted(glob.glob(os.path.join(directory, category, f'*.{extension}')))
+            if paths:
+                click.echo(f'==> {category}: {len(paths)} {extension} profiles')
+                click.echo(summarize_profiles(paths, sort, limit))
+
+
+if __name__ == '__main__':
+    summarize()
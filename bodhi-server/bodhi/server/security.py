@@ -16,6 +16,9 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """A collection of authentication and authorization functions and classes."""
+from collections import OrderedDict
+import threading
+import time
 import typing
 
 from cornice.errors import Errors
@@ -27,10 +30,82 @@ from pyramid.authorization import (
 from pyramid.request import RequestLocalCache
 from pyramid.threadlocal import get_current_registry
 
+from bodhi.server.config import config
+
 if typing.TYPE_CHECKING:  # pragma: no cover
     import pyramid.request.Request  # noqa: 401
 
 
+class IdentityCache:
+    """
+    Remember the identities of the users for ``identity_cache.ttl`` seconds.
+
+    The identities hold the name, the e-mail address, the groups and the OpenID URL of the users,
+    as the identity of the testing security policy. Up to ``identity_cache.max_size`` identities
+    are remembered, the least recently used ones are forgotten first.
+
+    Each process has its own cache. When a user logs in again, only the process serving the login
+    forgets their identity, so the other processes may keep granting the groups the user was
+    removed from until their cached identity expires. This staleness is accepted, and is bounded
+    by ``identity_cache.ttl``: set it to 0 where a revocation must take effect at once.
+    """
+
+    def __init__(self):
+        """Initialize the cache."""
+        self._lock = threading.Lock()
+        # Map the user names to the monotonic time their identity expires at, and the identity.
+        self._identities = OrderedDict()  # type: OrderedDict[str, typing.Tuple[float, dict]]
+
+    def get(self, name: str) -> typing.Optional[dict]:
+        """
+        Return the identity of a user.
+
+        Args:
+            name: The name of the user.
+        Returns:
+            The identity of the user, or None if it isn't cached or expired.
+        """
+        with self._lock:
+            cached = self._identities.get(name)
+            if cached is None:
+                return None
+            if cached[0] <= time.monotonic():
+                del self._identities[name]
+                return None
+            self._identities.move_to_end(name)
+            return cached[1]
+
+    def set(self, name: str, identity: dict):
+        """
+        Remember the identity of a user.
+
+        Args:
+            name: The name of the user.
+            identity: The identity of the user.
+        """
+        if config['identity_cache.ttl'] <= 0:
+            return
+        with self._lock:
+            self._identities.pop(name, None)
+            self._identities[name] = (time.monotonic() + config['identity_cache.ttl'], identity)
+            while len(self._identities) > config['identity_cache.max_size']:
+                self._identities.popitem(last=False)
+
+    def invalidate(self, name: str):
+        """
+        Forget the identity of a user, because their e-mail address or their groups changed.
+
+        Args:
+            name: The name of the user.
+        """
+        with self._lock:
+            self._identities.pop(name, None)
+
+
+#: The identities of the users of this process.
+identities = IdentityCache()
+
+
 class BodhiSecurityPolicy:  # pragma: no cover
     """Define a custom Pyramid security policy."""
 
@@ -47,11 +122,22 @@ class BodhiSecurityPolicy:  # pragma: no cover
         identity = self.helper.identify(request)
         if identity is None:
             return None
-        user = request.db.query(User).filter_by(name=str(identity['userid'])).first()
-        if user is None:
-            return None
+        userid = str(identity['userid'])
+        cached = identities.get(userid)
+        if cached is None:
+            user = request.db.query(User).filter_by(name=userid).first()
+            if user is None:
+                return None
+            cached = {
+                'name': user.name,
+                'email': user.email,
+                'groups': [{'name': group.name} for group in user.groups],
+                'openid': user.openid(request),
+            }
+            identities.set(userid, cached)
         # Why munch?  https://github.com/fedora-infra/bodhi/issues/473
-        return munchify(user.__json__(request=request))
+        # munchify() copies the cached identity, so the request can't alter it.
+        return munchify(cached)
 
     def identity(self, request):
         """Load identity from cache if already loaded."""
@@ -17,15 +17,56 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """Defines service endpoints pertaining to Composes."""
 
+from datetime import datetime, timedelta, timezone
+
 from cornice.resource import resource, view
 from pyramid import httpexceptions
 from pyramid.authorization import Allow, Everyone
 from sqlalchemy.orm import exc
 
-from bodhi.server import models, security
+from bodhi.server import models, scheduler, security
+from bodhi.server.config import config
 from bodhi.server.services import errors
 
 
+def _queue(composes):
+    """
+    Estimate when the given composes will start and end, the way the composer schedules them.
+
+    Args:
+        composes (list): The :class:`Composes <bodhi.server.models.Compose>` to estimate.
+    Returns:
+        list: A dictionary for each compose that is queued or running, in the order they should
+            start, with the ``release`` name, the ``request``, and the ``estimated_start`` and
+            ``estimated_end`` of the compose. ``estimated_start`` is None for the running composes,
+            and both are None for the composes that can't be scheduled.
+    """
+    now = datetime.now(timezone.utc)
+    queued = []
+    running = {}
+    for compose in composes:
+        if compose.state in (models.ComposeState.failed, models.ComposeState.success):
+            continue
+        job = scheduler.Job(
+            key=(compose.release.name, compose.request.value), security=compose.security,
+            stable=compose.request is models.UpdateRequest.stable,
+            estimated_duration=(compose.estimated_duration
+                                or config['compose_scheduler.default_duration']))
+        if compose.state in (models.ComposeState.requested, models.ComposeState.pending):
+            queued.append(job)
+        else:
+            started = compose.date_started or compose.state_date
+            running[job] = started + timedelta(seconds=job.estimated_duration)
+
+    schedule = sorted(((job, None, max(end, now)) for job, end in running.items()),
+                      key=lambda s: s[2])
+    schedule.extend(scheduler.simulate(queued, running, config['max_concurrent_composes'], now))
+    return [{'release': job.key[0], 'request': job.key[1],
+             'estimated_start': start and start.strftime('%Y-%m-%d %H:%M:%S'),
+             'estimated_end': end and end.strftime('%Y-%m-%d %H:%M:%S')}
+            for job, start, end in schedule]
+
+
 @resource(collection_path='/composes/', path='/composes/{release_name}/{request}',
           description='Compose service')
 class Composes(object):
@@ -68,9 +109,12 @@ class Composes(object):
         This method responds to the ``/composes/`` endpoint.
 
         Returns:
-            dict: A dictionary mapping the key 'composes' to an iterable of all Compose objects.
+            dict: A dictionary mapping the key 'composes' to an iterable of all Compose objects,
+                and the key 'queue' to the order in which the queued and running composes should
+                start and end.
         """
-        return {'composes': sorted(models.Compose.query.all())}
+        composes = sorted(models.Compose.query.all())
+        return {'composes': composes, 'queue': _queue(composes)}
 
     @view(accept=('application/json', 'text/json'), renderer='json',
           cors_origins=security.cors_origins_ro, error_handler=errors.json_handler,
@@ -6,6 +6,9 @@ from time import time
 from prometheus_client import Histogram, Gauge
 from pyramid.interfaces import IRoutesMapper
 
+from bodhi.server import querystats, spans
+from bodhi.server.config import config
+
 
 def get_pattern(request):
     """
@@ -38,6 +41,28 @@ pyramid_request = Histogram(
 )
 
 
+pyramid_request_sql_queries = Histogram(
+    'pyramid_request_sql_queries',
+    'SQL statements executed by HTTP requests',
+    labelnames=['method', 'path_info_pattern'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf')),
+)
+
+
+pyramid_request_sql_duration = Histogram(
+    'pyramid_request_sql_duration_seconds',
+    'Time spent executing the SQL statements of HTTP requests',
+    labelnames=['method', 'path_info_pattern'],
+)
+
+
+pyramid_request_dependency_duration = Histogram(
+    'pyramid_request_dependency_duration_seconds',
+    'Time spent by HTTP requests waiting for the services Bodhi depends on',
+    labelnames=['method', 'path_info_pattern', 'dependency'],
+)
+
+
 def histo_tween_factory(handler, registry):
     """
     Create a tween to monitor number of requests at a given time.
@@ -54,15 +79,33 @@ def histo_tween_factory(handler, registry):
         start = time()
         status = '500'
         try:
-            response = handler(request)
+            with querystats.track(f'{request.method} {request.path}') as stats, \
+                    spans.collect() as timings:
+                response = handler(request)
             status = str(response.status_int)
+            if config['server_timing']:
+                response.headers['Server-Timing'] = ', '.join(
+                    [f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"']
+                    + ([timings.server_timing()] if timings.durations else []))
             return response
         finally:
             duration = time() - start
+            path_info_pattern = get_pattern(request)
             pyramid_request.labels(
                 method=request.method,
-                path_info_pattern=get_pattern(request),
+                path_info_pattern=path_info_pattern,
                 status=status,
             ).observe(duration)
+            pyramid_request_sql_queries.labels(
+                method=request.method, path_info_pattern=path_info_pattern,
+            ).observe(stats.count)
+            pyramid_request_sql_duration.labels(
+                method=request.method, path_info_pattern=path_info_pattern,
+            ).observe(stats.duration)
+            for dependency, dependency_duration in timings.durations.items():
+                pyramid_request_dependency_duration.labels(
+                    method=request.method, path_info_pattern=path_info_pattern,
+                    dependency=dependency,
+                ).observe(dependency_duration)
             pyramid_request_ingress.labels(**gauge_labels).dec()
     return tween
@@ -42,6 +42,7 @@ from bodhi.server.models import (
 )
 from bodhi.server.tasks import handle_side_and_related_tags_task
 from bodhi.server.validators import (
+    prefetch_builds,
     validate_acls,
     validate_qa_acls,
     validate_bugs,
@@ -451,6 +452,7 @@ def query_updates(request):
     validators=(
         colander_body_validator,
         validate_from_tag,
+        prefetch_builds,
         validate_build_nvrs,
         validate_builds,
         validate_build_tags,
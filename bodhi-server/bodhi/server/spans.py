@@ -0,0 +1,131 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Record the time spent waiting for the services Bodhi depends on.
+
+The calls to Koji, to Bugzilla and to the services queried with :func:`bodhi.server.util.call_api`
+are wrapped in a :func:`span` of their dependency. The spans are added up while :func:`collect` is
+active, which the metrics tween does for every web request. Outside of it, a span only costs a
+context variable lookup.
+"""
+import contextlib
+import contextvars
+import functools
+import time
+import typing
+
+
+# The timings collected by the current web request, if any.
+_active = contextvars.ContextVar('spans', default=None)
+
+
+class Timings:
+    """
+    The time spent in each dependency.
+
+    Attributes:
+        durations: How many seconds were spent in each dependency.
+        calls: How many calls were made to each dependency.
+    """
+
+    def __init__(self):
+        """Initialize the timings."""
+        self.durations = {}  # type: typing.Dict[str, float]
+        self.calls = {}  # type: typing.Dict[str, int]
+        self._open = set()  # type: typing.Set[str]
+
+    def add(self, dependency: str, duration: float, calls: int = 1):
+        """
+        Add calls to a dependency.
+
+        Args:
+            dependency: The name of the dependency.
+            duration: How many seconds the calls took.
+            calls: How many calls were made.
+        """
+        self.durations[dependency] = self.durations.get(dependency, 0.0) + duration
+        self.calls[dependency] = self.calls.get(dependency, 0) + calls
+
+    def server_timing(self) -> str:
+        """
+        Return the timings as the value of a Server-Timing header.
+
+        Returns:
+            The durations in milliseconds and the number of calls of each dependency.
+        """
+        return ', '.join(
+            f'{dependency};dur={duration * 1000:.1f};desc="{self.calls[dependency]} calls"'
+            for dependency, duration in sorted(self.durations.items()))
+
+
+@contextlib.contextmanager
+def collect() -> typing.Iterator[Timings]:
+    """
+    Collect the timings of the spans of this thread in the block.
+
+    Yields:
+        The timings, which are updated until the block exits.
+    """
+    timings = Timings()
+    token = _active.set(timings)
+    try:
+        yield timings
+    finally:
+        _active.reset(token)
+
+
+@contextlib.contextmanager
+def span(dependency: str) -> typing.Iterator[None]:
+    """
+    Record the time spent in the block as a call to the given dependency.
+
+    The spans nested in a span of the same dependency are not recorded, so that the calls are not
+    counted twice.
+
+    Args:
+        dependency: The name of the dependency.
+    """
+    timings = _active.get()
+    if timings is None or dependency in timings._open:
+        yield
+        return
+    timings._open.add(dependency)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._open.discard(dependency)
+        timings.add(dependency, time.perf_counter() - start)
+
+
+def timed(dependency: str) -> typing.Callable:
+    """
+    Return a decorator that records the calls to the decorated function as a span.
+
+    Args:
+        dependency: The name of the dependency the function calls.
+    Returns:
+        The decorator.
+    """
+    def decorator(func: typing.Callable) -> typing.Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(dependency):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
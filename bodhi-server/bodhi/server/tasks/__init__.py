@@ -17,13 +17,16 @@
 # Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """Asynchronous tasks for Bodhi."""
 
+from contextlib import ExitStack
 import logging
 import sys
 import typing
 
 import celery
+from celery import signals
+from prometheus_client import Histogram
 
-from bodhi.server import bugs, buildsys, initialize_db
+from bodhi.server import bugs, buildsys, initialize_db, querystats
 from bodhi.server.config import config
 from bodhi.server.exceptions import ExternalCallException
 from bodhi.server.util import pyfile_to_module
@@ -41,6 +44,40 @@ log = logging.getLogger('bodhi')
 app = celery.Celery()
 app.config_from_object(pyfile_to_module(config["celery_config"], "celeryconfig"))
 
+TASK_SQL_QUERIES = Histogram(
+    'bodhi_task_sql_queries',
+    'SQL statements executed by the tasks',
+    labelnames=['task'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, 10000, float('inf')),
+)
+TASK_SQL_DURATION = Histogram(
+    'bodhi_task_sql_duration_seconds',
+    'Time spent executing the SQL statements of the tasks',
+    labelnames=['task'],
+)
+
+# The tracking of the SQL statements of the running tasks, by task id.
+_task_stats = {}  # type: typing.Dict[str, typing.Tuple[ExitStack, querystats.QueryStats]]
+
+
+@signals.task_prerun.connect
+def _track_task_queries(task_id: str, task: celery.Task, **kwargs):
+    """Start collecting the statistics of the SQL statements executed by a task."""
+    stack = ExitStack()
+    stats = stack.enter_context(querystats.track(f'Task {task.name}[{task_id}]'))
+    _task_stats[task_id] = stack, stats
+
+
+@signals.task_postrun.connect
+def _observe_task_queries(task_id: str, task: celery.Task, **kwargs):
+    """Export the statistics of the SQL statements executed by a task."""
+    if task_id not in _task_stats:
+        return
+    stack, stats = _task_stats.pop(task_id)
+    stack.close()
+    TASK_SQL_QUERIES.labels(task=task.name).observe(stats.count)
+    TASK_SQL_DURATION.labels(task=task.name).observe(stats.duration)
+
 
 def _do_init():
     config.load_config()
@@ -146,6 +183,14 @@ def handle_side_and_related_tags_task(
     main(builds, pending_signing_tag, from_tag, pending_testing_tag, candidate_tag)
 
 
+@app.task(name="send_mail", ignore_result=True)
+def send_mail_task(envelopes: typing.List[typing.List[str]]):
+    """Deliver e-mails, given as lists of their sender, recipient and content."""
+    from bodhi.server.mail import deliver  # Avoid an import loop
+    log.info("Received an order to send %d e-mails", len(envelopes))
+    deliver([tuple(e) for e in envelopes])
+
+
 @app.task(name="tag_update_builds", ignore_result=True)
 def tag_update_builds_task(tag: str, builds: typing.List[str]):
     """Handle tagging builds for an update in Koji."""
@@ -35,42 +35,264 @@ If the update meets testing requirements but does not have autotime enabled or h
 not reached that threshold, we check to see if the update already has a comment saying it is
 now "approved" for push to stable. If not, we post that comment, and publish the
 UpdateRequirementsMetStableV1 message.
+
+Updates for which none of this can happen are filtered out in the database. The others are
+processed in batches, each update in its own savepoint so that an error only discards the changes
+of the update that caused it.
 """
 
 import datetime
 import logging
+import time
+import typing
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import aliased
 
 from bodhi.messages.schemas import update as update_schemas
 from bodhi.server import Session, notifications, buildsys
 from bodhi.server.util import transactional_session_maker
-from ..models import Update, UpdateStatus, UpdateRequest
+from ..models import (
+    Build,
+    Comment,
+    TestGatingStatus,
+    Update,
+    UpdateRequest,
+    UpdateStatus,
+    User,
+)
 from ..config import config
 
 
 log = logging.getLogger(__name__)
 
 
+approve_testing_updates = Counter(
+    'bodhi_approve_testing_updates',
+    'Updates in testing seen by the approve_testing task',
+    labelnames=['result'],
+)
+
+
+approve_testing_duration = Histogram(
+    'bodhi_approve_testing_duration_seconds',
+    'Duration of the approve_testing task',
+)
+
+
 def main():
     """Query for updates in the testing state that have a NULL request, and run process_update."""
+    start = time.monotonic()
+    counts = dict.fromkeys(('processed', 'skipped', 'changed', 'failed'), 0)
     db_factory = transactional_session_maker()
     try:
         with db_factory() as db:
-            testing = db.query(Update).filter_by(status=UpdateStatus.testing, request=None)
-            for update in testing:
-                process_update(update, db)
-                db.commit()
+            total = db.query(Update).filter_by(status=UpdateStatus.testing, request=None).count()
+            candidates = select_candidates(db)
+            counts['skipped'] = total - len(candidates)
+            batch_size = config.get('approve_testing_batch_size')
+            # The creation time of the newest build pushed to stable by this run, by stable tag
+            # and package. Koji may not list them in the stable tags yet, even in later batches.
+            pushed = {}  # type: typing.Dict[typing.Tuple[str, str], datetime.datetime]
+            for i in range(0, len(candidates), batch_size):
+                # The last batch is committed when the session ends
+                if i:
+                    db.commit()
+                updates = db.query(Update).filter(
+                    Update.id.in_(candidates[i:i + batch_size])).order_by(Update.id).all()
+                not_latest = find_not_latest_builds(updates)
+                # Pushing an update commits, which expires its builds. Keep them at hand with
+                # the Koji info find_not_latest_builds() cached on them.
+                builds = {update.id: list(update.builds) for update in updates}
+                for update in updates:
+                    counts['processed'] += 1
+                    if not_latest is not None:
+                        not_latest |= _superseded_builds(update, pushed)
+                    result = _process_isolated(update, db, not_latest)
+                    if result is None:
+                        counts['failed'] += 1
+                    elif result:
+                        counts['changed'] += 1
+                        if update.status is UpdateStatus.stable:
+                            _record_pushed(update.release.stable_tag, builds[update.id], pushed)
     except Exception:
         log.exception("There was an error approving testing updates.")
     finally:
         db_factory._end_session()
+        duration = time.monotonic() - start
+        approve_testing_duration.observe(duration)
+        for result, count in counts.items():
+            approve_testing_updates.labels(result=result).inc(count)
+        log.info(
+            f"approve_testing processed {counts['processed']} updates ({counts['changed']} "
+            f"changed, {counts['failed']} failed) and skipped {counts['skipped']} in "
+            f"{duration:.2f}s")
 
 
-def autopush_update(update: Update, db: Session):
+def select_candidates(db: Session) -> typing.List[int]:
+    """
+    Return the ids of the updates in testing that process_update() could change.
+
+    Updates that can't meet the testing requirements because of their gating status, and updates
+    that were already approved and commented on but have not reached their autotime threshold,
+    are left out without loading them.
+
+    Args:
+        db: a database session.
+    Returns:
+        The ids of the updates to process, in ascending order.
+    """
+    bodhi = db.query(User.id).filter(User.name == 'bodhi').scalar_subquery()
+    approval = aliased(Comment)
+    reset = aliased(Comment)
+    # Mirrors Update.has_stable_comment: karma is reset when builds are added or removed
+    has_stable_comment = exists().where(
+        approval.update_id == Update.id,
+        approval.user_id == bodhi,
+        approval.text == str(config.get('testing_approval_msg')),
+        ~exists().where(
+            reset.update_id == Update.id,
+            reset.user_id == bodhi,
+            reset.timestamp >= approval.timestamp,
+            or_(reset.text.contains('New build'), reset.text.contains('Removed build'))))
+
+    query = db.query(
+        Update.id, Update.date_approved, Update.autotime, Update.stable_days, Update.date_testing,
+        has_stable_comment.label('has_stable_comment'),
+    ).filter(
+        Update.status == UpdateStatus.testing,
+        Update.request.is_(None),
+        or_(Update.date_approved.is_(None), Update.autotime.is_(True), ~has_stable_comment),
+    )
+    if config.get('test_gating.required'):
+        query = query.filter(
+            Update.test_gating_status.in_([TestGatingStatus.passed, TestGatingStatus.ignored]))
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    candidates = []
+    for row in query.order_by(Update.id):
+        # Mirrors Update.days_in_testing
+        days_in_testing = (now - row.date_testing).days if row.date_testing else 0
+        if (row.date_approved is None or not row.has_stable_comment
+                or (row.autotime and days_in_testing >= row.stable_days)):
+            candidates.append(row.id)
+    return candidates
+
+
+def _process_isolated(update: Update, db: Session,
+                      not_latest: typing.Optional[typing.Set[str]]) -> typing.Optional[bool]:
+    """
+    Call process_update() in a savepoint, so that a failure only discards the update's changes.
+
+    Args:
+        update: an update in testing that may be ready for stable.
+        db: a database session.
+        not_latest: the NVRs returned by find_not_latest_builds(), if any.
+    Returns:
+        Whether the update was changed, or None if processing it failed.
+    """
+    # Releasing the savepoint emits after_commit, which would publish the queued messages before
+    # the batch is committed. Keep them aside, and drop the ones of the update if it fails.
+    queued = db.info.get('messages', [])
+    db.info['messages'] = []
+    savepoint = db.begin_nested()
+    try:
+        changed = process_update(update, db, not_latest)
+    except Exception:
+        log.exception(f'There was an error processing {update.alias}.')
+        # autopush_update() commits, which ends the savepoint
+        if savepoint.is_active:
+            savepoint.rollback()
+        else:
+            db.rollback()
+        db.info['messages'] = queued
+        return None
+    messages = db.info['messages']
+    db.info['messages'] = []
+    if savepoint.is_active:
+        savepoint.commit()
+    db.info['messages'] = queued + messages
+    return changed
+
+
+def find_not_latest_builds(updates: typing.List[Update]) -> typing.Optional[typing.Set[str]]:
+    """
+    Check the builds of the updates that may be pushed by us against their stable tags at once.
+
+    Only the updates of releases not composed by Bodhi which have reached their autotime threshold
+    can be pushed by autopush_update(), so only their builds are checked, in a single Koji round
+    trip rather than a few per build.
+
+    Args:
+        updates: The updates about to be processed.
+    Returns:
+        The NVRs of the checked builds that are not the latest in their stable tag, or None if
+            they could not be checked, in which case every update is checked on its own.
+    """
+    builds = [
+        build for update in updates
+        if not update.release.composed_by_bodhi and update.autotime
+        and update.days_in_testing >= update.stable_days
+        for build in update.builds]
+    try:
+        return Build.find_not_latest(builds)
+    except Exception:
+        log.exception('Unable to check the builds against the stable tags in a batch')
+        return None
+
+
+def _superseded_builds(update: Update,
+                       pushed: typing.Dict[typing.Tuple[str, str], datetime.datetime]) \
+        -> typing.Set[str]:
+    """
+    Return the builds of the update that are older than a build pushed to stable by this run.
+
+    Args:
+        update: The update about to be processed.
+        pushed: The creation time of the newest build pushed by this run, by stable tag and
+            package.
+    Returns:
+        The NVRs of the builds of the update that are not the latest in their stable tag anymore.
+    """
+    superseded = set()
+    for build in update.builds:
+        key = (update.release.stable_tag, build.package.name)
+        if key in pushed and build.get_creation_time() < pushed[key]:
+            superseded.add(build.nvr)
+    return superseded
+
+
+def _record_pushed(stable_tag: str, builds: typing.List[Build],
+                   pushed: typing.Dict[typing.Tuple[str, str], datetime.datetime]):
+    """
+    Remember the builds of an update that was pushed to stable, for _superseded_builds().
+
+    Args:
+        stable_tag: The stable tag the builds were pushed to.
+        builds: The builds of the update.
+        pushed: The creation time of the newest build pushed by this run, by stable tag and
+            package, which is updated.
+    """
+    for build in builds:
+        key = (stable_tag, build.package.name)
+        creation_time = build.get_creation_time()
+        if key not in pushed or pushed[key] < creation_time:
+            pushed[key] = creation_time
+
+
+def autopush_update(update: Update, db: Session,
+                    not_latest: typing.Optional[typing.Set[str]] = None):
     """
     Push an update that has autopush for time enabled and has reached the required threshold.
 
     For releases composed by Bodhi, we set the request and leave the compose process to do the
     status change. For releases not composed by Bodhi, we do the status change here.
+
+    Args:
+        update: an update that has reached its autotime threshold.
+        db: a database session.
+        not_latest: the NVRs returned by find_not_latest_builds(), if any.
     """
     if not update.has_stable_comment:
         notifications.publish(update_schemas.UpdateRequirementsMetStableV1.from_dict(
@@ -83,7 +305,7 @@ def autopush_update(update: Update, db: Session):
         return
     # For releases not composed by Bodhi, do all the work here
     # Both side-tag and non-side-tag updates
-    conflicting_builds = update.find_conflicting_builds()
+    conflicting_builds = update.find_conflicting_builds(not_latest)
     if conflicting_builds:
         builds_str = str.join(", ", conflicting_builds)
         update.comment(
@@ -139,13 +361,18 @@ def autopush_update(update: Update, db: Session):
         update.remove_tag(update.release.candidate_tag)
 
 
-def approved_comment_message(update: Update, db: Session):
-    """Post "approved" comment and publish UpdatesRequirementsMetStable message."""
+def approved_comment_message(update: Update, db: Session) -> bool:
+    """
+    Post "approved" comment and publish UpdatesRequirementsMetStable message.
+
+    Returns:
+        False if the update had already been commented on, True otherwise.
+    """
     # If this update was already commented, skip it
     if update.has_stable_comment:
         log.info(f"{update.alias} has already the comment that it can be pushed to stable - "
                  "bailing")
-        return
+        return False
     # post the comment
     update.comment(
         db,
@@ -158,9 +385,11 @@ def approved_comment_message(update: Update, db: Session):
     # publish the message
     notifications.publish(update_schemas.UpdateRequirementsMetStableV1.from_dict(
         dict(update=update)))
+    return True
 
 
-def process_update(update: Update, db: Session):
+def process_update(update: Update, db: Session,
+                   not_latest: typing.Optional[typing.Set[str]] = None) -> bool:
     """
     Check requirements, update date_approved, then call appropriate handler function.
 
@@ -188,6 +417,9 @@ def process_update(update: Update, db: Session):
     Args:
         update: an update in testing that may be ready for stable.
         db: a database session.
+        not_latest: the NVRs returned by find_not_latest_builds(), if any.
+    Returns:
+        Whether the update was changed.
     """
     # meets_testing_requirements will be True if all non-karma / non-time
     # requirements are met, and the update has reached the minimum karma
@@ -195,19 +427,23 @@ def process_update(update: Update, db: Session):
     # means "update is eligible to be manually pushed stable"
     if not update.meets_testing_requirements:
         log.info(f"{update.alias} has not met testing requirements - bailing")
-        return
+        return False
     log.info(f'{update.alias} now meets testing requirements')
+    changed = False
     # always set date_approved, if it has never been set before: this
     # date indicates "first date update became eligible for manual push"
     if not update.date_approved:
         update.date_approved = datetime.datetime.now(datetime.timezone.utc)
+        changed = True
     if update.autotime and update.days_in_testing >= update.stable_days:
         # if update *additionally* meets the time-based autopush threshold,
         # push it
-        autopush_update(update, db)
+        autopush_update(update, db, not_latest)
+        changed = True
     else:
         # otherwise, post the comment and publish the message announcing
         # it is eligible for manual push, if this has not been done
-        approved_comment_message(update, db)
+        changed = approved_comment_message(update, db) or changed
 
     log.info(f'{update.alias} processed by approve_testing')
+    return changed
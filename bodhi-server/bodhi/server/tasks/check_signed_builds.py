@@ -24,10 +24,12 @@ have been signed.
 In these cases, the Update remain stuck in pending until a manual intervention.
 
 This script will cycle through builds of Updates in pending status and update
-the signed status in the db to match the tags found in Koji.
+the signed status in the db to match the tags found in Koji. The tags of all
+the builds are listed with a few Koji multicalls before being inspected.
 """
 
 import logging
+import typing
 from datetime import datetime, timedelta, timezone
 
 from bodhi.server import buildsys, models
@@ -38,6 +40,33 @@ from bodhi.server.util import transactional_session_maker
 log = logging.getLogger(__name__)
 
 
+def _list_build_tags(kc, nvrs: typing.List[str]) -> typing.Dict[str, typing.Set[str]]:
+    """
+    Return the tags of the given builds, listed with chunked Koji multicalls.
+
+    Args:
+        kc (koji.ClientSession or DevBuildsys): A Koji client.
+        nvrs: The NVRs of the builds to list the tags of.
+    Returns:
+        A dictionary mapping NVRs to the names of the tags of the build. Builds for which Koji
+        returned an error are left out.
+    """
+    batch_size = config.get('check_signed_builds_batch_size')
+    build_tags = {}
+    for i in range(0, len(nvrs), batch_size):
+        chunk = nvrs[i:i + batch_size]
+        kc.multicall = True
+        for nvr in chunk:
+            kc.listTags(build=nvr)
+        for nvr, result in zip(chunk, kc.multiCall() or []):
+            # Errors are returned as dicts, successful calls as lists holding the result
+            if isinstance(result, dict):
+                log.warning(f'Unable to list the tags of {nvr}: {result}')
+                continue
+            build_tags[nvr] = {t['name'] for t in result[0]}
+    return build_tags
+
+
 def main():
     """Check build tags and sign those we missed."""
     db_factory = transactional_session_maker()
@@ -49,14 +78,17 @@ def main():
         ).filter(
             models.Update.locked.is_(False)
         ).filter(
-            models.Update.release_id == models.Release.id
+            # Let Bodhi have its times
+            models.Update.date_submitted < older_than
+        ).join(
+            models.Release, models.Update.release_id == models.Release.id
         ).filter(
             models.Release.state.in_([
                 models.ReleaseState.current,
                 models.ReleaseState.pending,
                 models.ReleaseState.frozen,
             ])
-        ).all()
+        ).order_by(models.Update.id).all()
 
         if len(updates) == 0:
             log.debug('No stuck Updates found')
@@ -66,10 +98,10 @@ def main():
         stuck_builds = []
         overlooked_builds = []
 
+        build_tags = _list_build_tags(
+            kc, [build.nvr for update in updates for build in update.builds])
+
         for update in updates:
-            # Let Bodhi have its times
-            if update.date_submitted >= older_than:
-                continue
             builds = update.builds
             # Clean Updates with no builds
             if len(builds) == 0:
@@ -80,26 +112,28 @@ def main():
             pending_signing_tag = update.release.pending_signing_tag
             pending_testing_tag = update.release.pending_testing_tag
             for build in builds:
-                build_tags = [t['name'] for t in kc.listTags(build=build.nvr)]
+                if build.nvr not in build_tags:
+                    continue
+                tags = build_tags[build.nvr]
                 if build.signed:
                     log.debug(f'{build.nvr} already marked as signed')
-                    if (update.release.testing_tag in build_tags
-                            and update.release.candidate_tag not in build_tags):
+                    if (update.release.testing_tag in tags
+                            and update.release.candidate_tag not in tags):
                         # The update was probably ejected from a compose and is stuck
                         log.debug(f'Resubmitting {update.alias} to testing')
                         update.set_request(session, models.UpdateRequest.testing, 'bodhi')
                         break
                     continue
-                if pending_signing_tag not in build_tags and pending_testing_tag in build_tags:
+                if pending_signing_tag not in tags and pending_testing_tag in tags:
                     # Our composer missed the message that the build got signed
                     log.debug(f'Changing signed status of {build.nvr}')
                     build.signed = True
-                elif pending_signing_tag in build_tags and pending_testing_tag not in build_tags:
+                elif pending_signing_tag in tags and pending_testing_tag not in tags:
                     # autosign missed the message that the build is waiting to be signed
                     log.debug(f'{build.nvr} is stuck waiting to be signed, let\'s try again')
                     stuck_builds.append((build.nvr, pending_signing_tag))
-                elif (pending_signing_tag not in build_tags
-                      and pending_testing_tag not in build_tags):
+                elif (pending_signing_tag not in tags
+                      and pending_testing_tag not in tags):
                     # this means that an update has been created but we never tagged the build
                     # as pending-signing
                     log.debug(f'Oh, no! We\'ve never sent {build.nvr} for signing, let\'s fix it')
@@ -111,6 +145,7 @@ def main():
             for b, t in stuck_builds:
                 kc.untagBuild(t, b, force=True)
             kc.multiCall()
+            kc.multicall = True
             for b, t in stuck_builds:
                 kc.tagBuild(t, b, force=True)
             kc.multiCall()
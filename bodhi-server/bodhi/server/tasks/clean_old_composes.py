@@ -17,10 +17,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """Cleans up old composes that are left over in compose_dir."""
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import collections
 import os
-import shutil
+import threading
+import time
+import typing
 
 from bodhi.server import config
 
@@ -28,12 +31,154 @@ from bodhi.server import config
 log = logging.getLogger(__name__)
 
 
-def main(num_to_keep: int):
+class _Throttle:
+    """Limit the rate at which the deletion workers remove files, across all of them."""
+
+    def __init__(self, rate: int):
+        """
+        Initialize the throttle.
+
+        Args:
+            rate: The maximum number of files to remove per second, or 0 for no limit.
+        """
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        """Block until the caller is allowed to remove another file."""
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(self._next, now)
+            delay = self._next - now
+            self._next += self._interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _remove(path: str, remove: typing.Callable[[str], None],
+            errors: typing.List[OSError]) -> typing.Tuple[int, int]:
+    """
+    Remove a path, returning how much disk space this freed.
+
+    Removing a hardlink to a file that is linked elsewhere does not free anything, so only the
+    last link of a file is accounted for.
+
+    Args:
+        path: The path to remove.
+        remove: The function removing it, os.unlink or os.rmdir.
+        errors: The errors of the paths that could not be removed, which is appended to.
+    Returns:
+        A 2-tuple of the bytes and inodes that were reclaimed.
+    """
+    try:
+        st = os.lstat(path)
+        remove(path)
+    except FileNotFoundError:
+        # Another cleanup removed it first.
+        return 0, 0
+    except OSError as e:
+        log.warning(f'Unable to remove {path}: {e}')
+        errors.append(e)
+        return 0, 0
+    if st.st_nlink > 1 and remove is os.unlink:
+        return 0, 0
+    return st.st_blocks * 512, 1
+
+
+def _unlink_files(paths: typing.List[str], throttle: _Throttle,
+                  errors: typing.List[OSError]) -> typing.Tuple[int, int]:
+    """
+    Remove the given files.
+
+    Args:
+        paths: The files to remove.
+        throttle: The throttle shared by all the deletion workers.
+        errors: The errors of the files that could not be removed, which is appended to.
+    Returns:
+        A 2-tuple of the bytes and inodes that were reclaimed.
+    """
+    reclaimed_bytes = reclaimed_inodes = 0
+    for path in paths:
+        throttle.wait()
+        size, inodes = _remove(path, os.unlink, errors)
+        reclaimed_bytes += size
+        reclaimed_inodes += inodes
+    return reclaimed_bytes, reclaimed_inodes
+
+
+def _walk(path: str, directories: typing.List[str], shards: typing.List[typing.List[str]],
+          errors: typing.List[OSError]):
+    """
+    List the directories and the files of a directory tree.
+
+    Args:
+        path: The directory to walk.
+        directories: The directories of the tree, which is appended to before their children.
+        shards: The lists to append the files to. All the links to a file go to the same list.
+        errors: The errors of the directories that could not be listed, which is appended to.
+    """
+    directories.append(path)
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # The symlinks to directories are not followed, they are removed as files.
+                if entry.is_dir(follow_symlinks=False):
+                    _walk(entry.path, directories, shards, errors)
+                else:
+                    shards[entry.inode() % len(shards)].append(entry.path)
+    except OSError as e:
+        log.warning(f'Unable to list {path}: {e}')
+        errors.append(e)
+
+
+def delete_trees(paths: typing.Iterable[str]) -> typing.Tuple[int, int]:
+    """
+    Delete the given directory trees.
+
+    The files are removed by a pool of ``clean_old_composes.workers`` threads, no faster than
+    ``clean_old_composes.max_files_per_second`` files per second in total (0 means unlimited). All
+    the links to a file are removed by the same thread, so that the file is accounted for once its
+    last link was removed. The directories are removed once they are empty.
+
+    Args:
+        paths: The directories to delete.
+    Returns:
+        A 2-tuple of the bytes and inodes that were reclaimed.
+    Raises:
+        OSError: If some paths could not be removed, once all the others were.
+    """
+    throttle = _Throttle(config.config['clean_old_composes.max_files_per_second'])
+    directories = []
+    errors = []  # type: typing.List[OSError]
+    workers = max(config.config['clean_old_composes.workers'], 1)
+    shards = [[] for i in range(workers)]  # type: typing.List[typing.List[str]]
+    for path in paths:
+        _walk(path, directories, shards, errors)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_unlink_files, files, throttle, errors) for files in shards if files]
+        results = [future.result() for future in futures]
+
+    # Children are walked after their parents, so remove the directories in reverse order.
+    results.extend(_remove(d, os.rmdir, errors) for d in reversed(directories))
+    reclaimed_bytes, reclaimed_inodes = sum(r[0] for r in results), sum(r[1] for r in results)
+    if errors:
+        raise OSError(
+            f'Unable to remove {len(errors)} paths of the old composes, after reclaiming '
+            f'{reclaimed_bytes} bytes and {reclaimed_inodes} inodes') from errors[0]
+    return reclaimed_bytes, reclaimed_inodes
+
+
+def main(num_to_keep: int) -> typing.Tuple[int, int]:
     """
     Delete any repo composes that are older than the newest 10 from each repo series.
 
     Args:
         num_to_keep: How many of the newest compose dirs to keep during cleanup
+    Returns:
+        A 2-tuple of the bytes and inodes that were reclaimed.
     """
     compose_dir = config.config['compose_dir']
 
@@ -60,9 +205,15 @@ def main(num_to_keep: int):
         if len(dirs) > num_to_keep:
             dirs_to_delete.extend(sorted(dirs, reverse=True)[num_to_keep:])
 
-    if dirs_to_delete:
-        log.info('Deleting the following directories:')
-        for d in dirs_to_delete:
-            d = os.path.join(compose_dir, d)
-            log.info(d)
-            shutil.rmtree(d)
+    if not dirs_to_delete:
+        return 0, 0
+
+    log.info('Deleting the following directories:')
+    dirs_to_delete = [os.path.join(compose_dir, d) for d in dirs_to_delete]
+    for d in dirs_to_delete:
+        log.info(d)
+    start = time.monotonic()
+    reclaimed_bytes, reclaimed_inodes = delete_trees(dirs_to_delete)
+    log.info('Reclaimed %d bytes and %d inodes from %d old composes in %.2fs', reclaimed_bytes,
+             reclaimed_inodes, len(dirs_to_delete), time.monotonic() - start)
+    return reclaimed_bytes, reclaimed_inodes
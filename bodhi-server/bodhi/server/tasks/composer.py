@@ -23,10 +23,11 @@ comprised of a fedora messaging consumer that launches threads for each reposito
 composed.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from http.client import IncompleteRead
-from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 import functools
 import hashlib
 import json
@@ -39,17 +40,20 @@ import threading
 import time
 import typing
 
+from prometheus_client import Histogram
 import jinja2
 import sqlalchemy.orm.exc
 
 from bodhi.messages.schemas import compose as compose_schemas
 from bodhi.messages.schemas import update as update_schemas
-from bodhi.server import buildsys, mail, notifications
+from bodhi.server import buildsys, mail, notifications, profiling
 from bodhi.server.config import config, validate_path
 from bodhi.server.exceptions import BodhiException
 from bodhi.server.metadata import UpdateInfoMetadata
 from bodhi.server.models import (
+    BuildrootOverride,
     Compose,
+    ComposeDuration,
     ComposeState,
     ContentType,
     Release,
@@ -59,18 +63,33 @@ from bodhi.server.models import (
     UpdateStatus,
     UpdateType,
 )
-from bodhi.server.tasks.clean_old_composes import main as clean_old_composes
+from bodhi.server.scheduler import ComposeScheduler
+from bodhi.server.tasks import clean_old_composes_task
 from bodhi.server.util import (
     copy_container,
     get_createrepo_config,
     sanity_check_repodata,
     sorted_updates,
     transactional_session_maker,
+    wait_for_paths,
 )
 
 
 log = logging.getLogger('bodhi')
 
+SYNC_LATENCY = Histogram(
+    'bodhi_compose_sync_latency_seconds',
+    'Time it took for a composed repository to reach the master mirrors',
+    labelnames=['repo'],
+    buckets=(60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 5400, 7200, float('inf')),
+)
+PHASE_DURATION = Histogram(
+    'bodhi_compose_phase_duration_seconds',
+    'Time the composes spent in each of their states',
+    labelnames=['release', 'request', 'content_type', 'phase'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, float('inf')),
+)
+
 
 def checkpoint(method):
     """
@@ -170,7 +189,7 @@ class ComposerHandler(object):
 
         self.compose_dir = compose_dir
 
-        self.max_composes_sem = threading.BoundedSemaphore(config.get('max_concurrent_composes'))
+        self.scheduler = ComposeScheduler(config.get('max_concurrent_composes'))
 
         # This will ensure that the configured paths exist, and will raise ValueError if any does
         # not.
@@ -213,9 +232,13 @@ class ComposerHandler(object):
                 )
                 continue
 
-            thread = composer(self.max_composes_sem, compose, agent, self.db_factory,
+            thread = composer(self.scheduler, compose, agent, self.db_factory,
                               self.compose_dir, resume)
             threads.append(thread)
+            # Queue all the composes before starting them, so that they run in the right order.
+            self.scheduler.add(compose)
+
+        for thread in threads:
             thread.start()
 
         log.info('All of the batches are running. Now waiting for the final results')
@@ -267,6 +290,7 @@ class ComposerHandler(object):
             for c in composes:
                 # Acknowledge that we've received the command to run these composes.
                 c.state = ComposeState.pending
+                c.estimated_duration = ComposeDuration.estimate(db, c)
 
             return [c.__json__(composer=True) for c in composes]
 
@@ -294,13 +318,13 @@ class ComposerThread(threading.Thread):
     ctype = None
     keep_old_composes = 10
 
-    def __init__(self, max_concur_sem, compose, agent, db_factory, compose_dir, resume=False):
+    def __init__(self, scheduler, compose, agent, db_factory, compose_dir, resume=False):
         """
         Initialize the ComposerThread.
 
         Args:
-            max_concur_sem (threading.BoundedSemaphore): Semaphore making sure only a limited
-                number of ComposerThreads run at the same time.
+            scheduler (bodhi.server.scheduler.ComposeScheduler): Decides when this ComposerThread
+                can run, making sure only a limited number of ComposerThreads run at the same time.
             compose (dict): A dictionary representation of the Compose to run, formatted like the
                 output of :meth:`Compose.__json__`.
             agent (str): The user who is executing the compose.
@@ -314,7 +338,7 @@ class ComposerThread(threading.Thread):
         super(ComposerThread, self).__init__()
         self.db_factory = db_factory
         self.agent = agent
-        self.max_concur_sem = max_concur_sem
+        self.scheduler = scheduler
         self._compose = compose
         self.resume = resume
         self.add_tags_async = []
@@ -323,21 +347,32 @@ class ComposerThread(threading.Thread):
         self.move_tags_sync = []
         self.testing_digest = {}
         self.success = False
+        self._profile = None
 
     def run(self):
         """Run the thread by managing a db transaction and calling work()."""
-        log.info('Grabbing semaphore')
-        self.max_concur_sem.acquire()
-        log.info('Acquired semaphore, starting')
+        log.info('Waiting for the scheduler')
+        self.scheduler.acquire(self._compose)
+        log.info('Scheduled, starting')
+        start = time.monotonic()
         try:
             with self.db_factory() as session:
                 self.db = session
                 self.compose = Compose.from_dict(session, self._compose)
                 self._checkpoints = json.loads(self.compose.checkpoints)
+                update_count = len(self.compose.updates)
                 log.info('Starting composer type %s for %s with %d updates',
-                         self, str(self.compose), len(self.compose.updates))
+                         self, str(self.compose), update_count)
+                self.compose.date_started = datetime.now(timezone.utc)
                 self.save_state(ComposeState.initializing)
                 self.work()
+                if self.success and not self.resume:
+                    # Resumed composes skip some steps, they don't tell how long composes take.
+                    session.add(ComposeDuration(
+                        release_id=self._compose['release_id'],
+                        request=UpdateRequest.from_string(self._compose['request']),
+                        content_type=self.ctype, security=self._compose['security'],
+                        updates=update_count, duration=round(time.monotonic() - start)))
         except Exception as e:
             with self.db_factory() as session:
                 self.db = session
@@ -347,10 +382,11 @@ class ComposerThread(threading.Thread):
 
             log.exception('ComposerThread failed. Transaction rolled back.')
         finally:
+            self._profile_phase(None)
             self.compose = None
             self.db = None
-            self.max_concur_sem.release()
-            log.info('Released semaphore')
+            self.scheduler.release(self._compose)
+            log.info('Released the scheduler')
 
     def results(self):
         """
@@ -431,14 +467,14 @@ class ComposerThread(threading.Thread):
             self.check_all_karma_thresholds()
             self.obsolete_older_updates()
 
-            if config['clean_old_composes']:
-                # Clean old composes
-                self.save_state(ComposeState.cleaning)
-                clean_old_composes(self.keep_old_composes)
-
             self.save_state(ComposeState.success)
             self.success = True
 
+            if config['clean_old_composes']:
+                # Clean old composes in the background, this can take a long time and doesn't
+                # need to delay the success of this compose.
+                clean_old_composes_task.delay(num_to_keep=self.keep_old_composes)
+
             self.remove_state()
 
         except Exception:
@@ -516,18 +552,57 @@ class ComposerThread(threading.Thread):
         """
         Save the state of this push so it can be resumed later if necessary.
 
+        The time spent in the previous state is observed in the PHASE_DURATION histogram.
+
         Args:
             state (bodhi.server.models.ComposeState): If not ``None``, set the Compose's state
                 attribute to the given state. Defaults to ``None``.
         """
         self.compose.checkpoints = json.dumps(self._checkpoints)
-        if state is not None:
+        ended = []
+        changed = state is not None and state != self.compose.state
+        if changed:
             self.compose.state = state
+            # The time spent failed is the time until the compose was resumed, not a phase.
+            ended = [phase for phase in self.compose.phases[-2:-1]
+                     if phase['state'] != ComposeState.failed.value]
+            labels = {'release': self.compose.release.name, 'request': self._compose['request'],
+                      'content_type': self.ctype.value if self.ctype else ''}
         self.db.commit()
         log.info('Compose object updated.')
+        for phase in ended:
+            PHASE_DURATION.labels(phase=phase['state'], **labels).observe(phase['duration'])
+        if changed:
+            self._profile_phase(state)
         # Expire the compose object so sqlalchemy will reload it instead of use its cached copy
         self.db.expire(self.compose)
 
+    def _profile_phase(self, state):
+        """
+        Save the profile of the phase that ended, and start profiling the next one.
+
+        Nothing is profiled unless ``profiling.composes`` and ``profiling.directory`` are set.
+
+        Args:
+            state (bodhi.server.models.ComposeState or None): The state of the next phase, or
+                ``None`` if the compose is done.
+        """
+        if self._profile is not None:
+            profiling.stop(self._profile)
+            try:
+                path = profiling.save(self._profile, self._profile_category,
+                                      self._profiled_state.value)
+                log.info('Profiled the %s phase in %s', self._profiled_state.value, path)
+            except OSError:
+                log.exception('Unable to save the profile of the %s phase',
+                              self._profiled_state.value)
+            self._profile = None
+        if state is not None and config['profiling.composes'] and config['profiling.directory']:
+            self._profile_category = (
+                f"compose {self.compose.release.name} {self._compose['request']}")
+            self._profiled_state = state
+            self._profile = profiling.start()
+
     def load_state(self):
         """Load the state of this push so it can be resumed later if necessary."""
         self._checkpoints = json.loads(self.compose.checkpoints)
@@ -632,15 +707,17 @@ class ComposerThread(threading.Thread):
 
     def expire_buildroot_overrides(self):
         """Expire any buildroot overrides that are in this push."""
+        overrides = []
         for update in self.compose.updates:
             if update.request is UpdateRequest.stable:
                 for build in update.builds:
                     if build.override:
-                        try:
-                            log.debug(f"Expiring BRO for {build.nvr} because it is being pushed.")
-                            build.override.expire()
-                        except Exception:
-                            log.exception('Problem expiring override')
+                        log.debug(f"Expiring BRO for {build.nvr} because it is being pushed.")
+                        overrides.append(build.override)
+        try:
+            BuildrootOverride.expire_all(self.db, overrides)
+        except Exception:
+            log.exception('Problem expiring override')
 
     def remove_pending_tags(self):
         """Remove all pending tags from the updates."""
@@ -749,9 +826,10 @@ class ComposerThread(threading.Thread):
     def send_stable_announcements(self):
         """Send the stable announcement e-mails out."""
         log.info('Sending stable update announcements')
-        for update in self.compose.updates:
-            if update.request is UpdateRequest.stable:
-                update.send_update_notice()
+        with mail.batched():
+            for update in self.compose.updates:
+                if update.request is UpdateRequest.stable:
+                    update.send_update_notice()
 
     @checkpoint
     def send_testing_digest(self):
@@ -898,13 +976,13 @@ class PungiComposerThread(ComposerThread):
 
     pungi_template_config_key = None
 
-    def __init__(self, max_concur_sem, compose, agent, db_factory, compose_dir, resume=False):
+    def __init__(self, scheduler, compose, agent, db_factory, compose_dir, resume=False):
         """
         Initialize the ComposerThread.
 
         Args:
-            max_concur_sem (threading.BoundedSemaphore): Semaphore making sure only a limited
-                number of ComposerThreads run at the same time.
+            scheduler (bodhi.server.scheduler.ComposeScheduler): Decides when this ComposerThread
+                can run, making sure only a limited number of ComposerThreads run at the same time.
             compose (dict): A dictionary representation of the Compose to run, formatted like the
                 output of :meth:`Compose.__json__`.
             agent (str): The user who is executing the compose.
@@ -915,7 +993,7 @@ class PungiComposerThread(ComposerThread):
             resume (bool): Whether or not we are resuming a previous failed compose. Defaults to
                 False.
         """
-        super(PungiComposerThread, self).__init__(max_concur_sem, compose, agent, db_factory,
+        super(PungiComposerThread, self).__init__(scheduler, compose, agent, db_factory,
                                                   compose_dir, resume)
         self.compose_dir = compose_dir
         self.path = None
@@ -1033,19 +1111,19 @@ class PungiComposerThread(ComposerThread):
         log.info('Updateinfo generation for %s complete' % self.compose.release.name)
         return uinfo
 
-    def _get_master_repomd_url(self, arch):
+    def _get_master_repomd_urls(self, arch):
         """
-        Return the master repomd URL for the given arch.
+        Return the master repomd URLs for the given arch.
 
-        Look up the correct *_master_repomd setting in the config and use it to form the URL that
+        Look up the correct *_master_repomd setting in the config and use it to form the URLs that
         _wait_for_sync() will use to determine when the repository has been synchronized to the
-        master mirror.
+        master mirrors. The setting can list several whitespace separated URLs, one per mirror.
 
         Args:
-            arch (str): The architecture for which a URL needs to be formed.
+            arch (str): The architecture for which URLs need to be formed.
 
         Returns:
-            str: A URL on the master mirror where the repomd.xml file should be synchronized.
+            list: URLs on the master mirrors where the repomd.xml file should be synchronized.
         """
         release = self.compose.release.id_prefix.lower().replace('-', '_')
         version = self.compose.release.version
@@ -1070,7 +1148,7 @@ class PungiComposerThread(ComposerThread):
         for key in keys:
             val = config.get(key)
             if val:
-                return val % (version, arch)
+                return [url % (version, arch) for url in val.split()]
         raise ValueError("Could not find any of %s in the config file" % ','.join(keys))
 
     def _punge(self):
@@ -1264,7 +1342,15 @@ class PungiComposerThread(ComposerThread):
         self._checkpoints['completed_repo'] = self.path
 
     def _wait_for_repo_signature(self):
-        """Wait for a repo signature to appear."""
+        """
+        Wait for the repo signatures to appear.
+
+        While waiting, the arches that are not signed yet are listed in the error_message of the
+        compose. This waits for ``wait_for_repo_sig.timeout`` seconds at most (0 means forever).
+
+        Raises:
+            Exception: If the signatures did not appear before the timeout.
+        """
         # This message indicates to consumers that the repos are fully created and ready to be
         # signed or otherwise processed.
         notifications.publish(compose_schemas.RepoDoneV1.from_dict(
@@ -1272,34 +1358,48 @@ class PungiComposerThread(ComposerThread):
             force=True)
         if config.get('wait_for_repo_sig'):
             self.save_state(ComposeState.signing_repo)
-            sigpaths = []
+            sigpaths = {}
             repopath = os.path.join(self.path, 'compose', 'Everything')
             for arch in os.listdir(repopath):
                 if arch == 'source':
-                    sigpaths.append(os.path.join(repopath, arch, 'tree', 'repodata',
-                                                 'repomd.xml.asc'))
-                else:
-                    sigpaths.append(os.path.join(repopath, arch, 'os', 'repodata',
-                                                 'repomd.xml.asc'))
-
-            log.info('Waiting for signatures in %s', ', '.join(sigpaths))
-            while True:
-                missing = []
-                for path in sigpaths:
-                    if not os.path.exists(path):
-                        missing.append(path)
-                if len(missing) == 0:
-                    log.info('All signatures were created')
-                    break
+                    sigpaths[arch] = os.path.join(repopath, arch, 'tree', 'repodata',
+                                                  'repomd.xml.asc')
                 else:
-                    log.info('Waiting on %s', ', '.join(missing))
-                    time.sleep(300)
+                    sigpaths[arch] = os.path.join(repopath, arch, 'os', 'repodata',
+                                                  'repomd.xml.asc')
+
+            def missing_arches(missing):
+                return ', '.join(sorted(arch for arch, path in sigpaths.items() if path in missing))
+
+            def report(missing):
+                # Let the operators know which arches are still waiting for the signer.
+                log.info('Waiting on %s', ', '.join(missing))
+                self.compose.error_message = (
+                    f'Waiting for the repo signatures of: {missing_arches(missing)}')
+                self.save_state()
+
+            log.info('Waiting for signatures in %s', ', '.join(sigpaths.values()))
+            missing = wait_for_paths(
+                sigpaths.values(), timeout=config['wait_for_repo_sig.timeout'],
+                poll_interval=config['wait_for_repo_sig.poll_interval'], progress=report)
+            if missing:
+                raise Exception(
+                    f'Timed out waiting for the repo signatures of: {missing_arches(missing)}')
+            log.info('All signatures were created')
+            if self.compose.error_message:
+                self.compose.error_message = None
+                self.save_state()
         else:
             log.info('Not waiting for a repo signature')
 
     def _wait_for_sync(self):
         """
-        Block until our repomd.xml hits the master mirror.
+        Block until our repomd.xml files hit the master mirrors.
+
+        The repomd.xml of every arch is polled concurrently on each mirror, with conditional
+        requests so that unchanged files are not downloaded again. An arch is synchronized once
+        ``wait_for_sync.quorum`` mirrors (all of them if it is 0) serve the same repomd.xml as the
+        compose. The polls get more frequent as ``wait_for_sync.expected_duration`` approaches.
 
         Raises:
             Exception: If no folder other than "source" was found in the compose_path.
@@ -1309,45 +1409,121 @@ class PungiComposerThread(ComposerThread):
             dict(repo=self.id, agent=self.agent)),
             force=True)
         compose_path = os.path.join(self.path, 'compose', 'Everything')
-        checkarch = None
-        # Find the first non-source arch to check against
-        for arch in os.listdir(compose_path):
-            if arch == 'source':
-                continue
-            checkarch = arch
-            break
-        if not checkarch:
+        arches = [arch for arch in sorted(os.listdir(compose_path)) if arch != 'source']
+        if not arches:
             raise Exception('Not found an arch to _wait_for_sync with')
 
-        repomd = os.path.join(compose_path, arch, 'os', 'repodata', 'repomd.xml')
-        if not os.path.exists(repomd):
-            log.error('Cannot find local repomd: %s', repomd)
+        checksums = {}
+        for arch in arches:
+            repomd = os.path.join(compose_path, arch, 'os', 'repodata', 'repomd.xml')
+            if not os.path.exists(repomd):
+                log.error('Cannot find local repomd: %s', repomd)
+                continue
+            with open(repomd, 'rb') as repomdf:
+                checksums[arch] = hashlib.sha1(repomdf.read()).hexdigest()
+        if not checksums:
             return
 
         self.save_state(ComposeState.syncing_repo)
-        master_repomd_url = self._get_master_repomd_url(arch)
+        mirrors = {arch: [RepomdMirror(url, checksum)
+                          for url in self._get_master_repomd_urls(arch)]
+                   for arch, checksum in checksums.items()}
+        quorum = config['wait_for_sync.quorum']
+
+        def unsynced():
+            # Once an arch reached the quorum, its mirrors don't need to be polled anymore.
+            return [mirror for arch_mirrors in mirrors.values()
+                    if sum(m.synced for m in arch_mirrors) < (
+                        min(quorum, len(arch_mirrors)) or len(arch_mirrors))
+                    for mirror in arch_mirrors if not mirror.synced]
+
+        start = time.monotonic()
+        pending = unsynced()
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            while pending:
+                list(pool.map(RepomdMirror.poll, pending))
+                pending = unsynced()
+                if pending:
+                    interval = sync_poll_interval(time.monotonic() - start)
+                    log.debug('%d mirrors are not synchronized yet for %r, polling again in %ds',
+                              len(pending), self.id, interval)
+                    time.sleep(interval)
+
+        latency = time.monotonic() - start
+        SYNC_LATENCY.labels(repo=self.id).observe(latency)
+        log.info("master repomd.xml matches! (%d seconds)", latency)
+        notifications.publish(compose_schemas.ComposeSyncDoneV1.from_dict(
+            dict(repo=self.id, agent=self.agent)),
+            force=True)
 
-        with open(repomd) as repomdf:
-            checksum = hashlib.sha1(repomdf.read().encode('utf-8')).hexdigest()
-        while True:
-            try:
-                log.info('Polling %s' % master_repomd_url)
-                masterrepomd = urlopen(master_repomd_url)
-                newsum = hashlib.sha1(masterrepomd.read()).hexdigest()
-            except (ConnectionResetError, IncompleteRead, URLError, HTTPError):
+
+def sync_poll_interval(elapsed):
+    """
+    Return how long to wait before polling the master mirrors again.
+
+    The interval halves as ``wait_for_sync.expected_duration`` approaches, and grows back once it
+    is exceeded, bounded by ``wait_for_sync.min_interval`` and ``wait_for_sync.max_interval``.
+
+    Args:
+        elapsed (float): How many seconds have been spent waiting so far.
+    Returns:
+        int: The number of seconds to wait.
+    """
+    remaining = config['wait_for_sync.expected_duration'] - elapsed
+    interval = remaining / 2 if remaining > 0 else -remaining / 4
+    return int(max(config['wait_for_sync.min_interval'],
+                   min(config['wait_for_sync.max_interval'], interval)))
+
+
+class RepomdMirror(object):
+    """Poll a repomd.xml on a mirror until it matches the one of the compose."""
+
+    def __init__(self, url, checksum):
+        """
+        Initialize the RepomdMirror.
+
+        Args:
+            url (str): The URL of the repomd.xml on the mirror.
+            checksum (str): The SHA1 checksum of the repomd.xml of the compose.
+        """
+        self.url = url
+        self.checksum = checksum
+        self.synced = False
+        self._etag = None
+        self._last_modified = None
+
+    def poll(self):
+        """
+        Fetch the repomd.xml, unless it did not change since the last poll.
+
+        Returns:
+            bool: Whether the mirror serves the repomd.xml of the compose.
+        """
+        headers = {}
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        try:
+            log.info('Polling %s' % self.url)
+            response = urlopen(Request(self.url, headers=headers), timeout=60)
+            newsum = hashlib.sha1(response.read()).hexdigest()
+        except HTTPError as e:
+            if e.code != 304:
                 log.exception('Error fetching repomd.xml')
-                time.sleep(200)
-                continue
-            if newsum == checksum:
-                log.info("master repomd.xml matches!")
-                notifications.publish(compose_schemas.ComposeSyncDoneV1.from_dict(
-                    dict(repo=self.id, agent=self.agent)),
-                    force=True)
-                return
-
-            log.debug("master repomd.xml doesn't match! %s != %s for %r",
-                      checksum, newsum, self.id)
-            time.sleep(200)
+            return False
+        except (IncompleteRead, OSError):
+            # URLError, and the timeouts and resets of the connection while reading
+            log.exception('Error fetching repomd.xml')
+            return False
+
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+        self.synced = newsum == self.checksum
+        if not self.synced:
+            log.debug("master repomd.xml doesn't match! %s != %s for %s",
+                      self.checksum, newsum, self.url)
+        return self.synced
 
 
 class RPMComposerThread(PungiComposerThread):
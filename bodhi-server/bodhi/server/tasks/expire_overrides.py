@@ -40,13 +40,15 @@ def expire_overrides(db: Session):
     overrides = db.query(BuildrootOverride)
     overrides = overrides.filter(BuildrootOverride.expired_date.is_(None))
     overrides = overrides.filter(BuildrootOverride.expiration_date < now)
-    count = overrides.count()
-    if not count:
+    overrides = overrides.all()
+    if not overrides:
         log.info("No active buildroot override to expire")
         return
-    log.info("Expiring %d buildroot overrides...", count)
+    log.info("Expiring %d buildroot overrides...", len(overrides))
+    failures = BuildrootOverride.expire_all(db, overrides)
     for override in overrides:
-        log.debug(f"Expiring BRO for {override.build.nvr} because it's due to expire.")
-        override.expire()
-        db.add(override)
         log.info("Expired %s" % override.build.nvr)
+    if failures:
+        log.warning(
+            "%d of the expired buildroot overrides could not be fully untagged: %s",
+            len(failures), ', '.join(sorted(failures)))
@@ -25,6 +25,8 @@ from textwrap import TextWrapper
 from urllib.parse import urlencode
 import bz2
 import configparser
+import ctypes
+import ctypes.util
 import errno
 import functools
 import gzip
@@ -33,6 +35,7 @@ import json
 import lzma
 import os
 import re
+import select
 import socket
 import subprocess
 import tempfile
@@ -55,7 +58,7 @@ import requests
 import rpm
 import zstandard
 
-from bodhi.server import __version__, ffmarkdown, log, buildsys, Session
+from bodhi.server import __version__, ffmarkdown, log, buildsys, Session, spans
 from bodhi.server.config import config
 from bodhi.server.exceptions import RepodataException
 
@@ -972,15 +975,17 @@ def call_api(api_url, service_name, error_key=None, method='GET', data=None, hea
         base_error_msg = (
             'Bodhi failed to send POST request to {0} at the following URL '
             '"{1}". The status code was "{2}".')
-        rv = http_session.post(api_url,
-                               headers=headers,
-                               data=json.dumps(data),
-                               timeout=60)
+        with spans.span(service_name.lower()):
+            rv = http_session.post(api_url,
+                                   headers=headers,
+                                   data=json.dumps(data),
+                                   timeout=60)
     else:
         base_error_msg = (
             'Bodhi failed to get a resource from {0} at the following URL '
             '"{1}". The status code was "{2}".')
-        rv = http_session.get(api_url, timeout=60)
+        with spans.span(service_name.lower()):
+            rv = http_session.get(api_url, timeout=60)
 
     if rv.status_code >= 200 and rv.status_code < 300:
         return rv.json()
@@ -1408,3 +1413,91 @@ def get_createrepo_config(rel):
              'compatibility': configfile['DEFAULT'].getboolean('compatibility')
              }
         )
+
+
+# The inotify events meaning that a file appeared in a watched directory.
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+
+
+def _inotify_fd(directories: typing.Iterable[str]) -> typing.Optional[int]:
+    """
+    Return an inotify file descriptor watching for files appearing in the given directories.
+
+    Args:
+        directories: The directories to watch.
+    Returns:
+        A non-blocking file descriptor, or None if inotify isn't usable here.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (AttributeError, OSError):
+        return None
+    if fd < 0:
+        return None
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory),
+                                  _IN_CREATE | _IN_MOVED_TO | _IN_CLOSE_WRITE) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+def wait_for_paths(paths: typing.Iterable[str], timeout: float = 0, poll_interval: float = 30,
+                   progress: typing.Callable[[typing.List[str]], None] = None) \
+        -> typing.List[str]:
+    """
+    Block until all the given paths exist.
+
+    On Linux, inotify wakes the wait up as soon as a file appears in the directory of a missing
+    path. The paths are checked again every poll_interval seconds anyway, since inotify doesn't see
+    the files created by other hosts on network filesystems, or when inotify isn't usable.
+
+    Args:
+        paths: The paths to wait for.
+        timeout: How many seconds to wait at most, 0 to wait forever.
+        poll_interval: How many seconds to wait at most between two checks of the paths.
+        progress: If given, called with the list of missing paths before waiting, and whenever
+            that list changes.
+    Returns:
+        The paths that are still missing when the timeout expired, an empty list otherwise.
+    """
+    missing = [path for path in paths if not os.path.exists(path)]
+    if not missing:
+        return []
+
+    deadline = time.monotonic() + timeout if timeout else None
+    fd = _inotify_fd({os.path.dirname(path) for path in missing})
+    if fd is None:
+        log.debug('inotify is not available, polling for %s', ', '.join(missing))
+    try:
+        if progress:
+            progress(missing)
+        while True:
+            wait = poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return missing
+            if fd is None:
+                time.sleep(wait)
+            elif select.select([fd], [], [], wait)[0]:
+                # Drain the events, the paths are checked below anyway.
+                try:
+                    while os.read(fd, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+
+            still_missing = [path for path in missing if not os.path.exists(path)]
+            if not still_missing:
+                return []
+            if still_missing != missing:
+                missing = still_missing
+                if progress:
+                    progress(missing)
+    finally:
+        if fd is not None:
+            os.close(fd)
@@ -190,6 +190,54 @@ def cache_nvrs(request, build):
     request.buildinfo[build]['nvr'] = kbinfo['name'], kbinfo['version'], kbinfo['release']
 
 
+@postschema_validator
+def prefetch_builds(request, **kwargs):
+    """
+    Fetch the koji info and the tags of all the given builds with a few koji multicalls.
+
+    The results are cached in request.buildinfo, so the following validators don't have to ask
+    koji about each build one by one. The builds that koji doesn't know about, or that have no tags,
+    are not cached: the validators fetch them again and report the errors. A single build is left
+    to the validators too, as a multicall would only save one round trip for it.
+
+    Args:
+        request (pyramid.request.Request): The current request.
+        kwargs (dict): The kwargs of the related service definition. Unused.
+    """
+    builds = request.validated.get('builds')
+    if not isinstance(builds, list):
+        return
+    builds = [b for b in dict.fromkeys(builds)
+              if isinstance(b, str) and 'nvr' not in request.buildinfo.get(b, {})]
+    if len(builds) < 2:
+        return
+    batch_size = config['koji_prefetch_batch_size']
+    koji_session = request.koji
+
+    for i in range(0, len(builds), batch_size):
+        batch = builds[i:i + batch_size]
+        try:
+            koji_session.multicall = True
+            for build in batch:
+                koji_session.getBuild(build)
+                koji_session.listTags(build)
+            results = koji_session.multiCall()
+        except Exception:
+            log.exception('Unable to prefetch the builds from koji')
+            koji_session.multicall = False
+            return
+
+        # Koji returns a one element list for each successful call, and a fault dict for the others.
+        for build, kbinfo, tags in zip(batch, results[::2], results[1::2]):
+            if isinstance(kbinfo, list) and kbinfo[0]:
+                request.buildinfo[build]['info'] = kbinfo[0]
+                request.buildinfo[build]['nvr'] = (
+                    kbinfo[0]['name'], kbinfo[0]['version'], kbinfo[0]['release'])
+            if isinstance(tags, list) and tags[0]:
+                request.buildinfo[build]['tags'] = (
+                    [tag['name'] for tag in tags[0]] + request.from_tag_inherited)
+
+
 @postschema_validator
 def validate_build_nvrs(request, **kwargs):
     """
@@ -406,8 +454,8 @@ def validate_qa_acls(request, **kwargs):
         # If you're not logged in, obviously you don't have ACLs.
         request.errors.add('cookies', 'user', 'No ACLs for anonymous user')
         return
-    user = User.get(request.identity.name)
-    user_groups = [group.name for group in user.groups]
+    user_name = request.identity.name
+    user_groups = [group.name for group in request.identity.groups]
 
     if 'update' in request.validated:
         if request.validated['update'].release.state == ReleaseState.archived:
@@ -423,14 +471,14 @@ def validate_qa_acls(request, **kwargs):
     admin_groups = config['admin_packager_groups']
     for group in admin_groups:
         if group in user_groups:
-            log.debug(f'{user.name} is in {group} admin group')
+            log.debug(f'{user_name} is in {group} admin group')
             return
 
     # Allow qa groups to waive/trigger tests for any update
     ci_groups = config['qa_groups']
     for group in ci_groups:
         if group in user_groups:
-            log.debug(f'{user.name} is in {group} qa group')
+            log.debug(f'{user_name} is in {group} qa group')
             return
 
     # ...else fall back to standard ACLs
@@ -467,8 +515,9 @@ def validate_acls(request, **kwargs):
         # If you're not logged in, obviously you don't have ACLs.
         request.errors.add('cookies', 'user', 'No ACLs for anonymous user')
         return
-    user = User.get(request.identity.name)
-    user_groups = [group.name for group in user.groups]
+    # The cached identity holds the name and the groups of the user, so they aren't queried.
+    user_name = request.identity.name
+    user_groups = [group.name for group in request.identity.groups]
     acl_system = config.get('acl_system')
 
     builds = None
@@ -493,7 +542,7 @@ def validate_acls(request, **kwargs):
     admin_groups = config['admin_packager_groups']
     for group in admin_groups:
         if group in user_groups:
-            log.debug(f'{user.name} is in {group} admin group')
+            log.debug(f'{user_name} is in {group} admin group')
             return
 
     # Make sure the user is in the mandatory packager groups. This is a
@@ -502,7 +551,7 @@ def validate_acls(request, **kwargs):
     mandatory_groups = config['mandatory_packager_groups']
     for mandatory_group in mandatory_groups:
         if mandatory_group not in user_groups:
-            error = (f'{user.name} is not a member of "{mandatory_group}", which is a '
+            error = (f'{user_name} is not a member of "{mandatory_group}", which is a '
                      f'mandatory packager group')
             request.errors.add('body', 'builds', error)
             return
@@ -517,20 +566,20 @@ def validate_acls(request, **kwargs):
         if sidetag_owner is None:
             log.warning('Update appear to be from side-tag, but we cannot determine '
                         'the side-tag owner')
-        elif sidetag_owner != user.name:
-            log.warning(f'{user.name} does not own {sidetag} side-tag')
+        elif sidetag_owner != user_name:
+            log.warning(f'{user_name} does not own {sidetag} side-tag')
         else:
-            log.debug(f'{user.name} owns {sidetag} side-tag')
+            log.debug(f'{user_name} owns {sidetag} side-tag')
             return
     elif 'update' in request.validated and sidetag:
         # This is a simplified check to avoid quering Koji for the side-tag owner
         # The user whom created the update is surely the one owning the side-tag
         update = request.validated['update']
-        if user == update.user:
-            log.debug(f'{user.name} owns {update.alias} side-tag update')
+        if update.user is not None and update.user.name == user_name:
+            log.debug(f'{user_name} owns {update.alias} side-tag update')
             return
         else:
-            log.warning(f'{user.name} does not own {sidetag} side-tag')
+            log.warning(f'{user_name} does not own {sidetag} side-tag')
 
     # Check against every build
     log.debug('Using builds validation method')
@@ -576,7 +625,7 @@ def validate_acls(request, **kwargs):
         if acl_system == 'pagure':
             # Verify user's commit access
             try:
-                has_access = package.hascommitaccess(user.name, release.branch)
+                has_access = package.hascommitaccess(user_name, release.branch)
             except RuntimeError as error:
                 # If it's a RuntimeError, then the error will be logged
                 # and we can return the error to the user as is
@@ -591,7 +640,7 @@ def validate_acls(request, **kwargs):
                              'Please try again later.')
                 request.errors.add('body', 'builds', error_msg)
                 return
-            people = [user.name]
+            people = [user_name]
             if has_access:
                 # Retrieve people to be informed of the update
                 try:
@@ -613,7 +662,7 @@ def validate_acls(request, **kwargs):
                     update = Update.get(alias)
             if update:
                 committers.append(update.user.name)
-            if user.name in committers:
+            if user_name in committers:
                 has_access = True
             people = committers
         else:
@@ -624,7 +673,7 @@ def validate_acls(request, **kwargs):
 
         if not has_access:
             request.errors.add('body', 'builds',
-                               f'{user.name} does not have commit access to {package.name}')
+                               f'{user_name} does not have commit access to {package.name}')
             request.errors.status = 403
 
 
@@ -29,7 +29,7 @@ from pyramid.view import notfound_view_config, view_config
 import cornice.errors
 import sqlalchemy as sa
 
-from bodhi.server import log, METADATA, models
+from bodhi.server import candidates, log, METADATA, models
 from bodhi.server.config import config
 import bodhi.server.util
 
@@ -316,9 +316,23 @@ def latest_candidates(request):
     koji = request.koji
     db = request.db
 
+    def associated_build_nvrs():
+        # We want to filter out builds associated with an update.
+        # Since the candidate_tag is removed when an update is pushed to
+        # stable, we only need a list of builds that are associated to
+        # updates still in pending state.
+
+        # Don't filter by releases here, because the associated update
+        # might be archived but the build might be inherited into an active
+        # release.
+        return (row[0] for row in
+                db.query(models.Build.nvr).
+                join(models.Update).
+                filter(models.Update.status == models.UpdateStatus.pending))
+
     def work(testing, hide_existing, pkg=None, prefix=None):
         result = []
-        koji.multicall = True
+        seen = set()
 
         releases = db.query(models.Release) \
                      .filter(
@@ -328,66 +342,46 @@ def latest_candidates(request):
                               models.ReleaseState.current)))
 
         if hide_existing:
-            # We want to filter out builds associated with an update.
-            # Since the candidate_tag is removed when an update is pushed to
-            # stable, we only need a list of builds that are associated to
-            # updates still in pending state.
-
-            # Don't filter by releases here, because the associated update
-            # might be archived but the build might be inherited into an active
-            # release. If this gives performance troubles later on, caching
-            # this set should be easy enough.
-            associated_build_nvrs = set(
-                row[0] for row in
-                db.query(models.Build.nvr).
-                join(models.Update).
-                filter(models.Update.status == models.UpdateStatus.pending)
-            )
+            existing_build_nvrs = candidates.get_associated_build_nvrs(associated_build_nvrs)
 
-        kwargs = dict(package=pkg, prefix=prefix, latest=True)
+        tags = []
         tag_release = dict()
         for release in releases:
             tag_release[release.candidate_tag] = release.long_name
             tag_release[release.testing_tag] = release.long_name
             tag_release[release.pending_testing_tag] = release.long_name
             tag_release[release.pending_signing_tag] = release.long_name
-            koji.listTagged(release.candidate_tag, **kwargs)
+            tags.append(release.candidate_tag)
             if testing:
-                koji.listTagged(release.testing_tag, **kwargs)
-                koji.listTagged(release.pending_testing_tag, **kwargs)
+                tags.append(release.testing_tag)
+                tags.append(release.pending_testing_tag)
                 if release.pending_signing_tag:
-                    koji.listTagged(release.pending_signing_tag, **kwargs)
-
-        response = koji.multiCall() or []  # Protect against None
-        for taglist in response:
-            # if the call to koji results in errors, it returns them
-            # in the reponse as dicts. Here we detect these, and log
-            # the errors
-            if isinstance(taglist, dict):
-                log.error('latest_candidates endpoint asked Koji about a non-existent tag:')
-                log.error(taglist)
-            else:
-                for build in taglist[0]:
-                    if hide_existing and build['nvr'] in associated_build_nvrs:
-                        continue
-
-                    item = {
-                        'nvr': build['nvr'],
-                        'id': build['id'],
-                        'package_name': build['package_name'],
-                        'owner_name': build['owner_name'],
-                    }
-
-                    # The build's tag might not be present in tag_release
-                    # because its associated release is archived and therefore
-                    # filtered out in the query above.
-                    if build['tag_name'] in tag_release:
-                        item['release_name'] = tag_release[build['tag_name']]
-
-                    # Prune duplicates
-                    # https://github.com/fedora-infra/bodhi/issues/450
-                    if item not in result:
-                        result.append(item)
+                    tags.append(release.pending_signing_tag)
+
+        for index in candidates.get_tagged_builds(koji, tags, name=pkg or prefix):
+            for build in candidates.filter_builds(index, package=pkg, prefix=prefix):
+                if hide_existing and build['nvr'] in existing_build_nvrs:
+                    continue
+
+                item = {
+                    'nvr': build['nvr'],
+                    'id': build['id'],
+                    'package_name': build['package_name'],
+                    'owner_name': build['owner_name'],
+                }
+
+                # The build's tag might not be present in tag_release
+                # because its associated release is archived and therefore
+                # filtered out in the query above.
+                if build['tag_name'] in tag_release:
+                    item['release_name'] = tag_release[build['tag_name']]
+
+                # Prune duplicates
+                # https://github.com/fedora-infra/bodhi/issues/450
+                key = tuple(item.items())
+                if key not in seen:
+                    seen.add(key)
+                    result.append(item)
         return result
 
     pkg = request.params.get('package')
@@ -29,9 +29,13 @@ exclude_patterns = ['_build']
 # One entry per manual page. List of tuples
 # (source start file, name, description, authors, manual section).
 man_pages = [
+    ('man_pages/bodhi-profiles', 'bodhi-profiles', 'summarize the profiles of Bodhi',
+     ['Bodhi developers'], 1),
     ('man_pages/bodhi-push', 'bodhi-push', 'push Fedora updates', ['Randy Barlow'], 1),
     ('man_pages/initialize_bodhi_db', 'initialize_bodhi_db', 'initialize bodhi\'s database',
      ['Randy Barlow'], 1),
+    ('man_pages/bodhi-populate-db', 'bodhi-populate-db',
+     'populate the database with a generated dataset', ['Bodhi developers'], 1),
     ('man_pages/bodhi-sar', 'bodhi-sar', 'display user data', ['Randy Barlow'], 1),
     ('man_pages/bodhi-shell', 'bodhi-shell', 'run python shell initialized with Bodhi models',
      ['Randy Barlow', 'Sebastian Wojciechowski'], 1),
@@ -5,7 +5,7 @@ from pyramid import testing
 from pyramid.httpexceptions import HTTPAccepted, HTTPUnauthorized
 import pytest
 
-from bodhi.server import models
+from bodhi.server import models, security
 from bodhi.server.auth.utils import get_and_store_user, get_final_redirect, remember_me
 
 from .. import base
@@ -77,6 +77,15 @@ class TestRememberMe(base.BasePyTestCase):
         user = models.User.get('lmacken')
         assert user.email == '1337hax0r@example.com'
 
+    def test_identity_invalidated(self):
+        """Assert that the cached identity of the user is forgotten when they log in again."""
+        req, info = self._generate_req_info(self.app_settings['openid.provider'])
+        security.identities.set('lmacken', {'name': 'lmacken', 'groups': []})
+
+        remember_me(None, req, info)
+
+        assert security.identities.get('lmacken') is None
+
     def test_new_user(self):
         """Test the post-login hook"""
         req, info = self._generate_req_info(self.app_settings['openid.provider'])
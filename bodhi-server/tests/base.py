@@ -33,6 +33,7 @@ import createrepo_c
 from bodhi.server import (
     bugs,
     buildsys,
+    candidates,
     config,
     initialize_db,
     main,
@@ -238,6 +239,7 @@ class BaseTestCaseMixin:
         # Ensure "cached" objects are cleared before each test.
         models.Release.all_releases.cache_clear()
         models.Release.get_tags.cache_clear()
+        candidates.invalidate()
 
         if engine is None:
             self.engine = _configure_test_db(config.config)
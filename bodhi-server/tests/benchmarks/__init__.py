@@ -0,0 +1,69 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Benchmarks of the bodhi.server hot paths.
+
+These tests exercise code paths with production-sized datasets. Besides checking the results, they
+log how long each measured step took, which can be seen by running pytest with
+--log-cli-level=INFO.
+"""
+from contextlib import contextmanager
+from functools import partial
+from unittest import mock
+import logging
+import time
+
+from bodhi.server import buildsys
+
+
+log = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed(label):
+    """
+    Measure the wall clock time spent in the context and log it.
+
+    Args:
+        label (str): A description of what is being measured.
+    Yields:
+        dict: A dictionary whose "seconds" key holds the measured duration once the context exits.
+    """
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['seconds'] = time.perf_counter() - start
+        log.info('%s: %.4fs', label, result['seconds'])
+
+
+@contextmanager
+def fake_koji(dataset, latency=0):
+    """
+    Answer the Koji calls from the given dataset in the context.
+
+    Args:
+        dataset (bodhi.server.buildsys.KojiDataset): The Koji data, which also counts the calls.
+        latency (float): How many seconds Koji takes to answer each call or multicall.
+    Yields:
+        bodhi.server.buildsys.KojiDataset: The dataset.
+    """
+    with mock.patch.object(buildsys, '_buildsystem',
+                           partial(buildsys.DatasetBuildsys, dataset, latency=latency)):
+        yield dataset
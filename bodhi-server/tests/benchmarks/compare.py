@@ -0,0 +1,109 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Compare the results of the benchmarks with the committed baseline.
+
+The benchmarks are run, and their results compared, with::
+
+    $ python3 -m pytest --benchmark-enable --benchmark-only --benchmark-json=benchmarks.json \
+        tests/benchmarks
+    $ python3 -m tests.benchmarks.compare benchmarks.json
+
+The command fails if the median time of a benchmark is more than the threshold slower than in the
+baseline, and at least --min-slowdown seconds slower: the benchmarks that take less than a
+millisecond vary by more than the threshold between two runs on the same runner. The baseline holds
+the median times of the benchmarks on the CI runners, and is updated with the --update flag from
+the results of the benchmark job.
+"""
+import json
+import os
+
+import click
+
+
+#: The path to the committed baseline.
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def medians(results: dict) -> dict:
+    """
+    Return the median times of the benchmarks in the results of pytest-benchmark.
+
+    Args:
+        results: The results saved by pytest-benchmark with --benchmark-json.
+    Returns:
+        The median time of each benchmark in seconds, by benchmark name.
+    """
+    return {b['fullname']: b['stats']['median'] for b in results['benchmarks']}
+
+
+def regressions(current: dict, baseline: dict, threshold: float, min_slowdown: float = 0) -> dict:
+    """
+    Return the benchmarks that are slower than in the baseline by more than the thresholds.
+
+    Args:
+        current: The median times of the benchmarks, by benchmark name.
+        baseline: The median times of the benchmarks in the baseline, by benchmark name.
+        threshold: How much slower a benchmark can be, as a fraction of its baseline time.
+        min_slowdown: How much slower a benchmark can be in any case, in seconds.
+    Returns:
+        How many times slower each regressed benchmark is, by benchmark name.
+    """
+    return {name: current[name] / baseline[name] for name in sorted(current)
+            if name in baseline and current[name] > max(baseline[name] * (1 + threshold),
+                                                        baseline[name] + min_slowdown)}
+
+
+@click.command()
+@click.argument('results', type=click.File())
+@click.option('--baseline', 'baseline_path', default=BASELINE, show_default=True,
+              type=click.Path(dir_okay=False), help='The path to the baseline.')
+@click.option('--threshold', default=0.25, show_default=True,
+              help='How much slower than the baseline a benchmark can be, as a fraction.')
+@click.option('--min-slowdown', default=0.001, show_default=True,
+              help='How much slower than the baseline a benchmark can be in any case, in seconds.')
+@click.option('--update', is_flag=True, help='Replace the baseline with the results.')
+def main(results, baseline_path, threshold, min_slowdown, update):
+    """Compare the RESULTS of pytest-benchmark with the baseline."""
+    current = medians(json.load(results))
+    if update:
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(current, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        click.echo(f'Saved the median times of {len(current)} benchmarks to {baseline_path}')
+        return
+
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    slower = regressions(current, baseline, threshold, min_slowdown)
+    for name in sorted(current):
+        if name in baseline:
+            change = f'{current[name] / baseline[name] - 1:+.0%}'
+        else:
+            change = 'new'
+        click.echo(f'{"REGRESSED" if name in slower else "ok":9} {change:>6} '
+                   f'{current[name] * 1000:10.3f}ms {name}')
+    for name in sorted(set(baseline) - set(current)):
+        click.echo(f'{"missing":9} {"":>6} {"":>12} {name}')
+    if slower:
+        raise click.ClickException(
+            f'{len(slower)} benchmarks are more than {threshold:.0%} slower than the baseline')
+
+
+if __name__ == '__main__':
+    main()
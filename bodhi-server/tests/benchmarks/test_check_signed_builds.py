@@ -0,0 +1,83 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""Benchmark the check_signed_builds task with a thousand builds waiting to be signed."""
+from unittest import mock
+
+from bodhi.server import buildsys, models
+from bodhi.server.config import config
+from bodhi.server.tasks.check_signed_builds import main as check_signed_builds_main
+
+from . import timed
+from ..tasks.base import BaseTaskTestCase
+
+
+#: The number of pending updates and the number of builds in each of them.
+UPDATES = 200
+BUILDS = 5
+
+
+def _list_tags(self, build, *args, **kw):
+    """
+    Return the tags of a generated build.
+
+    A third of the builds were signed, a third are stuck waiting to be signed and a third were
+    never sent to signing.
+    """
+    if not build.startswith('package'):
+        return []
+    number = int(build.split('-')[0][len('package'):])
+    tags = ['f17-updates-candidate', 'f17-updates-testing-pending', 'f17-updates-signing-pending']
+    if number % 3 == 0:
+        return [{'name': tags[1]}]
+    elif number % 3 == 1:
+        return [{'name': tags[0]}, {'name': tags[2]}]
+    return [{'name': tags[0]}]
+
+
+class TestCheckSignedBuilds(BaseTaskTestCase):
+    """Benchmark the check_signed_builds task."""
+
+    def setup_method(self, method):
+        """Create pending updates whose builds were not marked as signed."""
+        super().setup_method(method)
+        for i in range(UPDATES):
+            update = self.create_update(
+                [f'package{i * BUILDS + j}-1.0-1.fc17' for j in range(BUILDS)])
+            for build in update.builds:
+                build.signed = False
+        self.db.commit()
+
+    @mock.patch.object(buildsys.DevBuildsys, 'multiCall', autospec=True,
+                       side_effect=buildsys.DevBuildsys.multiCall)
+    @mock.patch.object(buildsys.DevBuildsys, 'listTags', autospec=True,
+                       side_effect=buildsys.multicall_enabled(_list_tags))
+    def test_check_signed_builds(self, listTags, multiCall):
+        """All the builds are classified with a few Koji round trips."""
+        builds = UPDATES * BUILDS
+
+        with timed(f'check_signed_builds, {builds} builds'):
+            check_signed_builds_main()
+
+        signed = self.db.query(models.Build).filter(
+            models.Build.nvr.like('package%'), models.Build.signed.is_(True)).count()
+        assert signed == len([i for i in range(builds) if i % 3 == 0])
+        # The update of the base fixture is pending too.
+        assert listTags.call_count == builds + 1
+        batches = -(-(builds + 1) // config.get('check_signed_builds_batch_size'))
+        # The stuck builds are untagged and tagged again, the overlooked ones are tagged.
+        assert multiCall.call_count == batches + 3
@@ -0,0 +1,266 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Benchmark the server hot paths against a generated database and a fake Koji.
+
+These tests use the benchmark fixture of pytest-benchmark, which only runs them once unless
+--benchmark-enable is given. See compare.py for how their results are checked against the
+baseline.
+"""
+from unittest import mock
+import tempfile
+
+from cornice.errors import Errors
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+
+from bodhi.server import buildsys, models, util, validators
+from bodhi.server.config import config
+from bodhi.server.metadata import UpdateInfoMetadata
+from bodhi.server.scripts.populatedb import DatasetGenerator
+from bodhi.server.tasks import approve_testing, check_policies
+
+from . import fake_koji
+from ..tasks.base import BaseTaskTestCase
+
+
+#: The sizes of the generated database.
+SIZES = dict(releases=2, first_release=36, users=100, packages=300, builds=3000, updates=1000,
+             comments=4, bugs=1, overrides=50)
+#: The release whose updates are benchmarked, the newest one of the generated database.
+RELEASE = 'F37'
+#: How many updates are serialized or summed up at once.
+UPDATES = 100
+#: The notes of an update, using all the Bodhi markdown extensions.
+NOTES = '\n\n'.join([
+    '# Update to 2.0',
+    'This fixes #1234, RHBZ#56789 and [the crash](https://bugzilla.redhat.com/9012) reported by '
+    '@guest and @user1.',
+    '\n'.join(f'* Fix bug #{100 + i} in `module{i}`, thanks to @user{i}' for i in range(20)),
+    '```\n$ dnf upgrade --refresh --advisory=FEDORA-2024-abcdef\n```',
+    ' '.join(['Lorem ipsum dolor sit amet, consectetur adipiscing elit.'] * 20),
+])
+#: The answer of Greenwave about the updates.
+DECISION = {
+    'policies_satisfied': True, 'summary': 'All required tests passed',
+    'applicable_policies': ['kojibuild_bodhipush_no_requirements'],
+    'satisfied_requirements': [{'result_id': 1, 'subject_type': 'bodhi_update',
+                                'testcase': 'update.install', 'type': 'test-result-passed'}],
+    'unsatisfied_requirements': []}
+
+
+def _koji_dataset(db, release):
+    """
+    Return a Koji dataset with the builds of the given release.
+
+    The builds of the stable and testing updates are in the stable and testing tags of the
+    release, and the other ones in its candidate tag.
+
+    Args:
+        db (sqlalchemy.orm.session.Session): The database session.
+        release (bodhi.server.models.Release): The release.
+    Returns:
+        bodhi.server.buildsys.KojiDataset: The dataset.
+    """
+    dataset = buildsys.KojiDataset(
+        packages=0, side_tags=0,
+        tags=[release.stable_tag, release.testing_tag, release.candidate_tag])
+    tags = {models.UpdateStatus.stable: release.stable_tag,
+            models.UpdateStatus.testing: release.testing_tag}
+    builds = db.query(models.Build.nvr, models.Update.status).outerjoin(models.Update).filter(
+        models.Build.release == release)
+    for nvr, status in builds:
+        dataset.add_build(*nvr.rsplit('-', 2))
+        dataset.tag(tags.get(status, release.candidate_tag), nvr)
+    return dataset
+
+
+class TestHotPaths(BaseTaskTestCase):
+    """Benchmark the server hot paths."""
+
+    #: The rows of the generated database by table, generated once for all the tests.
+    _rows = None
+
+    def setup_method(self, method):
+        """Load the generated database, and answer the Koji calls from its builds."""
+        super().setup_method(method)
+        self._load_dataset()
+        self.release = models.Release.get(RELEASE)
+        self.koji = fake_koji(_koji_dataset(self.db, self.release))
+        self.koji.__enter__()
+
+    def _load_dataset(self):
+        """
+        Fill the database with the generated dataset.
+
+        The dataset is generated by the first test, and its rows are copied into the database of
+        the following ones, which is much faster than generating it again.
+        """
+        tables = models.Base.metadata.sorted_tables
+        if TestHotPaths._rows is None:
+            DatasetGenerator(self.db).generate(**SIZES)
+            self.db.commit()
+            TestHotPaths._rows = {
+                table.name: [dict(row) for row in self.db.execute(table.select()).mappings()]
+                for table in tables}
+            return
+        for table in reversed(tables):
+            self.db.execute(table.delete())
+        for table in tables:
+            if TestHotPaths._rows[table.name]:
+                self.db.execute(table.insert(), TestHotPaths._rows[table.name])
+        self.db.commit()
+
+    def teardown_method(self, method):
+        """Stop answering the Koji calls."""
+        self.koji.__exit__(None, None, None)
+        super().teardown_method(method)
+
+    def _updates(self, status=models.UpdateStatus.testing, count=UPDATES):
+        """Return updates of the benchmarked release, with their relationships loaded."""
+        return self.db.query(models.Update).filter_by(release=self.release, status=status).options(
+            selectinload(models.Update.builds), selectinload(models.Update.bugs),
+            selectinload(models.Update.comments)).order_by(models.Update.id).limit(count).all()
+
+    def test_query_updates_json(self, benchmark):
+        """List the updates as JSON."""
+        response = benchmark(self.app.get, '/updates/', {'rows_per_page': 100},
+                             headers={'Accept': 'application/json'})
+
+        assert len(response.json['updates']) == 100
+        assert response.json['total'] > SIZES['updates']
+
+    def test_query_updates_html(self, benchmark):
+        """List the updates as HTML."""
+        response = benchmark(self.app.get, '/updates/', {'rows_per_page': 100},
+                             headers={'Accept': 'text/html'})
+
+        assert 'FEDORA-' in response.text
+
+    def test_query_updates_rss(self, benchmark):
+        """List the updates as an RSS feed."""
+        response = benchmark(self.app.get, '/rss/updates/', {'rows_per_page': 100})
+
+        assert response.text.count('<item>') == 100
+
+    def test_update_json(self, benchmark):
+        """Serialize updates."""
+        updates = self._updates()
+
+        serialized = benchmark(lambda: [u.__json__() for u in updates])
+
+        assert [u['alias'] for u in serialized] == [u.alias for u in updates]
+
+    def test_update_karma(self, benchmark):
+        """Sum up the karma of updates."""
+        updates = self._updates()
+
+        karma = benchmark(lambda: [u.karma for u in updates])
+
+        assert len(karma) == len(updates)
+
+    def test_sorted_updates(self, benchmark):
+        """Sort the updates of a compose."""
+        updates = self._updates(count=None)
+
+        sync, async_ = benchmark(util.sorted_updates, updates)
+
+        assert sorted(u.id for u in sync + async_) == sorted(u.id for u in updates)
+
+    def test_obsolete_older_updates(self, benchmark):
+        """Obsolete the older updates of the packages of an update."""
+        # The newest testing update of the package with the most testing updates.
+        package_id = self.db.query(models.Build.package_id).join(models.Update).filter(
+            models.Update.release == self.release,
+            models.Update.status == models.UpdateStatus.testing,
+        ).group_by(models.Build.package_id).order_by(
+            func.count(models.Build.id).desc()).limit(1).scalar()
+        update = self.db.query(models.Update).join(models.Build).filter(
+            models.Build.package_id == package_id,
+            models.Update.status == models.UpdateStatus.testing).order_by(
+                models.Update.id.desc()).first()
+
+        def obsolete():
+            savepoint = self.db.begin_nested()
+            try:
+                return update.obsolete_older_updates(self.db)
+            finally:
+                savepoint.rollback()
+                self.db.info['messages'] = []
+
+        benchmark(obsolete)
+
+        assert update.status == models.UpdateStatus.testing
+
+    def test_updateinfo_metadata(self, benchmark):
+        """Generate the updateinfo of the stable updates."""
+        with tempfile.TemporaryDirectory() as composedir, \
+                mock.patch.dict(config, {'cache_dir': None}):
+            metadata = benchmark(UpdateInfoMetadata, self.release, models.UpdateRequest.stable,
+                                 self.db, composedir)
+
+        assert len(metadata.uinfo.updates) == len(metadata.updates) > 0
+
+    def test_validate_acls(self, benchmark):
+        """Check the ACLs of the builds of a new update."""
+        user = self.db.query(models.User).filter_by(name='guest').one()
+        builds = [b.nvr for b in self.db.query(models.Build).filter_by(
+            release=self.release, update=None).order_by(models.Build.id).limit(20)]
+
+        def request():
+            return (mock.Mock(identity=user, db=self.db, errors=Errors(),
+                              koji=buildsys.get_session(), buildinfo={}, from_tag_inherited=[],
+                              validated={'builds': builds}), ), {}
+
+        result = {}
+
+        def validate(request):
+            validators.validate_acls(request)
+            result['request'] = request
+
+        benchmark.pedantic(validate, setup=request, rounds=20)
+
+        assert result['request'].errors == []
+        assert {b['release'] for b in result['request'].buildinfo.values()} == {self.release}
+
+    @mock.patch.dict(config, {'greenwave_api_url': 'http://domain.local'})
+    @mock.patch('bodhi.server.models.util.greenwave_api_post', return_value=DECISION)
+    def test_check_policies(self, greenwave_api_post, benchmark):
+        """Check the gating status of the updates."""
+        benchmark(check_policies.main)
+
+        assert greenwave_api_post.call_count > 0
+        assert self.db.query(models.Update).filter_by(
+            release=self.release, status=models.UpdateStatus.testing, locked=False,
+            test_gating_status=models.TestGatingStatus.failed).count() == 0
+
+    @mock.patch('bodhi.server.notifications._publish_with_retry')
+    def test_approve_testing(self, _publish_with_retry, benchmark):
+        """Approve the updates that spent enough time in testing, once most of them were."""
+        benchmark.pedantic(approve_testing.main, rounds=5, warmup_rounds=1)
+
+        assert self.db.query(models.Update).filter(
+            models.Update.release == self.release,
+            models.Update.date_approved.isnot(None)).count() > 0
+
+    @mock.patch('bodhi.server.ffmarkdown.user_url', side_effect=lambda name: f'/users/{name}')
+    def test_markup(self, user_url, benchmark):
+        """Render the notes of an update."""
+        html = benchmark(util.markup, None, NOTES)
+
+        assert '<a href="https://bugzilla.redhat.com/show_bug.cgi?id=56789">' in html
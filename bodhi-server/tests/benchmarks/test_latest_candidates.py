@@ -0,0 +1,114 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""Benchmark the latest_candidates view with a few thousand candidate builds."""
+from unittest import mock
+
+from bodhi.server import buildsys, models
+
+from . import fake_koji, timed
+from .. import base
+
+
+#: The number of packages with a build in each of the tags of the benchmarked release.
+PACKAGES = 3000
+#: The time Koji takes to answer each call, in seconds.
+LATENCY = 0.05
+
+
+def _list_tagged(self, tag, *args, **kw):
+    """Return a build of every generated package for the given tag, with some duplicates."""
+    builds = [{'nvr': f'package{i}-1.0-1.fc17', 'id': i, 'package_name': f'package{i}',
+               'owner_name': 'packager', 'tag_name': tag}
+              for i in range(PACKAGES)]
+    # Koji can return the same build more than once, see
+    # https://github.com/fedora-infra/bodhi/issues/450
+    return builds + builds[:PACKAGES // 10]
+
+
+class TestLatestCandidates(base.BasePyTestCase):
+    """Benchmark the latest_candidates view."""
+
+    def setup_method(self, method):
+        """Serve a few thousand builds from each tag, some of which are already submitted."""
+        super().setup_method(method)
+        self.list_tagged = mock.patch.object(
+            buildsys.DevBuildsys, 'listTagged', autospec=True,
+            side_effect=buildsys.multicall_enabled(_list_tagged))
+        self.listTagged = self.list_tagged.start()
+
+        self.create_update([f'package{i}-1.0-1.fc17' for i in range(0, PACKAGES, 100)])
+        self.db.commit()
+
+    def teardown_method(self, method):
+        """Stop the Koji patch."""
+        self.list_tagged.stop()
+        super().teardown_method(method)
+
+    def test_all_candidates(self):
+        """All candidates of all tags are listed and deduplicated."""
+        params = {'testing': 'true', 'hide_existing': 'true'}
+
+        with timed(f'latest_candidates, {PACKAGES} builds per tag, cold cache'):
+            cold = self.app.get('/latest_candidates', params).json_body
+        with timed(f'latest_candidates, {PACKAGES} builds per tag, warm cache'):
+            warm = self.app.get('/latest_candidates', params).json_body
+
+        assert cold == warm
+        # Every tag of F17 maps to the same release, so each package is only listed once, and the
+        # packages already submitted in an update are hidden.
+        assert len(warm) == PACKAGES - PACKAGES // 100
+        # Only the cold request went to Koji, once for each of the 4 tags of the release.
+        assert self.listTagged.call_count == 4
+
+    def test_dataset(self):
+        """The tags of a production-sized Koji are listed with a single round trip."""
+        dataset = buildsys.KojiDataset(
+            packages=PACKAGES, side_tags=0,
+            tags=['f17-updates-testing', 'f17-updates-candidate'])
+        dataset.add_tag('f17-updates-testing-pending')
+        dataset.add_tag('f17-updates-signing-pending')
+
+        with fake_koji(dataset, latency=LATENCY), \
+                timed(f'latest_candidates, {PACKAGES} packages, {LATENCY}s Koji latency'):
+            candidates = self.app.get('/latest_candidates', {'testing': 'true'}).json_body
+
+        # The latest build of each package in the testing and candidate tags.
+        assert len(candidates) == 2 * PACKAGES
+        assert dataset.calls == {'listTagged': 4, 'multiCall': 1}
+
+    def test_keystrokes(self):
+        """Typing a package name in the new update form only goes to Koji once."""
+        name = f'package{PACKAGES - 1}'
+
+        with timed(f'latest_candidates, {len(name)} keystrokes'):
+            for i in range(1, len(name) + 1):
+                self.app.get('/latest_candidates', {'prefix': name[:i], 'testing': 'true'})
+
+        assert self.listTagged.call_count == 4
+
+    def test_associated_nvrs_invalidated(self):
+        """Creating an update refreshes the builds hidden by hide_existing."""
+        params = {'hide_existing': 'true'}
+        before = self.app.get('/latest_candidates', params).json_body
+
+        self.create_update(['package1-1.0-1.fc17'])
+        self.db.commit()
+
+        after = self.app.get('/latest_candidates', params).json_body
+        assert len(after) == len(before) - 1
+        assert self.db.query(models.Update).count() == 3
@@ -0,0 +1,110 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""Benchmark building the messages about a large update."""
+import json
+
+import pytest
+
+from bodhi.messages.schemas import (
+    buildroot_override as override_schemas,
+    errata as errata_schemas,
+    update as update_schemas,
+)
+from bodhi.messages.schemas.base import FedMsgEncoder
+from bodhi.server import models
+
+from . import timed
+from .. import base
+
+
+#: The number of builds, bugs and comments of the benchmarked update.
+BUILDS = 200
+BUGS = 100
+COMMENTS = 200
+#: How many times each message is built.
+ROUNDS = 20
+
+
+class TestMessagePayloads(base.BasePyTestCase):
+    """Compare the message payloads with the entire serialization of their objects."""
+
+    def setup_method(self, method):
+        """Create an update with many builds, bugs and comments."""
+        super().setup_method(method)
+        self.update = self.create_update([f'package{i}-1.0-1.fc17' for i in range(BUILDS)])
+        user = self.db.query(models.User).filter_by(name='guest').one()
+        for i in range(BUGS):
+            self.update.bugs.append(models.Bug(bug_id=100000 + i, title=f'Bug {i}'))
+        for i in range(COMMENTS):
+            self.db.add(models.Comment(text=f'Comment {i}', karma=0, user=user,
+                                       update=self.update))
+        self.db.commit()
+        self.comment = self.update.comments[-1]
+        self.override = self.db.query(models.BuildrootOverride).first()
+
+    def _bodies(self):
+        """Return the message classes to benchmark, with the dictionary they are built from."""
+        return {
+            update_schemas.UpdateCommentV1: {'comment': self.comment, 'agent': 'guest'},
+            update_schemas.UpdateEditV2: {
+                'update': self.update, 'agent': 'guest', 'new_bugs': [100000],
+                'new_builds': ['package0-1.0-1.fc17'], 'removed_builds': []},
+            update_schemas.UpdateCompleteStableV1: {'update': self.update, 'agent': 'bodhi'},
+            update_schemas.UpdateRequestTestingV1: {'update': self.update, 'agent': 'guest'},
+            errata_schemas.ErrataPublishV1: {
+                'subject': 'Fedora 17 Update', 'body': 'The update was pushed.',
+                'update': self.update},
+            override_schemas.BuildrootOverrideTagV1: {'override': self.override},
+        }
+
+    @pytest.mark.parametrize('cls', (
+        update_schemas.UpdateCommentV1, update_schemas.UpdateEditV2,
+        update_schemas.UpdateCompleteStableV1, update_schemas.UpdateRequestTestingV1,
+        errata_schemas.ErrataPublishV1, override_schemas.BuildrootOverrideTagV1))
+    def test_payload(self, cls):
+        """The payload is smaller and faster to build, and still satisfies the schema."""
+        message = self._bodies()[cls]
+        # Load the relationships once, so both ways are measured with a warm session.
+        json.dumps(message, cls=FedMsgEncoder)
+
+        with timed(f'{cls.__name__}, entire serialization') as entire_time:
+            for i in range(ROUNDS):
+                entire = json.loads(json.dumps(message, cls=FedMsgEncoder))
+        with timed(f'{cls.__name__}, payload') as payload_time:
+            for i in range(ROUNDS):
+                msg = cls.from_dict(message)
+
+        entire_size = len(json.dumps(entire))
+        payload_size = len(json.dumps(msg.body))
+        print(f'{cls.__name__}: {entire_size} bytes entirely serialized, '
+              f'{payload_size} bytes of payload')
+        msg.validate()
+        assert payload_size < entire_size
+        assert payload_time['seconds'] < entire_time['seconds']
+        assert _is_subset(msg.body, entire)
+
+
+def _is_subset(payload, entire):
+    """Return whether the payload only has values that are the same in the entire serialization."""
+    if isinstance(payload, dict):
+        return isinstance(entire, dict) and all(
+            key in entire and _is_subset(value, entire[key]) for key, value in payload.items())
+    if isinstance(payload, list):
+        return isinstance(entire, list) and len(payload) == len(entire) and all(
+            _is_subset(p, e) for p, e in zip(payload, entire))
+    return payload == entire
@@ -0,0 +1,97 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""Benchmark the validation of a new update with two hundred builds."""
+from unittest import mock
+import time
+
+from fedora_messaging import testing as fml_testing
+
+from bodhi.messages.schemas import update as update_schemas
+from bodhi.server import buildsys, models
+from bodhi.server.config import config
+
+from . import timed
+from ..base import BasePyTestCase
+
+
+#: The number of builds of the update.
+BUILDS = 200
+#: The time koji takes to answer each call, in seconds.
+LATENCY = 0.005
+
+
+class CountingBuildsys(buildsys.DevBuildsys):
+    """A DevBuildsys that counts the calls to koji, and that takes LATENCY to answer each."""
+
+    #: The calls to koji, as (method, whether it was part of a multicall) tuples.
+    calls = []
+
+    def _call(self, method):
+        """Record a call, and wait for koji to answer it unless it is part of a multicall."""
+        CountingBuildsys.calls.append((method, self.multicall))
+        if not self.multicall:
+            time.sleep(LATENCY)
+
+    def getBuild(self, *args, **kwargs):
+        """Emulate Koji's getBuild."""
+        self._call('getBuild')
+        return super().getBuild(*args, **kwargs)
+
+    def listTags(self, *args, **kwargs):
+        """Emulate Koji's listTags."""
+        self._call('listTags')
+        return super().listTags(*args, **kwargs)
+
+    def multiCall(self):
+        """Emulate Koji's multiCall."""
+        CountingBuildsys.calls.append(('multiCall', False))
+        time.sleep(LATENCY)
+        return super().multiCall()
+
+
+@mock.patch('bodhi.server.models.work_on_bugs_task', mock.Mock())
+@mock.patch('bodhi.server.models.fetch_test_cases_task', mock.Mock())
+class TestNewUpdate(BasePyTestCase):
+    """Benchmark the validators of a new update."""
+
+    @mock.patch.object(buildsys, '_buildsystem', CountingBuildsys)
+    def test_new_update(self):
+        """The builds are fetched from koji with a few multicalls, and only once."""
+        CountingBuildsys.calls = []
+        builds = [f'package{i}-1.0-1.fc17' for i in range(BUILDS)]
+        # The calls made by the validators and the view, before the update is created.
+        calls = []
+        new = models.Update.new
+
+        def record_calls(*args, **kwargs):
+            calls.extend(CountingBuildsys.calls)
+            return new(*args, **kwargs)
+
+        with timed(f'POST /updates/, {BUILDS} builds'):
+            with fml_testing.mock_sends(update_schemas.UpdateReadyForTestingV3,
+                                        update_schemas.UpdateRequestTestingV1), \
+                    mock.patch.object(models.Update, 'new', side_effect=record_calls):
+                self.app.post_json('/updates/', self.get_update(builds))
+
+        assert calls.count(('getBuild', True)) == BUILDS
+        assert calls.count(('listTags', True)) == BUILDS
+        # The validators didn't have to ask koji about any build on its own.
+        assert ('getBuild', False) not in calls
+        assert ('listTags', False) not in calls
+        assert calls.count(('multiCall', False)) == -(
+            -BUILDS // config['koji_prefetch_batch_size'])
@@ -0,0 +1,48 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.consumers.candidates module."""
+
+from unittest import mock
+
+from fedora_messaging.api import Message
+
+from bodhi.server.consumers import candidates
+
+
+class TestCandidatesHandler:
+    """Test class for the :class:`CandidatesHandler`."""
+
+    @mock.patch('bodhi.server.consumers.candidates.candidates.invalidate_tag')
+    def test_tag(self, invalidate_tag):
+        """The cached builds of the tag from the message are dropped."""
+        msg = Message(topic='org.fedoraproject.prod.buildsys.untag',
+                      body={'tag': 'f17-updates-candidate', 'name': 'bodhi',
+                            'version': '2.0', 'release': '1.fc17'})
+
+        candidates.CandidatesHandler()(msg)
+
+        invalidate_tag.assert_called_once_with('f17-updates-candidate')
+
+    @mock.patch('bodhi.server.consumers.candidates.candidates.invalidate_tag')
+    def test_no_tag(self, invalidate_tag):
+        """Messages without a tag are ignored."""
+        msg = Message(topic='org.fedoraproject.prod.buildsys.tag', body={})
+
+        candidates.CandidatesHandler()(msg)
+
+        invalidate_tag.assert_not_called()
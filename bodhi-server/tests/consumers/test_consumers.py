@@ -20,6 +20,7 @@ from unittest import mock
 import pytest
 from fedora_messaging.api import Message
 from fedora_messaging.exceptions import Nack
+from prometheus_client import REGISTRY
 
 from bodhi.server import config
 from bodhi.server.consumers import Consumer, HandlerInfo, signed
@@ -118,3 +119,183 @@ class TestConsumer:
         Handler.side_effect = lambda: handler
         Consumer()(msg)
         handler.assert_called_once_with(msg)
+
+    @mock.patch.dict(config.config, {'consumer.dispatch_exchange': 'bodhi.dispatch'})
+    @mock.patch('bodhi.server.consumers.dispatch.fedora_messaging.api.publish')
+    @mock.patch('bodhi.server.consumers.SignedHandler')
+    def test_messaging_callback_dispatch(self, SignedHandler, publish):
+        """With a dispatch exchange, the messages are dispatched rather than handled."""
+        msg = Message(
+            topic="org.fedoraproject.prod.buildsys.tag",
+            body={'name': 'bodhi', 'version': '8.0', 'release': '1.fc40', 'tag': 'f40'}
+        )
+        handler = mock.Mock()
+        SignedHandler.side_effect = lambda: handler
+
+        Consumer()(msg)
+
+        publish.assert_called_once_with(msg, exchange='bodhi.dispatch')
+        assert msg._headers['bodhi_ordering_key'] == 'bodhi-8.0-1.fc40'
+        handler.assert_not_called()
+
+    @mock.patch.dict(config.config, {'consumer.dispatch_exchange': 'bodhi.dispatch'})
+    @mock.patch('bodhi.server.consumers.dispatch.fedora_messaging.api.publish')
+    @mock.patch('bodhi.server.consumers.SignedHandler')
+    def test_messaging_callback_dispatched(self, SignedHandler, publish):
+        """The dispatched messages are handled, and returned to the broker if they fail."""
+        msg = Message(
+            topic="org.fedoraproject.prod.buildsys.tag",
+            body={'name': 'bodhi', 'version': '8.0', 'release': '1.fc40', 'tag': 'f40'},
+            headers={'bodhi_ordering_key': 'bodhi-8.0-1.fc40'}
+        )
+        handler = mock.Mock(side_effect=[Exception('Koji is down'), None])
+        SignedHandler.side_effect = lambda: handler
+        consumer = Consumer()
+        failed = REGISTRY.get_sample_value(
+            'bodhi_consumer_messages_total', {'result': 'failed'}) or 0
+        processed = REGISTRY.get_sample_value(
+            'bodhi_consumer_messages_total', {'result': 'processed'}) or 0
+
+        with pytest.raises(Nack):
+            consumer(msg)
+        consumer(msg)
+
+        publish.assert_not_called()
+        assert handler.mock_calls == [mock.call(msg), mock.call(msg)]
+        assert REGISTRY.get_sample_value(
+            'bodhi_consumer_messages_total', {'result': 'failed'}) == failed + 1
+        assert REGISTRY.get_sample_value(
+            'bodhi_consumer_messages_total', {'result': 'processed'}) == processed + 1
+
+    @mock.patch.dict(config.config, {'consumer.dedupe.ttl': 60})
+    def test_messaging_callback_duplicate(self):
+        """Messages that were already handled are skipped, unless they failed."""
+        msg = Message(
+            topic="org.fedoraproject.prod.buildsys.tag",
+            body={'name': 'bodhi', 'version': '8.0', 'release': '1.fc40', 'tag': 'f40'}
+        )
+        handler = mock.Mock(side_effect=[Exception('Koji is down'), None, None])
+        consumer = Consumer()
+
+        with mock.patch.object(consumer, 'handler_infos',
+                               [HandlerInfo('.buildsys.tag', 'Signed', handler)]):
+            with pytest.raises(Nack):
+                consumer(msg)
+            consumer(msg)
+            consumer(msg)
+
+        assert handler.mock_calls == [mock.call(msg), mock.call(msg)]
+
+    @mock.patch.dict(config.config, {'consumer.dedupe.ttl': 60})
+    @mock.patch('bodhi.server.consumers.log.exception')
+    def test_messaging_callback_dedupe_failure(self, exception):
+        """Failing to remember a message doesn't fail it."""
+        msg = Message(topic="org.fedoraproject.prod.waiverdb.waiver.new", body={})
+        handler = mock.Mock()
+        consumer = Consumer()
+
+        with mock.patch.object(consumer, 'handler_infos',
+                               [HandlerInfo('.waiverdb.waiver.new', 'WaiverDB', handler)]):
+            with mock.patch.object(consumer.dedupe, 'remember',
+                                   side_effect=Exception('DB is down')):
+                consumer(msg)
+
+        handler.assert_called_once_with(msg)
+        exception.assert_called_once_with(f'Unable to remember that message {msg.id} was handled')
+
+    def _tag_message(self, release):
+        msg = Message(
+            topic="org.fedoraproject.prod.buildsys.tag",
+            body={'name': 'bodhi', 'version': '8.0', 'release': release, 'tag': 'f40'}
+        )
+        msg.queue = 'bodhi'
+        return msg
+
+    @mock.patch.dict(config.config, {'signed_handler.batch_window': 5,
+                                     'signed_handler.batch_size': 500})
+    @mock.patch('bodhi.server.consumers.QueuePrefetcher')
+    @mock.patch('bodhi.server.consumers.AutomaticUpdateHandler')
+    @mock.patch('bodhi.server.consumers.SignedHandler')
+    def test_messaging_callback_batch(self, SignedHandler, AutomaticUpdateHandler,
+                                      QueuePrefetcher):
+        """The tag messages are handled in batches, and the pulled ones acked once handled."""
+        msg = self._tag_message('1.fc40')
+        pulled = [(1, self._tag_message('2.fc40')), (2, self._tag_message('3.fc40')),
+                  (3, self._tag_message('4.fc40'))]
+        prefetcher = QueuePrefetcher.return_value
+        prefetcher.pull.return_value = pulled
+        signed_handler = mock.Mock()
+        signed_handler.handle_messages.return_value = {1: Exception('Koji is down')}
+        SignedHandler.side_effect = lambda: signed_handler
+        automatic_update_handler = mock.Mock(side_effect=[None, None, None,
+                                                          Exception('Koji is down')])
+        AutomaticUpdateHandler.side_effect = lambda: automatic_update_handler
+
+        Consumer()(msg)
+
+        prefetcher.pull.assert_called_once_with('bodhi', '.buildsys.tag', 499, 5)
+        signed_handler.handle_messages.assert_called_once_with(
+            [msg] + [m for t, m in pulled])
+        # The signed handler handled the messages as a batch already.
+        signed_handler.assert_not_called()
+        assert automatic_update_handler.mock_calls == (
+            [mock.call(msg)] + [mock.call(m) for t, m in pulled])
+        prefetcher.settle.assert_called_once_with([2], [1, 3])
+
+    @mock.patch.dict(config.config, {'signed_handler.batch_window': 5})
+    @mock.patch('bodhi.server.consumers.QueuePrefetcher')
+    @mock.patch('bodhi.server.consumers.SignedHandler')
+    @mock.patch('bodhi.server.consumers.log.exception')
+    def test_messaging_callback_batch_failed(self, exception, SignedHandler, QueuePrefetcher):
+        """All the messages of a batch that could not be committed are returned to the broker."""
+        msg = self._tag_message('1.fc40')
+        prefetcher = QueuePrefetcher.return_value
+        prefetcher.pull.return_value = [(1, self._tag_message('2.fc40'))]
+        signed_handler = mock.Mock()
+        signed_handler.handle_messages.side_effect = Exception('DB is down')
+        SignedHandler.side_effect = lambda: signed_handler
+
+        with pytest.raises(Nack):
+            Consumer()(msg)
+
+        prefetcher.settle.assert_called_once_with([], [1])
+        exception.assert_any_call('Unable to handle a batch of 2 messages in Signed handler')
+
+    @mock.patch.dict(config.config, {'signed_handler.batch_window': 5,
+                                     'consumer.dedupe.ttl': 60})
+    @mock.patch('bodhi.server.consumers.QueuePrefetcher')
+    @mock.patch('bodhi.server.consumers.SignedHandler')
+    def test_messaging_callback_batch_duplicate(self, SignedHandler, QueuePrefetcher):
+        """The messages of a batch that were already handled are skipped and acknowledged."""
+        msg = self._tag_message('1.fc40')
+        duplicate = self._tag_message('2.fc40')
+        prefetcher = QueuePrefetcher.return_value
+        prefetcher.pull.return_value = [(1, duplicate)]
+        signed_handler = mock.Mock()
+        signed_handler.handle_messages.return_value = {}
+        SignedHandler.side_effect = lambda: signed_handler
+        consumer = Consumer()
+        consumer.dedupe.remember(duplicate)
+
+        consumer(msg)
+
+        signed_handler.handle_messages.assert_called_once_with([msg])
+        prefetcher.settle.assert_called_once_with([1], [])
+        assert consumer.dedupe.is_duplicate(msg)
+
+    @mock.patch.dict(config.config, {'signed_handler.batch_window': 5})
+    @mock.patch('bodhi.server.consumers.QueuePrefetcher')
+    @mock.patch('bodhi.server.consumers.SignedHandler')
+    def test_messaging_callback_batch_other_topic(self, SignedHandler, QueuePrefetcher):
+        """Only the tag messages are handled in batches."""
+        msg = Message(topic="org.fedoraproject.prod.buildsys.untag", body={})
+        msg.queue = 'bodhi'
+        handler = mock.Mock()
+
+        consumer = Consumer()
+        with mock.patch.object(consumer, 'handler_infos',
+                               [HandlerInfo('.buildsys.untag', 'Candidates', handler)]):
+            consumer(msg)
+
+        handler.assert_called_once_with(msg)
+        QueuePrefetcher.return_value.pull.assert_not_called()
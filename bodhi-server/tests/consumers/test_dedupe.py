@@ -0,0 +1,158 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.consumers.dedupe module."""
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from fedora_messaging.api import Message
+from prometheus_client import REGISTRY
+
+from bodhi.server.consumers import dedupe
+from bodhi.server.models import ProcessedMessage
+
+from .. import base
+
+
+def _tag_message(topic='org.fedoraproject.prod.buildsys.tag', tag='f17-updates-testing-pending'):
+    return Message(topic=topic, body={'name': 'bodhi', 'version': '2.0', 'release': '1.fc17',
+                                      'tag': tag})
+
+
+def _duplicates(kind):
+    return REGISTRY.get_sample_value(
+        'bodhi_consumer_duplicate_messages_total', {'key': kind}) or 0
+
+
+class TestMessageKeys:
+    """Test the message_keys() function."""
+
+    def test_buildsys(self):
+        """The buildsys messages are identified by their build and tag."""
+        msg = _tag_message()
+
+        assert dedupe.message_keys(msg) == [
+            ('message_id', f'id:{msg.id}', ''),
+            ('semantic', 'buildsys:bodhi-2.0-1.fc17:f17-updates-testing-pending', 'tag')]
+
+    def test_resultsdb(self):
+        """The ResultsDB messages are identified by their result."""
+        msg = Message(topic='org.fedoraproject.prod.resultsdb.result.new',
+                      body={'id': 1234, 'data': {}})
+
+        assert dedupe.message_keys(msg)[1:] == [('semantic', 'resultsdb:1234', '')]
+
+    def test_waiverdb(self):
+        """The WaiverDB messages are identified by their waiver."""
+        msg = Message(topic='org.fedoraproject.prod.waiverdb.waiver.new',
+                      body={'id': 42, 'subject': {}})
+
+        assert dedupe.message_keys(msg)[1:] == [('semantic', 'waiverdb:42', '')]
+
+    def test_other(self):
+        """The other messages are identified by their id only."""
+        msg = Message(topic='org.fedoraproject.prod.ci.koji-build.test.running', body={})
+
+        assert dedupe.message_keys(msg) == [('message_id', f'id:{msg.id}', '')]
+
+
+class TestDedupeStore(base.BasePyTestCase):
+    """Test the DedupeStore class."""
+
+    def test_message_id(self):
+        """A message delivered again is a duplicate."""
+        store = dedupe.DedupeStore(ttl=60, max_size=10)
+        msg = Message(topic='org.fedoraproject.prod.ci.koji-build.test.running', body={})
+        duplicates = _duplicates('message_id')
+
+        assert not store.is_duplicate(msg)
+        store.remember(msg)
+
+        assert store.is_duplicate(msg)
+        assert _duplicates('message_id') == duplicates + 1
+
+    def test_semantic(self):
+        """A message about an event that was handled is a duplicate, unless it was undone."""
+        store = dedupe.DedupeStore(ttl=60, max_size=10)
+        duplicates = _duplicates('semantic')
+        store.remember(_tag_message())
+
+        assert store.is_duplicate(_tag_message())
+        assert not store.is_duplicate(_tag_message(tag='f17-updates-testing'))
+        assert _duplicates('semantic') == duplicates + 1
+
+        store.remember(_tag_message(topic='org.fedoraproject.prod.buildsys.untag'))
+
+        assert not store.is_duplicate(_tag_message())
+
+    def test_ttl(self):
+        """The messages are forgotten after the TTL."""
+        store = dedupe.DedupeStore(ttl=60, max_size=10)
+        msg = _tag_message()
+
+        with mock.patch('bodhi.server.consumers.dedupe.time.monotonic', return_value=1000):
+            store.remember(msg)
+        with mock.patch('bodhi.server.consumers.dedupe.time.monotonic', return_value=1059):
+            assert store.is_duplicate(msg)
+        with mock.patch('bodhi.server.consumers.dedupe.time.monotonic', return_value=1060):
+            assert not store.is_duplicate(msg)
+            store.remember(_tag_message(tag='f17-updates'))
+
+        # The expired keys were evicted.
+        assert len(store._keys) == 2
+
+    def test_max_size(self):
+        """The oldest messages are forgotten when too many are remembered."""
+        store = dedupe.DedupeStore(ttl=60, max_size=2)
+        messages = [Message(topic='org.fedoraproject.prod.test', body={}) for i in range(3)]
+
+        for msg in messages:
+            store.remember(msg)
+
+        assert [store.is_duplicate(msg) for msg in messages] == [False, True, True]
+
+    def test_persist(self):
+        """The messages are remembered in the database, to be shared by the consumers."""
+        msg = _tag_message()
+        store = dedupe.DedupeStore(ttl=60, max_size=10, persist=True)
+        store.db_factory = base.TransactionalSessionMaker(self.Session)
+        other_store = dedupe.DedupeStore(ttl=60, max_size=10, persist=True)
+        other_store.db_factory = base.TransactionalSessionMaker(self.Session)
+
+        store.remember(msg)
+        # Remembering it again updates the rows.
+        store.remember(msg)
+
+        assert self.db.query(ProcessedMessage).count() == 2
+        assert other_store.is_duplicate(_tag_message())
+        assert not other_store.is_duplicate(_tag_message(tag='f17-updates'))
+
+    def test_persist_expired(self):
+        """The expired messages are ignored and purged from the database."""
+        self.db.add(ProcessedMessage(
+            key='buildsys:bodhi-2.0-1.fc17:f17-updates-testing-pending', value='tag',
+            date_created=datetime.now(timezone.utc) - timedelta(seconds=120)))
+        self.db.commit()
+        store = dedupe.DedupeStore(ttl=60, max_size=10, persist=True)
+        store.db_factory = base.TransactionalSessionMaker(self.Session)
+
+        assert not store.is_duplicate(_tag_message())
+
+        store.remember(Message(topic='org.fedoraproject.prod.test', body={}))
+
+        assert self.db.query(ProcessedMessage).filter(
+            ProcessedMessage.key.like('buildsys:%')).count() == 0
@@ -0,0 +1,115 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.consumers.dispatch module."""
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from fedora_messaging.api import Message
+from fedora_messaging.exceptions import Nack, PublishTimeout
+from prometheus_client import REGISTRY
+import pytest
+
+from bodhi.server.consumers import dispatch
+
+
+def _sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+class TestOrderingKey:
+    """Test the ordering_key() function."""
+
+    @pytest.mark.parametrize('body,key', (
+        ({'name': 'bodhi', 'version': '8.0', 'release': '1.fc40', 'tag': 'f40'},
+         'bodhi-8.0-1.fc40'),
+        ({'artifact': {'nvr': 'bodhi-8.0-1.fc40'}, 'pipeline': {}, 'run': {}},
+         'bodhi-8.0-1.fc40'),
+        ({'subject': {'type': 'koji_build', 'item': 'bodhi-8.0-1.fc40'}}, 'bodhi-8.0-1.fc40'),
+        ({'subject': {'type': 'bodhi_update', 'item': 'FEDORA-2024-abcdef'}},
+         'FEDORA-2024-abcdef'),
+        ({'data': {'type': ['koji_build'], 'nvr': ['bodhi-8.0-1.fc40'],
+                   'item': ['bodhi-8.0-1.fc40']}},
+         'bodhi-8.0-1.fc40'),
+        ({'data': {'type': ['bodhi_update'], 'item': ['FEDORA-2024-abcdef']}},
+         'FEDORA-2024-abcdef'),
+    ))
+    def test_key(self, body, key):
+        """The key is the build or the update the message is about."""
+        assert dispatch.ordering_key(Message(topic='org.fedoraproject.prod.test', body=body)) == key
+
+    @pytest.mark.parametrize('body', ({}, {'data': {'item': []}}, {'subject': None}))
+    def test_unrelated(self, body):
+        """Messages about neither a build nor an update use their id as key."""
+        msg = Message(topic='org.fedoraproject.prod.test', body=body)
+
+        assert dispatch.ordering_key(msg) == msg.id
+
+
+class TestDispatch:
+    """Test the dispatch() function."""
+
+    def _message(self):
+        return Message(topic='org.fedoraproject.prod.buildsys.tag',
+                       body={'name': 'bodhi', 'version': '8.0', 'release': '1.fc40'})
+
+    @mock.patch('bodhi.server.consumers.dispatch.fedora_messaging.api.publish')
+    def test_dispatch(self, publish):
+        """The message is republished to the exchange with its ordering key."""
+        msg = self._message()
+        dispatched = _sample('bodhi_consumer_messages_total', {'result': 'dispatched'})
+
+        dispatch.dispatch(msg, 'bodhi.dispatch')
+
+        publish.assert_called_once_with(msg, exchange='bodhi.dispatch')
+        assert msg._headers['bodhi_ordering_key'] == 'bodhi-8.0-1.fc40'
+        assert dispatch.is_dispatched(msg)
+        assert _sample('bodhi_consumer_messages_total', {'result': 'dispatched'}) == dispatched + 1
+
+    @mock.patch('bodhi.server.consumers.dispatch.fedora_messaging.api.publish',
+                side_effect=PublishTimeout('The broker is down'))
+    def test_dispatch_failed(self, publish):
+        """The message is returned to the broker if it could not be republished."""
+        msg = self._message()
+
+        with pytest.raises(Nack):
+            dispatch.dispatch(msg, 'bodhi.dispatch')
+
+        assert not dispatch.is_dispatched(msg)
+
+    def test_lag(self):
+        """The time between a message being sent and it being handled is observed."""
+        msg = self._message()
+        msg._headers['sent-at'] = (
+            datetime.now(timezone.utc) - timedelta(seconds=120)).isoformat()
+        count = _sample('bodhi_consumer_lag_seconds_count')
+        total = _sample('bodhi_consumer_lag_seconds_sum')
+
+        dispatch.observe_lag(msg)
+
+        assert _sample('bodhi_consumer_lag_seconds_count') == count + 1
+        assert 120 <= _sample('bodhi_consumer_lag_seconds_sum') - total < 180
+
+    def test_lag_invalid(self):
+        """Messages without a valid sent-at header are not observed."""
+        msg = self._message()
+        msg._headers['sent-at'] = 'yesterday'
+        count = _sample('bodhi_consumer_lag_seconds_count')
+
+        dispatch.observe_lag(msg)
+
+        assert _sample('bodhi_consumer_lag_seconds_count') == count
@@ -324,3 +324,98 @@ class TestSignedHandlerConsume(base.BasePyTestCase):
         assert update.pushed is False
         assert update.test_gating_status == TestGatingStatus.passed
         add_tag.assert_not_called()
+
+
+class TestSignedHandlerBatch(base.BasePyTestCase):
+    """Test the batching mode of the :class:`SignedHandler`."""
+
+    def _message(self, nvr, tag='f30-side-tag-testing-pending'):
+        name, version, release = nvr.rsplit('-', 2)
+        return api.Message(
+            topic='', body={'build_id': 442562, 'name': name, 'version': version,
+                            'release': release, 'tag': tag, 'tag_id': 214, 'instance': 's390',
+                            'user': 'sharkcz', 'owner': 'sharkcz'})
+
+    def test_handle_batch(self):
+        """The builds are marked as signed, and their update is evaluated once."""
+        handler = signed.SignedHandler()
+        handler.db_factory = base.TransactionalSessionMaker(self.Session)
+        update = self.create_update(['foo-1.0-1.fc17', 'bar-1.0-1.fc17'])
+        update.from_tag = 'f30-side-tag'
+        update.status = UpdateStatus.pending
+        update.release.composed_by_bodhi = False
+        for build in update.builds:
+            build.signed = False
+        update.pushed = False
+        self.db.commit()
+        tag = 'f30-side-tag-testing-pending'
+
+        with mock.patch.object(handler, '_update_signed',
+                               wraps=handler._update_signed) as update_signed:
+            handler.handle_batch([('foo-1.0-1.fc17', tag), ('bar-1.0-1.fc17', tag),
+                                  ('foo-1.0-1.fc17', tag), ('unknown-1.0-1.fc17', tag),
+                                  ('bodhi-2.0-1.fc17', 'f17-updates-candidate')])
+
+        update_signed.assert_called_once_with(mock.ANY, update)
+        assert all(build.signed for build in update.builds)
+        assert update.status == UpdateStatus.testing
+        assert update.pushed is True
+
+    def test_handle_batch_nothing_to_mark(self):
+        """Updates are not evaluated when no build was marked as signed."""
+        handler = signed.SignedHandler()
+        handler.db_factory = base.TransactionalSessionMaker(self.Session)
+
+        with mock.patch.object(handler, '_update_signed') as update_signed:
+            handler.handle_batch([('unknown-1.0-1.fc17', 'f17-updates-testing-pending')])
+
+        update_signed.assert_not_called()
+
+    def test_handle_batch_update_error(self):
+        """A failure only fails the builds of its update, which are left unsigned."""
+        handler = signed.SignedHandler()
+        handler.db_factory = base.TransactionalSessionMaker(self.Session)
+        updates = [self.create_update(['foo-1.0-1.fc17']), self.create_update(['bar-1.0-1.fc17'])]
+        for update in updates:
+            update.from_tag = 'f30-side-tag'
+            update.status = UpdateStatus.pending
+            update.release.composed_by_bodhi = False
+            update.builds[0].signed = False
+            update.pushed = False
+        self.db.commit()
+        tag = 'f30-side-tag-testing-pending'
+        update_signed = handler._update_signed
+
+        def fail_foo(dbsession, update):
+            if update.builds[0].nvr == 'foo-1.0-1.fc17':
+                raise Exception('Greenwave is down')
+            update_signed(dbsession, update)
+
+        with mock.patch.object(handler, '_update_signed', side_effect=fail_foo):
+            errors = handler.handle_batch([('foo-1.0-1.fc17', tag), ('bar-1.0-1.fc17', tag),
+                                           ('foo-1.0-1.fc17', tag)])
+
+        assert sorted(errors) == [0, 2]
+        assert str(errors[0]) == 'Greenwave is down'
+        self.db.expire_all()
+        assert updates[0].builds[0].signed is False
+        assert updates[0].status == UpdateStatus.pending
+        assert updates[1].builds[0].signed is True
+        assert updates[1].status == UpdateStatus.testing
+
+    def test_handle_messages(self):
+        """The builds of the messages are handled as a batch, except for the invalid ones."""
+        handler = signed.SignedHandler()
+        messages = [self._message('foo-1.0-1.fc17'), api.Message(topic='', body={'name': 'foo'}),
+                    self._message('bar-1.0-1.fc17')]
+
+        with mock.patch.object(handler, 'handle_batch',
+                               return_value={1: Exception('Greenwave is down')}) as handle_batch:
+            errors = handler.handle_messages(messages)
+
+        handle_batch.assert_called_once_with([
+            ('foo-1.0-1.fc17', 'f30-side-tag-testing-pending'),
+            ('bar-1.0-1.fc17', 'f30-side-tag-testing-pending')])
+        assert sorted(errors) == [1, 2]
+        assert isinstance(errors[1], KeyError)
+        assert str(errors[2]) == 'Greenwave is down'
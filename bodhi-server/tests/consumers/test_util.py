@@ -0,0 +1,142 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.consumers.util module."""
+import json
+from unittest import mock
+
+import pika
+
+from bodhi.server.consumers.util import QueuePrefetcher
+
+
+def _delivery(delivery_tag, topic, body=None):
+    """Return what basic_get() returns for a message."""
+    method = mock.Mock(delivery_tag=delivery_tag, routing_key=topic)
+    properties = pika.BasicProperties(
+        content_encoding='utf-8', message_id=f'message-{delivery_tag}',
+        headers={'fedora_messaging_schema': 'base.message', 'fedora_messaging_severity': 20})
+    if body is None:
+        body = json.dumps({'name': 'bodhi', 'version': '8.0', 'release': f'{delivery_tag}.fc40',
+                           'tag': 'f40'}).encode()
+    return method, properties, body
+
+
+@mock.patch.dict('bodhi.server.consumers.util.messaging_config.conf',
+                 {'amqp_url': 'amqp://localhost/%2F'})
+@mock.patch('bodhi.server.consumers.util.pika.BlockingConnection')
+class TestQueuePrefetcher:
+    """Test the QueuePrefetcher class."""
+
+    def test_pull(self, BlockingConnection):
+        """The messages are pulled until one has another topic, which is returned to the queue."""
+        channel = BlockingConnection.return_value.channel.return_value
+        channel.basic_get.side_effect = [
+            _delivery(1, 'org.fedoraproject.prod.buildsys.tag'),
+            (None, None, None),
+            _delivery(2, 'org.fedoraproject.prod.buildsys.tag', body=b'not json'),
+            _delivery(3, 'org.fedoraproject.prod.buildsys.tag'),
+            _delivery(4, 'org.fedoraproject.prod.buildsys.untag'),
+            _delivery(5, 'org.fedoraproject.prod.buildsys.tag'),
+        ]
+        prefetcher = QueuePrefetcher()
+
+        messages = prefetcher.pull('bodhi', '.buildsys.tag', max_count=10, window=10)
+
+        assert [t for t, m in messages] == [1, 3]
+        assert [m.body['release'] for t, m in messages] == ['1.fc40', '3.fc40']
+        assert all(m.queue == 'bodhi' for t, m in messages)
+        channel.basic_get.assert_called_with('bodhi')
+        assert channel.basic_nack.mock_calls == [mock.call(2, requeue=False),
+                                                 mock.call(4, requeue=True)]
+        channel.basic_ack.assert_not_called()
+
+    def test_pull_max_count(self, BlockingConnection):
+        """No more than max_count messages are pulled."""
+        channel = BlockingConnection.return_value.channel.return_value
+        channel.basic_get.side_effect = [
+            _delivery(i, 'org.fedoraproject.prod.buildsys.tag') for i in range(1, 4)]
+
+        messages = QueuePrefetcher().pull('bodhi', '.buildsys.tag', max_count=2, window=10)
+
+        assert [t for t, m in messages] == [1, 2]
+        assert channel.basic_get.call_count == 2
+
+    def test_pull_window(self, BlockingConnection):
+        """The messages are pulled until the window passed."""
+        channel = BlockingConnection.return_value.channel.return_value
+        channel.basic_get.return_value = (None, None, None)
+
+        assert QueuePrefetcher().pull('bodhi', '.buildsys.tag', max_count=2, window=0.3) == []
+        assert channel.basic_get.call_count >= 2
+
+    def test_pull_error(self, BlockingConnection):
+        """The pulled messages are returned to the queue with the connection if it fails."""
+        connection = BlockingConnection.return_value
+        channel = connection.channel.return_value
+        channel.basic_get.side_effect = [
+            _delivery(1, 'org.fedoraproject.prod.buildsys.tag'),
+            pika.exceptions.ChannelClosed(406, 'PRECONDITION_FAILED')]
+        prefetcher = QueuePrefetcher()
+
+        assert prefetcher.pull('bodhi', '.buildsys.tag', max_count=10, window=10) == []
+
+        connection.close.assert_called_once_with()
+        # It connects again the next time.
+        channel.basic_get.side_effect = None
+        channel.basic_get.return_value = _delivery(2, 'org.fedoraproject.prod.buildsys.tag')
+        assert len(prefetcher.pull('bodhi', '.buildsys.tag', max_count=1, window=10)) == 1
+        assert BlockingConnection.call_count == 2
+
+    def test_settle(self, BlockingConnection):
+        """The handled messages are acknowledged, and the failed ones returned to the queue."""
+        channel = BlockingConnection.return_value.channel.return_value
+        channel.basic_get.side_effect = [
+            _delivery(i, 'org.fedoraproject.prod.buildsys.tag') for i in range(1, 4)]
+        prefetcher = QueuePrefetcher()
+        prefetcher.pull('bodhi', '.buildsys.tag', max_count=3, window=10)
+
+        prefetcher.settle([1, 3], [2])
+
+        assert channel.basic_ack.mock_calls == [mock.call(1), mock.call(3)]
+        channel.basic_nack.assert_called_once_with(2, requeue=True)
+
+    def test_settle_error(self, BlockingConnection):
+        """The messages that could not be settled are delivered again with the connection."""
+        connection = BlockingConnection.return_value
+        channel = connection.channel.return_value
+        channel.basic_get.side_effect = [_delivery(1, 'org.fedoraproject.prod.buildsys.tag')]
+        channel.basic_ack.side_effect = pika.exceptions.StreamLostError('Connection lost')
+        prefetcher = QueuePrefetcher()
+        prefetcher.pull('bodhi', '.buildsys.tag', max_count=1, window=10)
+
+        prefetcher.settle([1], [])
+
+        connection.close.assert_called_once_with()
+        assert prefetcher._channel is None
+
+    @mock.patch.dict('bodhi.server.consumers.util.messaging_config.conf',
+                     {'amqp_url': 'amqps://rabbitmq.example.com/%2F',
+                      'tls': {'ca_cert': None, 'certfile': None, 'keyfile': None}})
+    def test_tls(self, BlockingConnection):
+        """The connection uses TLS like fedora-messaging for amqps URLs."""
+        QueuePrefetcher().pull('bodhi', '.buildsys.tag', max_count=0, window=10)
+
+        parameters = BlockingConnection.call_args[0][0]
+        assert parameters.host == 'rabbitmq.example.com'
+        assert parameters.ssl_options.server_hostname == 'rabbitmq.example.com'
+        assert isinstance(parameters.credentials, pika.credentials.PlainCredentials)
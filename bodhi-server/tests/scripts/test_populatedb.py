@@ -0,0 +1,129 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""Contains tests for the bodhi.server.scripts.populatedb module."""
+from unittest import mock
+
+from click import testing
+
+from bodhi.server import models
+from bodhi.server.scripts import populatedb
+
+from ..base import BasePyTestCase
+
+
+SIZES = dict(releases=3, first_release=30, users=20, packages=50, builds=400, updates=150,
+             comments=3, bugs=1, overrides=20)
+
+
+class TestDatasetGenerator(BasePyTestCase):
+    """Test the DatasetGenerator class."""
+
+    def _generate(self, seed=0):
+        """Generate a small dataset, and return a summary of it."""
+        counts = populatedb.DatasetGenerator(self.db, seed=seed, batch_size=100).generate(**SIZES)
+        self.db.flush()
+        updates = self.db.query(models.Update).join(models.Release).filter(
+            models.Release.name.in_(['F30', 'F31', 'F32'])).order_by(models.Update.id)
+        return counts, [(u.alias, u.status, [b.nvr for b in u.builds], len(u.comments))
+                        for u in updates]
+
+    def test_generate(self):
+        """The dataset has the requested sizes, and consistent rows."""
+        counts, updates = self._generate()
+
+        assert counts['users'] == 20
+        assert counts['releases'] == 3
+        assert counts['packages'] == 50
+        assert counts['builds'] == 400
+        assert counts['updates'] == 150
+        assert len(updates) == 150
+        assert all(builds for alias, status, builds, comments in updates)
+        assert counts['comments'] == sum(u[3] for u in updates)
+        assert self.db.query(models.Build).filter(
+            models.Build.nvr.like('package%-1.0-1.fc30')).count() > 0
+        release = models.Release.get('F32')
+        assert release.state == models.ReleaseState.pending
+        assert models.Release.get('F30').state == models.ReleaseState.archived
+        # The builds of an update are in its release.
+        assert self.db.query(models.Build).join(models.Update).filter(
+            models.Build.release_id != models.Update.release_id).count() == 0
+        assert self.db.query(models.BuildrootOverride).count() == 20 + 1
+        # The updates with a request are in composes.
+        requests = self.db.query(models.Update.release_id, models.Update.request).filter(
+            models.Update.release_id == release.id, models.Update.request.isnot(None)).distinct()
+        assert self.db.query(models.Compose).filter_by(release_id=release.id).count() \
+            == requests.count()
+        users = self.db.query(models.User).filter(models.User.email.like('%@example.com'))
+        assert all('packager' in [g.name for g in u.groups] for u in users)
+
+    def test_seed(self):
+        """The same seed generates the same dataset, and another one a different dataset."""
+        first = self._generate()
+        self.db.rollback()
+
+        assert self._generate() == first
+
+        self.db.rollback()
+
+        assert self._generate(seed=1) != first
+
+    def test_empty(self):
+        """The dataset can be generated without updates and the rows that depend on them."""
+        counts = populatedb.DatasetGenerator(self.db).generate(
+            releases=1, users=1, packages=1, builds=1, updates=0, overrides=0)
+
+        assert counts['builds'] == 1
+        assert counts['updates'] == 0
+        assert counts['comments'] == 0
+
+
+@mock.patch('bodhi.server.scripts.populatedb.get_appsettings')
+@mock.patch('bodhi.server.scripts.populatedb.initialize_db')
+@mock.patch('bodhi.server.scripts.populatedb.setup_logging', mock.Mock())
+class TestMain(BasePyTestCase):
+    """Test the main() function."""
+
+    def test_main(self, initialize_db, get_appsettings):
+        """The dataset is generated, and its sizes are printed."""
+        runner = testing.CliRunner()
+
+        r = runner.invoke(populatedb.main, [
+            'development.ini', '--seed', '3', '--releases', '2', '--first-release', '40',
+            '--users', '5', '--packages', '10', '--builds', '30', '--updates', '10',
+            '--overrides', '2'])
+
+        assert r.exit_code == 0, r.output
+        get_appsettings.assert_called_once_with('development.ini')
+        initialize_db.assert_called_once_with(get_appsettings.return_value)
+        assert 'builds: 30\n' in r.output
+        assert 'updates: 10\n' in r.output
+        assert models.Release.get('F41').state == models.ReleaseState.pending
+
+    def test_error(self, initialize_db, get_appsettings):
+        """The changes are rolled back when the dataset can't be generated."""
+        runner = testing.CliRunner()
+
+        with mock.patch.object(populatedb.DatasetGenerator, '_overrides',
+                               side_effect=ValueError('no')):
+            r = runner.invoke(populatedb.main, [
+                'development.ini', '--releases', '1', '--first-release', '40', '--users', '1',
+                '--packages', '1', '--builds', '1', '--updates', '1'])
+
+        assert r.exit_code == 1
+        assert r.output == 'Error: no\n'
+        assert models.Release.get('F40') is None
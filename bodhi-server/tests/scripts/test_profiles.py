@@ -0,0 +1,113 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This module contains tests for the bodhi.server.scripts.profiles module."""
+
+from unittest import mock
+import cProfile
+import os
+import shutil
+import tempfile
+
+from click import testing
+
+from bodhi.server.config import config
+from bodhi.server.scripts import profiles
+
+
+def _work():
+    """Do something to profile."""
+    return sum(range(1000))
+
+
+class TestSummarize:
+    """This class contains tests for the summarize() function."""
+
+    def setup_method(self, method):
+        """Write some profiles in a temporary directory."""
+        self.tempdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tempdir, 'GET_updates_id'))
+        for name in ('a', 'b'):
+            profile = cProfile.Profile()
+            profile.runcall(_work)
+            profile.dump_stats(os.path.join(self.tempdir, 'GET_updates_id', f'{name}.pstats'))
+        os.makedirs(os.path.join(self.tempdir, 'compose_F17_testing'))
+        with open(os.path.join(self.tempdir, 'compose_F17_testing',
+                               'punging-a.collapsed'), 'w') as profile:
+            profile.write('run;work;query 3\nrun;work 1\n')
+        with open(os.path.join(self.tempdir, 'compose_F17_testing',
+                               'punging-b.collapsed'), 'w') as profile:
+            profile.write('run;notify 4\n')
+        with open(os.path.join(self.tempdir, 'README'), 'w') as readme:
+            readme.write('Not a route.')
+
+    def teardown_method(self, method):
+        """Remove the profiles."""
+        shutil.rmtree(self.tempdir)
+
+    def test_summarize(self):
+        """The profiles of each route and compose are added up."""
+        runner = testing.CliRunner()
+
+        r = runner.invoke(profiles.summarize, [self.tempdir])
+
+        assert r.exit_code == 0
+        assert r.output.startswith('==> GET_updates_id: 2 pstats profiles\n')
+        assert '6 function calls in' in r.output
+        assert '_work' in r.output
+        assert '==> compose_F17_testing: 2 collapsed profiles\n8 samples\n' in r.output
+        assert r.output.endswith(
+            '    own   total  function\n'
+            '   0.0%  100.0%  run\n'
+            '  12.5%   50.0%  work\n'
+            '  50.0%   50.0%  notify\n'
+            '  37.5%   37.5%  query\n\n')
+
+    def test_sort_tottime(self):
+        """The functions can be sorted by the samples they are at the top of."""
+        runner = testing.CliRunner()
+
+        r = runner.invoke(profiles.summarize,
+                          [self.tempdir, '--sort', 'tottime', '--limit', '2', '--match', 'compose'])
+
+        assert r.exit_code == 0
+        assert r.output == (
+            '==> compose_F17_testing: 2 collapsed profiles\n'
+            '8 samples\n'
+            '    own   total  function\n'
+            '  50.0%   50.0%  notify\n'
+            '  37.5%   37.5%  query\n\n')
+
+    def test_default_directory(self):
+        """The profiles are read from profiling.directory by default."""
+        runner = testing.CliRunner()
+
+        with mock.patch.dict(config, {'profiling.directory': self.tempdir}):
+            r = runner.invoke(profiles.summarize, ['--match', 'GET'])
+
+        assert r.exit_code == 0
+        assert r.output.startswith('==> GET_updates_id: 2 pstats profiles\n')
+        assert 'compose' not in r.output
+
+    def test_no_directory(self):
+        """An error is shown when no directory is given and profiling.directory is not set."""
+        runner = testing.CliRunner()
+
+        r = runner.invoke(profiles.summarize, [])
+
+        assert r.exit_code == 1
+        assert r.output == 'profiling.directory is not set.\n'
@@ -16,10 +16,13 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """This module contains tests for bodhi.server.services.composes."""
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
 from pyramid import testing
 
 from bodhi.server import models
+from bodhi.server.config import config
 from bodhi.server.services import composes
 
 from .. import base
@@ -67,7 +70,10 @@ class TestComposeCollectionGet(base.BasePyTestCase):
 
         response = self.app.get('/composes/', status=200, headers={'Accept': '*/*'})
 
-        assert response.json == {'composes': [compose.__json__()]}
+        assert response.json == {
+            'composes': [compose.__json__()],
+            'queue': [{'release': compose.release.name, 'request': compose.request.value,
+                       'estimated_start': mock.ANY, 'estimated_end': mock.ANY}]}
 
     def test_no_composes_html(self):
         """Assert correct behavior for html interface when there are no composes."""
@@ -80,7 +86,7 @@ class TestComposeCollectionGet(base.BasePyTestCase):
         """Assert correct behavior for json interface when there are no composes."""
         response = self.app.get('/composes/', status=200, headers={'Accept': 'application/json'})
 
-        assert response.json == {'composes': []}
+        assert response.json == {'composes': [], 'queue': []}
 
     def test_with_compose_html(self):
         """Assert correct behavior for the html interface when there is a compose."""
@@ -105,7 +111,59 @@ class TestComposeCollectionGet(base.BasePyTestCase):
 
         response = self.app.get('/composes/', status=200, headers={'Accept': 'application/json'})
 
-        assert response.json == {'composes': [compose.__json__()]}
+        assert response.json == {
+            'composes': [compose.__json__()],
+            'queue': [{'release': compose.release.name, 'request': compose.request.value,
+                       'estimated_start': mock.ANY, 'estimated_end': mock.ANY}]}
+
+    @mock.patch('bodhi.server.services.composes.datetime')
+    def test_queue(self, mock_datetime):
+        """The queue estimates when the composes start and end, the way they are scheduled."""
+        now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+        mock_datetime.now.return_value = now
+        release = models.Release.query.filter_by(name='F17').one()
+        other_release = self.create_release('18')
+        self.db.add(models.Compose(
+            release=release, request=models.UpdateRequest.testing,
+            state=models.ComposeState.punging, date_started=now - timedelta(seconds=600),
+            estimated_duration=1800))
+        self.db.add(models.Compose(
+            release=release, request=models.UpdateRequest.stable, estimated_duration=600))
+        self.db.add(models.Compose(
+            release=other_release, request=models.UpdateRequest.testing,
+            estimated_duration=300))
+        self.db.add(models.Compose(
+            release=other_release, request=models.UpdateRequest.stable,
+            state=models.ComposeState.failed))
+        self.db.flush()
+
+        response = self.app.get('/composes/', status=200, headers={'Accept': 'application/json'})
+
+        # The stable compose of F17 has the highest priority, but it is one of the two longest
+        # composes so the testing compose of F18 goes first. Once it is done, the two composes that
+        # are left can run together.
+        assert response.json['queue'] == [
+            {'release': 'F17', 'request': 'testing', 'estimated_start': None,
+             'estimated_end': '2024-05-01 12:20:00'},
+            {'release': 'F18', 'request': 'testing', 'estimated_start': '2024-05-01 12:00:00',
+             'estimated_end': '2024-05-01 12:05:00'},
+            {'release': 'F17', 'request': 'stable', 'estimated_start': '2024-05-01 12:05:00',
+             'estimated_end': '2024-05-01 12:15:00'},
+        ]
+
+    def test_queue_no_composes_run(self):
+        """The queue is shown without estimates when no compose can run."""
+        update = models.Update.query.first()
+        self.db.add(models.Compose(release=update.release, request=update.request))
+        self.db.flush()
+
+        with mock.patch.dict(config, {'max_concurrent_composes': 0}):
+            response = self.app.get('/composes/', status=200,
+                                    headers={'Accept': 'application/json'})
+
+        assert response.json['queue'] == [
+            {'release': update.release.name, 'request': update.request.value,
+             'estimated_start': None, 'estimated_end': None}]
 
 
 class TestComposeGet(base.BasePyTestCase):
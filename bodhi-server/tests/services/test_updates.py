@@ -59,7 +59,7 @@ from bodhi.server.models import (
 from bodhi.server.util import call_api
 
 from ..base import BasePyTestCase
-from ..utils import assert_multiline_equal
+from ..utils import assert_max_queries, assert_multiline_equal
 
 
 YEAR = time.localtime().tm_year
@@ -171,7 +171,8 @@ class TestNewUpdate(BasePyTestCase):
         self.db.add(user)
         self.db.commit()
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='bodhi', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='bodhi', session=self.db,
+                               testing_groups=[], **self.app_settings))
         update_json = self.get_update('bodhi-2.1-1.fc17')
         update_json['csrf_token'] = self.get_csrf_token(app)
 
@@ -195,7 +196,8 @@ class TestNewUpdate(BasePyTestCase):
         user.groups.append(group)
 
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='bodhi', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='bodhi', session=self.db,
+                               testing_groups=['provenpackager'], **self.app_settings))
         update = self.get_update('bodhi-2.1-1.fc17')
         update['csrf_token'] = app.get('/csrf').json_body['csrf_token']
 
@@ -1300,7 +1302,8 @@ class TestEditUpdateForm(BasePyTestCase):
         Test a logged in User without permissions on the update can't see the form
         """
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='anonymous', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='anonymous', session=self.db,
+                               testing_groups=[], **self.app_settings))
 
         resp = app.get(
             f'/updates/FEDORA-{datetime.now(timezone.utc).year}-a3bbe1a8f2/edit', status=400,
@@ -1603,7 +1606,8 @@ class TestUpdatesService(BasePyTestCase):
         user2.groups.append(group2)
 
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='ralph', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='ralph', session=self.db,
+                               testing_groups=['packager'], **self.app_settings))
         up_data = self.get_update(nvr)
         up_data['csrf_token'] = app.get('/csrf').json_body['csrf_token']
 
@@ -1613,7 +1617,8 @@ class TestUpdatesService(BasePyTestCase):
 
         assert 'does not have commit access to bodhi' not in res
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='lloyd', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='lloyd', session=self.db,
+                               testing_groups=['provenpackager'], **self.app_settings))
         update = self.get_update(nvr)
         update['csrf_token'] = app.get('/csrf').json_body['csrf_token']
         update['notes'] = 'testing!!!'
@@ -1642,7 +1647,8 @@ class TestUpdatesService(BasePyTestCase):
         user2.groups.append(group2)
 
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='ralph', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='ralph', session=self.db,
+                               testing_groups=['packager'], **self.app_settings))
         up_data = self.get_update(nvr)
         up_data['csrf_token'] = app.get('/csrf').json_body['csrf_token']
 
@@ -1657,7 +1663,8 @@ class TestUpdatesService(BasePyTestCase):
 
         # Try and submit the update to stable as a non-provenpackager
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='ralph', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='ralph', session=self.db,
+                               testing_groups=['packager'], **self.app_settings))
         post_data = dict(update=nvr, request='stable',
                          csrf_token=app.get('/csrf').json_body['csrf_token'])
         res = app.post_json(f"/updates/{res.json['alias']}/request", post_data, status=400)
@@ -1708,7 +1715,8 @@ class TestUpdatesService(BasePyTestCase):
 
         # Try and submit the update to stable as a proventester
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='bob', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='bob', session=self.db,
+                               testing_groups=['provenpackager'], **self.app_settings))
 
         with fml_testing.mock_sends(update_schemas.UpdateRequestStableV1):
             res = app.post_json(f'/updates/{update.alias}/request',
@@ -1719,7 +1727,8 @@ class TestUpdatesService(BasePyTestCase):
         assert res.json_body['update']['request'] == 'stable'
 
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='bob', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='bob', session=self.db,
+                               testing_groups=['provenpackager'], **self.app_settings))
 
         with fml_testing.mock_sends(update_schemas.UpdateRequestObsoleteV1):
             res = app.post_json(f'/updates/{update.alias}/request',
@@ -1736,14 +1745,16 @@ class TestUpdatesService(BasePyTestCase):
 
         # Test that bob has can_edit True, provenpackager
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='bob', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='bob', session=self.db,
+                               testing_groups=['provenpackager'], **self.app_settings))
 
         res = app.get(f'/updates/{update.alias}', status=200)
         assert res.json_body['can_edit'] is True
 
         # Test that ralph has can_edit True, they submitted it.
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='ralph', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='ralph', session=self.db,
+                               testing_groups=['packager'], **self.app_settings))
 
         res = app.get(f'/updates/{update.alias}', status=200)
         assert res.json_body['can_edit'] is True
@@ -1751,7 +1762,8 @@ class TestUpdatesService(BasePyTestCase):
         # Test that someuser has can_edit False, they are unrelated
         # This check *failed* with the old acls code.
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='someuser', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='someuser', session=self.db,
+                               testing_groups=[], **self.app_settings))
 
         res = app.get(f'/updates/{update.alias}', status=200)
         assert res.json_body['can_edit'] is False
@@ -1840,6 +1852,15 @@ class TestUpdatesService(BasePyTestCase):
         assert res.json_body['update']['version_hash'] == version_hash
         assert 'application/json' in res.headers['Content-Type']
 
+    @pytest.mark.parametrize('accept, queries', (('application/json', 16), ('text/html', 14)))
+    def test_get_single_update_query_budget(self, accept, queries):
+        """Getting an update doesn't execute more SQL statements than it used to."""
+        alias = Build.query.filter_by(nvr='bodhi-2.0-1.fc17').one().update.alias
+        self.db.expire_all()
+
+        with assert_max_queries(queries):
+            self.app.get(f'/updates/{alias}', headers={'Accept': accept})
+
     def test_get_single_update_jsonp(self):
         update = Build.query.filter_by(nvr='bodhi-2.0-1.fc17').one().update
 
@@ -1930,6 +1951,14 @@ class TestUpdatesService(BasePyTestCase):
         assert up['karma'] == 1
         assert up['url'] == urlparse.urljoin(config['base_address'], f'/updates/{alias}')
 
+    @pytest.mark.parametrize('accept, queries', (('application/json', 15), ('text/html', 6)))
+    def test_list_updates_query_budget(self, accept, queries):
+        """Listing the updates doesn't execute more SQL statements than it used to."""
+        self.db.expire_all()
+
+        with assert_max_queries(queries):
+            self.app.get('/updates/', headers={'Accept': accept})
+
     def test_list_updates_jsonp(self):
         res = self.app.get('/updates/',
                            {'callback': 'callback'},
@@ -5609,7 +5638,8 @@ class TestWaiveTestResults(BasePyTestCase):
 
         # Test that bob as provenpackager can waive tests
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='bob', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='bob', session=self.db,
+                               testing_groups=['provenpackager'], **self.app_settings))
 
         res = app.get(f'/updates/{update.alias}', status=200)
         assert res.json_body['can_edit'] is True
@@ -5617,7 +5647,8 @@ class TestWaiveTestResults(BasePyTestCase):
 
         # Test that alice as CI group member can waive tests but cannot edit update
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='alice', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='alice', session=self.db,
+                               testing_groups=['fedora-ci-users'], **self.app_settings))
 
         res = app.get(f'/updates/{update.alias}', status=200)
         assert res.json_body['can_edit'] is False
@@ -5625,7 +5656,8 @@ class TestWaiveTestResults(BasePyTestCase):
 
         # Test that carlo cannot waive tests and cannot edit update
         with mock.patch('bodhi.server.Session.remove'):
-            app = TestApp(main({}, testing='carlo', session=self.db, **self.app_settings))
+            app = TestApp(main({}, testing='carlo', session=self.db,
+                               testing_groups=['packager'], **self.app_settings))
 
         res = app.get(f'/updates/{update.alias}', status=200)
         assert res.json_body['can_edit'] is False
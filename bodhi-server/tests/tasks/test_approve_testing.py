@@ -22,12 +22,13 @@ from datetime import datetime, timedelta, timezone
 from unittest.mock import call, patch
 
 from fedora_messaging import testing as fml_testing
+from prometheus_client import REGISTRY
 import pytest
 import sqlalchemy.exc
 
 from bodhi.messages.schemas import update as update_schemas
 from bodhi.server.config import config
-from bodhi.server import models
+from bodhi.server import buildsys, models
 from bodhi.server.tasks import approve_testing_task
 from bodhi.server.tasks.approve_testing import main as approve_testing_main
 from ..base import BasePyTestCase
@@ -254,8 +255,9 @@ class TestMain(BaseTaskTestCase):
     @pytest.mark.parametrize(('from_tag', 'update_status'),
                              [('f17-build-side-1234', models.UpdateStatus.pending),
                              (None, models.UpdateStatus.obsolete)])
-    @patch("bodhi.server.buildsys.DevBuildsys.getLatestBuilds", return_value=[{
-        'creation_time': '2007-08-25 19:38:29.422344'}])
+    @patch("bodhi.server.buildsys.DevBuildsys.getLatestBuilds", autospec=True,
+           side_effect=buildsys.multicall_enabled(lambda self, *args, **kwargs: [{
+               'creation_time': '2007-08-25 19:38:29.422344'}]))
     @patch('bodhi.server.models.Update.meets_testing_requirements', True)
     def test_update_conflicting_build_not_pushed(self, build_creation_time,
                                                  from_tag, update_status):
@@ -284,12 +286,91 @@ class TestMain(BaseTaskTestCase):
             "These builds bodhi-2.0-1.fc17 have a more recent build in koji's "\
             f"{self.update.release.stable_tag} tag."
 
+    @patch('bodhi.server.models.Update.add_tag')
+    @patch('bodhi.server.models.Update.remove_tag')
+    @patch('bodhi.server.models.Update.meets_testing_requirements', True)
+    def test_conflicting_builds_checked_in_batch(self, remove_tag, add_tag):
+        """The builds of all the updates that may be pushed are checked against Koji at once."""
+        updates = [self.update]
+        for nvr in ('bodhi2-2.0-1.fc17', 'bodhi3-2.0-1.fc17'):
+            update = self.create_update([nvr])
+            update.status = models.UpdateStatus.testing
+            update.request = None
+            updates.append(update)
+        for update in updates:
+            update.autotime = True
+            update.stable_days = 7
+            update.date_testing = datetime.now(timezone.utc) - timedelta(days=8)
+        self.db.flush()
+
+        with patch.object(models.Build, 'find_not_latest',
+                          wraps=models.Build.find_not_latest) as find_not_latest:
+            with fml_testing.mock_sends(*[update_schemas.UpdateRequirementsMetStableV1] * 3):
+                approve_testing_main()
+
+        find_not_latest.assert_called_once()
+        assert sorted(b.nvr for b in find_not_latest.call_args[0][0]) == [
+            'bodhi-2.0-1.fc17', 'bodhi2-2.0-1.fc17', 'bodhi3-2.0-1.fc17']
+        for update in updates:
+            assert update.status == models.UpdateStatus.stable
+
+    @pytest.mark.parametrize('batch_size', (1, 2))
+    @patch('bodhi.server.models.Update.add_tag')
+    @patch('bodhi.server.models.Update.remove_tag')
+    @patch('bodhi.server.models.Update.meets_testing_requirements', True)
+    def test_conflicting_builds_pushed_in_same_run(self, remove_tag, add_tag, batch_size):
+        """An update is not pushed if this run pushed a newer build of its package to stable."""
+        older = self.create_update(['bodhi-1.0-1.fc17'])
+        older.status = models.UpdateStatus.testing
+        older.request = None
+        for update in (self.update, older):
+            update.autotime = True
+            update.stable_days = 7
+            update.date_testing = datetime.now(timezone.utc) - timedelta(days=8)
+        # The stable tag only has older builds, but the newer update is pushed first
+        for update, creation_time in ((self.update, '2024-02-01 00:00:00'),
+                                      (older, '2024-01-01 00:00:00')):
+            build = update.builds[0]
+            build._kojiinfo = dict(build._get_kojiinfo(), creation_time=creation_time)
+        self.db.flush()
+
+        with patch.dict(config, {'approve_testing_batch_size': batch_size}):
+            with fml_testing.mock_sends(*[update_schemas.UpdateRequirementsMetStableV1] * 2):
+                approve_testing_main()
+
+        assert self.update.status == models.UpdateStatus.stable
+        assert older.status == models.UpdateStatus.obsolete
+        assert older.comments[-1].text == (
+            "This update cannot be pushed to stable. These builds bodhi-1.0-1.fc17 have a more "
+            f"recent build in koji's {older.release.stable_tag} tag.")
+
+    @patch('bodhi.server.models.Update.add_tag')
+    @patch('bodhi.server.models.Update.remove_tag')
+    @patch('bodhi.server.tasks.approve_testing.log')
+    @patch('bodhi.server.models.Update.meets_testing_requirements', True)
+    def test_conflicting_builds_batch_failure(self, log, remove_tag, add_tag):
+        """If the batched check fails, each update is checked on its own."""
+        self.update.autotime = True
+        self.update.stable_days = 7
+        self.update.date_testing = datetime.now(timezone.utc) - timedelta(days=8)
+
+        with patch.object(models.Build, 'find_not_latest',
+                          side_effect=[Exception('Koji is down'), set()]) as find_not_latest:
+            with fml_testing.mock_sends(update_schemas.UpdateRequirementsMetStableV1):
+                approve_testing_main()
+
+        log.exception.assert_called_once_with(
+            'Unable to check the builds against the stable tags in a batch')
+        assert find_not_latest.call_count == 2
+        assert find_not_latest.call_args[0][0] == self.update.builds
+        assert self.update.status == models.UpdateStatus.stable
+
     @pytest.mark.parametrize('composed_by_bodhi', (True, False))
     @patch('bodhi.server.models.Update.comment', side_effect=IOError('The DB died lol'))
     @patch('bodhi.server.tasks.approve_testing.log')
     @patch('bodhi.server.models.Update.meets_testing_requirements', True)
     def test_exception_handler(self, log, comment, composed_by_bodhi):
-        """The Exception handler prints the Exception, rolls back and closes the db, and exits."""
+        """The Exception handler prints the Exception and discards the changes of the update."""
         self.update.autotime = False
         self.update.release.composed_by_bodhi = composed_by_bodhi
         self.db.flush()
@@ -297,8 +378,8 @@ class TestMain(BaseTaskTestCase):
         with patch.object(self.db, 'commit'):
             with patch.object(self.db, 'rollback'):
                 approve_testing_main()
-                assert self.db.commit.call_count == 0
-                self.db.rollback.assert_called_once_with()
+                assert self.db.commit.call_count == 1
+                self.db.rollback.assert_not_called()
 
         comment.assert_called_once_with(
             self.db,
@@ -306,17 +387,21 @@ class TestMain(BaseTaskTestCase):
             author='bodhi',
             email_notification=composed_by_bodhi,
         )
-        log.info.assert_called_with(f'{self.update.alias} now meets testing requirements')
-        log.exception.assert_called_with("There was an error approving testing updates.")
+        log.info.assert_any_call(f'{self.update.alias} now meets testing requirements')
+        log.exception.assert_called_once_with(
+            f'There was an error processing {self.update.alias}.')
+        assert log.info.call_args[0][0].startswith(
+            'approve_testing processed 1 updates (0 changed, 1 failed) and skipped 0 in ')
+        assert self.update.date_approved is None
 
     @pytest.mark.parametrize('composed_by_bodhi', (True, False))
-    @patch('bodhi.server.models.Update.comment', side_effect=[None, IOError('The DB died lol')])
+    @patch('bodhi.server.models.Update.comment', side_effect=[IOError('The DB died lol'), None])
     @patch('bodhi.server.tasks.approve_testing.log')
     @patch('bodhi.server.models.Update.meets_testing_requirements', True)
-    def test_exception_handler_on_the_second_update(self, log, comment, composed_by_bodhi):
+    def test_exception_handler_on_the_first_update(self, log, comment, composed_by_bodhi):
         """
-        Ensure, that when the Exception is raised, all previous transactions are commited,
-        the Exception handler prints the Exception, rolls back and closes the db, and exits.
+        Ensure, that when the Exception is raised, the changes of the other updates are committed,
+        and only the changes of the failed update are discarded.
         """
         self.update.autotime = False
         self.update.release.composed_by_bodhi = composed_by_bodhi
@@ -331,7 +416,7 @@ class TestMain(BaseTaskTestCase):
             with patch.object(self.db, 'rollback'):
                 approve_testing_main()
                 assert self.db.commit.call_count == 1
-                self.db.rollback.assert_called_once_with()
+                self.db.rollback.assert_not_called()
 
         comment_expected_call = call(
             self.db,
@@ -342,4 +427,84 @@ class TestMain(BaseTaskTestCase):
         assert comment.call_args_list == [comment_expected_call, comment_expected_call]
         log.info.assert_any_call(f'{self.update.alias} now meets testing requirements')
         log.info.assert_any_call(f'{update2.alias} now meets testing requirements')
-        log.exception.assert_called_with("There was an error approving testing updates.")
+        log.exception.assert_called_once_with(
+            f'There was an error processing {self.update.alias}.')
+        assert self.update.date_approved is None
+        assert update2.date_approved is not None
+
+    @patch.dict(config, {'approve_testing_batch_size': 1})
+    @patch('bodhi.server.models.Update.meets_testing_requirements', True)
+    def test_batches(self):
+        """The updates are processed and committed in batches of the configured size."""
+        self.update.autotime = False
+        update2 = self.create_update(['bodhi2-2.0-1.fc17'])
+        update2.autotime = False
+        update2.request = None
+        update2.status = models.UpdateStatus.testing
+        self.db.flush()
+
+        with fml_testing.mock_sends(*[update_schemas.UpdateRequirementsMetStableV1] * 2):
+            with patch.object(self.db, 'commit', wraps=self.db.commit) as commit:
+                approve_testing_main()
+
+        assert commit.call_count == 2
+        assert self.update.date_approved is not None
+        assert update2.date_approved is not None
+
+    @patch('bodhi.server.tasks.approve_testing.log')
+    @patch('bodhi.server.models.Update.meets_testing_requirements', True)
+    def test_skip_commented_updates(self, log):
+        """Updates already approved and commented on are skipped without being loaded."""
+        self.update.autotime = False
+        with fml_testing.mock_sends(update_schemas.UpdateRequirementsMetStableV1):
+            approve_testing_main()
+        self._assert_commented(1)
+
+        def sample(result):
+            return REGISTRY.get_sample_value(
+                'bodhi_approve_testing_updates_total', {'result': result}) or 0
+
+        before = {result: sample(result) for result in ('processed', 'skipped', 'changed')}
+        with patch('bodhi.server.tasks.approve_testing.process_update') as process_update:
+            with fml_testing.mock_sends():
+                approve_testing_main()
+
+        process_update.assert_not_called()
+        assert sample('processed') == before['processed']
+        assert sample('changed') == before['changed']
+        assert sample('skipped') == before['skipped'] + 1
+        assert log.info.call_args[0][0].startswith(
+            'approve_testing processed 0 updates (0 changed, 0 failed) and skipped 1 in ')
+
+    @patch('bodhi.server.models.Update.add_tag')
+    @patch('bodhi.server.models.Update.remove_tag')
+    @patch('bodhi.server.models.Update.meets_testing_requirements', True)
+    def test_commented_updates_reaching_autotime(self, remove_tag, add_tag):
+        """Updates already approved and commented on are processed once they reach autotime."""
+        self.update.autotime = True
+        self.update.stable_days = 7
+        self.update.date_testing = datetime.now(timezone.utc) - timedelta(days=1)
+        self.db.flush()
+        with fml_testing.mock_sends(update_schemas.UpdateRequirementsMetStableV1):
+            approve_testing_main()
+        self._assert_commented(1)
+        assert self.update.status == models.UpdateStatus.testing
+        assert self.update.request is None
+
+        self.update.date_testing = datetime.now(timezone.utc) - timedelta(days=8)
+        self.db.flush()
+        with fml_testing.mock_sends():
+            approve_testing_main()
+
+        assert self.update.status == models.UpdateStatus.stable
+
+    @patch.dict(config, {'test_gating.required': True})
+    @patch('bodhi.server.tasks.approve_testing.process_update')
+    def test_skip_gating_failed(self, process_update):
+        """Updates that failed gating can't meet the testing requirements and are skipped."""
+        self.update.test_gating_status = models.TestGatingStatus.failed
+        self.db.flush()
+
+        approve_testing_main()
+
+        process_update.assert_not_called()
@@ -23,6 +23,7 @@ from datetime import datetime, timezone
 from unittest.mock import call, patch
 
 from bodhi.server import models
+from bodhi.server.config import config
 from bodhi.server.tasks import check_signed_builds_task
 from bodhi.server.tasks.check_signed_builds import main as check_signed_builds_main
 from ..base import BasePyTestCase
@@ -81,11 +82,12 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
             {'arches': 'i386 x86_64 ppc ppc64', 'id': 10, 'locked': True,
              'name': 'f17-updates-pending', 'perm': None, 'perm_id': None}, ]
 
-        buildsys.get_session.return_value.listTags.return_value = listTags
+        buildsys.get_session.return_value.multiCall.return_value = [[listTags]]
         check_signed_builds_main()
 
         update = models.Update.query.first()
-        buildsys.get_session.assert_called_once()
+        debug.assert_called_once_with('No stuck Updates found')
+        buildsys.get_session.assert_not_called()
         assert update.builds[0].signed is False
 
     @patch('bodhi.server.tasks.check_signed_builds.buildsys')
@@ -99,6 +101,7 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
 
         self.db.commit()
 
+        buildsys.get_session.return_value.multiCall.return_value = [[[]]]
         check_signed_builds_main()
 
         buildsys.get_session.assert_called_once()
@@ -120,7 +123,7 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
             {'arches': 'i386 x86_64 ppc ppc64', 'id': 10, 'locked': True,
              'name': 'f17-updates-testing', 'perm': None, 'perm_id': None}, ]
 
-        buildsys.get_session.return_value.listTags.return_value = listTags
+        buildsys.get_session.return_value.multiCall.return_value = [[listTags]]
         check_signed_builds_main()
 
         buildsys.get_session.assert_called_once()
@@ -148,7 +151,7 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
             {'arches': 'i386 x86_64 ppc ppc64', 'id': 10, 'locked': True,
              'name': 'f17-updates-signing-pending', 'perm': None, 'perm_id': None}, ]
 
-        buildsys.get_session.return_value.listTags.return_value = listTags
+        buildsys.get_session.return_value.multiCall.return_value = [[listTags]]
         check_signed_builds_main()
 
         update = models.Update.query.first()
@@ -180,7 +183,7 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
             {'arches': 'i386 x86_64 ppc ppc64', 'id': 10, 'locked': True,
              'name': 'f17-updates-candidate', 'perm': None, 'perm_id': None}, ]
 
-        buildsys.get_session.return_value.listTags.return_value = listTags
+        buildsys.get_session.return_value.multiCall.return_value = [[listTags]]
         check_signed_builds_main()
 
         update = models.Update.query.first()
@@ -208,7 +211,7 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
             {'arches': 'i386 x86_64 ppc ppc64', 'id': 10, 'locked': True,
              'name': 'f17-updates-testing-pending', 'perm': None, 'perm_id': None}, ]
 
-        buildsys.get_session.return_value.listTags.return_value = listTags
+        buildsys.get_session.return_value.multiCall.return_value = [[listTags]]
         check_signed_builds_main()
 
         update = models.Update.query.first()
@@ -233,3 +236,46 @@ class TestCheckSignedBuilds(BaseTaskTestCase):
         buildsys.get_session.assert_called_once()
         debug.assert_called_once_with(f'Obsoleting empty update {update.alias}')
         assert update.status == models.UpdateStatus.obsolete
+
+    @patch.dict(config, {'check_signed_builds_batch_size': 1})
+    @patch('bodhi.server.tasks.check_signed_builds.buildsys')
+    @patch('bodhi.server.tasks.check_signed_builds.log.debug')
+    def test_check_signed_builds_batches(self, debug, buildsys):
+        """
+        The tags of all the builds are listed with multicalls of the configured size.
+        """
+        update = models.Update.query.first()
+        update.builds[0].signed = False
+        update2 = self.create_update(['bodhi2-2.0-1.fc17'])
+        update2.builds[0].signed = False
+        self.db.commit()
+
+        kc = buildsys.get_session.return_value
+        testing_pending = [{'name': 'f17-updates-testing-pending'}]
+        kc.multiCall.side_effect = [[[testing_pending]], [[testing_pending]]]
+        check_signed_builds_main()
+
+        assert kc.listTags.call_args_list == [
+            call(build='bodhi-2.0-1.fc17'), call(build='bodhi2-2.0-1.fc17')]
+        assert kc.multiCall.call_count == 2
+        assert update.builds[0].signed is True
+        assert update2.builds[0].signed is True
+
+    @patch('bodhi.server.tasks.check_signed_builds.buildsys')
+    @patch('bodhi.server.tasks.check_signed_builds.log')
+    def test_check_signed_builds_koji_error(self, log, buildsys):
+        """
+        Builds whose tags Koji failed to list are left alone.
+        """
+        update = models.Update.query.first()
+        update.builds[0].signed = False
+        self.db.commit()
+
+        error = {'faultCode': 1000, 'faultString': 'No such build'}
+        buildsys.get_session.return_value.multiCall.return_value = [error]
+        check_signed_builds_main()
+
+        log.warning.assert_called_once_with(f'Unable to list the tags of bodhi-2.0-1.fc17: {error}')
+        log.debug.assert_not_called()
+        buildsys.get_session.return_value.tagBuild.assert_not_called()
+        assert update.builds[0].signed is False
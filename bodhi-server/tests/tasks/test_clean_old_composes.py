@@ -24,9 +24,11 @@ import os
 import shutil
 import tempfile
 
+import pytest
+
 from bodhi.server import config
 from bodhi.server.tasks import clean_old_composes_task
-from bodhi.server.tasks.clean_old_composes import main as clean_old_composes_main
+from bodhi.server.tasks.clean_old_composes import _walk, main as clean_old_composes_main
 from ..base import BasePyTestCase
 
 
@@ -112,6 +114,124 @@ class TestMain(BasePyTestCase):
         # Make sure the logged output is correct
         expected_output = set(dirs) - expected_dirs
         expected_output = {os.path.join(self.compose_dir, d) for d in expected_output}
-        expected_output = expected_output | {'Deleting the following directories:'}
+        expected_output = expected_output | {
+            'Deleting the following directories:',
+            'Reclaimed %d bytes and %d inodes from %d old composes in %.2fs'}
         logged = set([c[0][0] for c in log.info.call_args_list])
         assert logged == expected_output
+
+    @patch('bodhi.server.tasks.clean_old_composes.log')
+    def test_main_nothing_to_delete(self, log):
+        """Nothing is deleted nor logged when there are no old composes."""
+        os.makedirs(os.path.join(self.compose_dir, 'f23-updates-161005.0259'))
+
+        with patch.dict(config.config, {'compose_dir': self.compose_dir}):
+            assert clean_old_composes_main(2) == (0, 0)
+
+        assert os.listdir(self.compose_dir) == ['f23-updates-161005.0259']
+        log.info.assert_not_called()
+
+    @patch.dict(config.config, {'clean_old_composes.workers': 2})
+    def test_main_reclaimed(self):
+        """The reclaimed space accounts for hardlinks and symlinks."""
+        kept = os.path.join(self.compose_dir, 'f23-updates-161005.0259')
+        old = os.path.join(self.compose_dir, 'f23-updates-161004.1423')
+        older = os.path.join(self.compose_dir, 'f23-updates-161003.1302')
+        for d in (kept, old, older):
+            os.makedirs(os.path.join(d, 'x86_64', 'Packages'))
+        # A package that is still linked in the kept compose.
+        with open(os.path.join(kept, 'x86_64', 'Packages', 'shared.rpm'), 'wb') as rpm:
+            rpm.write(b'a' * 8192)
+        os.link(os.path.join(kept, 'x86_64', 'Packages', 'shared.rpm'),
+                os.path.join(old, 'x86_64', 'Packages', 'shared.rpm'))
+        # A package that is only linked from the two old composes.
+        with open(os.path.join(old, 'x86_64', 'Packages', 'old.rpm'), 'wb') as rpm:
+            rpm.write(b'b' * 8192)
+        os.link(os.path.join(old, 'x86_64', 'Packages', 'old.rpm'),
+                os.path.join(older, 'x86_64', 'Packages', 'old.rpm'))
+        # A symlink to a directory that must not be followed.
+        os.symlink(os.path.join(kept, 'x86_64'), os.path.join(older, 'latest'))
+        expected_bytes = sum(
+            os.lstat(p).st_blocks * 512
+            for p in (os.path.join(old, 'x86_64', 'Packages', 'old.rpm'),
+                      os.path.join(older, 'latest'),
+                      old, os.path.join(old, 'x86_64'), os.path.join(old, 'x86_64', 'Packages'),
+                      older, os.path.join(older, 'x86_64'),
+                      os.path.join(older, 'x86_64', 'Packages')))
+
+        with patch.dict(config.config, {'compose_dir': self.compose_dir}):
+            reclaimed = clean_old_composes_main(1)
+
+        # One file, one symlink and six directories.
+        assert reclaimed == (expected_bytes, 8)
+        assert os.listdir(self.compose_dir) == ['f23-updates-161005.0259']
+        assert os.listdir(os.path.join(kept, 'x86_64', 'Packages')) == ['shared.rpm']
+        assert os.stat(os.path.join(kept, 'x86_64', 'Packages', 'shared.rpm')).st_nlink == 1
+
+    def test_walk_links_same_shard(self):
+        """All the links to a file are removed by the same worker."""
+        for name in ('a', 'b'):
+            os.makedirs(os.path.join(self.compose_dir, name))
+        for i in range(20):
+            path = os.path.join(self.compose_dir, 'a', str(i))
+            with open(path, 'w'):
+                pass
+            os.link(path, os.path.join(self.compose_dir, 'b', str(i)))
+        directories = []
+        shards = [[], [], []]
+
+        _walk(self.compose_dir, directories, shards, [])
+
+        assert directories[0] == self.compose_dir
+        assert sorted(directories[1:]) == [os.path.join(self.compose_dir, d) for d in 'ab']
+        assert sum(len(shard) for shard in shards) == 40
+        for shard in shards:
+            names = [os.path.basename(p) for p in shard]
+            assert all(names.count(n) == 2 for n in names)
+
+    @patch.dict(config.config, {'clean_old_composes.max_files_per_second': 10})
+    @patch('bodhi.server.tasks.clean_old_composes.time.sleep')
+    def test_main_throttled(self, sleep):
+        """The removal of files is throttled to the configured rate."""
+        for name in ('f23-updates-161005.0259', 'f23-updates-161004.1423'):
+            os.makedirs(os.path.join(self.compose_dir, name))
+        for i in range(5):
+            with open(os.path.join(self.compose_dir, 'f23-updates-161004.1423', str(i)), 'w'):
+                pass
+
+        with patch.dict(config.config, {'compose_dir': self.compose_dir}):
+            clean_old_composes_main(1)
+
+        assert os.listdir(self.compose_dir) == ['f23-updates-161005.0259']
+        # The first file can be removed straight away, the others wait for their turn.
+        assert sleep.call_count == 4
+        assert all(0 < c[0][0] <= 0.4 for c in sleep.call_args_list)
+
+    @patch('bodhi.server.tasks.clean_old_composes.log')
+    def test_main_removal_error(self, log):
+        """The paths that can't be removed are reported once all the others were removed."""
+        for name in ('f23-updates-161005.0259', 'f23-updates-161004.1423',
+                     'f23-updates-161003.1302'):
+            os.makedirs(os.path.join(self.compose_dir, name))
+        for name in ('f23-updates-161004.1423', 'f23-updates-161003.1302'):
+            with open(os.path.join(self.compose_dir, name, 'repomd.xml'), 'w'):
+                pass
+        stuck = os.path.join(self.compose_dir, 'f23-updates-161004.1423', 'repomd.xml')
+        unlink = os.unlink
+
+        def fail_to_unlink(path):
+            if path == stuck:
+                raise PermissionError(13, 'Permission denied', path)
+            unlink(path)
+
+        with patch.dict(config.config, {'compose_dir': self.compose_dir}):
+            with patch('bodhi.server.tasks.clean_old_composes.os.unlink', fail_to_unlink):
+                with pytest.raises(OSError) as exc:
+                    clean_old_composes_main(1)
+
+        # The file and the directory that holds it are left, the other compose is removed.
+        assert sorted(os.listdir(self.compose_dir)) == [
+            'f23-updates-161004.1423', 'f23-updates-161005.0259']
+        assert str(exc.value).startswith('Unable to remove 2 paths of the old composes')
+        assert isinstance(exc.value.__cause__, PermissionError)
+        assert log.warning.call_count == 2
@@ -17,6 +17,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 import hashlib
 from http.client import IncompleteRead
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import mock
 from urllib.error import HTTPError, URLError
 from datetime import datetime, timedelta, timezone
@@ -25,12 +26,14 @@ import json
 import os
 import shutil
 import tempfile
+import threading
 import time
 import urllib.parse as urlparse
 
 from click import testing
 from fedora_messaging import api
 from fedora_messaging.testing import mock_sends
+from prometheus_client import REGISTRY
 import pytest
 
 from bodhi.messages.schemas import base as base_schemas
@@ -38,13 +41,14 @@ from bodhi.messages.schemas import buildroot_override as override_schemas
 from bodhi.messages.schemas import compose as compose_schemas
 from bodhi.messages.schemas import errata as errata_schemas
 from bodhi.messages.schemas import update as update_schemas
-from bodhi.server import buildsys, exceptions, log, push
+from bodhi.server import buildsys, exceptions, log, profiling, push
 from bodhi.server.config import config
 from bodhi.server.exceptions import LockedUpdateException
 from bodhi.server.models import (
     Build,
     BuildrootOverride,
     Compose,
+    ComposeDuration,
     ComposeState,
     ContainerBuild,
     ContentType,
@@ -72,6 +76,7 @@ from bodhi.server.tasks.composer import (
     ModuleComposerThread,
     PungiComposerThread,
     RPMComposerThread,
+    sync_poll_interval,
 )
 
 from .. import base
@@ -81,6 +86,54 @@ mock_exc = mock.Mock()
 mock_exc.side_effect = Exception
 
 
+class RepomdServer(object):
+    """A local HTTP server standing in for the master mirrors, with ETag support."""
+
+    def __init__(self):
+        #: Map the served paths to their content.
+        self.files = {}
+        #: The path, If-None-Match header and response code of each request.
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                content = server.files.get(self.path)
+                etag = content and '"%s"' % hashlib.sha1(content).hexdigest()
+                if content is None:
+                    code = 404
+                elif self.headers.get('If-None-Match') == etag:
+                    code = 304
+                else:
+                    code = 200
+                server.requests.append((self.path, self.headers.get('If-None-Match'), code))
+                self.send_response(code)
+                if code == 200:
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                if code == 200:
+                    self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self._httpd.server_port
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def requests_for(self, path):
+        """Return the If-None-Match header and response code of the requests for a path."""
+        return [r[1:] for r in self.requests if r[0] == path]
+
+
 def _expected_skopeo_args(config, source, dtag, extra_args=[]):
     source_repository, source_version_release = source.split(':')
     # Match how buildsys.py creates a fake digest
@@ -200,11 +253,17 @@ class TestComposer(base.BasePyTestCase):
 
         self.expected_sems = 0
         self.semmock = mock.MagicMock()
-        self.handler.max_composes_sem = self.semmock
+        self.handler.scheduler = self.semmock
+
+        # Old composes are cleaned by their own task, don't queue it for real.
+        self._clean_old_composes_task = mock.patch(
+            'bodhi.server.tasks.composer.clean_old_composes_task')
+        self.clean_old_composes_task = self._clean_old_composes_task.start()
 
     def teardown_method(self, method):
         """Call assert_sems and remove temporary files."""
         super(TestComposer, self).teardown_method(method)
+        self._clean_old_composes_task.stop()
 
         self.assert_sems(self.expected_sems)
 
@@ -351,9 +410,27 @@ That was the actual one''' % compose_dir
             compose = Compose.from_dict(db, composes[0])
             assert composes == \
                 [{'content_type': compose.content_type.value, 'release_id': compose.release.id,
-                  'request': compose.request.value, 'security': compose.security}]
+                  'request': compose.request.value, 'security': compose.security,
+                  'estimated_duration': 3600}]
             assert compose.state == ComposeState.pending
 
+    def test__get_composes_estimated_duration(self):
+        """_get_composes() estimates the duration of the composes from the previous ones."""
+        task = self._make_task()
+        api_version = task.pop("api_version")
+        with self.db_factory() as db:
+            release = Release.query.filter_by(name='F17').one()
+            for duration in (1000, 2000):
+                db.add(ComposeDuration(
+                    release_id=release.id, request=UpdateRequest.testing,
+                    content_type=ContentType.rpm, updates=1, duration=duration))
+
+        composes = self.handler._get_composes(api_version, task)
+
+        assert [c['estimated_duration'] for c in composes] == [1500]
+        with self.db_factory() as db:
+            assert Compose.from_dict(db, composes[0]).estimated_duration == 1500
+
     def test__get_composes_api_3(self):
         """Test _get_composes() with API version 3, which is currently unsupported."""
         task = self._make_task()
@@ -589,7 +666,7 @@ That was the actual one''' % compose_dir
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread._generate_updateinfo')
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread._wait_for_sync')
     @mock.patch('bodhi.server.tasks.composer.time.sleep')
-    @mock.patch('bodhi.server.mail._send_mail')
+    @mock.patch('bodhi.server.mail._send_mails')
     def test_testing_digest(self, mail, *args):
         self.expected_sems = 1
 
@@ -640,11 +717,13 @@ References:
 
 """
 
-        mail.assert_called_with(config.get('bodhi_email'),
-                                config.get('fedora_test_announce_list'),
-                                mock.ANY)
-        assert len(mail.mock_calls) == 2
-        body = mail.mock_calls[1][1][2]
+        # The mails are delivered in batches, some of which are empty.
+        deliveries = [c[1][0] for c in mail.mock_calls if c[1][0]]
+        assert len(deliveries) == 2
+        assert deliveries[1] == [(config.get('bodhi_email'),
+                                  config.get('fedora_test_announce_list'),
+                                  mock.ANY)]
+        body = deliveries[1][0][2]
         assert body.startswith(
             ('From: updates@fedoraproject.org\r\nTo: %s\r\nX-Bodhi: fedoraproject.org\r\nSubject: '
              'Fedora 17 updates-testing report\r\n\r\nThe following builds have been pushed to '
@@ -1277,34 +1356,17 @@ That was the actual one'''
         self.set_stable_request('bodhi-2.0-1.fc17')
         task = self._make_task()
         compose_dir = os.path.join(self.tempdir, 'cool_dir')
+        os.makedirs(compose_dir)
         config["compose_dir"] = compose_dir
 
-        # Set up some directories that look similar to what might be found in production, with
-        # some directories that don't match the pattern of ending in -<timestamp>.
-        dirs = {
-            'dist-5E-epel-161003.0724', 'dist-5E-epel-161011.0458', 'dist-5E-epel-161012.1854',
-            'dist-5E-epel-161013.1711', 'dist-5E-epel-testing-161001.0424',
-            'dist-5E-epel-testing-161003.0856', 'dist-5E-epel-testing-161006.0053',
-            'dist-6E-epel-161002.2331', 'dist-6E-epel-161003.2046',
-            'dist-6E-epel-testing-161001.0528', 'epel7-161003.0724', 'epel7-161003.2046',
-            'epel7-161004.1423', 'epel7-161005.1122', 'epel7-testing-161001.0424',
-            'epel7-testing-161003.0621', 'epel7-testing-161003.2217', 'f23-updates-161002.2331',
-            'f23-updates-161003.1302', 'f23-updates-161004.1423', 'f23-updates-161005.0259',
-            'f23-updates-testing-161001.0424', 'f23-updates-testing-161003.0621',
-            'f23-updates-testing-161003.2217', 'f24-updates-161002.2331',
-            'f24-updates-161003.1302', 'f24-updates-testing-161001.0424',
-            'this_should_get_left_alone', 'f23-updates-should_be_untouched',
-            'f23-updates.repocache', 'f23-updates-testing-blank'}
-        [os.makedirs(os.path.join(compose_dir, d)) for d in dirs]
-        # Now let's make a few files here and there.
-        with open(os.path.join(compose_dir, 'dist-5E-epel-161003.0724', 'oops.txt'), 'w') as oops:
-            oops.write('This compose failed to get cleaned and left this file around, oops!')
-        with open(os.path.join(compose_dir, 'COOL_FILE.txt'), 'w') as cool_file:
-            cool_file.write('This file should be allowed to hang out here because it\'s cool.')
-
         t = RPMComposerThread(self.semmock, task['composes'][0],
                               'ralph', self.db_factory, compose_dir)
         t.keep_old_composes = 2
+        labels = {'release': 'F17', 'request': 'stable', 'content_type': 'rpm'}
+        phase_counts = {
+            phase: REGISTRY.get_sample_value(
+                'bodhi_compose_phase_duration_seconds_count', dict(labels, phase=phase)) or 0
+            for phase in ('initializing', 'punging', 'notifying')}
         expected_messages = (
             update_schemas.UpdateCommentV1,
             compose_schemas.ComposeComposingV1,
@@ -1327,32 +1389,23 @@ That was the actual one'''
                 with mock_sends(*expected_messages):
                     t.run()
 
-        actual_dirs = set([
-            d for d in os.listdir(compose_dir)
-            if os.path.isdir(os.path.join(compose_dir, d))
-            and not d.startswith("Fedora-17-updates")])
-
+        # The old composes are cleaned in the background after the compose succeeded.
+        assert t.success
+        # The duration of the compose is recorded to estimate the next ones.
+        with self.db_factory() as session:
+            duration = session.query(ComposeDuration).one()
+            assert duration.request == UpdateRequest.stable
+            assert duration.content_type == ContentType.rpm
+            assert duration.updates == 1
+        # The time spent in each state is observed once the next one starts.
+        for phase, count in phase_counts.items():
+            assert REGISTRY.get_sample_value(
+                'bodhi_compose_phase_duration_seconds_count',
+                dict(labels, phase=phase)) == count + 1
         if clean_old:
-            # We expect these and only these directories to remain.
-            expected_dirs = {
-                'dist-5E-epel-161012.1854', 'dist-5E-epel-161013.1711',
-                'dist-5E-epel-testing-161003.0856', 'dist-5E-epel-testing-161006.0053',
-                'dist-6E-epel-161002.2331', 'dist-6E-epel-161003.2046',
-                'dist-6E-epel-testing-161001.0528', 'epel7-161004.1423', 'epel7-161005.1122',
-                'epel7-testing-161003.0621', 'epel7-testing-161003.2217', 'f23-updates-161004.1423',
-                'f23-updates-161005.0259', 'f23-updates-testing-161003.0621',
-                'f23-updates-testing-161003.2217', 'f24-updates-161002.2331',
-                'f24-updates-161003.1302', 'f24-updates-testing-161001.0424',
-                'this_should_get_left_alone', 'f23-updates-should_be_untouched',
-                'f23-updates.repocache', 'f23-updates-testing-blank'}
+            self.clean_old_composes_task.delay.assert_called_once_with(num_to_keep=2)
         else:
-            # No dirs should have been removed since we had clean_old_composes set False.
-            expected_dirs = dirs
-        assert actual_dirs == expected_dirs
-        # The cool file should still be here
-        actual_files = [f for f in os.listdir(compose_dir)
-                        if os.path.isfile(os.path.join(compose_dir, f))]
-        assert actual_files == ['COOL_FILE.txt']
+            self.clean_old_composes_task.delay.assert_not_called()
 
         assert Popen.mock_calls == \
             [mock.call(
@@ -1640,7 +1693,7 @@ testmodule:master:20172:2
                 {'repo': 'f17-updates', 'updates': [u.builds[0].nvr], 'agent': 'ralph',
                  'ctype': 'rpm'}),
             override_schemas.BuildrootOverrideUntagV1.from_dict(dict(
-                override=u.builds[0].override.__json__())),
+                override=u.builds[0].override)),
             update_schemas.UpdateCompleteStableV1,
             errata_schemas.ErrataPublishV1,
             compose_schemas.ComposeCompleteV1.from_dict(dict(
@@ -1661,7 +1714,8 @@ testmodule:master:20172:2
                     # t.run() modified some of the objects we used to construct the expected
                     # messages above, so we need to inject the altered data into them so the
                     # assertions are correct.
-                    expected_messages[2].body['override'] = u.builds[0].override.__json__()
+                    expected_messages[2].body['override'] = type(expected_messages[2]).from_dict(
+                        {'override': u.builds[0].override}).body['override']
 
         u = Build.query.filter_by(nvr='bodhi-2.0-1.fc17').one().update
         assert u.comments[-1].text == 'This update has been pushed to stable.'
@@ -1884,6 +1938,8 @@ testmodule:master:20172:2
             up = session.query(Update).one()
             assert up.status == UpdateStatus.testing
             assert up.request is None
+            # Resumed composes don't tell how long a compose takes.
+            assert session.query(ComposeDuration).count() == 0
 
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread._sanity_check_repo')
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread._stage_repo')
@@ -2126,8 +2182,8 @@ testmodule:master:20172:2
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread._generate_updateinfo')
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread._wait_for_sync')
     @mock.patch('bodhi.server.tasks.composer.log.exception')
-    @mock.patch('bodhi.server.models.BuildrootOverride.expire', side_effect=Exception())
-    def test_expire_buildroot_overrides_exception(self, expire, exception_log, *args):
+    @mock.patch('bodhi.server.models.BuildrootOverride.expire_all', side_effect=Exception())
+    def test_expire_buildroot_overrides_exception(self, expire_all, exception_log, *args):
         self.expected_sems = 1
 
         with self.db_factory() as db:
@@ -2414,8 +2470,8 @@ class TestFlatpakComposerThread__compose_updates(ComposerThreadBaseTestCase):
         assert Popen.mock_calls == expected_mock_calls
 
 
-class TestPungiComposerThread__get_master_repomd_url(ComposerThreadBaseTestCase):
-    """This class contains tests for the PungiComposerThread._get_master_repomd_url() method."""
+class TestPungiComposerThread__get_master_repomd_urls(ComposerThreadBaseTestCase):
+    """This class contains tests for the PungiComposerThread._get_master_repomd_urls() method."""
     def test_alternative_arch(self):
         """
         Assert that the *_alt_master_repomd settings are used when the release does define primary
@@ -2433,10 +2489,11 @@ class TestPungiComposerThread__get_master_repomd_url(ComposerThreadBaseTestCase)
                                 'bowlofeggs', self.Session, self.tempdir)
         t.compose = Compose.from_dict(self.db, task['composes'][0])
 
-        url = t._get_master_repomd_url('aarch64')
+        urls = t._get_master_repomd_urls('aarch64')
 
-        assert url == \
-            'http://example.com/pub/fedora-secondary/updates/testing/17/aarch64/repodata.repomd.xml'
+        assert urls == [
+            'http://example.com/pub/fedora-secondary/updates/testing/17/aarch64/'
+            'repodata.repomd.xml']
 
         self.assert_sems(0)
 
@@ -2457,7 +2514,7 @@ class TestPungiComposerThread__get_master_repomd_url(ComposerThreadBaseTestCase)
         t.compose = Compose.from_dict(self.db, task['composes'][0])
 
         with pytest.raises(ValueError) as exc:
-            t._get_master_repomd_url('aarch64')
+            t._get_master_repomd_urls('aarch64')
 
         assert (
             'Could not find any of fedora_17_testing_alt_master_repomd,'
@@ -2485,10 +2542,10 @@ class TestPungiComposerThread__get_master_repomd_url(ComposerThreadBaseTestCase)
                                 'bowlofeggs', self.Session, self.tempdir)
         t.compose = Compose.from_dict(self.db, task['composes'][0])
 
-        url = t._get_master_repomd_url('x86_64')
+        urls = t._get_master_repomd_urls('x86_64')
 
-        assert url == \
-            'http://example.com/pub/fedora/linux/updates/testing/17/x86_64/repodata.repomd.xml'
+        assert urls == [
+            'http://example.com/pub/fedora/linux/updates/testing/17/x86_64/repodata.repomd.xml']
 
         self.assert_sems(0)
 
@@ -2512,11 +2569,11 @@ class TestPungiComposerThread__get_master_repomd_url(ComposerThreadBaseTestCase)
                                 'bowlofeggs', self.Session, self.tempdir)
         t.compose = Compose.from_dict(self.db, task['composes'][0])
 
-        url = t._get_master_repomd_url('x86_64')
+        urls = t._get_master_repomd_urls('x86_64')
 
-        assert url == \
-            'http://example.com/pub/fedora/linux/updates/testing/17/Everything/'\
-            'x86_64/repodata.repomd.xml'
+        assert urls == [
+            'http://example.com/pub/fedora/linux/updates/testing/17/Everything/'
+            'x86_64/repodata.repomd.xml']
 
         self.assert_sems(0)
 
@@ -2536,10 +2593,32 @@ class TestPungiComposerThread__get_master_repomd_url(ComposerThreadBaseTestCase)
                                 'bowlofeggs', self.Session, self.tempdir)
         t.compose = Compose.from_dict(self.db, task['composes'][0])
 
-        url = t._get_master_repomd_url('aarch64')
+        urls = t._get_master_repomd_urls('aarch64')
 
-        assert url == \
-            'http://example.com/pub/fedora/linux/updates/testing/17/aarch64/repodata.repomd.xml'
+        assert urls == [
+            'http://example.com/pub/fedora/linux/updates/testing/17/aarch64/repodata.repomd.xml']
+
+        self.assert_sems(0)
+
+    def test_several_mirrors(self):
+        """
+        Assert that a URL is returned for each of the mirrors listed in the setting.
+        """
+        config.update({
+            'fedora_testing_master_repomd':
+                'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml\n'
+                'http://example.org/fedora/updates/testing/%s/%s/repodata.repomd.xml',
+        })
+        task = self._make_task()
+        t = PungiComposerThread(self.semmock, task['composes'][0],
+                                'bowlofeggs', self.Session, self.tempdir)
+        t.compose = Compose.from_dict(self.db, task['composes'][0])
+
+        urls = t._get_master_repomd_urls('x86_64')
+
+        assert urls == [
+            'http://example.com/pub/fedora/linux/updates/testing/17/x86_64/repodata.repomd.xml',
+            'http://example.org/fedora/updates/testing/17/x86_64/repodata.repomd.xml']
 
         self.assert_sems(0)
 
@@ -2684,7 +2763,7 @@ class TestComposerThread__determine_tag_actions(ComposerThreadBaseTestCase):
         t.skip_compose = True
         expected_messages = (
             update_schemas.UpdateEjectV1.from_dict({
-                'repo': 'f17-updates', 'update': self.db.query(Update).one().__json__(),
+                'repo': 'f17-updates', 'update': self.db.query(Update).one(),
                 'reason': (f"Cannot find relevant tag for bodhi-2.0-1.fc17.  None of {tags} are "
                            f"in {Release.get_tags()[0]['candidate']}."),
                 'request': UpdateRequest.testing,
@@ -2692,7 +2771,8 @@ class TestComposerThread__determine_tag_actions(ComposerThreadBaseTestCase):
 
         with mock_sends(*expected_messages):
             t._determine_tag_actions()
-            expected_messages[0].body['update'] = self.db.query(Update).one().__json__()
+            expected_messages[0].body['update'] = update_schemas.UpdateEjectV1.from_dict(
+                {'update': self.db.query(Update).one()}).body['update']
 
         # Since the update should have been ejected, no tags should get added to add_tags or
         # move_tags.
@@ -2723,7 +2803,7 @@ class TestComposerThread_eject_from_compose(ComposerThreadBaseTestCase):
         up = self.db.query(Update).one()
         expected_messages = (
             update_schemas.UpdateEjectV1.from_dict({
-                'repo': 'f17-updates', 'update': up.__json__(),
+                'repo': 'f17-updates', 'update': up,
                 'reason': 'This update is unacceptable!',
                 'request': UpdateRequest.testing,
                 'release': t.compose.release, 'agent': 'bowlofeggs'}),)
@@ -2732,7 +2812,8 @@ class TestComposerThread_eject_from_compose(ComposerThreadBaseTestCase):
             t.eject_from_compose(up, 'This update is unacceptable!')
             # The method modifies the update, so we need to modify our expected message's serialized
             # update suitably.
-            expected_messages[0].body['update'] = self.db.query(Update).one().__json__()
+            expected_messages[0].body['update'] = update_schemas.UpdateEjectV1.from_dict(
+                {'update': self.db.query(Update).one()}).body['update']
             self.db.commit()
 
         assert buildsys.DevBuildsys.__untag__ == \
@@ -2850,50 +2931,182 @@ class TestComposerThread_save_state(ComposerThreadBaseTestCase):
         assert json.loads(compose.checkpoints) == {'cool': 'checkpoint'}
         t.db.commit.assert_called_once_with()
 
+    def test_profile_phases(self):
+        """Each phase is profiled when profiling.composes is set."""
+        t = ComposerThread(self.semmock, self._make_task()['composes'][0],
+                           'bowlofeggs', self.Session, self.tempdir)
+        t._checkpoints = {}
+        t.compose = self.db.query(Compose).one()
+        t.db = self.db
+
+        with mock.patch.dict(config, {'profiling.composes': True,
+                                      'profiling.directory': self.tempdir}):
+            t.save_state(ComposeState.punging)
+            t.save_state(ComposeState.punging)
+            t.save_state(ComposeState.notifying)
+            t._profile_phase(None)
+
+        assert t._profile is None
+        profiles = os.listdir(os.path.join(self.tempdir, 'compose_F17_testing'))
+        assert sorted(p.split('-')[0] for p in profiles) == ['notifying', 'punging']
+        assert all(p.endswith('.pstats') for p in profiles)
+
+    def test_profile_phases_other_profile(self):
+        """The phases are not profiled while another profile is active."""
+        t = ComposerThread(self.semmock, self._make_task()['composes'][0],
+                           'bowlofeggs', self.Session, self.tempdir)
+        t._checkpoints = {}
+        t.compose = self.db.query(Compose).one()
+        t.db = self.db
+        other = profiling.start()
+
+        try:
+            with mock.patch.dict(config, {'profiling.composes': True,
+                                          'profiling.directory': self.tempdir}):
+                t.save_state(ComposeState.punging)
+                assert t._profile is None
+                t._profile_phase(None)
+        finally:
+            profiling.stop(other)
+
+        assert os.listdir(self.tempdir) == []
+
+    def test_profile_phases_disabled(self):
+        """The phases are not profiled by default."""
+        t = ComposerThread(self.semmock, self._make_task()['composes'][0],
+                           'bowlofeggs', self.Session, self.tempdir)
+        t._checkpoints = {}
+        t.compose = self.db.query(Compose).one()
+        t.db = self.db
+
+        with mock.patch.dict(config, {'profiling.directory': self.tempdir}):
+            t.save_state(ComposeState.punging)
+
+        assert t._profile is None
+        assert os.listdir(self.tempdir) == []
+
 
 class TestPungiComposerThread__wait_for_sync(ComposerThreadBaseTestCase):
     """This test class contains tests for the PungiComposerThread._wait_for_sync() method."""
-    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
-    @mock.patch('bodhi.server.tasks.composer.time.sleep',
-                mock.MagicMock(side_effect=Exception('This should not happen during this test.')))
-    @mock.patch('bodhi.server.tasks.composer.urlopen')
-    def test_checksum_match_immediately(self, urlopen, save):
-        """
-        Assert correct operation when the repomd checksum matches immediately.
-        """
-        config.update({
-            'fedora_testing_master_repomd':
-                'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
-        })
-        urlopen.return_value.read.return_value = b'---\nyaml: rules'
+
+    def _make_thread(self, arches=('aarch64', 'x86_64')):
+        """Return a PungiComposerThread with a compose of the given arches."""
         t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
                                 'bowlofeggs', self.Session, self.tempdir)
         t.compose = self.db.query(Compose).one()
         t.id = 'f26-updates-testing'
         t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
+        for arch in arches:
             repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
             os.makedirs(repodata)
             with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
                 repomd.write('---\nyaml: rules')
-        expected_messages = (
+        return t
+
+    def _expected_messages(self, t):
+        return (
             compose_schemas.ComposeSyncWaitV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}),
             compose_schemas.ComposeSyncDoneV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}))
 
-        with mock_sends(*expected_messages):
-            t._wait_for_sync()
+    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
+    @mock.patch('bodhi.server.tasks.composer.time.sleep',
+                mock.MagicMock(side_effect=Exception('This should not happen during this test.')))
+    def test_checksum_match_immediately(self, save):
+        """
+        Assert correct operation when the repomd checksum matches immediately.
+        """
+        t = self._make_thread()
+        latency_count = REGISTRY.get_sample_value(
+            'bodhi_compose_sync_latency_seconds_count', {'repo': t.id}) or 0
+
+        with RepomdServer() as server:
+            config.update({
+                'fedora_testing_master_repomd': server.url + '/testing/%s/%s/repomd.xml'})
+            server.files = {f'/testing/17/{arch}/repomd.xml': b'---\nyaml: rules'
+                            for arch in ('aarch64', 'x86_64')}
+            with mock_sends(*self._expected_messages(t)):
+                t._wait_for_sync()
 
-        assert urlopen.call_count == 1
-        # Since os.listdir() isn't deterministic about the order of the items it returns, the test
-        # won't be deterministic about which of these URLs get called. However, either one of them
-        # would be correct so we will just assert that one of them is called.
-        expected_calls = [
-            mock.call('http://example.com/pub/fedora/linux/updates/testing/17/x86_64/'
-                      'repodata.repomd.xml'),
-            mock.call('http://example.com/pub/fedora/linux/updates/testing/17/aarch64/'
-                      'repodata.repomd.xml')]
-        assert urlopen.mock_calls[0] in expected_calls
+        # All the arches are checked.
+        assert server.requests_for('/testing/17/aarch64/repomd.xml') == [(None, 200)]
+        assert server.requests_for('/testing/17/x86_64/repomd.xml') == [(None, 200)]
         save.assert_called_once_with(ComposeState.syncing_repo)
+        assert REGISTRY.get_sample_value(
+            'bodhi_compose_sync_latency_seconds_count', {'repo': t.id}) == latency_count + 1
+
+    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
+    @mock.patch('bodhi.server.tasks.composer.time.sleep')
+    def test_checksum_match_third_try(self, sleep, save):
+        """
+        Assert correct operation when the repomd checksum matches on the third try, and that the
+        unchanged files are not downloaded again.
+        """
+        t = self._make_thread()
+        synced = iter(['/testing/17/aarch64/repomd.xml', '/testing/17/x86_64/repomd.xml'])
+
+        with RepomdServer() as server:
+            config.update({
+                'fedora_testing_master_repomd': server.url + '/testing/%s/%s/repomd.xml'})
+            server.files = {f'/testing/17/{arch}/repomd.xml': b'wrong'
+                            for arch in ('aarch64', 'x86_64')}
+            # An arch reaches the mirror during each wait.
+            sleep.side_effect = lambda interval: server.files.update(
+                {next(synced): b'---\nyaml: rules'})
+            with mock_sends(*self._expected_messages(t)):
+                t._wait_for_sync()
+
+        etag = '"%s"' % hashlib.sha1(b'wrong').hexdigest()
+        assert server.requests_for('/testing/17/aarch64/repomd.xml') == [
+            (None, 200), (etag, 200)]
+        assert server.requests_for('/testing/17/x86_64/repomd.xml') == [
+            (None, 200), (etag, 304), (etag, 200)]
+        sleep.assert_has_calls([mock.call(200), mock.call(200)])
+        save.assert_called_with(ComposeState.syncing_repo)
+
+    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
+    @mock.patch('bodhi.server.tasks.composer.time.sleep',
+                mock.MagicMock(side_effect=Exception('This should not happen during this test.')))
+    def test_quorum(self, save):
+        """
+        Assert that the composer carries on once wait_for_sync.quorum mirrors are synchronized.
+        """
+        t = self._make_thread(arches=('x86_64',))
+
+        with RepomdServer() as server:
+            config.update({
+                'fedora_testing_master_repomd': ' '.join(
+                    server.url + f'/{mirror}/%s/%s/repomd.xml' for mirror in ('a', 'b', 'c')),
+                'wait_for_sync.quorum': 2})
+            server.files = {'/a/17/x86_64/repomd.xml': b'---\nyaml: rules',
+                            '/b/17/x86_64/repomd.xml': b'wrong',
+                            '/c/17/x86_64/repomd.xml': b'---\nyaml: rules'}
+            with mock_sends(*self._expected_messages(t)):
+                t._wait_for_sync()
+
+        assert len(server.requests) == 3
+
+    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
+    @mock.patch('bodhi.server.tasks.composer.time.sleep')
+    def test_all_mirrors(self, sleep, save):
+        """
+        Assert that all the mirrors must be synchronized when no quorum is configured.
+        """
+        t = self._make_thread(arches=('x86_64',))
+
+        with RepomdServer() as server:
+            config.update({
+                'fedora_testing_master_repomd': ' '.join(
+                    server.url + f'/{mirror}/%s/%s/repomd.xml' for mirror in ('a', 'b'))})
+            server.files = {'/a/17/x86_64/repomd.xml': b'---\nyaml: rules'}
+            sleep.side_effect = lambda interval: server.files.update(
+                {'/b/17/x86_64/repomd.xml': b'---\nyaml: rules'})
+            with mock_sends(*self._expected_messages(t)):
+                t._wait_for_sync()
+
+        # The synchronized mirror isn't polled again.
+        assert server.requests_for('/a/17/x86_64/repomd.xml') == [(None, 200)]
+        assert server.requests_for('/b/17/x86_64/repomd.xml') == [(None, 404), (None, 200)]
+        sleep.assert_called_once_with(200)
 
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
     @mock.patch('bodhi.server.tasks.composer.time.sleep',
@@ -2908,16 +3121,7 @@ class TestPungiComposerThread__wait_for_sync(ComposerThreadBaseTestCase):
                 'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
         })
         urlopen.return_value.read.return_value = b'---\nyaml: rules'
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['source']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
+        t = self._make_thread(arches=('source',))
         with pytest.raises(Exception) as exc:
             with mock_sends(*[base_schemas.BodhiMessage] * 5):
                 t._wait_for_sync()
@@ -2925,90 +3129,33 @@ class TestPungiComposerThread__wait_for_sync(ComposerThreadBaseTestCase):
         assert "Not found an arch to _wait_for_sync with" in str(exc.value)
         save.assert_not_called()
 
-    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
-    @mock.patch('bodhi.server.tasks.composer.time.sleep')
-    @mock.patch('bodhi.server.tasks.composer.urlopen')
-    def test_checksum_match_third_try(self, urlopen, sleep, save):
-        """
-        Assert correct operation when the repomd checksum matches on the third try.
-        """
-        config.update({
-            'fedora_testing_master_repomd':
-                'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
-        })
-        urlopen.return_value.read.side_effect = [b'wrong', b'nope', b'---\nyaml: rules']
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
-        expected_messages = (
-            compose_schemas.ComposeSyncWaitV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}),
-            compose_schemas.ComposeSyncDoneV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}))
-
-        with mock_sends(*expected_messages):
-            t._wait_for_sync()
-
-        # Since os.listdir() isn't deterministic about the order of the items it returns, the test
-        # won't be deterministic about which of arch URL gets used. However, either one of them
-        # would be correct so we will just assert that the one that is used is used correctly.
-        arch = 'x86_64' if 'x86_64' in urlopen.mock_calls[0][1][0] else 'aarch64'
-        expected_calls = [
-            mock.call('http://example.com/pub/fedora/linux/updates/testing/17/'
-                      '{}/repodata.repomd.xml'.format(arch)),
-            mock.call().read()]
-        expected_calls = expected_calls * 3
-        urlopen.assert_has_calls(expected_calls)
-        sleep.assert_has_calls([mock.call(200), mock.call(200)])
-        save.assert_called_with(ComposeState.syncing_repo)
-
+    @pytest.mark.parametrize('error', (
+        HTTPError('url', 404, 'Not found', {}, None),
+        ConnectionResetError(104, 'Connection reset by peer'),
+        URLError('it broke')))
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
     @mock.patch('bodhi.server.tasks.composer.time.sleep')
     @mock.patch('bodhi.server.tasks.composer.urlopen')
     @mock.patch('bodhi.server.tasks.composer.log')
-    def test_httperror(self, mocked_log, urlopen, sleep, save):
+    def test_urlopen_error(self, mocked_log, urlopen, sleep, save, error):
         """
-        Assert that an HTTPError is properly caught and logged, and that the algorithm continues.
+        Assert that an error is properly caught and logged, and that the algorithm continues.
         """
         config.update({
             'fedora_testing_master_repomd':
-                'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml'
+                'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
         })
-        mocked_log.exception = mock.MagicMock()
         fake_url = mock.MagicMock()
         fake_url.read.return_value = b'---\nyaml: rules'
-        urlopen.side_effect = [HTTPError('url', 404, 'Not found', {}, None), fake_url]
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
-        expected_messages = (
-            compose_schemas.ComposeSyncWaitV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}),
-            compose_schemas.ComposeSyncDoneV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}))
+        urlopen.side_effect = [error, fake_url]
+        t = self._make_thread(arches=('x86_64',))
 
-        with mock_sends(*expected_messages):
+        with mock_sends(*self._expected_messages(t)):
             t._wait_for_sync()
 
-        # Since os.listdir() isn't deterministic about the order of the items it returns, the test
-        # won't be deterministic about which of arch URL gets used. However, either one of them
-        # would be correct so we will just assert that the one that is used is used correctly.
-        arch = 'x86_64' if 'x86_64' in urlopen.mock_calls[0][1][0] else 'aarch64'
-        expected_calls = [
-            mock.call('http://example.com/pub/fedora/linux/updates/testing/17/'
-                      '{}/repodata.repomd.xml'.format(arch))
-            for i in range(2)]
-        urlopen.assert_has_calls(expected_calls)
+        assert [c[1][0].full_url for c in urlopen.mock_calls if c[0] == ''] == [
+            'http://example.com/pub/fedora/linux/updates/testing/17/x86_64/repodata.repomd.xml'
+        ] * 2
         mocked_log.exception.assert_called_once_with('Error fetching repomd.xml')
         sleep.assert_called_once_with(200)
         save.assert_called_once_with(ComposeState.syncing_repo)
@@ -3017,91 +3164,48 @@ class TestPungiComposerThread__wait_for_sync(ComposerThreadBaseTestCase):
     @mock.patch('bodhi.server.tasks.composer.time.sleep')
     @mock.patch('bodhi.server.tasks.composer.urlopen')
     @mock.patch('bodhi.server.tasks.composer.log')
-    def test_connectionreseterror(self, mocked_log, urlopen, sleep, save):
+    def test_incompleteread(self, mocked_log, urlopen, sleep, save):
         """
-        Assert that an ConnectionResetError is properly caught and logged, and that the
-        algorithm continues.
+        Assert that an IncompleteRead is properly caught and logged, and that the code continues.
         """
         config.update({
             'fedora_testing_master_repomd':
                 'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
         })
-        mocked_log.exception = mock.MagicMock()
-        fake_url = mock.MagicMock()
-        fake_url.read.return_value = b'---\nyaml: rules'
-        urlopen.side_effect = [ConnectionResetError(104, 'Connection reset by peer'), fake_url]
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
-        expected_messages = (
-            compose_schemas.ComposeSyncWaitV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}),
-            compose_schemas.ComposeSyncDoneV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}))
+        urlopen.return_value.read.side_effect = [IncompleteRead('some_data'), b'---\nyaml: rules']
+        t = self._make_thread(arches=('x86_64',))
 
-        with mock_sends(*expected_messages):
+        with mock_sends(*self._expected_messages(t)):
             t._wait_for_sync()
 
-        # Since os.listdir() isn't deterministic about the order of the items it returns, the test
-        # won't be deterministic about which of arch URL gets used. However, either one of them
-        # would be correct so we will just assert that the one that is used is used correctly.
-        arch = 'x86_64' if 'x86_64' in urlopen.mock_calls[0][1][0] else 'aarch64'
-        expected_calls = [
-            mock.call('http://example.com/pub/fedora/linux/updates/testing/17/'
-                      '{}/repodata.repomd.xml'.format(arch))
-            for i in range(2)]
-        urlopen.assert_has_calls(expected_calls)
+        assert urlopen.call_count == 2
+        assert urlopen.return_value.read.call_count == 2
         mocked_log.exception.assert_called_once_with('Error fetching repomd.xml')
         sleep.assert_called_once_with(200)
         save.assert_called_once_with(ComposeState.syncing_repo)
 
+    @pytest.mark.parametrize('error', (
+        TimeoutError('The read operation timed out'),
+        ConnectionResetError(104, 'Connection reset by peer')))
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
     @mock.patch('bodhi.server.tasks.composer.time.sleep')
     @mock.patch('bodhi.server.tasks.composer.urlopen')
     @mock.patch('bodhi.server.tasks.composer.log')
-    def test_incompleteread(self, mocked_log, urlopen, sleep, save):
+    def test_read_error(self, mocked_log, urlopen, sleep, save, error):
         """
-        Assert that an IncompleteRead is properly caught and logged, and that the code continues.
+        Assert that an error while reading the repomd.xml is caught and polled again later.
         """
         config.update({
             'fedora_testing_master_repomd':
                 'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
         })
-        mocked_log.exception = mock.MagicMock()
-        urlopen.return_value.read.side_effect = [IncompleteRead('some_data'), b'---\nyaml: rules']
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
-        expected_messages = (
-            compose_schemas.ComposeSyncWaitV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}),
-            compose_schemas.ComposeSyncDoneV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}))
+        urlopen.return_value.read.side_effect = [error, b'---\nyaml: rules']
+        t = self._make_thread(arches=('x86_64',))
 
-        with mock_sends(*expected_messages):
+        with mock_sends(*self._expected_messages(t)):
             t._wait_for_sync()
 
-        # Since os.listdir() isn't deterministic about the order of the items it returns, the test
-        # won't be deterministic about which of arch URL gets used. However, either one of them
-        # would be correct so we will just assert that the one that is used is used correctly.
-        arch = 'x86_64' if 'x86_64' in urlopen.mock_calls[0][1][0] else 'aarch64'
-        expected_calls = []
-        for i in range(2):
-            expected_calls.append(
-                mock.call('http://example.com/pub/fedora/linux/updates/testing/17/'
-                          '{}/repodata.repomd.xml'.format(arch)))
-            expected_calls.append(mock.call().read())
-        urlopen.assert_has_calls(expected_calls)
+        assert urlopen.call_count == 2
         mocked_log.exception.assert_called_once_with('Error fetching repomd.xml')
         sleep.assert_called_once_with(200)
         save.assert_called_once_with(ComposeState.syncing_repo)
@@ -3118,16 +3222,7 @@ class TestPungiComposerThread__wait_for_sync(ComposerThreadBaseTestCase):
         config.update({
             'fedora_testing_master_repomd': None,
         })
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
+        t = self._make_thread()
 
         with pytest.raises(ValueError) as exc:
             with mock_sends(compose_schemas.ComposeSyncWaitV1.from_dict(
@@ -3168,51 +3263,15 @@ class TestPungiComposerThread__wait_for_sync(ComposerThreadBaseTestCase):
             'Cannot find local repomd: %s', os.path.join(repodata, 'repomd.xml'))
         save.assert_not_called()
 
-    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
-    @mock.patch('bodhi.server.tasks.composer.time.sleep')
-    @mock.patch('bodhi.server.tasks.composer.urlopen')
-    @mock.patch('bodhi.server.tasks.composer.log')
-    def test_urlerror(self, mocked_log, urlopen, sleep, save):
-        """
-        Assert that a URLError is properly caught and logged, and that the algorithm continues.
-        """
-        config.update({
-            'fedora_testing_master_repomd':
-                'http://example.com/pub/fedora/linux/updates/testing/%s/%s/repodata.repomd.xml',
-        })
-        mocked_log.exception = mock.MagicMock()
-        fake_url = mock.MagicMock()
-        fake_url.read.return_value = b'---\nyaml: rules'
-        urlopen.side_effect = [URLError('it broke'), fake_url]
-        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
-                                'bowlofeggs', self.Session, self.tempdir)
-        t.compose = self.db.query(Compose).one()
-        t.id = 'f26-updates-testing'
-        t.path = os.path.join(self.tempdir, t.id + '-' + time.strftime("%y%m%d.%H%M"))
-        for arch in ['aarch64', 'x86_64']:
-            repodata = os.path.join(t.path, 'compose', 'Everything', arch, 'os', 'repodata')
-            os.makedirs(repodata)
-            with open(os.path.join(repodata, 'repomd.xml'), 'w') as repomd:
-                repomd.write('---\nyaml: rules')
-        expected_messages = (
-            compose_schemas.ComposeSyncWaitV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}),
-            compose_schemas.ComposeSyncDoneV1.from_dict({'repo': t.id, 'agent': 'bowlofeggs'}))
-
-        with mock_sends(*expected_messages):
-            t._wait_for_sync()
 
-        # Since os.listdir() isn't deterministic about the order of the items it returns, the test
-        # won't be deterministic about which of arch URL gets used. However, either one of them
-        # would be correct so we will just assert that the one that is used is used correctly.
-        arch = 'x86_64' if 'x86_64' in urlopen.mock_calls[0][1][0] else 'aarch64'
-        expected_calls = [
-            mock.call('http://example.com/pub/fedora/linux/updates/testing/17/'
-                      '{}/repodata.repomd.xml'.format(arch))
-            for i in range(2)]
-        urlopen.assert_has_calls(expected_calls)
-        mocked_log.exception.assert_called_once_with('Error fetching repomd.xml')
-        sleep.assert_called_once_with(200)
-        save.assert_called_once_with(ComposeState.syncing_repo)
+@pytest.mark.parametrize('elapsed,interval', (
+    (0, 200), (300, 150), (560, 20), (590, 15), (600, 15), (1000, 100), (5000, 200)))
+def test_sync_poll_interval(elapsed, interval):
+    """The mirrors are polled more often as the expected sync duration approaches."""
+    with mock.patch.dict(config, {'wait_for_sync.expected_duration': 600,
+                                  'wait_for_sync.min_interval': 15,
+                                  'wait_for_sync.max_interval': 200}):
+        assert sync_poll_interval(elapsed) == interval
 
 
 class TestComposerThread_mark_status_changes(ComposerThreadBaseTestCase):
@@ -3282,7 +3341,7 @@ class TestComposerThread_send_notifications(ComposerThreadBaseTestCase):
         t.compose = self.db.query(Compose).one()
         expected_messages = (
             update_schemas.UpdateCompleteTestingV1.from_dict({
-                'update': Update.query.one().__json__(), 'agent': 'composer'}),)
+                'update': Update.query.one(), 'agent': 'composer'}),)
 
         with mock.patch('bodhi.server.tasks.composer.os.getlogin', side_effect=OSError()):
             with mock_sends(*expected_messages):
@@ -3497,54 +3556,78 @@ class TestPungiComposerThread__wait_for_repo_signature(ComposerThreadBaseTestCas
             [mock.call('Not waiting for a repo signature')]
 
     @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
-    @mock.patch('time.sleep')
-    @mock.patch('os.listdir', return_value=['x86_64', 'aarch64', 'source'])
     @mock.patch('bodhi.server.tasks.composer.log')
-    def test_wait_for_signatures(self, mocked_log, listdir, sleep, save):
-        """Test that if wait_for_repo_sig is disabled, nothing happens."""
+    def test_wait_for_signatures(self, mocked_log, save):
+        """Test that the arches waiting for their signature are reported until they are signed."""
         mocked_log.info = mock.MagicMock()
         t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
                                 'ralph', self.Session, self.tempdir)
+        t.compose = self.db.query(Compose).one()
         t.id = 'f17-updates-testing'
-        t.path = '/composepath'
+        t.path = os.path.join(self.tempdir, 'composepath')
+        sigpaths = {}
+        for arch, tree in (('aarch64', 'os'), ('source', 'tree'), ('x86_64', 'os')):
+            repodata = os.path.join(t.path, 'compose', 'Everything', arch, tree, 'repodata')
+            os.makedirs(repodata)
+            sigpaths[arch] = os.path.join(repodata, 'repomd.xml.asc')
+        with open(sigpaths['source'], 'w'):
+            pass
+        messages = []
+        save.side_effect = lambda state=None: messages.append(t.compose.error_message)
+
+        def sign(arch):
+            with open(sigpaths[arch], 'w'):
+                pass
+
+        timers = [threading.Timer(0.1, sign, ('x86_64', )),
+                  threading.Timer(0.3, sign, ('aarch64', ))]
+        [timer.start() for timer in timers]
+        config["wait_for_repo_sig"] = True
+        try:
+            with mock_sends(compose_schemas.RepoDoneV1.from_dict({
+                'repo': t.id, 'path': t.path, 'agent': 'ralph'})
+            ):
+                with mock.patch.dict(config, {'wait_for_repo_sig.poll_interval': 60}):
+                    t._wait_for_repo_signature()
+        finally:
+            [timer.cancel() for timer in timers]
+
+        assert save.mock_calls == [mock.call(ComposeState.signing_repo), mock.call(),
+                                   mock.call(), mock.call()]
+        assert messages == [None,
+                            'Waiting for the repo signatures of: aarch64, x86_64',
+                            'Waiting for the repo signatures of: aarch64',
+                            None]
+        assert t.compose.error_message is None
+        assert mocked_log.info.mock_calls[-1] == mock.call('All signatures were created')
+        assert mock.call('Waiting on %s', sigpaths['aarch64']) in mocked_log.info.mock_calls
+
+    @mock.patch('bodhi.server.tasks.composer.PungiComposerThread.save_state')
+    @mock.patch('bodhi.server.tasks.composer.wait_for_paths')
+    def test_wait_for_signatures_timeout(self, wait_for_paths, save):
+        """Test that the compose fails if the signatures don't appear before the timeout."""
+        t = PungiComposerThread(self.semmock, self._make_task()['composes'][0],
+                                'ralph', self.Session, self.tempdir)
+        t.compose = self.db.query(Compose).one()
+        t.id = 'f17-updates-testing'
+        t.path = os.path.join(self.tempdir, 'composepath')
+        for arch in ('aarch64', 'ppc64le', 'x86_64'):
+            os.makedirs(os.path.join(t.path, 'compose', 'Everything', arch))
+        wait_for_paths.side_effect = lambda paths, **kwargs: [
+            p for p in paths if '/x86_64/' not in p]
 
         config["wait_for_repo_sig"] = True
         with mock_sends(compose_schemas.RepoDoneV1.from_dict({
             'repo': t.id, 'path': t.path, 'agent': 'ralph'})
         ):
-            with mock.patch('os.path.exists', side_effect=[
-                # First time, none of the signatures exist
-                False, False, False,
-                # Second time, we have two sets of signatures
-                True, False, True,
-                # Third time, we get all signatures and proceed
-                True, True, True
-            ]) as exists:
-                t._wait_for_repo_signature()
-
-        assert len(sleep.mock_calls) == 2
-        assert mocked_log.info.mock_calls == \
-            [mock.call("Waiting for signatures in %s",
-                       "/composepath/compose/Everything/x86_64/os/repodata/repomd.xml.asc, "
-                       "/composepath/compose/Everything/aarch64/os/repodata/repomd.xml.asc, "
-                       "/composepath/compose/Everything/source/tree/repodata/repomd.xml.asc"),
-             mock.call('Waiting on %s',
-                       "/composepath/compose/Everything/x86_64/os/repodata/repomd.xml.asc, "
-                       "/composepath/compose/Everything/aarch64/os/repodata/repomd.xml.asc, "
-                       "/composepath/compose/Everything/source/tree/repodata/repomd.xml.asc"),
-             mock.call('Waiting on %s',
-                       "/composepath/compose/Everything/aarch64/os/repodata/repomd.xml.asc"),
-             mock.call('All signatures were created')]
-        assert exists.mock_calls == \
-            [mock.call('/composepath/compose/Everything/x86_64/os/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/aarch64/os/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/source/tree/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/x86_64/os/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/aarch64/os/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/source/tree/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/x86_64/os/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/aarch64/os/repodata/repomd.xml.asc'),
-             mock.call('/composepath/compose/Everything/source/tree/repodata/repomd.xml.asc')]
+            with mock.patch.dict(config, {'wait_for_repo_sig.timeout': 3600,
+                                          'wait_for_repo_sig.poll_interval': 10}):
+                with pytest.raises(Exception) as exc:
+                    t._wait_for_repo_signature()
+
+        assert str(exc.value) == 'Timed out waiting for the repo signatures of: aarch64, ppc64le'
+        assert wait_for_paths.call_args[1]['timeout'] == 3600
+        assert wait_for_paths.call_args[1]['poll_interval'] == 10
         save.assert_called_once_with(ComposeState.signing_repo)
 
 
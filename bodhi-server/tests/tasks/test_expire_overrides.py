@@ -83,6 +83,25 @@ class TestMain(BaseTaskTestCase):
                                    mock.call('Expired bodhi-2.0-1.fc17')], any_order=True)
         assert buildrootoverride.expired_date is not None
 
+    def test_expire_failures(self, log):
+        """
+        Assert that the overrides that could not be untagged are summarized
+        """
+        buildrootoverride = self.db.query(models.BuildrootOverride).all()[0]
+        buildrootoverride.expiration_date = buildrootoverride.expiration_date - timedelta(days=500)
+        self.db.commit()
+        failures = {'bodhi-2.0-1.fc17': ["Unable to untag override bodhi-2.0-1.fc17 from "
+                                         "f17-override: 'oh no!'"]}
+
+        with mock.patch('bodhi.server.models.BuildrootOverride.expire_all',
+                        return_value=failures) as expire_all:
+            expire_overrides_main()
+
+        expire_all.assert_called_once_with(self.db, [buildrootoverride])
+        log.warning.assert_called_once_with(
+            "%d of the expired buildroot overrides could not be fully untagged: %s",
+            1, 'bodhi-2.0-1.fc17')
+
     def test_exception(self, log):
         """
         Test the exception handling
@@ -20,7 +20,7 @@
 from unittest import mock
 import xmlrpc.client
 
-from bodhi.server import bugs, models
+from bodhi.server import bugs, models, spans
 
 
 class TestBugzilla:
@@ -330,6 +330,17 @@ class TestBugzilla:
         assert return_value is bz._bz.getbug.return_value
         bz._bz.getbug.assert_called_once_with(1411188)
 
+    def test_getbug_span(self):
+        """The calls to Bugzilla are recorded as spans."""
+        bz = bugs.Bugzilla()
+        bz._bz = mock.MagicMock()
+
+        with spans.collect() as timings:
+            bz.getbug(1411188)
+            bz.comment(1411188, 'A nice message.')
+
+        assert timings.calls == {'bugzilla': 2}
+
     @mock.patch('bodhi.server.bugs.log.info')
     @mock.patch.dict('bodhi.server.bugs.config', {'bz_products': 'aproduct'})
     def test_modified(self, info):
@@ -24,7 +24,7 @@ import os
 import koji
 import pytest
 
-from bodhi.server import buildsys
+from bodhi.server import buildsys, spans
 
 
 class TestTeardown:
@@ -49,6 +49,124 @@ class TestSetup:
         pytest.raises(ValueError, buildsys.setup_buildsystem, {'buildsystem': 'invalid'})
 
 
+class TestKojiDataset:
+    """Test the KojiDataset class."""
+
+    def test_generate(self):
+        """The packages have builds in each tag, the newest ones in the candidate tag."""
+        dataset = buildsys.KojiDataset(packages=3, builds_per_tag=2, side_tags=1)
+
+        assert list(dataset.tags) == [
+            'f17-updates', 'f17-updates-testing', 'f17-updates-candidate', 'f17-build-side-1']
+        assert len(dataset.builds) == 3 * 3 * 2 + 1
+        assert list(dataset.tagged['f17-updates-candidate']) == [
+            'package0-3.0-1.fc17', 'package0-3.1-1.fc17', 'package1-3.0-1.fc17',
+            'package1-3.1-1.fc17', 'package2-3.0-1.fc17', 'package2-3.1-1.fc17']
+        assert list(dataset.tagged['f17-build-side-1']) == ['package0-4.0-1.fc17']
+        assert dataset.tags['f17-build-side-1']['extra'] == {
+            'sidetag': True, 'sidetag_user': 'packager0'}
+
+    def test_rpms(self):
+        """The RPMs of a build are generated from the seed."""
+        dataset = buildsys.KojiDataset(packages=1, rpms_per_build=2, side_tags=0)
+        build = dataset.builds['package0-1.0-1.fc17']
+
+        rpms = dataset.rpms(build)
+
+        assert [(r['nvr'], r['arch']) for r in rpms] == [
+            ('package0-1.0-1.fc17', 'src'), ('package0-sub0-1.0-1.fc17', 'x86_64'),
+            ('package0-sub1-1.0-1.fc17', 'x86_64')]
+        assert rpms == dataset.rpms(build)
+        assert rpms != buildsys.KojiDataset(packages=1, rpms_per_build=2, side_tags=0,
+                                            seed=1).rpms(build)
+
+
+class TestDatasetBuildsys:
+    """Test the DatasetBuildsys class."""
+
+    def setup_method(self, method):
+        self.dataset = buildsys.KojiDataset(packages=2, builds_per_tag=2, side_tags=2)
+        self.koji = buildsys.DatasetBuildsys(self.dataset)
+
+    def test_builds(self):
+        """The builds are found by NVR or id, and listed with their tags."""
+        build = self.koji.getBuild('package1-2.1-1.fc17')
+
+        assert self.koji.getBuild(build['id']) is build
+        assert self.koji.getBuild('package1-9-1.fc17') is None
+        with pytest.raises(koji.GenericError):
+            self.koji.getBuild('package1-9-1.fc17', strict=True)
+        assert [t['name'] for t in self.koji.listTags(build['id'])] == ['f17-updates-testing']
+        assert len(self.koji.listBuildRPMs(build['id'])) == 5
+        assert self.dataset.calls == {'getBuild': 4, 'listTags': 1, 'listBuildRPMs': 1}
+
+    def test_list_tagged(self):
+        """The tagged builds are listed from the most recently tagged."""
+        assert [b['nvr'] for b in self.koji.listTagged('f17-updates')] == [
+            'package1-1.1-1.fc17', 'package1-1.0-1.fc17', 'package0-1.1-1.fc17',
+            'package0-1.0-1.fc17']
+        assert [b['nvr'] for b in self.koji.listTagged('f17-updates', latest=True)] == [
+            'package1-1.1-1.fc17', 'package0-1.1-1.fc17']
+        assert [b['nvr'] for b in self.koji.getLatestBuilds('f17-updates', package='package0')] \
+            == ['package0-1.1-1.fc17']
+        assert self.koji.listTagged(1)[0]['tag_name'] == 'f17-updates'
+        with pytest.raises(koji.GenericError):
+            self.koji.listTagged('f18-updates')
+
+    def test_tags(self):
+        """The tags and the side tags are found."""
+        assert self.koji.getTag('f17-updates-testing')['id'] == 2
+        assert self.koji.getTag('f18-updates') is None
+        with pytest.raises(koji.GenericError):
+            self.koji.getTag('f18-updates', strict=True)
+        assert self.koji.listSideTags(user='packager1') == [
+            {'id': 5, 'name': 'f17-build-side-2', 'user_name': 'packager1'}]
+        assert self.koji.listPackages() == [
+            {'package_id': 1, 'package_name': 'package0'},
+            {'package_id': 2, 'package_name': 'package1'}]
+
+    def test_tag_actions(self):
+        """Tagging, untagging and moving the builds changes the dataset."""
+        nvr = 'package0-3.1-1.fc17'
+
+        assert self.koji.moveBuild('f17-updates-candidate', 'f17-updates-testing', nvr) == 1
+        assert self.koji.tagBuild('f17-updates', nvr) == 2
+        self.koji.untagBuild('f17-updates-testing', nvr)
+
+        assert [t['name'] for t in self.koji.listTags(nvr)] == ['f17-updates']
+        assert self.koji.listTagged('f17-updates')[0]['nvr'] == nvr
+
+    def test_multicall(self):
+        """The calls are answered together, with the errors as faults."""
+        self.koji.multicall = True
+
+        assert self.koji.getBuild('package0-1.0-1.fc17') is None
+        assert self.koji.getTag('f18-updates', strict=True) is None
+        results = self.koji.multiCall()
+
+        assert results == [[self.dataset.builds['package0-1.0-1.fc17']],
+                           {'faultCode': 1000, 'faultString': "Invalid tagInfo: 'f18-updates'"}]
+        assert not self.koji.multicall
+        self.koji.multicall = True
+        self.koji.getTag('f18-updates', strict=True)
+        with pytest.raises(koji.GenericError):
+            self.koji.multiCall(strict=True)
+
+    @mock.patch('bodhi.server.buildsys.time.sleep')
+    def test_latency(self, sleep):
+        """Each call takes a round trip, and a multicall takes one round trip per batch."""
+        self.koji.latency = 0.5
+
+        self.koji.getBuild('package0-1.0-1.fc17')
+        self.koji.multicall = True
+        for nvr in list(self.dataset.builds)[:5]:
+            self.koji.listTags(nvr)
+        self.koji.multiCall(batch=2)
+
+        assert sleep.mock_calls == [mock.call(0.5)] * 4
+        assert self.dataset.calls == {'getBuild': 1, 'listTags': 5, 'multiCall': 1}
+
+
 class TestGetKrbConf:
     """This class contains tests for the get_krb_conf() function."""
     def test_all_config_items_missing(self):
@@ -101,6 +219,21 @@ class TestGetKrbConf:
         assert config == {'principal': 'a_principal'}
 
 
+class TestClientSession:
+    """This class contains tests for the ClientSession class."""
+
+    @mock.patch('bodhi.server.buildsys.koji.ClientSession._sendCall', return_value=['f17'])
+    def test__sendCall(self, _sendCall):
+        """The calls to the hub are recorded as spans."""
+        client = buildsys.ClientSession('http://example.com/koji')
+
+        with spans.collect() as timings:
+            assert client.getBuildTargets() == ['f17']
+
+        assert timings.calls == {'koji': 1}
+        assert timings.durations['koji'] >= 0
+
+
 class TestKojiLogin:
     """This class contains tests for the koji_login() function."""
 
@@ -126,7 +259,7 @@ class TestKojiLogin:
 
         for key in default_koji_opts:
             assert default_koji_opts[key] == client.opts[key]
-        assert type(client) is koji.ClientSession
+        assert type(client) is buildsys.ClientSession
         # Due to the use of backoff, we should have called gssapi_login three times.
         assert gssapi_login.mock_calls == (
             [mock.call(ccache='a_ccache', keytab='a_keytab', principal='a_principal')] * 3)
@@ -157,7 +290,7 @@ class TestKojiLogin:
 
         for key in default_koji_opts:
             assert default_koji_opts[key] == client.opts[key]
-        assert type(client) is koji.ClientSession
+        assert type(client) is buildsys.ClientSession
         # Since authenticate was False, the login should not have happened.
         assert gssapi_login.call_count == 0
         # No error should have been logged
@@ -175,7 +308,7 @@ class TestKojiLogin:
 
         client = buildsys.koji_login(config, authenticate=True)
 
-        assert type(client) is koji.ClientSession
+        assert type(client) is buildsys.ClientSession
         gssapi_login.assert_called_once_with(ccache='a_ccache', keytab='a_keytab',
                                              principal='a_principal')
         error.assert_called_once_with('Koji gssapi_login failed')
@@ -202,7 +335,7 @@ class TestKojiLogin:
 
         for key in default_koji_opts:
             assert default_koji_opts[key] == client.opts[key]
-        assert type(client) is koji.ClientSession
+        assert type(client) is buildsys.ClientSession
         gssapi_login.assert_called_once_with(ccache='a_ccache', keytab='a_keytab',
                                              principal='a_principal')
         # No error should have been logged
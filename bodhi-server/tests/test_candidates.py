@@ -0,0 +1,221 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.candidates module."""
+
+from unittest import mock
+
+from bodhi.server import buildsys, candidates, models
+
+from . import base
+
+
+def _build(name, release='1.fc17', tag='f17-updates-candidate', id=1):
+    return {'nvr': f'{name}-1.0-{release}', 'id': id, 'package_name': name,
+            'owner_name': 'lmacken', 'tag_name': tag, 'extra': {'ignored': True}}
+
+
+def _slim(build):
+    return {field: value for field, value in build.items() if field != 'extra'}
+
+
+class TestGetRegion:
+    """Test the _get_region() function."""
+
+    @mock.patch('bodhi.server.candidates._region', None)
+    @mock.patch('bodhi.server.candidates.get_cacheregion')
+    def test_shared_region(self, get_cacheregion):
+        """The index is stored in the cache region of Bodhi, which is only configured once."""
+        assert candidates._get_region() is get_cacheregion.return_value
+        assert candidates._get_region() is get_cacheregion.return_value
+
+        get_cacheregion.assert_called_once_with(None)
+
+
+class TestGetTaggedBuilds(base.BasePyTestCase):
+    """Test the get_tagged_builds() function."""
+
+    def test_no_tags(self):
+        """No call is made to Koji when no tags are given."""
+        koji = mock.Mock()
+
+        assert candidates.get_tagged_builds(koji, []) == []
+
+        koji.multiCall.assert_not_called()
+
+    def test_cache(self):
+        """Tags are only listed in Koji on cache misses."""
+        koji = buildsys.get_session()
+        tags = ['f17-updates-candidate', 'f17-updates-testing']
+
+        with mock.patch.object(koji, 'listTagged', wraps=koji.listTagged) as listTagged:
+            first = candidates.get_tagged_builds(koji, tags)
+            second = candidates.get_tagged_builds(koji, tags)
+
+        assert first == second
+        assert listTagged.call_count == 2
+        assert first[0] == {'TurboGears': [{
+            'nvr': 'TurboGears-1.0.2.2-3.fc17', 'id': 16059, 'package_name': 'TurboGears',
+            'owner_name': 'lmacken', 'tag_name': 'f17-updates-candidate'}]}
+        assert first[1]['TurboGears'][0]['nvr'] == 'TurboGears-1.0.2.2-4.fc17'
+
+    def test_only_missing_tags_are_listed(self):
+        """Only the tags that are not cached are listed in Koji."""
+        koji = buildsys.get_session()
+        candidates.get_tagged_builds(koji, ['f17-updates-candidate'])
+
+        with mock.patch.object(koji, 'listTagged', wraps=koji.listTagged) as listTagged:
+            candidates.get_tagged_builds(koji, ['f17-updates-candidate', 'f17-updates-testing'])
+
+        listTagged.assert_called_once_with('f17-updates-testing', latest=True)
+
+    def test_invalidate_tag(self):
+        """invalidate_tag() makes the next call list the tag in Koji again."""
+        koji = buildsys.get_session()
+        candidates.get_tagged_builds(koji, ['f17-updates-candidate'])
+
+        candidates.invalidate_tag('f17-updates-candidate')
+
+        with mock.patch.object(koji, 'listTagged', wraps=koji.listTagged) as listTagged:
+            candidates.get_tagged_builds(koji, ['f17-updates-candidate'])
+        listTagged.assert_called_once_with('f17-updates-candidate', latest=True)
+
+    def test_name(self):
+        """Only the builds of the packages starting with the letter of the name are loaded."""
+        koji = buildsys.get_session()
+        builds = [_build('bodhi', id=1), _build('Bodhi-client', id=2), _build('TurboGears', id=3)]
+        region = candidates._get_region()
+
+        with mock.patch.object(koji, 'multiCall', return_value=[[builds]]):
+            cold = candidates.get_tagged_builds(koji, ['f17-updates-candidate'], name='BOD')
+        with mock.patch.object(region, 'get_multi', wraps=region.get_multi) as get_multi:
+            warm = candidates.get_tagged_builds(koji, ['f17-updates-candidate'], name='bo')
+
+        assert cold == warm
+        assert sorted(warm[0]) == ['Bodhi-client', 'bodhi']
+        assert get_multi.call_args_list[1] == mock.call(
+            ['latest_candidates:tag:f17-updates-candidate:b'], expiration_time=mock.ANY)
+        assert candidates.get_tagged_builds(koji, ['f17-updates-candidate'])[0] == {
+            'bodhi': [_slim(builds[0])], 'Bodhi-client': [_slim(builds[1])],
+            'TurboGears': [_slim(builds[2])]}
+        assert candidates.get_tagged_builds(koji, ['f17-updates-candidate'], name='x') == [{}]
+
+    def test_expired_letter(self):
+        """The tag is listed in Koji again if the builds of a letter expired before its letters."""
+        koji = buildsys.get_session()
+        candidates.get_tagged_builds(koji, ['f17-updates-candidate'])
+        candidates._get_region().delete('latest_candidates:tag:f17-updates-candidate:t')
+
+        with mock.patch.object(koji, 'listTagged', wraps=koji.listTagged) as listTagged:
+            index = candidates.get_tagged_builds(koji, ['f17-updates-candidate'], name='Turbo')
+
+        listTagged.assert_called_once_with('f17-updates-candidate', latest=True)
+        assert index[0]['TurboGears'][0]['nvr'] == 'TurboGears-1.0.2.2-3.fc17'
+
+    @mock.patch('bodhi.server.candidates.log.error')
+    def test_koji_error_not_cached(self, error):
+        """Errors returned by Koji are logged, treated as an empty tag, and not cached."""
+        koji = buildsys.get_session()
+        fault = {'faultCode': 1000, 'faultString': 'no such tag'}
+
+        with mock.patch.object(koji, 'multiCall', return_value=[fault]):
+            assert candidates.get_tagged_builds(koji, ['f17-updates-candidate']) == [{}]
+
+        error.assert_called_with(fault)
+        assert candidates.get_tagged_builds(koji, ['f17-updates-candidate'])[0] != {}
+
+    def test_koji_returns_none(self):
+        """A multicall returning None is handled as if the tags were empty."""
+        koji = buildsys.get_session()
+
+        with mock.patch.object(koji, 'multiCall', return_value=None):
+            assert candidates.get_tagged_builds(koji, ['f17-updates-candidate']) == [{}]
+
+
+class TestFilterBuilds:
+    """Test the filter_builds() function."""
+
+    index = {'bodhi': [_build('bodhi')], 'Bodhi-client': [_build('Bodhi-client')],
+             'TurboGears': [_build('TurboGears')]}
+
+    def test_package(self):
+        """Only the builds of the exact package are returned."""
+        assert candidates.filter_builds(self.index, package='bodhi') == [_build('bodhi')]
+
+    def test_unknown_package(self):
+        """An empty list is returned for an unknown package."""
+        assert candidates.filter_builds(self.index, package='nope') == []
+
+    def test_prefix(self):
+        """The prefix is matched case-insensitively, like Koji does."""
+        assert candidates.filter_builds(self.index, prefix='BOD') == [
+            _build('bodhi'), _build('Bodhi-client')]
+
+    def test_nothing(self):
+        """All the builds are returned if neither package nor prefix is given."""
+        assert len(candidates.filter_builds(self.index)) == 3
+
+
+class TestAssociatedBuildNvrs(base.BasePyTestCase):
+    """Test the caching of the NVRs of builds associated with pending updates."""
+
+    def test_cached(self):
+        """The creator is only called on cache misses."""
+        creator = mock.Mock(return_value=['bodhi-2.0-1.fc17'])
+
+        assert candidates.get_associated_build_nvrs(creator) == frozenset(['bodhi-2.0-1.fc17'])
+        assert candidates.get_associated_build_nvrs(creator) == frozenset(['bodhi-2.0-1.fc17'])
+
+        creator.assert_called_once_with()
+
+    def test_invalidated_on_commit_after_status_change(self):
+        """Changing the status of an update invalidates the NVRs once the session commits."""
+        creator = mock.Mock(return_value=[])
+        candidates.get_associated_build_nvrs(creator)
+        update = self.db.query(models.Update).one()
+
+        update.status = models.UpdateStatus.testing
+        candidates.get_associated_build_nvrs(creator)
+        assert creator.call_count == 1
+
+        self.db.commit()
+        candidates.get_associated_build_nvrs(creator)
+        assert creator.call_count == 2
+
+    def test_invalidated_on_commit_after_builds_change(self):
+        """Adding a build to an update invalidates the NVRs once the session commits."""
+        creator = mock.Mock(return_value=[])
+        candidates.get_associated_build_nvrs(creator)
+        update = self.db.query(models.Update).one()
+        package = self.db.query(models.RpmPackage).one()
+
+        update.builds.append(models.RpmBuild(nvr='bodhi-2.0-2.fc17', package=package,
+                                             release=update.release))
+        self.db.commit()
+
+        candidates.get_associated_build_nvrs(creator)
+        assert creator.call_count == 2
+
+    def test_not_invalidated_without_changes(self):
+        """Committing a session which didn't touch updates keeps the cached NVRs."""
+        creator = mock.Mock(return_value=[])
+        candidates.get_associated_build_nvrs(creator)
+
+        self.db.commit()
+
+        candidates.get_associated_build_nvrs(creator)
+        creator.assert_called_once_with()
@@ -295,6 +295,22 @@ class TestGenerateListValidatorTests:
         assert str(exc.value) == '"{\'lol\': \'wut\'}" cannot be interpreted as a list.'
 
 
+class TestGenerateChoiceValidator:
+    """Test the _generate_choice_validator() function."""
+
+    def test_choice(self):
+        """The allowed values are returned."""
+        assert config._generate_choice_validator(('pstats', 'collapsed'))(' collapsed') == \
+            'collapsed'
+
+    def test_not_a_choice(self):
+        """Other values raise a ValueError."""
+        with pytest.raises(ValueError) as exc:
+            config._generate_choice_validator(('pstats', 'collapsed'))('collapse')
+
+        assert str(exc.value) == '"collapse" is not one of pstats, collapsed.'
+
+
 class TestValidateBoolTests:
     """This class contains tests for the _validate_bool() function."""
     def test_bool(self):
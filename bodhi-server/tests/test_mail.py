@@ -21,9 +21,16 @@ from unittest import mock
 import os
 import smtplib
 
+from prometheus_client import REGISTRY
+
 from bodhi.server import config, mail, models
 from bodhi.server.util import get_absolute_path
 from .base import BasePyTestCase
+from .utils import SMTPServer
+
+
+def _mails(result):
+    return REGISTRY.get_sample_value('bodhi_mail_messages_total', {'result': result}) or 0
 
 
 class TestGetTemplate(BasePyTestCase):
@@ -264,6 +271,157 @@ class TestSend(BasePyTestCase):
         assert sendmail.call_count == 0
 
 
+class TestSendToMany(BasePyTestCase):
+    """Test the send() function with a local SMTP server."""
+
+    def test_rendered_once(self):
+        """Assert the e-mail is rendered once, and delivered to everyone over one connection."""
+        update = models.Update.query.all()[0]
+        fields = mock.Mock(wraps=mail.MESSAGES['comment']['fields'])
+        people = [f'watcher{i}@example.com' for i in range(5)]
+
+        with SMTPServer() as server, \
+                mock.patch.dict(mail.MESSAGES['comment'], {'fields': fields}), \
+                mock.patch.dict(config.config, {'smtp_server': server.address}):
+            mail.send(people, 'comment', update, agent='bowlofeggs')
+
+        fields.assert_called_once_with('bowlofeggs', update)
+        assert server.connections == 1
+        assert [m[1] for m in server.messages] == [[p] for p in people]
+        assert len({m[2].split(b'\r\n', 2)[2] for m in server.messages}) == 1
+
+    @mock.patch.dict(config.config, {'mail.queue': True})
+    @mock.patch('bodhi.server.mail.send_mail_task.delay')
+    def test_queue(self, delay):
+        """Assert the e-mails are handed to the send_mail task if mail.queue is True."""
+        update = models.Update.query.all()[0]
+
+        mail.send(['a@example.com', 'b@example.com'], 'comment', update, agent='bowlofeggs')
+
+        envelopes = delay.mock_calls[0].kwargs['envelopes']
+        assert [e[:2] for e in envelopes] == [['updates@fedoraproject.org', 'a@example.com'],
+                                              ['updates@fedoraproject.org', 'b@example.com']]
+        assert delay.call_count == 1
+
+
+class TestDeliver:
+    """Test the deliver() function."""
+
+    def _envelopes(self, count):
+        return [('bodhi@example.com', f'user{i}@example.com', f'Subject: {i}\r\n\r\nHi')
+                for i in range(count)]
+
+    def test_batches(self):
+        """Assert a connection is reused for mail.batch_size e-mails."""
+        sent = _mails('sent')
+        runs = REGISTRY.get_sample_value('bodhi_mail_delivery_duration_seconds_count') or 0
+
+        with SMTPServer() as server, mock.patch.dict(
+                config.config, {'smtp_server': server.address, 'mail.batch_size': 2}):
+            mail.deliver(self._envelopes(5))
+
+        assert server.connections == 3
+        assert [m[1][0] for m in server.messages] == [f'user{i}@example.com' for i in range(5)]
+        assert server.messages[0][2] == b'Subject: 0\r\n\r\nHi\r\n'
+        assert _mails('sent') == sent + 5
+        assert REGISTRY.get_sample_value('bodhi_mail_delivery_duration_seconds_count') == runs + 1
+
+    @mock.patch('bodhi.server.mail.log.warning')
+    def test_recipient_refused(self, warning):
+        """Assert the e-mails after a refused recipient are still delivered."""
+        refused = _mails('refused')
+
+        with SMTPServer() as server, mock.patch.dict(
+                config.config, {'smtp_server': server.address}):
+            server.refused.add('user1@example.com')
+            mail.deliver(self._envelopes(3))
+
+        assert [m[1][0] for m in server.messages] == ['user0@example.com', 'user2@example.com']
+        assert _mails('refused') == refused + 1
+        assert warning.call_count == 1
+
+    @mock.patch('bodhi.server.mail.log.warning')
+    @mock.patch('bodhi.server.mail.smtplib.SMTP')
+    def test_reconnect(self, SMTP, warning):
+        """Assert an e-mail that fails is retried over a new connection, with the following ones."""
+        SMTP.return_value.sendmail.side_effect = [
+            {}, smtplib.SMTPServerDisconnected('Bye'), {}, {}, {}, {}]
+        SMTP.return_value.quit.side_effect = [smtplib.SMTPServerDisconnected('Bye'), None, None]
+        sent = _mails('sent')
+
+        with mock.patch.dict(config.config, {'smtp_server': 'smtp.fp.o', 'mail.batch_size': 3}):
+            mail.deliver(self._envelopes(5))
+
+        # The batches are sent over two connections, and the second batch over another one.
+        assert SMTP.call_count == 3
+        assert [c.args[1] for c in SMTP.return_value.sendmail.mock_calls] == [
+            ['user0@example.com'], ['user1@example.com'], ['user1@example.com'],
+            ['user2@example.com'], ['user3@example.com'], ['user4@example.com']]
+        assert _mails('sent') == sent + 5
+        # The broken connection is closed even though quitting it failed.
+        SMTP.return_value.close.assert_called_once_with()
+        assert warning.call_count == 1
+
+    @mock.patch('bodhi.server.mail.log.exception')
+    @mock.patch('bodhi.server.mail.log.warning')
+    @mock.patch('bodhi.server.mail.smtplib.SMTP')
+    def test_failure(self, SMTP, warning, exception):
+        """Assert an e-mail that fails again over a new connection is counted as failed."""
+        SMTP.return_value.sendmail.side_effect = [
+            {}, smtplib.SMTPDataError(554, 'Nope'), smtplib.SMTPDataError(554, 'Nope'), {}]
+        failed = _mails('failed')
+        sent = _mails('sent')
+
+        with mock.patch.dict(config.config, {'smtp_server': 'smtp.fp.o', 'mail.batch_size': 3}):
+            mail.deliver(self._envelopes(3))
+
+        assert SMTP.call_count == 3
+        assert SMTP.return_value.sendmail.call_count == 4
+        assert _mails('failed') == failed + 1
+        assert _mails('sent') == sent + 2
+        exception.assert_called_once_with('Unable to send mail')
+
+    @mock.patch('bodhi.server.mail.log.exception')
+    @mock.patch('bodhi.server.mail.smtplib.SMTP')
+    def test_connection_failure(self, SMTP, exception):
+        """Assert the e-mails of a batch fail if the server can't be connected to."""
+        SMTP.side_effect = [mock.DEFAULT, ConnectionRefusedError(), mock.DEFAULT]
+        SMTP.return_value.sendmail.side_effect = [
+            {}, smtplib.SMTPServerDisconnected('Bye'), {}, {}]
+        failed = _mails('failed')
+
+        with mock.patch.dict(config.config, {'smtp_server': 'smtp.fp.o', 'mail.batch_size': 3}):
+            mail.deliver(self._envelopes(5))
+
+        # The second batch was delivered over a new connection.
+        assert SMTP.call_count == 3
+        assert SMTP.return_value.sendmail.call_count == 4
+        assert _mails('failed') == failed + 2
+        exception.assert_called_once_with('Unable to send mail')
+
+
+class TestBatched:
+    """Test the batched() context manager."""
+
+    def test_batched(self):
+        """Assert the e-mails sent in the context are delivered together when it exits."""
+        with SMTPServer() as server, mock.patch.dict(
+                config.config, {'smtp_server': server.address}):
+            with mail.batched():
+                mail.send_mail('bodhi@example.com', 'a@example.com', 'Hi', 'Hello')
+                with mail.batched():
+                    mail.send_releng('Hi', 'Hello')
+                assert server.messages == []
+
+            assert server.connections == 1
+            assert [m[1] for m in server.messages] == [
+                ['a@example.com'], [config.config['release_team_address']]]
+
+            mail.send_mail('bodhi@example.com', 'b@example.com', 'Hi', 'Hello')
+
+        assert server.connections == 2
+
+
 class TestSendMail:
     """Test the send_mail() function."""
 
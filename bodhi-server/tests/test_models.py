@@ -22,6 +22,7 @@ import hashlib
 import html
 import json
 import pickle
+import re
 import time
 import uuid
 
@@ -29,10 +30,12 @@ from fedora_messaging.api import Message
 from fedora_messaging.testing import mock_sends
 from mediawiki.exceptions import HTTPTimeoutError, MediaWikiAPIURLError
 from pyramid.testing import DummyRequest
+from sqlalchemy import and_, or_
 from sqlalchemy.exc import IntegrityError
 import cornice
 import pytest
 import requests.exceptions
+import rpm
 
 from bodhi.messages.schemas import errata as errata_schemas
 from bodhi.messages.schemas import update as update_schemas
@@ -641,6 +644,26 @@ class TestCompose(BasePyTestCase):
         assert compose.state_date > before
         assert datetime.now(timezone.utc) > compose.state_date
 
+    def test_update_state_date_phases(self):
+        """Each change of state is recorded in the phases of the compose."""
+        compose = self._generate_compose(model.UpdateRequest.stable, True)
+        compose.state_date = datetime.now(timezone.utc) - timedelta(seconds=60)
+        requested = compose.state_date.strftime('%Y-%m-%d %H:%M:%S')
+
+        compose.state = model.ComposeState.punging
+        compose.state = model.ComposeState.punging
+        compose.state = model.ComposeState.notifying
+        self.db.flush()
+
+        phases = compose.phases
+        assert [p['state'] for p in phases] == ['requested', 'punging', 'notifying']
+        assert phases[0]['started'] == requested
+        assert 60 <= phases[0]['duration'] < 70
+        assert 0 <= phases[1]['duration'] < 10
+        assert phases[2]['started'] == compose.state_date.strftime('%Y-%m-%d %H:%M:%S')
+        assert phases[2]['duration'] is None
+        assert compose.__json__()['phases'] == phases
+
     def test_update_summary(self):
         """Test the update_summary() property."""
         compose = self._generate_compose(model.UpdateRequest.stable, True)
@@ -716,6 +739,44 @@ class TestCompose(BasePyTestCase):
         assert str(compose) == '<Compose: {} stable>'.format(compose.release.name)
 
 
+class TestComposeDuration(BasePyTestCase):
+    """Test the :class:`ComposeDuration` model."""
+
+    def _add_durations(self, release, request, *durations, content_type=model.ContentType.rpm):
+        """Record composes of the given release and request that took the given durations."""
+        for i, duration in enumerate(durations):
+            self.db.add(model.ComposeDuration(
+                release_id=release.id, request=request, content_type=content_type, updates=1,
+                duration=duration,
+                date_created=datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=i)))
+        self.db.flush()
+
+    @mock.patch.dict(config, {'compose_scheduler.default_duration': 1234})
+    def test_estimate_no_history(self):
+        """The default duration is used when there are no previous composes."""
+        compose = TestCompose._generate_compose(self, model.UpdateRequest.stable, False)
+
+        assert model.ComposeDuration.estimate(self.db, compose) == 1234
+
+    def test_estimate_release(self):
+        """The last composes of the same release and request are averaged."""
+        compose = TestCompose._generate_compose(self, model.UpdateRequest.stable, False)
+        self._add_durations(compose.release, model.UpdateRequest.stable, 9000, 100, 200, 300)
+        self._add_durations(compose.release, model.UpdateRequest.testing, 5000)
+
+        assert model.ComposeDuration.estimate(self.db, compose, history=3) == 200
+
+    def test_estimate_content_type(self):
+        """Releases that were never composed use the composes of the same content type."""
+        compose = TestCompose._generate_compose(self, model.UpdateRequest.stable, False)
+        other = model.Release.query.filter_by(name='F17').one()
+        self._add_durations(other, model.UpdateRequest.stable, 100, 300)
+        self._add_durations(other, model.UpdateRequest.stable, 5000,
+                            content_type=model.ContentType.module)
+
+        assert model.ComposeDuration.estimate(self.db, compose, history=2) == 200
+
+
 class TestRelease(ModelTest):
     """Unit test case for the ``Release`` model."""
     klass = model.Release
@@ -2867,6 +2928,87 @@ class TestUpdateMeetsTestingRequirements(BasePyTestCase):
             assert update.critpath_approved
 
 
+def _obsolete_older_updates_reference(update, db):
+    """
+    Obsolete the updates older than the given one, one build at a time.
+
+    This is the implementation Update.obsolete_older_updates() had before it was batched. It is kept
+    to check that both give the same results.
+    """
+    caveats = []
+    for build in update.builds:
+        for oldBuild in db.query(model.Build).join(model.Update).filter(
+            and_(model.Build.nvr != build.nvr,
+                 model.Build.package == build.package,
+                 model.Update.locked.is_(False),
+                 model.Update.release == update.release,
+                 or_(and_(or_(model.Update.status == UpdateStatus.testing,
+                              model.Update.status == UpdateStatus.pending),
+                          or_(model.Update.request != UpdateRequest.stable,
+                              model.Update.request.is_(None))),
+                     and_(or_(model.Update.status == UpdateStatus.testing,
+                              model.Update.status == UpdateStatus.pending),
+                          model.Update.request == UpdateRequest.stable,
+                          update.request == UpdateRequest.stable)))
+        ).all():
+            obsoletable = False
+            nvr = build.get_n_v_r()
+            if rpm.labelCompare(oldBuild.get_n_v_r(), nvr) < 0:
+                obsoletable = True
+
+            pkgs = [b.package.name for b in update.builds]
+            for _build in oldBuild.update.builds:
+                if _build.package.name not in pkgs:
+                    obsoletable = False
+                    break
+
+            if len(oldBuild.update.builds) != len(update.builds):
+                if oldBuild.update.user.name != update.user.name:
+                    caveats.append({
+                        'name': 'update',
+                        'description': 'Please be aware that there '
+                        'is another update in flight owned by %s, '
+                        'containing %s. Are you coordinating with '
+                        'them?' % (
+                            oldBuild.update.user.name,
+                            oldBuild.nvr,
+                        )
+                    })
+
+            if oldBuild.update.type == UpdateType.security and \
+                    update.type is not UpdateType.security:
+                caveats.append({
+                    'name': 'update',
+                    'description': 'Adjusting type of this update to security,'
+                    'since it obsoletes another security update'
+                })
+                update.type = UpdateType.security
+                update.severity = oldBuild.update.severity
+
+            if obsoletable:
+                oldbugs = [bug.bug_id for bug in oldBuild.update.bugs]
+                bugs = [bug.bug_id for bug in update.bugs]
+                update.update_bugs(bugs + oldbugs, db)
+
+                re_changelog = re.compile(r"(?s)\n##### \*\*Changelog\*\*\n\n```\n.*\n```")
+                old_notes = re.sub(re_changelog, '', oldBuild.update.notes)
+                new_notes = update.notes + '\n\n----\n\n' + old_notes
+                if len(new_notes) <= config.get('update_notes_maxlength'):
+                    update.notes = new_notes
+                oldBuild.update.obsolete(db, newer=build)
+                template = ('This update has obsoleted %s, and has '
+                            'inherited its bugs and notes.')
+                link = "[%s](%s)" % (oldBuild.nvr,
+                                     oldBuild.update.abs_url())
+                update.comment(db, template % link, author='bodhi')
+                caveats.append({
+                    'name': 'update',
+                    'description': template % oldBuild.nvr,
+                })
+
+    return caveats
+
+
 @mock.patch('bodhi.server.models.work_on_bugs_task', mock.Mock())
 @mock.patch('bodhi.server.models.fetch_test_cases_task', mock.Mock())
 class TestUpdate(ModelTest):
@@ -3846,7 +3988,6 @@ class TestUpdate(ModelTest):
             # reflect those changes so the mock_sends() check will pass.
             expected_message.body['update']['status'] = 'pending'
             expected_message.body['update']['request'] = 'testing'
-            expected_message.body['update']['comments'] = self.obj.__json__()['comments']
             self.db.commit()
 
         assert self.obj.status == UpdateStatus.pending
@@ -3872,7 +4013,6 @@ class TestUpdate(ModelTest):
             # reflect those changes so the mock_sends() check will pass.
             expected_message.body['update']['status'] = 'pending'
             expected_message.body['update']['request'] = 'testing'
-            expected_message.body['update']['comments'] = self.obj.__json__()['comments']
             self.db.commit()
 
         assert self.obj.status == UpdateStatus.pending
@@ -3894,7 +4034,8 @@ class TestUpdate(ModelTest):
         with mock_sends(expected_message):
             self.obj.set_request(self.db, UpdateRequest.revoke, req.user.name)
             # set_request alters obj, so let's modify the expected_message with the updated obj.
-            expected_message.body['update'] = self.obj.__json__()
+            expected_message.body['update'] = type(expected_message).from_dict(
+                {'update': self.obj}).body['update']
             self.db.commit()
 
         assert self.obj.request is None
@@ -3943,7 +4084,6 @@ class TestUpdate(ModelTest):
             # reflect those changes so the mock_sends() check will pass.
             expected_message.body['update']['status'] = 'testing'
             expected_message.body['update']['request'] = 'stable'
-            expected_message.body['update']['comments'] = self.obj.__json__()['comments']
             self.db.commit()
 
         assert self.obj.request == UpdateRequest.stable
@@ -3979,7 +4119,6 @@ class TestUpdate(ModelTest):
             # reflect those changes so the mock_sends() check will pass.
             expected_message.body['update']['status'] = 'testing'
             expected_message.body['update']['request'] = 'stable'
-            expected_message.body['update']['comments'] = self.obj.__json__()['comments']
             self.db.commit()
         assert self.obj.request == UpdateRequest.stable
         assert len(req.errors) == 0
@@ -4025,7 +4164,8 @@ class TestUpdate(ModelTest):
             self.obj.set_request(self.db, UpdateRequest.stable, req.user.name)
             # set_request alters the update a bit, so we need to adjust the expected message to
             # reflect those changes so the mock_sends() check will pass.
-            expected_message.body['update'] = self.obj.__json__()
+            expected_message.body['update'] = type(expected_message).from_dict(
+                {'update': self.obj}).body['update']
             self.db.commit()
 
         # The request should have gotten switched to testing.
@@ -4690,6 +4830,184 @@ class TestUpdate(ModelTest):
         new_update.obsolete_older_updates(self.db)
         assert new_update.notes == 'b' * 101
 
+    def _create_obsoletion_scenario(self, prefix, bug_offset):
+        """
+        Create an update and older updates of the same packages in various states.
+
+        The packages, users and bugs are named after prefix and bug_offset, so that the scenario
+        can be created several times in the same database.
+
+        Returns:
+            tuple: The new update, and a dictionary mapping labels to the older updates.
+        """
+        release = self.db.query(model.Release).filter_by(name='F11').one()
+        lmacken = self.db.query(model.User).filter_by(name='lmacken').one()
+        other = model.User(name=f'{prefix}-other')
+        packages = {name: model.RpmPackage(name=f'{prefix}-{name}') for name in 'abcd'}
+
+        def create(label, nvrs, user=lmacken, bugs=(), **kwargs):
+            attrs = self.attrs.copy()
+            attrs.update(
+                builds=[model.RpmBuild(nvr=f'{prefix}-{nvr}.fc11', package=packages[nvr[0]],
+                                       release=release)
+                        for nvr in nvrs],
+                bugs=[model.Bug(bug_id=bug_offset + bug_id, security=security)
+                      for bug_id, security in bugs],
+                release=release, user=user, status=UpdateStatus.testing, request=None,
+                notes=label)
+            attrs.update(kwargs)
+            update = model.Update(**attrs)
+            self.db.add(update)
+            return update
+
+        olds = {
+            # Obsoleted, and the new update becomes a security update.
+            'obsoleted-security': create(
+                'obsoleted-security', ['a-1.0-1', 'b-1.0-1'], user=other, bugs=[(1, True)],
+                type=UpdateType.security, severity=UpdateSeverity.high),
+            # Newer than the new update.
+            'newer': create('newer', ['c-3.0-1'], user=other),
+            # Contains a package that is not in the new update.
+            'incomplete': create('incomplete', ['b-0.5-1', 'd-1.0-1'], user=other),
+            # Requested for stable while the new update is not.
+            'stable': create('stable', ['a-1.5-1'], status=UpdateStatus.pending,
+                             request=UpdateRequest.stable),
+            'locked': create('locked', ['c-0.1-1'], locked=True),
+            'obsoleted': create('obsoleted', ['c-1.0-1'], bugs=[(2, False)],
+                                type=UpdateType.bugfix),
+        }
+        new = create('These notes are new.', ['a-2.0-1', 'b-2.0-1', 'c-2.0-1'], bugs=[(3, False)],
+                     type=UpdateType.bugfix, severity=UpdateSeverity.unspecified,
+                     status=UpdateStatus.pending, request=UpdateRequest.testing)
+        self.db.flush()
+        return new, olds
+
+    def _obsoletion_results(self, prefix, bug_offset, new, olds, caveats):
+        """
+        Return what obsoleting the scenario changed, without the prefix, offset and aliases.
+
+        The caveats and comments are kept in order, as the updates must be obsoleted and commented
+        on in the same order.
+        """
+        def normalize(text):
+            text = text.replace(new.alias, 'new')
+            for label, update in olds.items():
+                text = text.replace(update.alias, label)
+            return text.replace(f'{prefix}-', '')
+
+        return {
+            'caveats': [normalize(caveat['description']) for caveat in caveats],
+            'type': new.type,
+            'severity': new.severity,
+            'notes': new.notes,
+            'bugs': sorted(bug.bug_id - bug_offset for bug in new.bugs),
+            'comments': [normalize(comment.text) for comment in new.comments],
+            'olds': {
+                label: (update.status, update.request,
+                        [normalize(comment.text) for comment in update.comments])
+                for label, update in olds.items()},
+        }
+
+    @mock.patch('bodhi.server.models.mail')
+    def test_obsolete_older_updates_same_as_per_build(self, mail):
+        """Assert the batched obsoletion gives the same results as obsoleting build per build."""
+        new, olds = self._create_obsoletion_scenario('reference', 1000)
+        caveats = _obsolete_older_updates_reference(new, self.db)
+        expected = self._obsoletion_results('reference', 1000, new, olds, caveats)
+
+        new, olds = self._create_obsoletion_scenario('batched', 2000)
+        caveats = new.obsolete_older_updates(self.db)
+
+        assert self._obsoletion_results('batched', 2000, new, olds, caveats) == expected
+        assert expected['type'] == UpdateType.security
+        assert expected['severity'] == UpdateSeverity.high
+        assert expected['bugs'] == [1, 2, 3]
+        assert expected['notes'] == (
+            'These notes are new.\n\n----\n\nobsoleted-security\n\n----\n\nobsoleted')
+        assert {label for label, (status, _, _) in expected['olds'].items()
+                if status == UpdateStatus.obsolete} == {'obsoleted-security', 'obsoleted'}
+        assert len(expected['caveats']) == 6
+
+    @mock.patch('bodhi.server.buildsys.DevBuildsys.getLatestBuilds', autospec=True,
+                side_effect=buildsys.multicall_enabled(
+                    lambda self, *args, **kwargs: [
+                        {'creation_time': '2007-08-25 19:38:29.422344'}]))
+    def test_find_conflicting_builds(self, getLatestBuilds):
+        """Assert builds older than the latest build in the stable tag are conflicting."""
+        assert self.obj.find_conflicting_builds() == ['TurboGears-1.0.8-3.fc11']
+        assert not self.obj.builds[0].is_latest()
+        getLatestBuilds.assert_called_with(
+            mock.ANY, 'dist-f11-updates', package='TurboGears')
+
+    def test_find_conflicting_builds_none(self):
+        """Assert builds as recent as the latest build in the stable tag are not conflicting."""
+        assert self.obj.find_conflicting_builds() == []
+        assert self.obj.builds[0].is_latest()
+
+    def test_find_conflicting_builds_known(self):
+        """Assert the given NVRs are used rather than asking Koji."""
+        with mock.patch.object(model.Build, 'find_not_latest') as find_not_latest:
+            conflicts = self.obj.find_conflicting_builds({'TurboGears-1.0.8-3.fc11', 'other-1-1'})
+
+        assert conflicts == ['TurboGears-1.0.8-3.fc11']
+        find_not_latest.assert_not_called()
+
+    def test_find_not_latest_single_multicall(self):
+        """Assert the builds of several updates are checked with a single Koji multicall."""
+        other = self.get_update(name='TurboGears-1.0.9-1.fc11')
+        other.builds.append(model.RpmBuild(
+            nvr='python-1.0-1.fc11', package=model.RpmPackage(name='python'),
+            release=other.release))
+        self.db.add(other)
+        self.db.flush()
+        builds = self.obj.builds + other.builds
+        # Forget the Koji info cached when the updates were created.
+        for build in builds:
+            vars(build).pop('_kojiinfo', None)
+        DevBuildsys = buildsys.DevBuildsys
+
+        with mock.patch.object(DevBuildsys, 'multiCall', autospec=True,
+                               side_effect=DevBuildsys.multiCall) as multiCall:
+            with mock.patch.object(DevBuildsys, 'getBuild', autospec=True,
+                                   side_effect=DevBuildsys.getBuild) as getBuild:
+                assert model.Build.find_not_latest(builds) == set()
+                # The Koji info is cached on the builds.
+                assert model.Build.find_not_latest(builds) == set()
+
+        assert multiCall.call_count == 2
+        # DevBuildsys.getLatestBuilds() calls getBuild() without arguments.
+        nvrs = [c[0][1] for c in getBuild.call_args_list if len(c[0]) > 1]
+        assert sorted(nvrs) == sorted(b.nvr for b in builds)
+
+    def test_find_not_latest_no_builds(self):
+        """Assert Koji is not called when there are no builds to check."""
+        with mock.patch('bodhi.server.models.buildsys.get_session') as get_session:
+            assert model.Build.find_not_latest([]) == set()
+
+        get_session.assert_not_called()
+
+    @mock.patch('bodhi.server.buildsys.DevBuildsys.multiCall', return_value=[
+        {'faultCode': 1000, 'faultString': 'No such tagInfo'}, [{}]])
+    def test_find_not_latest_koji_error(self, multiCall):
+        """Assert an error returned by Koji is raised."""
+        vars(self.obj.builds[0]).pop('_kojiinfo', None)
+        with pytest.raises(BodhiException) as exc:
+            model.Build.find_not_latest(self.obj.builds)
+
+        assert str(exc.value) == (
+            "Unexpected data returned by Koji for getLatestBuilds('dist-f11-updates', "
+            "package='TurboGears'): {'faultCode': 1000, 'faultString': 'No such tagInfo'}")
+
+    @mock.patch('bodhi.server.buildsys.DevBuildsys.multiCall', return_value=[[[]], [None]])
+    def test_find_not_latest_unknown_build(self, multiCall):
+        """Assert a build unknown to Koji is an unexpected result."""
+        vars(self.obj.builds[0]).pop('_kojiinfo', None)
+        with pytest.raises(BodhiException) as exc:
+            model.Build.find_not_latest(self.obj.builds)
+
+        assert str(exc.value) == (
+            "Unexpected data returned by Koji for getBuild('TurboGears-1.0.8-3.fc11'): [None]")
+
     def test_update__str__(self):
         """
         Test the __str__ representation of the Update.
@@ -4761,6 +5079,76 @@ class TestBuildrootOverride(ModelTest):
         error.assert_called_once_with(f"Unable to untag override {bro.nvr} "
                                       f"from {bro.build.release.override_tag}: 'oh no!'")
 
+    def _create_overrides(self, count):
+        """Create count more overrides of the F11 release, and return all of its overrides."""
+        release = model.Release.query.one()
+        package = model.RpmPackage.query.one()
+        user = model.User.query.one()
+        for i in range(count):
+            build = model.RpmBuild(nvr=f'TurboGears-2.0.{i}-1.fc11', package=package,
+                                   release=release)
+            self.db.add(model.BuildrootOverride(
+                build=build, submitter=user, notes='blah',
+                expiration_date=datetime.now(timezone.utc)))
+        self.db.flush()
+        return model.BuildrootOverride.query.order_by(model.BuildrootOverride.build_id).all()
+
+    @mock.patch.dict(config, {'expire_overrides_batch_size': 2})
+    @mock.patch('bodhi.server.models.notifications.publish')
+    def test_expire_all(self, publish):
+        """expire_all() untags the builds with chunked multicalls and expires all overrides."""
+        overrides = self._create_overrides(2)
+        overrides[0].expired_date = expired_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        koji = buildsys.DevBuildsys
+
+        with mock.patch.object(koji, 'multiCall', autospec=True,
+                               side_effect=koji.multiCall) as multiCall:
+            failures = model.BuildrootOverride.expire_all(self.db, overrides)
+
+        assert failures == {}
+        assert multiCall.call_count == 1
+        assert koji.__untag__ == [('dist-f11-override', 'TurboGears-2.0.0-1.fc11'),
+                                  ('dist-f11-override', 'TurboGears-2.0.1-1.fc11')]
+        assert overrides[0].expired_date == expired_date
+        for override in overrides[1:]:
+            self.db.refresh(override)
+            assert override.expired_date is not None
+        assert [c[0][0].body['override']['nvr'] for c in publish.call_args_list] == [
+            'TurboGears-2.0.0-1.fc11', 'TurboGears-2.0.1-1.fc11']
+
+    @mock.patch.dict(config, {'expire_overrides_batch_size': 2})
+    @mock.patch('bodhi.server.models.buildsys.get_session')
+    @mock.patch('bodhi.server.models.log.error')
+    def test_expire_all_failures(self, error, get_session):
+        """Overrides that could not be untagged are reported, and expired anyway."""
+        overrides = self._create_overrides(2)
+        get_session.return_value.multiCall.side_effect = [
+            [[None], {'faultCode': 1000, 'faultString': 'not tagged'}], IOError('oh no!')]
+
+        failures = model.BuildrootOverride.expire_all(self.db, overrides)
+
+        assert failures == {
+            'TurboGears-2.0.0-1.fc11': [
+                "Unable to untag override TurboGears-2.0.0-1.fc11 from dist-f11-override: "
+                "'not tagged'"],
+            'TurboGears-2.0.1-1.fc11': [
+                "Unable to untag override TurboGears-2.0.1-1.fc11 from dist-f11-override: "
+                "'oh no!'"]}
+        assert error.call_count == 2
+        assert get_session.return_value.untagBuild.call_count == 3
+        for override in overrides:
+            assert override.expired_date is not None
+
+    @mock.patch('bodhi.server.models.buildsys.get_session')
+    def test_expire_all_nothing_to_expire(self, get_session):
+        """expire_all() does not call Koji when there is nothing to expire."""
+        bro = model.BuildrootOverride.query.one()
+        bro.expired_date = datetime.now(timezone.utc)
+
+        assert model.BuildrootOverride.expire_all(self.db, [bro]) == {}
+
+        get_session.assert_not_called()
+
     def test_new_already_exists(self):
         """new() should put an error on the request if the BRO already exists."""
         req = DummyRequest(user=DummyUser())
@@ -17,15 +17,31 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """This test module contains tests for bodhi.server.notifications."""
 
+from datetime import datetime, timedelta, timezone
 from unittest import mock
 
-from fedora_messaging import api, testing as fml_testing, exceptions as fml_exceptions
+from fedora_messaging import (
+    api, testing as fml_testing, exceptions as fml_exceptions, message as fml_message)
+from prometheus_client import REGISTRY
+from sqlalchemy.orm import Query
+from twisted.internet import defer
+import crochet
 
 from bodhi.messages.schemas import compose as compose_schemas
-from bodhi.server import notifications, Session
+from bodhi.server import config, notifications, Session
+from bodhi.server.models import OutboxMessage
 from . import base
 
 
+def _message(repo='f30'):
+    return compose_schemas.ComposeSyncWaitV1.from_dict({'agent': 'double O seven', 'repo': repo})
+
+
+def _published(result):
+    return REGISTRY.get_sample_value(
+        'bodhi_publisher_messages_total', {'result': result}) or 0
+
+
 class TestPublish(base.BasePyTestCase):
     """Tests for :func:`bodhi.server.notifications.publish`."""
 
@@ -63,6 +79,34 @@ class TestPublish(base.BasePyTestCase):
         msg = session.info['messages'][0]
         assert msg == message
 
+    @mock.patch('bodhi.server.notifications.get_publisher')
+    def test_publish_force_async(self, get_publisher):
+        """Assert forced messages are handed to the background publisher if there is one."""
+        message = _message()
+
+        with fml_testing.mock_sends():
+            notifications.publish(message, force=True)
+
+        get_publisher.return_value.submit.assert_called_once_with(message)
+
+    @mock.patch('bodhi.server.notifications.get_publisher')
+    def test_publish_outbox(self, get_publisher):
+        """Assert the messages are written in the outbox in the current transaction."""
+        get_publisher.return_value.outbox = True
+        get_publisher.return_value.name = 'publisher'
+        message = _message()
+
+        notifications.publish(message)
+
+        assert Session().info['messages'] == [message]
+        self.db.flush()
+        row = self.db.query(OutboxMessage).one()
+        assert row.message_id == message.id
+        assert fml_message.loads(row.body)[0].body == message.body
+        assert row.claimed_by == 'publisher'
+        assert row.claimed_at is not None
+        get_publisher.return_value.submit.assert_not_called()
+
 
 class TestSendMessagesAfterCommit(base.BasePyTestCase):
     """Tests for :func:`bodhi.server.notifications.send_messages_after_commit`."""
@@ -94,3 +138,311 @@ class TestSendMessagesAfterCommit(base.BasePyTestCase):
 
         mock_log.exception.assert_called_once_with(
             "An error occurred publishing %r after a database commit", message)
+
+    @mock.patch('bodhi.server.notifications.get_publisher')
+    def test_async(self, get_publisher):
+        """Assert the messages are handed to the background publisher if there is one."""
+        get_publisher.return_value.outbox = True
+        session = Session()
+        message = _message()
+        session.info['messages'] = [message]
+
+        with fml_testing.mock_sends():
+            notifications.send_messages_after_commit(session)
+
+        get_publisher.return_value.submit.assert_called_once_with(message, spooled=True)
+        assert session.info['messages'] == []
+
+
+class TestGetPublisher(base.BasePyTestCase):
+    """Tests for :func:`bodhi.server.notifications.get_publisher`."""
+
+    def test_disabled(self):
+        """Assert there is no publisher by default."""
+        assert notifications.get_publisher() is None
+
+    @mock.patch.dict(config.config, {'publisher.queue_size': 10, 'publisher.outbox': True})
+    @mock.patch('bodhi.server.notifications.atexit.register')
+    @mock.patch('bodhi.server.notifications.AsyncPublisher.start')
+    @mock.patch('bodhi.server.notifications._publisher', None)
+    def test_started_once_per_process(self, start, register):
+        """Assert each process starts its own publisher, once."""
+        publisher = notifications.get_publisher()
+
+        assert notifications.get_publisher() is publisher
+        assert publisher.outbox
+        assert publisher._queue.maxsize == 10
+        start.assert_called_once_with()
+        register.assert_called_once_with(publisher.close)
+
+        with mock.patch('bodhi.server.notifications.os.getpid', return_value=publisher.pid + 1):
+            assert notifications.get_publisher() is not publisher
+
+
+class TestAsyncPublisher(base.BasePyTestCase):
+    """Tests for :class:`bodhi.server.notifications.AsyncPublisher`."""
+
+    def _publisher(self, **kwargs):
+        publisher = notifications.AsyncPublisher(**{'queue_size': 10, 'batch_size': 2, **kwargs})
+        publisher.db_factory = base.TransactionalSessionMaker(self.Session)
+        return publisher
+
+    @mock.patch('bodhi.server.notifications._publish_all')
+    def test_submit(self, publish_all):
+        """Assert the messages are published in order by the background thread, in batches."""
+        messages = [_message(f'f{i}') for i in range(5)]
+        publish_all.side_effect = lambda batch: [None] * len(batch)
+        published = _published('published')
+        depth = REGISTRY.get_sample_value('bodhi_publisher_queue_depth')
+        publisher = self._publisher()
+
+        for message in messages:
+            publisher.submit(message)
+        publisher.start()
+        publisher.close()
+
+        assert publish_all.mock_calls == [
+            mock.call(messages[:2]), mock.call(messages[2:4]), mock.call(messages[4:])]
+        assert _published('published') == published + 5
+        assert REGISTRY.get_sample_value('bodhi_publisher_queue_depth') == depth
+
+    @mock.patch('bodhi.server.notifications._log')
+    def test_queue_full(self, log):
+        """Assert the messages that don't fit in the queue are dropped, or left in the outbox."""
+        dropped = _published('dropped')
+        deferred = _published('deferred')
+        publisher = self._publisher(queue_size=1)
+        message = _message()
+
+        publisher.submit(_message())
+        publisher.submit(message)
+        publisher.submit(message, spooled=True)
+
+        assert _published('dropped') == dropped + 1
+        assert _published('deferred') == deferred + 1
+        log.error.assert_called_once_with('The publisher queue is full, dropping %r', message)
+        log.warning.assert_called_once_with(
+            'The publisher queue is full, %r will be published from the outbox', message.id)
+
+    def test_closed(self):
+        """Assert the messages submitted while exiting are published synchronously."""
+        publisher = self._publisher()
+        publisher.close()
+        message = _message()
+
+        with fml_testing.mock_sends(message):
+            publisher.submit(message)
+
+    def _spool(self, message, claimed_by=None, claimed_at=None):
+        self.db.add(OutboxMessage(message_id=message.id, body=fml_message.dumps(message),
+                                  claimed_by=claimed_by, claimed_at=claimed_at))
+
+    @mock.patch('bodhi.server.notifications._publish_all')
+    @mock.patch('bodhi.server.notifications._log')
+    def test_publish_batch(self, log, publish_all):
+        """Assert the published messages are deleted from the outbox, and the failed released."""
+        publisher = self._publisher(outbox=True)
+        messages = [_message('f30'), _message('f31'), _message('f32')]
+        for message in messages:
+            self._spool(message, publisher.name, datetime.now(timezone.utc))
+        self.db.commit()
+        error = fml_exceptions.ConnectionException(reason='down')
+        publish_all.return_value = [None, error, None]
+        failed = _published('failed')
+
+        publisher._publish_batch([(m, True) for m in messages])
+
+        publish_all.assert_called_once_with(messages)
+        rows = self.db.query(OutboxMessage).all()
+        assert [(r.message_id, r.claimed_by, r.claimed_at) for r in rows] == [
+            (messages[1].id, None, None)]
+        assert _published('failed') == failed + 1
+        log.error.assert_called_once_with(
+            'An error occurred publishing %r', messages[1], exc_info=error)
+
+    @mock.patch('bodhi.server.notifications._publish_all')
+    def test_publish_batch_claimed_elsewhere(self, publish_all):
+        """Assert the messages another publisher claimed meanwhile are left to it."""
+        publisher = self._publisher(outbox=True)
+        mine, theirs = _message('f30'), _message('f31')
+        self._spool(mine, publisher.name, datetime.now(timezone.utc) - timedelta(hours=1))
+        self._spool(theirs, 'another', datetime.now(timezone.utc))
+        self.db.commit()
+        publisher._queued.update([mine.id, theirs.id])
+        publish_all.return_value = [None, None]
+        forced = _message('f32')
+
+        publisher._publish_batch([(mine, True), (theirs, True), (forced, False)])
+
+        publish_all.assert_called_once_with([mine, forced])
+        rows = self.db.query(OutboxMessage).all()
+        assert [(r.message_id, r.claimed_by) for r in rows] == [(theirs.id, 'another')]
+        assert publisher._queued == set()
+
+    @mock.patch('bodhi.server.notifications._publish_all')
+    @mock.patch('bodhi.server.notifications._log')
+    def test_recover(self, log, publish_all):
+        """Assert the unclaimed messages, and the ones whose claim expired, are published."""
+        publisher = self._publisher(outbox=True)
+        old = datetime.now(timezone.utc) - timedelta(hours=1)
+        released, expired, recent, queued = [_message(f'f{i}') for i in range(30, 34)]
+        self._spool(released)
+        self._spool(expired, 'another', old)
+        self._spool(recent, 'another', datetime.now(timezone.utc))
+        self._spool(queued, publisher.name, old)
+        self.db.add(OutboxMessage(message_id='invalid', body='not a message'))
+        self.db.commit()
+        publisher._queued.add(queued.id)
+        publish_all.side_effect = lambda batch: [None] * len(batch)
+        recovered = _published('recovered')
+
+        publisher.batch_size = 10
+        publisher._recover()
+
+        assert publish_all.call_count == 1
+        assert [m.id for m in publish_all.call_args[0][0]] == [released.id, expired.id]
+        assert [r.message_id for r in self.db.query(OutboxMessage).order_by(OutboxMessage.id)] == [
+            recent.id, queued.id]
+        assert _published('recovered') == recovered + 2
+        log.exception.assert_called_once_with(
+            'Dropping the invalid message %s from the outbox', 'invalid')
+
+    @mock.patch('bodhi.server.notifications._publish_all')
+    def test_recover_claimed_meanwhile(self, publish_all):
+        """Assert the messages another publisher claimed after they were listed are skipped."""
+        publisher = self._publisher(outbox=True)
+        message = _message()
+        self._spool(message)
+        self.db.commit()
+        update = Query.update
+
+        def claim(query, values, **kwargs):
+            if values.get('claimed_by') == publisher.name:
+                # Another publisher claims the message between the listing and the claim.
+                self.db.execute(OutboxMessage.__table__.update().values(
+                    claimed_by='another', claimed_at=datetime.now(timezone.utc)))
+            return update(query, values, **kwargs)
+
+        with mock.patch.object(Query, 'update', claim):
+            publisher._recover()
+
+        publish_all.assert_not_called()
+        assert self.db.query(OutboxMessage).one().claimed_by == 'another'
+
+    @mock.patch('bodhi.server.notifications._publish_all')
+    def test_recover_broker_down(self, publish_all):
+        """Assert the messages stay in the outbox, unclaimed, while the broker is unavailable."""
+        message = _message()
+        self._spool(message)
+        self.db.commit()
+        publish_all.return_value = [fml_exceptions.PublishTimeout(reason='down')]
+
+        self._publisher(outbox=True)._recover()
+
+        row = self.db.query(OutboxMessage).one()
+        assert (row.claimed_by, row.claimed_at) == (None, None)
+
+
+class TestPublishAll:
+    """Tests for :func:`bodhi.server.notifications._publish_all`."""
+
+    def _twisted_publish_all(self, twisted_publish_all, *errors):
+        """Make the reactor publish the messages with the given errors, and return its result."""
+        result = mock.Mock()
+
+        def publish_all(messages, published):
+            published.extend(errors)
+            return result
+
+        twisted_publish_all.side_effect = publish_all
+        return result
+
+    @mock.patch('bodhi.server.notifications._twisted_publish_all')
+    @mock.patch('bodhi.server.notifications.api.publish')
+    def test_published(self, publish, twisted_publish_all):
+        """Assert the first message connects to the broker, and the others are published at once."""
+        messages = [_message('f30'), _message('f31'), _message('f32')]
+        result = self._twisted_publish_all(twisted_publish_all, None, None)
+
+        assert notifications._publish_all(messages) == [None, None, None]
+
+        publish.assert_called_once_with(messages[0], timeout=30)
+        assert twisted_publish_all.call_args[0][0] == messages[1:]
+        result.wait.assert_called_once_with(timeout=30)
+
+    @mock.patch('bodhi.server.notifications._twisted_publish_all')
+    @mock.patch('bodhi.server.notifications.api.publish')
+    def test_single(self, publish, twisted_publish_all):
+        """Assert a single message is only published with api.publish()."""
+        message = _message()
+
+        assert notifications._publish_all([message]) == [None]
+
+        publish.assert_called_once_with(message, timeout=30)
+        twisted_publish_all.assert_not_called()
+
+    @mock.patch('bodhi.server.notifications._twisted_publish_all')
+    @mock.patch('bodhi.server.notifications.api.publish')
+    def test_broker_unreachable(self, publish, twisted_publish_all):
+        """Assert the other messages fail at once if the first one timed out."""
+        error = fml_exceptions.PublishTimeout(reason='down')
+        publish.side_effect = error
+
+        assert notifications._publish_all([_message('f30'), _message('f31')]) == [error, error]
+
+        twisted_publish_all.assert_not_called()
+
+    @mock.patch('bodhi.server.notifications._twisted_publish_all')
+    @mock.patch('bodhi.server.notifications.api.publish')
+    def test_first_rejected(self, publish, twisted_publish_all):
+        """Assert the other messages are published if the broker rejected the first one."""
+        error = fml_exceptions.PublishReturned(reason='rejected')
+        publish.side_effect = error
+        self._twisted_publish_all(twisted_publish_all, None)
+
+        assert notifications._publish_all([_message('f30'), _message('f31')]) == [error, None]
+
+    @mock.patch('bodhi.server.notifications._twisted_publish_all')
+    @mock.patch('bodhi.server.notifications.api.publish')
+    def test_timeout(self, publish, twisted_publish_all):
+        """Assert the messages the broker didn't confirm in time failed."""
+        result = self._twisted_publish_all(twisted_publish_all, None)
+        result.wait.side_effect = crochet.TimeoutError()
+
+        errors = notifications._publish_all([_message('f30'), _message('f31'), _message('f32')])
+
+        assert errors[:2] == [None, None]
+        assert isinstance(errors[2], fml_exceptions.PublishTimeout)
+        result.cancel.assert_called_once_with()
+
+
+class TestTwistedPublishAll:
+    """Tests for :func:`bodhi.server.notifications._twisted_publish_all`."""
+
+    @mock.patch('bodhi.server.notifications.api.twisted_publish')
+    def test_errors(self, twisted_publish):
+        """Assert the messages are published in order, and their errors collected."""
+        messages = [_message('f30'), _message('f31'), _message('f32')]
+        error = fml_exceptions.PublishReturned(reason='rejected')
+        twisted_publish.side_effect = [defer.succeed(None), defer.fail(error), defer.succeed(None)]
+        errors = []
+
+        notifications._twisted_publish_all.__wrapped__(messages, errors)
+
+        assert twisted_publish.mock_calls == [mock.call(m) for m in messages]
+        assert errors == [None, error, None]
+
+    @mock.patch('bodhi.server.notifications.api.twisted_publish')
+    def test_cancelled(self, twisted_publish):
+        """Assert the messages are no longer published once the batch is cancelled."""
+        twisted_publish.return_value = defer.Deferred()
+        errors = []
+
+        result = notifications._twisted_publish_all.__wrapped__(
+            [_message('f30'), _message('f31')], errors)
+        result.cancel()
+
+        assert twisted_publish.call_count == 1
+        assert errors == []
+        assert isinstance(result.result.value, defer.CancelledError)
+        result.addErrback(lambda failure: None)
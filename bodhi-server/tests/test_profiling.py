@@ -0,0 +1,297 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.profiling module."""
+
+from unittest import mock
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from bodhi.server import profiling
+from bodhi.server.config import config
+
+
+def _request(headers=None, groups=('packager',)):
+    """Return a fake request to /updates/{id} with the given headers, by a user in the groups."""
+    request = mock.MagicMock(method='GET', path='/updates/FEDORA-2019-1a2b3c4d5e',
+                             headers=headers or {})
+    request.matched_route.pattern = '/updates/{id}'
+    request.identity.groups = [mock.MagicMock() for group in groups]
+    for group, name in zip(request.identity.groups, groups):
+        group.name = name
+    return request
+
+
+class TestSampler:
+    """Test the Sampler class."""
+
+    def test_sample(self):
+        """The stacks of the thread are counted, from the outermost frame."""
+        sampler = profiling.Sampler(threading.get_ident())
+
+        sampler.sample()
+        sampler.sample()
+
+        assert len(sampler.stacks) == 1
+        stack, count = sampler.stacks.most_common(1)[0]
+        assert count == 2
+        assert stack.split(';')[-1].startswith(f'sample ({profiling.__file__}:')
+        assert stack.split(';')[-2].startswith('test_sample (')
+
+    def test_sample_unknown_thread(self):
+        """Nothing is recorded for a thread that does not exist anymore."""
+        sampler = profiling.Sampler(-1)
+
+        sampler.sample()
+
+        assert sampler.stacks == {}
+
+    def test_enable_disable(self):
+        """The thread is sampled in the background until the sampler is disabled."""
+        sampler = profiling.Sampler(threading.get_ident(), interval=0.001)
+        event = threading.Event()
+
+        sampler.enable()
+        event.wait(0.05)
+        sampler.disable()
+
+        assert not sampler._thread.is_alive()
+        assert sum(sampler.stacks.values()) > 0
+
+    def test_dump_stats(self):
+        """The stacks are written in the collapsed format."""
+        sampler = profiling.Sampler(threading.get_ident())
+        sampler.stacks['main;handler'] = 1
+        sampler.stacks['main;handler;query'] = 3
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            sampler.dump_stats(os.path.join(tempdir, 'profile'))
+
+            with open(os.path.join(tempdir, 'profile')) as profile:
+                assert profile.read() == 'main;handler;query 3\nmain;handler 1\n'
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class TestStart:
+    """Test the start() and stop() functions."""
+
+    def test_pstats(self):
+        """cProfile is used by default, one profile at a time."""
+        profile = profiling.start()
+
+        try:
+            assert isinstance(profile, cProfile.Profile)
+            assert profiling.start() is None
+        finally:
+            profiling.stop(profile)
+
+        profile = profiling.start()
+        assert isinstance(profile, cProfile.Profile)
+        profiling.stop(profile)
+
+    @mock.patch.object(cProfile.Profile, 'enable',
+                       side_effect=ValueError('Another profiling tool is already active'))
+    @mock.patch('bodhi.server.profiling.log.info')
+    def test_other_profiler(self, info, enable):
+        """Nothing is profiled while another profiling tool is active."""
+        assert profiling.start() is None
+
+        info.assert_called_once_with('Not profiling: %s', enable.side_effect)
+        assert not profiling._cprofile_lock.locked()
+
+    @mock.patch.dict(config, {'profiling.format': 'collapsed'})
+    def test_collapsed(self):
+        """The stacks of the current thread are sampled for the collapsed format, concurrently."""
+        profiles = [profiling.start(), profiling.start()]
+
+        for profile in profiles:
+            assert isinstance(profile, profiling.Sampler)
+            assert profile.thread_id == threading.get_ident()
+            profiling.stop(profile)
+
+
+class TestSave:
+    """Test the save() function."""
+
+    def setup_method(self, method):
+        """Profile in a temporary directory."""
+        self.tempdir = tempfile.mkdtemp()
+        self.config = mock.patch.dict(config, {'profiling.directory': self.tempdir})
+        self.config.start()
+
+    def teardown_method(self, method):
+        """Remove the profiles."""
+        self.config.stop()
+        shutil.rmtree(self.tempdir)
+
+    def test_pstats(self):
+        """The cProfile profiles are written in the directory of their category."""
+        profile = cProfile.Profile()
+        profile.enable()
+        profile.disable()
+
+        path = profiling.save(profile, 'GET /updates/{id}')
+
+        assert os.path.dirname(path) == os.path.join(self.tempdir, 'GET_updates_id')
+        assert path.endswith(f'-{os.getpid()}.pstats')
+        pstats.Stats(path)
+
+    def test_collapsed(self):
+        """The sampled stacks are written with the collapsed extension, after their name."""
+        profile = profiling.Sampler(threading.get_ident())
+        profile.stacks['main'] = 1
+
+        path = profiling.save(profile, 'compose F17 testing', 'punging')
+
+        assert os.path.dirname(path) == os.path.join(self.tempdir, 'compose_F17_testing')
+        assert os.path.basename(path).startswith('punging-')
+        assert path.endswith('.collapsed')
+
+
+class TestShouldProfile:
+    """Test the _should_profile() function."""
+
+    def test_not_sampled(self):
+        """The requests are not profiled by default."""
+        assert not profiling._should_profile(_request())
+
+    @mock.patch.dict(config, {'profiling.sample_rate': 0.5})
+    @mock.patch('bodhi.server.profiling.random.random', mock.MagicMock(return_value=0.25))
+    def test_sampled(self):
+        """The requests in the sample are profiled."""
+        assert profiling._should_profile(_request())
+
+    @mock.patch.dict(config, {'profiling.sample_rate': 0.5})
+    @mock.patch('bodhi.server.profiling.random.random', mock.MagicMock(return_value=0.75))
+    def test_not_in_sample(self):
+        """The requests out of the sample are not profiled."""
+        assert not profiling._should_profile(_request())
+
+    def test_admin_header(self):
+        """The requests of the admins with the header are profiled."""
+        request = _request({profiling.HEADER: '1'}, ('packager', config['admin_groups'][0]))
+
+        assert profiling._should_profile(request)
+
+    def test_header_not_admin(self):
+        """The header is ignored for the users who are not admins."""
+        assert not profiling._should_profile(_request({profiling.HEADER: '1'}))
+
+    def test_header_anonymous(self):
+        """The header is ignored for the anonymous requests."""
+        request = _request({profiling.HEADER: '1'})
+        request.identity = None
+
+        assert not profiling._should_profile(request)
+
+
+class TestProfilingTweenFactory:
+    """Test the profiling_tween_factory() function."""
+
+    def setup_method(self, method):
+        """Profile all the requests in a temporary directory."""
+        self.tempdir = tempfile.mkdtemp()
+        self.config = mock.patch.dict(
+            config, {'profiling.directory': self.tempdir, 'profiling.sample_rate': 1.0})
+        self.config.start()
+        self.handler = mock.MagicMock(return_value='response')
+
+    def teardown_method(self, method):
+        """Remove the profiles."""
+        self.config.stop()
+        shutil.rmtree(self.tempdir)
+
+    def test_disabled(self):
+        """The handler is returned as is when profiling.directory is not set."""
+        with mock.patch.dict(config, {'profiling.directory': ''}):
+            tween = profiling.profiling_tween_factory(self.handler, mock.MagicMock())
+
+        assert tween is self.handler
+
+    def test_profiled(self):
+        """The sampled requests are profiled by route."""
+        tween = profiling.profiling_tween_factory(self.handler, mock.MagicMock())
+
+        assert tween(_request()) == 'response'
+        assert tween(_request()) == 'response'
+
+        assert len(os.listdir(os.path.join(self.tempdir, 'GET_updates_id'))) == 2
+
+    @mock.patch.dict(config, {'profiling.sample_rate': 0.0})
+    def test_not_profiled(self):
+        """The requests that are not sampled are not profiled."""
+        tween = profiling.profiling_tween_factory(self.handler, mock.MagicMock())
+
+        assert tween(_request()) == 'response'
+
+        assert os.listdir(self.tempdir) == []
+
+    def test_handler_error(self):
+        """The requests that fail are profiled too."""
+        self.handler.side_effect = ValueError()
+        tween = profiling.profiling_tween_factory(self.handler, mock.MagicMock())
+
+        with pytest.raises(ValueError):
+            tween(_request())
+
+        assert len(os.listdir(os.path.join(self.tempdir, 'GET_updates_id'))) == 1
+
+    @pytest.mark.parametrize('format, profiled', (('pstats', 1), ('collapsed', 2)))
+    def test_concurrent(self, format, profiled):
+        """Concurrent requests are only profiled by cProfile one at a time."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def handle(request):
+            if not started.is_set():
+                started.set()
+                release.wait(timeout=10)
+            return 'response'
+
+        tween = profiling.profiling_tween_factory(handle, mock.MagicMock())
+        responses = []
+        thread = threading.Thread(target=lambda: responses.append(tween(_request())))
+
+        with mock.patch.dict(config, {'profiling.format': format}):
+            thread.start()
+            started.wait(timeout=10)
+            responses.append(tween(_request()))
+            release.set()
+            thread.join(timeout=10)
+
+        assert responses == ['response', 'response']
+        assert len(os.listdir(os.path.join(self.tempdir, 'GET_updates_id'))) == profiled
+        assert not profiling._cprofile_lock.locked()
+
+    @mock.patch('bodhi.server.profiling.log.exception')
+    @mock.patch('bodhi.server.profiling.save', mock.MagicMock(side_effect=OSError()))
+    def test_save_error(self, exception):
+        """The response is returned when the profile cannot be saved."""
+        tween = profiling.profiling_tween_factory(self.handler, mock.MagicMock())
+
+        assert tween(_request()) == 'response'
+
+        exception.assert_called_once_with('Unable to save the profile of %s %s', 'GET',
+                                          '/updates/FEDORA-2019-1a2b3c4d5e')
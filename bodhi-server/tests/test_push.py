@@ -508,7 +508,8 @@ class TestPush(base.BasePyTestCase):
                 compose_task.delay.assert_called_with(
                     api_version=2, agent="bowlofeggs", resume=False,
                     composes=[{'security': False, 'release_id': ejabberd.release.id,
-                               'request': u'testing', 'content_type': u'rpm'}],
+                               'request': u'testing', 'content_type': u'rpm',
+                               'estimated_duration': None}],
                 )
 
         assert result.exit_code == 0
@@ -606,7 +607,7 @@ class TestPush(base.BasePyTestCase):
         assert compose_call["api_version"] == 2
         assert compose_call["composes"] == \
             [{'security': False, 'release_id': ejabberd.release.id,
-              'request': 'testing', 'content_type': 'rpm'}]
+              'request': 'testing', 'content_type': 'rpm', 'estimated_duration': None}]
         assert not compose_call['resume']
         assert compose_call['agent'] == 'bowlofeggs'
         assert result.output == TEST_BUILDS_FLAG_EXPECTED_OUTPUT
@@ -722,7 +723,8 @@ class TestPush(base.BasePyTestCase):
                 compose_task.delay.assert_called_with(
                     api_version=2, agent="bowlofeggs", resume=False,
                     composes=[{'security': False, 'release_id': 1,
-                               'request': u'testing', 'content_type': u'rpm'}],
+                               'request': u'testing', 'content_type': u'rpm',
+                               'estimated_duration': None}],
                 )
 
         assert result.exit_code == 0
@@ -763,7 +765,8 @@ class TestPush(base.BasePyTestCase):
                 compose_task.delay.assert_called_with(
                     api_version=2, agent="bowlofeggs", resume=True,
                     composes=[{'security': False, 'release_id': 1,
-                               'request': u'testing', 'content_type': u'rpm'}],
+                               'request': u'testing', 'content_type': u'rpm',
+                               'estimated_duration': None}],
                 )
 
         assert result.exit_code == 0
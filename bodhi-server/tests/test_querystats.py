@@ -0,0 +1,186 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.querystats module."""
+
+from unittest import mock
+
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+import pytest
+
+from bodhi.server import models, querystats, tasks
+from bodhi.server.config import config
+
+from . import base
+from .utils import assert_max_queries
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestTrack(base.BasePyTestCase):
+    """Test the track() function."""
+
+    def test_statements(self):
+        """The statements executed in the block are counted and timed."""
+        self.db.execute(text('SELECT 1'))
+
+        with querystats.track('test') as stats:
+            for i in range(3):
+                self.db.execute(text('SELECT :i'), {'i': i})
+            self.db.execute(text('SELECT 2'))
+
+        self.db.execute(text('SELECT 1'))
+        assert stats.name == 'test'
+        assert stats.count == 4
+        assert stats.duration > 0
+        assert stats.statements == {'SELECT ?': 3, 'SELECT 2': 1}
+
+    def test_nested(self):
+        """The statements are recorded by all the enclosing blocks."""
+        self.db.execute(text('SELECT 0'))
+
+        with querystats.track('outer') as outer:
+            self.db.execute(text('SELECT 1'))
+            with querystats.track('inner') as inner:
+                self.db.execute(text('SELECT 2'))
+            self.db.execute(text('SELECT 3'))
+
+        assert outer.count == 3
+        assert inner.count == 1
+        assert inner.statements == {'SELECT 2': 1}
+
+    @mock.patch.dict(config, {'querystats.repeat_threshold': 3})
+    def test_repeated(self, caplog):
+        """The statements executed at least querystats.repeat_threshold times are logged."""
+        with querystats.track('GET /updates/'):
+            for i in range(3):
+                self.db.execute(text('SELECT :i'), {'i': i})
+            self.db.execute(text('SELECT 1'))
+            self.db.execute(text('SELECT 1'))
+
+        assert caplog.messages == [
+            'GET /updates/ executed the same SQL statement 3 times, it may be lazy loading a '
+            'relationship in a loop: SELECT ?']
+
+    @mock.patch.dict(config, {'querystats.repeat_threshold': 0})
+    def test_repeated_disabled(self, caplog):
+        """No statement is logged if querystats.repeat_threshold is 0."""
+        with querystats.track('test'):
+            for i in range(3):
+                self.db.execute(text('SELECT 1'))
+
+        assert caplog.messages == []
+
+
+class TestSlowStatements(base.BasePyTestCase):
+    """Test the logging of the slow statements."""
+
+    @mock.patch.dict(config, {'querystats.slow_threshold': 1e-9})
+    def test_call_site(self, caplog):
+        """The slow statements are logged with the Bodhi code that executed them."""
+        self.db.execute(text('SELECT 0'))
+        caplog.clear()
+
+        models.Release.get('F17')
+
+        assert len(caplog.messages) == 1
+        assert caplog.messages[0].startswith('Slow SQL statement (')
+        assert 's) executed from bodhi/server/models.py:' in caplog.messages[0]
+        assert ' in get: SELECT ' in caplog.messages[0]
+
+    @mock.patch.dict(config, {'querystats.slow_threshold': 1e-9})
+    def test_unknown_call_site(self, caplog):
+        """The call site is unknown if the statement wasn't executed by Bodhi."""
+        self.db.execute(text('SELECT 0'))
+        caplog.clear()
+
+        self.db.execute(text('SELECT 1'))
+
+        assert len(caplog.messages) == 1
+        assert caplog.messages[0].startswith('Slow SQL statement (')
+        assert caplog.messages[0].endswith('s) executed from unknown: SELECT 1')
+
+    @mock.patch.dict(config, {'querystats.slow_threshold': 0})
+    def test_disabled(self, caplog):
+        """No statement is logged if querystats.slow_threshold is 0."""
+        models.Release.get('F17')
+
+        assert caplog.messages == []
+
+    def test_failed_statement(self):
+        """The failed statements are not recorded."""
+        connection = self.db.connection()
+
+        with querystats.track('test') as stats:
+            with pytest.raises(Exception):
+                with connection.begin_nested():
+                    connection.execute(text('SELECT * FROM nope'))
+
+        assert not connection.info.get('querystats_start')
+        assert stats.count == 2
+        assert 'SELECT * FROM nope' not in stats.statements
+
+
+class TestRequests(base.BasePyTestCase):
+    """Test the tracking of the web requests."""
+
+    def test_metrics(self):
+        """The statements of the requests are exported by route."""
+        labels = {'method': 'GET', 'path_info_pattern': '/updates/{id}'}
+        count = _sample('pyramid_request_sql_queries_count', labels)
+        queries = _sample('pyramid_request_sql_queries_sum', labels)
+        alias = models.Update.query.one().alias
+
+        with assert_max_queries(20) as stats:
+            self.app.get(f'/updates/{alias}', headers={'Accept': 'application/json'})
+
+        assert _sample('pyramid_request_sql_queries_count', labels) == count + 1
+        # The transaction is committed once the response was returned by the tween.
+        assert queries < _sample('pyramid_request_sql_queries_sum', labels) <= queries + stats.count
+        assert _sample('pyramid_request_sql_duration_seconds_count', labels) == count + 1
+
+
+class TestTasks:
+    """Test the tracking of the Celery tasks."""
+
+    def test_metrics(self):
+        """The statements of the tasks are exported by task name."""
+        task = mock.Mock()
+        task.name = 'check_policies'
+        labels = {'task': 'check_policies'}
+        count = _sample('bodhi_task_sql_queries_count', labels)
+
+        tasks._track_task_queries(task_id='abc', task=task)
+        stats = tasks._task_stats['abc'][1]
+        stats.record('SELECT 1', 0.5)
+        tasks._observe_task_queries(task_id='abc', task=task)
+
+        assert 'abc' not in tasks._task_stats
+        assert _sample('bodhi_task_sql_queries_count', labels) == count + 1
+        assert _sample('bodhi_task_sql_duration_seconds_sum', labels) >= 0.5
+
+    def test_unknown_task(self):
+        """Nothing is exported for the tasks that weren't tracked."""
+        task = mock.Mock()
+        task.name = 'unknown'
+
+        tasks._observe_task_queries(task_id='unknown', task=task)
+
+        assert _sample('bodhi_task_sql_queries_count', {'task': 'unknown'}) == 0
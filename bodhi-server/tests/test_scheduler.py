@@ -0,0 +1,208 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.scheduler module."""
+from datetime import datetime, timedelta, timezone
+import random
+import threading
+from unittest import mock
+
+from bodhi.server import scheduler
+from bodhi.server.config import config
+
+
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _job(key, duration, security=False, stable=False):
+    return scheduler.Job(key=key, security=security, stable=stable, estimated_duration=duration)
+
+
+def _compose(release_id, request, duration, security=False):
+    return {'release_id': release_id, 'request': request, 'security': security,
+            'content_type': 'rpm', 'estimated_duration': duration}
+
+
+class TestJob:
+    """Test the Job class."""
+
+    def test_from_dict(self):
+        """The job is built from the composer JSON of a compose."""
+        job = scheduler.Job.from_dict(_compose(1, 'stable', 120, security=True))
+
+        assert job.key == (1, 'stable')
+        assert job.security
+        assert job.stable
+        assert job.estimated_duration == 120
+
+    @mock.patch.dict(config, {'compose_scheduler.default_duration': 42})
+    def test_from_dict_no_estimate(self):
+        """The default duration is used for the composes that have no estimate."""
+        job = scheduler.Job.from_dict({'release_id': 1, 'request': 'testing'})
+
+        assert not job.security
+        assert not job.stable
+        assert job.estimated_duration == 42
+
+
+class TestPriority:
+    """Test the priority() function."""
+
+    def test_order(self):
+        """Security composes go first, then stable composes, then the shortest ones."""
+        jobs = [_job('testing-short', 10), _job('testing-long', 100),
+                _job('stable', 1000, stable=True), _job('security', 5000, security=True)]
+
+        assert [j.key for j in sorted(jobs, key=scheduler.priority)] == \
+            ['security', 'stable', 'testing-short', 'testing-long']
+
+
+class TestNextJob:
+    """Test the next_job() function."""
+
+    def test_nothing_queued(self):
+        """None is returned when there is nothing to run."""
+        assert scheduler.next_job([], [], 2) is None
+
+    def test_full(self):
+        """None is returned when as many jobs as allowed are running."""
+        assert scheduler.next_job([_job('a', 10)], [_job('b', 10), _job('c', 10)], 2) is None
+
+    @mock.patch.dict(config, {'compose_scheduler.io_bound': True})
+    def test_io_bound(self):
+        """The two longest jobs don't run at the same time."""
+        running = [_job('long', 1000)]
+        queued = [_job('longer', 2000, stable=True), _job('short', 10)]
+
+        assert scheduler.next_job(queued, running, 2).key == 'short'
+
+    @mock.patch.dict(config, {'compose_scheduler.io_bound': True})
+    def test_io_bound_all_fit(self):
+        """The two longest jobs run together when all the jobs can run at once."""
+        running = [_job('long', 1000)]
+        queued = [_job('longer', 2000, stable=True)]
+
+        assert scheduler.next_job(queued, running, 2).key == 'longer'
+        assert scheduler.next_job(queued, [], 2).key == 'longer'
+
+    @mock.patch.dict(config, {'compose_scheduler.io_bound': False})
+    def test_not_io_bound(self):
+        """The longest jobs can run together when io_bound is off."""
+        running = [_job('long', 1000)]
+        queued = [_job('longer', 2000, stable=True), _job('short', 10)]
+
+        assert scheduler.next_job(queued, running, 2).key == 'longer'
+
+
+class TestSimulate:
+    """Test the simulate() function."""
+
+    @mock.patch.dict(config, {'compose_scheduler.io_bound': True})
+    def test_synthetic_workload(self):
+        """A random workload runs with the expected constraints, and security goes first."""
+        rand = random.Random(1234)
+        jobs = [_job(i, rand.randint(300, 7200), security=rand.random() < 0.25,
+                     stable=rand.random() < 0.5)
+                for i in range(30)]
+        longest = {j.key for j in sorted(jobs, key=lambda j: j.estimated_duration)[-2:]}
+
+        schedule = scheduler.simulate(jobs, {}, 3, NOW)
+
+        assert sorted(j.key for j, _, _ in schedule) == list(range(30))
+        for job, start, end in schedule:
+            assert end - start == timedelta(seconds=job.estimated_duration)
+            overlapping = [k for k, s, e in schedule if s <= start < e]
+            assert len(overlapping) <= 3
+            # Once the remaining jobs all fit, the longest ones can run together.
+            remaining = [k for k, s, e in schedule if e > start]
+            if job.key in longest and len(remaining) > 3:
+                assert not longest & {k.key for k in overlapping} - {job.key}
+        # No other job starts before the security jobs, unless it's the io_bound rule that
+        # delays one of the longest.
+        starts = [job.security for job, _, _ in schedule
+                  if job.key not in longest]
+        assert starts == sorted(starts, reverse=True)
+
+        def mean_completion(s):
+            ends = [(e - NOW).total_seconds() for j, _, e in s if j.security]
+            return sum(ends) / len(ends)
+
+        with mock.patch.dict(config, {'compose_scheduler.io_bound': False}):
+            fifo = []
+            running = {}
+            now = NOW
+            for job in jobs:
+                if len(running) == 3:
+                    now = running.pop(min(running, key=running.get))
+                end = now + timedelta(seconds=job.estimated_duration)
+                running[job] = end
+                fifo.append((job, now, end))
+        assert mean_completion(schedule) < mean_completion(fifo)
+
+    @mock.patch.dict(config, {'compose_scheduler.io_bound': False})
+    def test_running(self):
+        """The queued jobs wait for the running ones, that can't be done in the past."""
+        running = {_job('late', 10): NOW - timedelta(seconds=60),
+                   _job('running', 10): NOW + timedelta(seconds=60)}
+
+        schedule = scheduler.simulate([_job('a', 30), _job('b', 30)], running, 2, NOW)
+
+        assert [(j.key, s, e) for j, s, e in schedule] == [
+            ('a', NOW, NOW + timedelta(seconds=30)),
+            ('b', NOW + timedelta(seconds=30), NOW + timedelta(seconds=60))]
+
+    def test_never_run(self):
+        """The jobs that can't run have no estimate."""
+        schedule = scheduler.simulate([_job('a', 30), _job('b', 30)], {}, 0, NOW)
+
+        assert [(j.key, s, e) for j, s, e in schedule] == [('a', None, None), ('b', None, None)]
+
+
+class TestComposeScheduler:
+    """Test the ComposeScheduler class."""
+
+    def test_order(self):
+        """The threads run the composes one after the other, by priority."""
+        composes = [_compose(1, 'testing', 10), _compose(2, 'testing', 1),
+                    _compose(1, 'stable', 100), _compose(2, 'stable', 1000, security=True)]
+        compose_scheduler = scheduler.ComposeScheduler(1)
+        for compose in composes:
+            compose_scheduler.add(compose)
+        order = []
+
+        def run(compose):
+            compose_scheduler.acquire(compose)
+            order.append(scheduler.job_key(compose))
+            compose_scheduler.release(compose)
+
+        threads = [threading.Thread(target=run, args=(c, )) for c in composes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert order == [(2, 'stable'), (1, 'stable'), (2, 'testing'), (1, 'testing')]
+
+    def test_acquire_not_added(self):
+        """Composes that were not added are queued when they ask to run."""
+        compose_scheduler = scheduler.ComposeScheduler(2)
+
+        compose_scheduler.acquire(_compose(1, 'testing', 10))
+
+        assert list(compose_scheduler._running) == [(1, 'testing')]
+        compose_scheduler.release(_compose(1, 'testing', 10))
+        assert not compose_scheduler._running
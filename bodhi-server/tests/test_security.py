@@ -23,6 +23,7 @@ from cornice import errors
 from pyramid import testing
 
 from bodhi.server import security
+from bodhi.server.config import config
 
 from . import base
 
@@ -199,6 +200,99 @@ class TestPackagerACLFactory(base.BasePyTestCase):
              (Allow, 'group:cool_guys', ALL_PERMISSIONS)] + [DENY_ALL])
 
 
+class TestBodhiSecurityPolicy(base.BasePyTestCase):
+    """Test the BodhiSecurityPolicy class."""
+
+    def setup_method(self, method):
+        super().setup_method(method)
+        security.identities.invalidate('guest')
+        self.policy = security.BodhiSecurityPolicy('secret', False, 'sha512', 3600, 3600, 'Lax')
+        self.request = testing.DummyRequest()
+        self.request.db = self.db
+        self.request.registry.settings = self.app_settings
+
+    def teardown_method(self, method):
+        security.identities.invalidate('guest')
+        super().teardown_method(method)
+
+    def test_load_identity_cached(self):
+        """The identity is loaded from the database once, and each request gets its own copy."""
+        with mock.patch.object(self.policy.helper, 'identify', return_value={'userid': 'guest'}):
+            identity = self.policy.load_identity(self.request)
+            identity.groups.append({'name': 'provenpackager'})
+            with mock.patch.object(self.request, 'db') as db:
+                cached_identity = self.policy.load_identity(self.request)
+
+        assert identity.name == 'guest'
+        assert cached_identity == {
+            'name': 'guest', 'email': None, 'groups': [{'name': 'packager'}],
+            'openid': 'guest.id.fedoraproject.org'}
+        assert cached_identity.groups[0].name == 'packager'
+        db.query.assert_not_called()
+
+    def test_load_identity_unknown_user(self):
+        """Unknown users have no identity, and aren't cached."""
+        with mock.patch.object(self.policy.helper, 'identify',
+                               return_value={'userid': 'bowlofeggs'}):
+            assert self.policy.load_identity(self.request) is None
+
+        assert security.identities.get('bowlofeggs') is None
+
+    def test_load_identity_unauthenticated(self):
+        """Requests without an authentication ticket have no identity."""
+        with mock.patch.object(self.policy.helper, 'identify', return_value=None):
+            assert self.policy.load_identity(self.request) is None
+
+
+class TestIdentityCache:
+    """Test the IdentityCache class."""
+
+    def test_ttl(self):
+        """The identities are forgotten after identity_cache.ttl seconds."""
+        cache = security.IdentityCache()
+
+        with mock.patch.dict(config, {'identity_cache.ttl': 30}):
+            with mock.patch('bodhi.server.security.time.monotonic', return_value=1000):
+                cache.set('guest', {'name': 'guest'})
+            with mock.patch('bodhi.server.security.time.monotonic', return_value=1029):
+                assert cache.get('guest') == {'name': 'guest'}
+            with mock.patch('bodhi.server.security.time.monotonic', return_value=1030):
+                assert cache.get('guest') is None
+
+        assert len(cache._identities) == 0
+
+    def test_disabled(self):
+        """Nothing is cached when identity_cache.ttl is 0."""
+        cache = security.IdentityCache()
+
+        with mock.patch.dict(config, {'identity_cache.ttl': 0}):
+            cache.set('guest', {'name': 'guest'})
+
+        assert cache.get('guest') is None
+
+    def test_max_size(self):
+        """The least recently used identities are forgotten first."""
+        cache = security.IdentityCache()
+
+        with mock.patch.dict(config, {'identity_cache.max_size': 2}):
+            cache.set('bowlofeggs', {'name': 'bowlofeggs'})
+            cache.set('guest', {'name': 'guest'})
+            cache.get('bowlofeggs')
+            cache.set('lmacken', {'name': 'lmacken'})
+
+        assert list(cache._identities) == ['bowlofeggs', 'lmacken']
+
+    def test_invalidate(self):
+        """Invalidated identities are loaded again."""
+        cache = security.IdentityCache()
+        cache.set('guest', {'name': 'guest'})
+
+        cache.invalidate('guest')
+        cache.invalidate('bowlofeggs')
+
+        assert cache.get('guest') is None
+
+
 class TestProtectedRequest:
     """Test the ProtectedRequest class."""
     def test___init__(self):
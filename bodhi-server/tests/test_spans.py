@@ -0,0 +1,162 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""This test suite contains tests for the bodhi.server.spans module."""
+
+from unittest import mock
+import re
+
+from prometheus_client import REGISTRY
+import pytest
+
+from bodhi.server import models, spans
+from bodhi.server.config import config
+
+from . import base
+
+
+class TestTimings:
+    """Test the Timings class."""
+
+    def test_add(self):
+        """The calls are added up by dependency."""
+        timings = spans.Timings()
+
+        timings.add('koji', 0.5)
+        timings.add('koji', 0.25, calls=2)
+        timings.add('bugzilla', 1)
+
+        assert timings.durations == {'koji': 0.75, 'bugzilla': 1}
+        assert timings.calls == {'koji': 3, 'bugzilla': 1}
+
+    def test_server_timing(self):
+        """The timings are formatted as a Server-Timing header, in milliseconds."""
+        timings = spans.Timings()
+        timings.add('koji', 0.5)
+        timings.add('koji', 0.25)
+        timings.add('bugzilla', 0.0123)
+
+        assert timings.server_timing() == (
+            'bugzilla;dur=12.3;desc="1 calls", koji;dur=750.0;desc="2 calls"')
+
+
+class TestSpan:
+    """Test the span() function and the timed() decorator."""
+
+    def test_not_collecting(self):
+        """The spans don't record anything outside of collect()."""
+        with spans.span('koji'):
+            pass
+
+        with spans.collect() as timings:
+            pass
+
+        assert timings.calls == {}
+
+    def test_nested(self):
+        """The spans nested in a span of the same dependency are not recorded."""
+        with spans.collect() as timings:
+            with spans.span('koji'):
+                with spans.span('koji'):
+                    pass
+                with spans.span('bugzilla'):
+                    pass
+            with spans.span('koji'):
+                pass
+
+        assert timings.calls == {'koji': 2, 'bugzilla': 1}
+
+    def test_exception(self):
+        """The spans are recorded when the call fails."""
+        with spans.collect() as timings:
+            with pytest.raises(ValueError):
+                with spans.span('koji'):
+                    raise ValueError()
+            with spans.span('koji'):
+                pass
+
+        assert timings.calls == {'koji': 2}
+
+    def test_collect_nested(self):
+        """The inner collect() gets the spans of its block."""
+        with spans.collect() as outer:
+            with spans.collect() as inner:
+                with spans.span('koji'):
+                    pass
+            with spans.span('bugzilla'):
+                pass
+
+        assert outer.calls == {'bugzilla': 1}
+        assert inner.calls == {'koji': 1}
+
+    def test_timed(self):
+        """The calls to the decorated functions are recorded."""
+        @spans.timed('pagure')
+        def call(value):
+            """Call Pagure."""
+            return value
+
+        with spans.collect() as timings:
+            assert call(42) == 42
+
+        assert call.__doc__ == 'Call Pagure.'
+        assert timings.calls == {'pagure': 1}
+
+
+class TestRequests(base.BasePyTestCase):
+    """Test the timings of the web requests."""
+
+    def _get_update(self):
+        """Get the update, while Greenwave is queried for its test results."""
+        with mock.patch('bodhi.server.util.http_session.post') as post:
+            post.return_value.status_code = 200
+            post.return_value.json.return_value = {'results': []}
+            return self.app.get(f'/updates/{self.update.alias}/get-test-results')
+
+    def setup_method(self, method):
+        """Find the update."""
+        super().setup_method(method)
+        self.update = self.db.query(models.Update).one()
+
+    def test_metrics(self):
+        """The time spent in each dependency is exported by route."""
+        labels = {'method': 'GET', 'path_info_pattern': '/updates/{id}/get-test-results',
+                  'dependency': 'greenwave'}
+        count = REGISTRY.get_sample_value(
+            'pyramid_request_dependency_duration_seconds_count', labels) or 0
+
+        self._get_update()
+
+        assert REGISTRY.get_sample_value(
+            'pyramid_request_dependency_duration_seconds_count', labels) == count + 1
+
+    def test_server_timing_disabled(self):
+        """There is no Server-Timing header by default."""
+        response = self._get_update()
+
+        assert 'Server-Timing' not in response.headers
+
+    def test_server_timing(self):
+        """The time spent in the database and the dependencies is in the Server-Timing header."""
+        # The config is reloaded before each test, while patching it would leave it unloaded.
+        config['server_timing'] = True
+
+        response = self._get_update()
+
+        assert re.fullmatch(
+            r'db;dur=\d+\.\d;desc="\d+ queries", greenwave;dur=\d+\.\d;desc="1 calls"',
+            response.headers['Server-Timing'])
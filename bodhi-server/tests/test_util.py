@@ -23,6 +23,8 @@ import os
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
 
 from webob.multidict import MultiDict
 import bleach
@@ -30,7 +32,7 @@ import createrepo_c
 import packaging
 import pytest
 
-from bodhi.server import models, util
+from bodhi.server import models, spans, util
 from bodhi.server.config import config
 from bodhi.server.exceptions import RepodataException
 from bodhi.server.models import ReleaseState, TestGatingStatus, Update
@@ -225,6 +227,19 @@ class TestCallAPI:
         assert get.mock_calls == [mock.call('url', timeout=60), mock.call('url', timeout=60)]
         sleep.assert_called_once_with(1)
 
+    @mock.patch('bodhi.server.util.http_session.post')
+    @mock.patch('bodhi.server.util.http_session.get')
+    def test_spans(self, get, post, sleep):
+        """Each request is recorded as a call to the service."""
+        get.return_value.status_code = post.return_value.status_code = 200
+
+        with spans.collect() as timings:
+            util.call_api('url', 'Greenwave', method='POST')
+            util.call_api('url', 'Pagure')
+            util.call_api('url', 'Pagure')
+
+        assert timings.calls == {'greenwave': 1, 'pagure': 2}
+
 
 class TestMemoized:
     """Test the memoized class."""
@@ -1586,3 +1601,64 @@ class TestGetCreaterepoConfig(base.BasePyTestCase):
         assert cr_config.zchunk is True
         mock_log.error.assert_any_call(f'Error reading {broken_config}.')
         mock_log.warning.assert_any_call('No createrepo_c config file found.')
+
+
+class TestWaitForPaths:
+    """Test the wait_for_paths() function."""
+
+    def setup_method(self, method):
+        self.tempdir = tempfile.mkdtemp()
+        self.paths = [os.path.join(self.tempdir, name) for name in ('a', 'b')]
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.tempdir)
+
+    def _create(self, path):
+        with open(path, 'w'):
+            pass
+
+    @mock.patch('bodhi.server.util._inotify_fd')
+    def test_all_exist(self, inotify_fd):
+        """Nothing is watched when all the paths exist."""
+        for path in self.paths:
+            self._create(path)
+        progress = mock.Mock()
+
+        assert util.wait_for_paths(self.paths, progress=progress) == []
+
+        inotify_fd.assert_not_called()
+        progress.assert_not_called()
+
+    def test_inotify(self):
+        """The wait is woken up as soon as the files appear."""
+        self._create(self.paths[0])
+        progress = mock.Mock()
+        timer = threading.Timer(0.1, self._create, (self.paths[1], ))
+        timer.start()
+        start = time.monotonic()
+
+        try:
+            assert util.wait_for_paths(self.paths, poll_interval=60, progress=progress) == []
+        finally:
+            timer.cancel()
+
+        assert time.monotonic() - start < 30
+        progress.assert_called_once_with([self.paths[1]])
+
+    @mock.patch('bodhi.server.util._inotify_fd', return_value=None)
+    @mock.patch('bodhi.server.util.time.sleep')
+    def test_polling(self, sleep, inotify_fd):
+        """The paths are polled when inotify is not available."""
+        sleep.side_effect = lambda interval: self._create(self.paths[len(sleep.mock_calls) - 1])
+        progress = mock.Mock()
+
+        assert util.wait_for_paths(self.paths, poll_interval=5, progress=progress) == []
+
+        assert sleep.mock_calls == [mock.call(5), mock.call(5)]
+        assert progress.mock_calls == [mock.call(self.paths), mock.call([self.paths[1]])]
+
+    def test_timeout(self):
+        """The missing paths are returned when the timeout expires."""
+        self._create(self.paths[0])
+
+        assert util.wait_for_paths(self.paths, timeout=0.1) == [self.paths[1]]
@@ -16,6 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """This module contains tests for bodhi.server.validators."""
+from collections import defaultdict
 from unittest import mock
 from datetime import date, datetime, timedelta, timezone
 
@@ -968,6 +969,84 @@ class TestValidateBuildsOrFromTagExist(BasePyTestCase):
         ]
 
 
+class TestPrefetchBuilds(BasePyTestCase):
+    """Test the prefetch_builds() function."""
+
+    def setup_method(self, method):
+        """Sets up the environment for each test method call."""
+        super().setup_method(method)
+
+        self.request = mock.Mock()
+        self.request.db = self.db
+        self.request.errors = Errors()
+        self.request.buildinfo = defaultdict(dict)
+        self.request.from_tag_inherited = ['f17-build']
+        self.request.koji = buildsys.get_session()
+
+    def test_prefetch(self):
+        """The info and the tags of the builds koji knows are cached."""
+        self.request.validated = {'builds': ['bodhi-2.0-2.fc17', 'youdontknowme-1-1.fc17']}
+
+        validators.prefetch_builds(self.request)
+
+        buildinfo = self.request.buildinfo['bodhi-2.0-2.fc17']
+        assert buildinfo['nvr'] == ('bodhi', '2.0', '2.fc17')
+        assert buildinfo['info']['source'] == 'git+https://src.fedoraproject.org/rpms/bodhi.git#abc'
+        assert buildinfo['tags'] == [
+            'f17-updates-candidate', 'f17', 'f17-updates-testing', 'f17-build']
+        # The unknown build is left to validate_build_nvrs(), which reports it.
+        assert self.request.buildinfo['youdontknowme-1-1.fc17'] == {
+            'tags': ['f17-updates-candidate', 'f17', 'f17-updates-testing', 'f17-build']}
+        assert self.request.errors == []
+
+    @mock.patch.dict('bodhi.server.validators.config', {'koji_prefetch_batch_size': 2})
+    @mock.patch.object(buildsys.DevBuildsys, 'multiCall', autospec=True,
+                       side_effect=buildsys.DevBuildsys.multiCall)
+    def test_batches(self, multiCall):
+        """The builds are fetched with a multicall per batch, and only once."""
+        self.request.validated = {'builds': [
+            'bodhi-2.0-2.fc17', 'bodhi-2.0-2.fc17', 'python-3.0-1.fc17', 'nethack-3.6-1.fc17',
+            'cached-1-1.fc17']}
+        self.request.buildinfo['cached-1-1.fc17'] = {'nvr': ('cached', '1', '1.fc17')}
+
+        validators.prefetch_builds(self.request)
+
+        assert multiCall.call_count == 2
+        assert [b for b in self.request.buildinfo if 'tags' in self.request.buildinfo[b]] == [
+            'bodhi-2.0-2.fc17', 'python-3.0-1.fc17', 'nethack-3.6-1.fc17']
+
+    @mock.patch.object(buildsys.DevBuildsys, 'getBuild', side_effect=koji.GenericError('down'))
+    def test_koji_error(self, getBuild):
+        """The builds are fetched by the validators if koji fails."""
+        self.request.validated = {'builds': ['bodhi-2.0-2.fc17', 'python-3.0-1.fc17']}
+
+        with mock.patch('bodhi.server.validators.log.exception') as exception:
+            validators.prefetch_builds(self.request)
+
+        exception.assert_called_once_with('Unable to prefetch the builds from koji')
+        assert self.request.buildinfo == {}
+        assert not self.request.koji.multicall
+
+    def test_no_builds(self):
+        """Nothing is fetched for updates that are created from a side tag."""
+        self.request.validated = {'builds': None}
+
+        with mock.patch.object(self.request.koji, 'multiCall') as multiCall:
+            validators.prefetch_builds(self.request)
+
+        multiCall.assert_not_called()
+
+    def test_single_build(self):
+        """A single build is left to the validators."""
+        self.request.validated = {'builds': ['bodhi-2.0-2.fc17']}
+
+        with mock.patch.object(self.request.koji, 'multiCall') as multiCall:
+            validators.prefetch_builds(self.request)
+
+        multiCall.assert_not_called()
+        assert self.request.buildinfo == {}
+
+
 class TestValidateBuildNvrs(BasePyTestCase):
     """Test the validate_build_nvrs() function."""
 
@@ -1,10 +1,15 @@
 """Some utilities for bodhi-server's unit tests."""
 
 from unittest import mock, TestCase
+import contextlib
+import socketserver
+import threading
 import time
 
 import requests
 
+from bodhi.server import querystats
+
 
 _dummy = TestCase()
 assert_multiline_equal = _dummy.assertMultiLineEqual
@@ -39,3 +44,106 @@ def get_bearer_token():
         'expires_in': '3600',
         'expires_at': int(time.time()) + 3600,
     }
+
+
+@contextlib.contextmanager
+def assert_max_queries(count):
+    """Fail if the block executes more than the given number of SQL statements.
+
+    Args:
+        count (int): How many SQL statements the block can execute.
+
+    Yields:
+        bodhi.server.querystats.QueryStats: The statistics of the statements of the block.
+    """
+    with querystats.track('assert_max_queries') as stats:
+        yield stats
+    assert stats.count <= count, (
+        f'{stats.count} SQL statements were executed, expected at most {count}:\n'
+        + '\n'.join(f'{n} x {statement}' for statement, n in stats.statements.most_common()))
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    """
+    A local SMTP server, which stores the e-mails it receives.
+
+    Use it as a context manager, and point the smtp_server setting to its address.
+
+    Attributes:
+        messages (list): The sender, the recipients and the content of the received e-mails.
+        connections (int): How many connections the server accepted.
+        refused (set): The recipients the server refuses.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        """Listen on a free local port."""
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.refused = set()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        """Return the address of the server, as accepted by smtplib.SMTP."""
+        return '%s:%d' % self.server_address
+
+    def __enter__(self):
+        """Start serving."""
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop serving."""
+        self.shutdown()
+        self.server_close()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Handle the commands smtplib sends to deliver e-mails."""
+
+    def handle(self):
+        """Handle a connection."""
+        self.server.connections += 1
+        self._reply('220 localhost ESMTP')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self._reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip().strip('<>'), []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command.split(':', 1)[1].strip().strip('<>')
+                if recipient in self.server.refused:
+                    self._reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                content = []
+                for data in iter(self.rfile.readline, b''):
+                    if data == b'.\r\n':
+                        break
+                    content.append(data[1:] if data.startswith(b'..') else data)
+                self.server.messages.append((sender, recipients, b''.join(content)))
+                self._reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+    def _reply(self, reply):
+        """Send a reply to the client."""
+        self.wfile.write(f'{reply}\r\n'.encode())
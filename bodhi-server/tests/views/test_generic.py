@@ -25,7 +25,7 @@ import packaging
 import pytest
 import webtest
 
-from bodhi.server import __version__, main, util
+from bodhi.server import __version__, buildsys, main, util
 from bodhi.server.config import config
 from bodhi.server.models import Release, ReleaseState, Update, UpdateStatus
 
@@ -388,10 +388,38 @@ class TestGenericViews(base.BasePyTestCase):
             assert body[0]['package_name'] == 'TurboGears'
             assert body[0]['release_name'] == 'Fedora 17'
 
+    def test_candidates_cached(self):
+        """The latest builds of the tags are cached between requests."""
+        with mock.patch.object(buildsys.DevBuildsys, 'listTagged', autospec=True,
+                               side_effect=buildsys.DevBuildsys.listTagged) as listTagged:
+            first = self.app.get('/latest_candidates', {'prefix': 'Turbo'}).json_body
+            second = self.app.get('/latest_candidates', {'package': 'TurboGears'}).json_body
+
+        assert first == second
+        assert listTagged.call_count == 1
+
+    def test_candidates_prefix(self):
+        """Only the builds of packages starting with the prefix are returned."""
+        assert len(self.app.get('/latest_candidates', {'prefix': 'turbo'}).json_body) == 1
+        assert self.app.get('/latest_candidates', {'prefix': 'bodhi'}).json_body == []
+
+    def test_candidates_hide_existing_new_update(self):
+        """Builds submitted in a new update are hidden right away."""
+        res = self.app.get('/latest_candidates', {'hide_existing': 'true'})
+        assert [b['nvr'] for b in res.json_body] == ['TurboGears-1.0.2.2-3.fc17']
+
+        self.create_update(['TurboGears-1.0.2.2-3.fc17'])
+        self.db.commit()
+
+        res = self.app.get('/latest_candidates', {'hide_existing': 'true'})
+        assert res.json_body == []
+
     def _test_candidates_hide_existing(self, archived):
         if archived:
             r = self.db.query(Release).one()
             r.state = ReleaseState.archived
+            # The builds of the archived release are inherited into an active one.
+            self.create_release('18')
             self.db.commit()
 
         # check that hide_existing does not return builds already in an update
@@ -410,6 +438,8 @@ class TestGenericViews(base.BasePyTestCase):
             # even though 2 builds are returned from koji, the bodhi one is
             # already in an update, so we only expect one here
             assert len(body) == 1
+            # the tag of the archived release is not attributed to any release
+            assert ('release_name' in body[0]) is not archived
 
     def test_candidates_hide_existing(self):
         self._test_candidates_hide_existing(archived=False)
@@ -0,0 +1,68 @@
+# Copyright Red Hat and others.
+#
+# This file is part of Bodhi.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""Benchmark jobs."""
+from .constants import MODULES
+from .job import BuildJob, Job
+
+
+class BenchmarkJob(Job):
+    """
+    Define a Job for running the server benchmarks and comparing them with the baseline.
+
+    See the Job superclass's docblock for details about its attributes.
+    """
+
+    _label = 'benchmark'
+    _dependencies = [BuildJob]
+    only_releases = ["pip"]
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the BenchmarkJob.
+
+        See the superclass's docblock for details about additional accepted parameters.
+        """
+        super().__init__(*args, **kwargs)
+
+        pytest_flags = ('--no-cov --benchmark-enable --benchmark-only '
+                        '--benchmark-json=/results/benchmarks.json tests/benchmarks')
+        if self.options["only_tests"]:
+            pytest_flags += f' -k {self.options["only_tests"]}'
+
+        test_command = (
+            f'for submodule in {" ".join(MODULES)}; do '
+            '  pushd $submodule; '
+            '  VERSION=( $(poetry version) ); '
+            '  poetry build -f sdist; '
+            '  FILENAME=( $(find dist/ -type f) ); '
+            '  FILENAME=${FILENAME##*/}; '
+            '  FILENAME=${FILENAME%-*}; '
+            '  tar -xzvf "dist/$FILENAME-${VERSION[1]}.tar.gz" -C /tmp/; '
+            '  pushd "/tmp/$FILENAME-${VERSION[1]}"; '
+            '  python setup.py develop; '
+            '  popd; '
+            '  popd; '
+            'done; '
+            'cd bodhi-server && '
+            f'/usr/bin/python3 -m pytest {pytest_flags} && '
+            '/usr/bin/python3 -m tests.benchmarks.compare /results/benchmarks.json '
+            f'--threshold {self.options["benchmark_threshold"]}'
+        )
+        self._command = ['/usr/bin/bash', '-c', test_command]
+
+        self._convert_command_for_container()
@@ -67,6 +67,9 @@ def _set_concurrency(ctx, param, value):
     return value
 
 
+benchmark_threshold_option = click.option(
+    '--threshold', 'benchmark_threshold', type=float, callback=_set_context, expose_value=False,
+    help='How much slower than the baseline a benchmark can be, as a fraction. Defaults to 0.25.')
 archive_option = click.option(
     '--archive/--no-archive', is_flag=True, default=True, callback=_set_context, expose_value=False,
     help=("Collect *.xml from the tests and put them into test_results/."))
@@ -203,6 +206,23 @@ def unit(ctx, releases):
     Runner(options=ctx.obj).run_jobs(["unit"], releases=releases)
 
 
+@cli.command()
+@archive_option
+@archive_path_option
+@benchmark_threshold_option
+@concurrency_option
+@container_runtime_option
+@failfast_option
+@onlytests_option
+@no_build_option
+@releases_option
+@tty_option
+@click.pass_context
+def benchmark(ctx, releases):
+    """Run the server benchmarks and compare them with the baseline."""
+    Runner(options=ctx.obj).run_jobs(["benchmark"], releases=releases)
+
+
 @cli.command("diff-cover")
 @archive_option
 @archive_path_option
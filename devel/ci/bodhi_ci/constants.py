@@ -18,6 +18,8 @@ DEFAULT_OPTIONS = dict(
     container_runtime='docker',
     failfast=False,
     only_tests=None,
+    # benchmark_threshold: How much slower than the baseline a benchmark can be, as a fraction.
+    benchmark_threshold=0.25,
     init=True,
     # If True, we will try to skip running any builds if suitable builds already exist.
     no_build=False,
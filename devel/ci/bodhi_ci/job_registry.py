@@ -20,6 +20,7 @@
 
 import typing
 
+from .benchmark import BenchmarkJob
 from .docs import DocsJob
 from .integration import (IntegrationBuildJob, IntegrationCleanJob,
                           IntegrationJob)
@@ -34,6 +35,7 @@ AVAILABLE_JOBS: typing.Dict[str, typing.Type['Job']] = {
     "docs": DocsJob,
     "unit": UnitJob,
     "diff-cover": DiffCoverJob,
+    "benchmark": BenchmarkJob,
     "integration": IntegrationJob,
     "integration-build": IntegrationBuildJob,
     "clean": CleanJob,
@@ -46,7 +46,6 @@ compose_state_mapping = {
     'success': 'Success',
     'failed': 'Failed',
     'signing_repo': 'Signing repo',
-    'cleaning': 'Cleaning old composes',
 }
 
 